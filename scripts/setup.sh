@@ -46,6 +46,10 @@ scrape_configs:
   - job_name: 'ml-service'
     static_configs:
       - targets: ['ml-service:4002']
+  
+  - job_name: 'analytics-service'
+    static_configs:
+      - targets: ['analytics-service:4003']
 EOL
 
 # Make all scripts executable
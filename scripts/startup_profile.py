@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Cold-start import profile of the analytics and ML services.
+
+    python scripts/startup_profile.py analytics --runs 5 --top 25
+    python scripts/startup_profile.py ml --budget-seconds 2.5 --budget-rss-mb 128
+
+Each run imports the service's app in a fresh interpreter under
+`python -X importtime` (run from the service directory, as its container
+does). The report gives the median import wall time and the largest peak RSS
+over the runs. It then lists the packages by self time, the time spent
+importing their own module bodies, summed over their modules. Last come the
+slowest modules by cumulative time, children included, which is the time
+deferring that import would save. With --budget-* the script exits 1 when the
+median time or the peak RSS is over budget, like the services' startup tests.
+
+Needs only the service's own requirements.
+"""
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SERVER = Path(__file__).resolve().parents[1] / "server"
+SERVICES = {
+    # working directory, app module
+    "analytics": (SERVER / "analytics-service", "src.main"),
+    "ml": (SERVER / "ml-service" / "src", "main"),
+}
+
+# VmHWM rather than ru_maxrss, which on Linux keeps the parent's peak across exec
+PROBE = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+if os.path.exists("/proc/self/status"):
+    with open("/proc/self/status") as status:
+        rss_mb = next(int(line.split()[1]) for line in status if line.startswith("VmHWM")) / 1024
+print(json.dumps({{"seconds": seconds, "rss_mb": rss_mb}}))
+"""
+
+def parse_importtime(stderr: str) -> List[Tuple[str, float, float]]:
+    """
+    (module, self seconds, cumulative seconds) from `-X importtime` output
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        modules.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return modules
+
+def profile_once(service: str) -> Tuple[Dict[str, float], List[Tuple[str, float, float]]]:
+    cwd, module = SERVICES[service]
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        sys.exit(f"importing {module} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.splitlines()[-1]), parse_importtime(completed.stderr)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("service", choices=sorted(SERVICES))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="packages and modules to list")
+    parser.add_argument("--budget-seconds", type=float, help="fail when the median import time exceeds this")
+    parser.add_argument("--budget-rss-mb", type=float, help="fail when the peak RSS exceeds this")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    runs = [profile_once(args.service) for _ in range(args.runs)]
+    seconds = statistics.median(totals["seconds"] for totals, _ in runs)
+    rss_mb = max(totals["rss_mb"] for totals, _ in runs)
+
+    # Per-module timings of the median run
+    _, modules = sorted(runs, key=lambda run: run[0]["seconds"])[len(runs) // 2]
+    packages: Dict[str, float] = defaultdict(float)
+    for name, self_seconds, _ in modules:
+        packages[name.split(".")[0]] += self_seconds
+    top_packages = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+    top_modules = sorted(modules, key=lambda module: -module[2])[:args.top]
+
+    if args.json:
+        print(json.dumps({
+            "service": args.service,
+            "seconds": seconds,
+            "rss_mb": rss_mb,
+            "modules": len(modules),
+            "packages": dict(top_packages),
+            "cumulative": {name: cumulative for name, _, cumulative in top_modules}
+        }, indent=2))
+    else:
+        print(f"{args.service}: {seconds:.3f}s median import over {args.runs} runs, "
+              f"peak RSS {rss_mb:.1f} MiB, {len(modules)} modules\n")
+        print(f"{'package':<32} {'self s':>8}")
+        for name, self_seconds in top_packages:
+            print(f"{name:<32} {self_seconds:>8.3f}")
+        print(f"\n{'module':<48} {'cumulative s':>12}")
+        for name, _, cumulative in top_modules:
+            print(f"{name:<48} {cumulative:>12.3f}")
+
+    failures = []
+    if args.budget_seconds is not None and seconds > args.budget_seconds:
+        failures.append(f"import time {seconds:.3f}s over budget {args.budget_seconds}s")
+    if args.budget_rss_mb is not None and rss_mb > args.budget_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.1f} MiB over budget {args.budget_rss_mb} MiB")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
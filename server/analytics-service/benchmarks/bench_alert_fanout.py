@@ -0,0 +1,123 @@
+# benchmarks/bench_alert_fanout.py
+"""
+Alert stream fan-out: publish cost and delivery latency with many subscribers.
+
+    python -m benchmarks.bench_alert_fanout --subscribers 1000 10000 --events 50
+    python -m benchmarks.bench_alert_fanout --live http://localhost:4003 --subscribers 2000 --events 20
+
+In-process, every subscriber is an asyncio task draining AlertService.stream,
+as the SSE endpoint does, and latency runs from publish until the last
+subscriber has the frame. --live opens real SSE connections to a running
+service, all following one synthetic patient. It then posts readings that
+alternately breach and clear the heart rate threshold. Raise the open file
+limit (ulimit -n) for thousands of connections.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from src.services.alert_service import ALERT_RULES, AlertBroker, AlertEvaluator, AlertService
+
+def _percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+async def run_in_process(subscribers: int, events: int) -> dict:
+    broker = AlertBroker(max_queue=256, max_subscribers=subscribers)
+    service = AlertService(AlertEvaluator(ALERT_RULES, 1000), broker, heartbeat=60, department_ttl=3600)
+    service._departments["p1"] = (float("inf"), "ward-1")
+
+    pending = 0
+    all_received = asyncio.Event()
+
+    async def consume(subscription):
+        nonlocal pending
+        async for frame in service.stream(subscription):
+            if frame.startswith(b"event: alert"):
+                pending -= 1
+                if pending == 0:
+                    all_received.set()
+
+    tasks = [asyncio.create_task(consume(broker.subscribe(["department:ward-1"]))) for _ in range(subscribers)]
+    await asyncio.sleep(0)
+
+    publish_seconds, latencies = [], []
+    for i in range(events):
+        pending = subscribers
+        all_received.clear()
+        event = {"patient_id": "p1", "rule": "elevated_heart_rate", "status": "triggered" if i % 2 == 0 else "resolved"}
+        start = time.perf_counter()
+        await service._publish([event])
+        publish_seconds.append(time.perf_counter() - start)
+        await all_received.wait()
+        latencies.append(time.perf_counter() - start)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {"publish": publish_seconds, "latency": latencies}
+
+async def run_live(base_url: str, subscribers: int, events: int) -> dict:
+    import httpx
+
+    patient_id = str(uuid4())
+    limits = httpx.Limits(max_connections=subscribers + 10, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as client:
+        received = []
+        ready = 0
+        connected = asyncio.Event()
+
+        async def consume():
+            nonlocal ready
+            async with client.stream("GET", "/api/alerts/stream", params={"patient_id": patient_id}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.startswith("retry:"):
+                        ready += 1
+                        if ready == subscribers:
+                            connected.set()
+                    elif line.startswith("data:"):
+                        received.append(time.perf_counter())
+
+        tasks = [asyncio.create_task(consume()) for _ in range(subscribers)]
+        await asyncio.wait_for(connected.wait(), 60)
+
+        latencies = []
+        for i in range(events):
+            received.clear()
+            start = time.perf_counter()
+            await client.post("/api/metrics/health-metrics", json={
+                "patient_id": patient_id,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "heart_rate": 130.0 if i % 2 == 0 else 80.0
+            })
+            while len(received) < subscribers:
+                await asyncio.sleep(0.001)
+            latencies.append(max(received) - start)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return {"latency": latencies}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--live", metavar="BASE_URL", help="benchmark a running service over SSE")
+    args = parser.parse_args()
+
+    print(f"{'subscribers':>11} {'publish p50':>12} {'latency p50':>12} {'latency p99':>12}")
+    for subscribers in args.subscribers:
+        if args.live:
+            result = asyncio.run(run_live(args.live, subscribers, args.events))
+        else:
+            result = asyncio.run(run_in_process(subscribers, args.events))
+        publish = f"{_percentile(result['publish'], 0.5) * 1e3:>10.3f}ms" if "publish" in result else f"{'-':>12}"
+        print(f"{subscribers:>11} {publish} {_percentile(result['latency'], 0.5) * 1e3:>10.3f}ms "
+              f"{_percentile(result['latency'], 0.99) * 1e3:>10.3f}ms")
+
+if __name__ == "__main__":
+    main()
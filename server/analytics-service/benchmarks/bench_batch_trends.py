@@ -0,0 +1,62 @@
+# benchmarks/bench_batch_trends.py
+"""
+Per-series trend loop vs. the vectorized batch engine.
+
+    python -m benchmarks.bench_batch_trends --patients 200 --length 288
+
+The loop baseline is what a ward dashboard would do today: dropna, then
+_calculate_metric_trend and _calculate_trend_strength for every patient.
+"""
+import argparse
+import time
+import warnings
+
+import pandas as pd
+
+from benchmarks.synthetic import vital_signs
+from src.services.time_series_service import TimeSeriesService
+
+def run(patients: int, length: int, loop_patients: int, seed: int) -> dict:
+    service = TimeSeriesService()
+    values = vital_signs(patients, length, metrics=("heart_rate",), seed=seed)["heart_rate"]
+
+    start = time.perf_counter()
+    service.calculate_batch_trends(values)
+    batch_seconds = time.perf_counter() - start
+
+    loop_patients = min(loop_patients, patients)
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for row in values[:loop_patients]:
+            series = pd.Series(row).dropna().reset_index(drop=True)
+            service._calculate_metric_trend(series)
+            service._calculate_trend_strength(series)
+    loop_seconds = (time.perf_counter() - start) * patients / loop_patients
+
+    return {
+        "patients": patients,
+        "length": length,
+        "batch_seconds": batch_seconds,
+        "loop_seconds_extrapolated": loop_seconds,
+        "loop_patients_timed": loop_patients,
+        "speedup": loop_seconds / batch_seconds if batch_seconds else float("inf")
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--length", type=int, default=288, help="readings per patient (288 = 24h at 5 min)")
+    parser.add_argument("--loop-patients", type=int, default=100,
+                        help="patients actually timed in the loop; the rest is extrapolated")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'patients':>9} {'length':>7} {'batch s':>9} {'loop s':>9} {'speedup':>9}")
+    for patients in args.patients:
+        result = run(patients, args.length, args.loop_patients, args.seed)
+        print(f"{result['patients']:>9} {result['length']:>7} {result['batch_seconds']:>9.4f} "
+              f"{result['loop_seconds_extrapolated']:>9.2f} {result['speedup']:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
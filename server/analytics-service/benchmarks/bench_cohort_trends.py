@@ -0,0 +1,139 @@
+# benchmarks/bench_cohort_trends.py
+"""
+Cohort trends: one aggregate pass plus vectorized post-processing vs. a
+per-patient calculate_trends loop.
+
+    python -m benchmarks.bench_cohort_trends --patients 50000
+    python -m benchmarks.bench_cohort_trends --live --metric oxygen_saturation --runs 20
+
+Offline, the hourly bucketing and per-patient regression that the database
+does are reproduced with NumPy on synthetic data, so the Python side of the
+endpoint (summarize_cohort) and the loop baseline can be timed anywhere.
+--live times CohortTrendService end to end against DB_* (cache bypassed).
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from benchmarks.synthetic import vital_signs
+from src.services.cohort_service import DEFAULT_STABLE_BANDS, summarize_cohort
+from src.services.trend_state import build_trend_state
+
+def hourly_aggregate(values: np.ndarray, per_hour: int):
+    """
+    NumPy stand-in for the SQL: hourly bucket means, then the least-squares
+    slope (per hour) and mean over each patient's buckets
+    """
+    n_patients, length = values.shape
+    hours = length // per_hour
+    with np.errstate(invalid="ignore"):
+        buckets = np.nanmean(values[:, :hours * per_hour].reshape(n_patients, hours, per_hour), axis=2)
+    present = ~np.isnan(buckets)
+    counts = present.sum(axis=1)
+    x = np.where(present, np.arange(hours), 0.0)
+    y = np.where(present, buckets, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = x.sum(axis=1) / counts
+        y_mean = y.sum(axis=1) / counts
+        dx = np.where(present, np.arange(hours) - x_mean[:, None], 0.0)
+        slopes = (dx * (y - y_mean[:, None] * present)).sum(axis=1) / (dx * dx).sum(axis=1)
+    population_counts = present.sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        population_means = np.nanmean(buckets, axis=0)
+    return counts, slopes, y_mean, population_counts, population_means
+
+def run_offline(patients: int, length: int, per_hour: int, loop_patients: int, metric: str, seed: int) -> dict:
+    values = vital_signs(patients, length, metrics=(metric,), seed=seed)[metric]
+
+    start = time.perf_counter()
+    counts, slopes, means, population_counts, population_means = hourly_aggregate(values, per_hour)
+    aggregate_seconds = time.perf_counter() - start
+
+    window_start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    patient_rows = [
+        (f"patient-{i}", int(c), None if np.isnan(s) else float(s), float(m))
+        for i, (c, s, m) in enumerate(zip(counts, slopes, means))
+    ]
+    period_rows = [
+        (window_start + timedelta(hours=h), int(c), float(m))
+        for h, (c, m) in enumerate(zip(population_counts, population_means))
+    ]
+    start = time.perf_counter()
+    summary = summarize_cohort(patient_rows, period_rows, DEFAULT_STABLE_BANDS[metric])
+    summarize_seconds = time.perf_counter() - start
+
+    # Baseline: rebuild every patient's trend state from raw readings, as a
+    # loop over calculate_trends would (database time not included)
+    loop_patients = min(loop_patients, patients)
+    start = time.perf_counter()
+    for row in values[:loop_patients]:
+        readings = [{metric: None if np.isnan(v) else float(v)} for v in row]
+        build_trend_state(readings, window_start, 0.5, 0.1).snapshot()
+    loop_seconds = (time.perf_counter() - start) * patients / loop_patients
+
+    return {
+        "patients": patients,
+        "aggregate_seconds": aggregate_seconds,
+        "summarize_seconds": summarize_seconds,
+        "loop_seconds_extrapolated": loop_seconds,
+        "share_rising": summary["share_rising"]
+    }
+
+async def run_live(metric: str, department_id, hours: float, bucket_minutes: int, runs: int) -> list:
+    from src.core.config import db_pool
+    from src.services.cohort_service import CohortTrendService
+
+    service = CohortTrendService()
+    bucket = timedelta(minutes=bucket_minutes)
+    end = datetime.now(timezone.utc)
+    await db_pool.connect()
+    try:
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = await service._query_cohort_trends(
+                metric, department_id, end - timedelta(hours=hours), end, bucket,
+                DEFAULT_STABLE_BANDS[metric], 3
+            )
+            timings.append(time.perf_counter() - start)
+        print(f"patients: {result['patients']}")
+        return timings
+    finally:
+        await db_pool.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--length", type=int, default=288, help="readings per patient (288 = 24h at 5 min)")
+    parser.add_argument("--per-hour", type=int, default=12, help="readings per hourly bucket")
+    parser.add_argument("--loop-patients", type=int, default=500,
+                        help="patients actually timed in the loop; the rest is extrapolated")
+    parser.add_argument("--metric", default="oxygen_saturation", choices=sorted(DEFAULT_STABLE_BANDS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", action="store_true", help="time the service against the database")
+    parser.add_argument("--department-id")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--bucket-minutes", type=int, default=60)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.live:
+        timings = sorted(asyncio.run(run_live(
+            args.metric, args.department_id, args.hours, args.bucket_minutes, args.runs
+        )))
+        print(f"p50 {timings[len(timings) // 2]:.3f}s  p95 {timings[int(0.95 * (len(timings) - 1))]:.3f}s  "
+              f"max {timings[-1]:.3f}s over {len(timings)} runs")
+        return
+
+    print(f"{'patients':>9} {'aggregate s':>12} {'summarize s':>12} {'loop s':>9} {'speedup':>9}")
+    for patients in args.patients:
+        result = run_offline(patients, args.length, args.per_hour, args.loop_patients, args.metric, args.seed)
+        vectorized = result["aggregate_seconds"] + result["summarize_seconds"]
+        print(f"{result['patients']:>9} {result['aggregate_seconds']:>12.4f} {result['summarize_seconds']:>12.4f} "
+              f"{result['loop_seconds_extrapolated']:>9.2f} {result['loop_seconds_extrapolated'] / vectorized:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/bench_columnar_fetch.py
+"""
+SELECT * into per-row records vs. the column-projected binary COPY path.
+
+    python -m benchmarks.bench_columnar_fetch --readings 1000 100000
+    python -m benchmarks.bench_columnar_fetch --live --patient-id <uuid> --days 7 --runs 20
+
+Offline, the row path starts from already-built dict rows carrying every
+health_metrics column (so asyncpg's per-row decoding, which it also pays,
+is left out) and collects the requested metric into a float Series. The
+columnar path decodes a binary COPY stream of that one metric. --live times
+both queries end to end against DB_*.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import pgcopy_binary, vital_signs
+from src.services.columnar_fetch import decode_binary_copy, fetch_metric_columns
+
+def _best_of(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def run_offline(readings: int, metric: str, runs: int, seed: int) -> dict:
+    vitals = vital_signs(1, readings, seed=seed)
+    patient_id = uuid4()
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "id": uuid4(),
+            "patient_id": patient_id,
+            "timestamp": start + timedelta(minutes=5 * i),
+            **{name: None if np.isnan(values[0, i]) else float(values[0, i]) for name, values in vitals.items()},
+            "created_at": start
+        }
+        for i in range(readings)
+    ]
+    buffer = pgcopy_binary({metric: vitals[metric][0]})
+
+    row_seconds = _best_of(lambda: pd.Series([row[metric] for row in rows], dtype=float), runs)
+    columnar_seconds = _best_of(lambda: pd.Series(decode_binary_copy(buffer, [metric])[metric]), runs)
+    return {
+        "readings": readings,
+        "row_seconds": row_seconds,
+        "columnar_seconds": columnar_seconds,
+        "speedup": row_seconds / columnar_seconds if columnar_seconds else float("inf")
+    }
+
+async def run_live(patient_id: str, metric: str, days: float, runs: int) -> dict:
+    from src.core.config import db_pool, get_db
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    await db_pool.connect()
+    try:
+        timings = {"row": [], "columnar": []}
+        for _ in range(runs):
+            async with get_db("bench.columnar_fetch") as db:
+                began = time.perf_counter()
+                rows = await db.fetch_all(
+                    """
+                        SELECT * FROM health_metrics
+                        WHERE patient_id = :patient_id AND timestamp BETWEEN :start_date AND :end_date
+                        ORDER BY timestamp
+                    """,
+                    {"patient_id": patient_id, "start_date": start, "end_date": end}
+                )
+                pd.Series([row[metric] for row in rows], dtype=float)
+                timings["row"].append(time.perf_counter() - began)
+
+                began = time.perf_counter()
+                columns = await fetch_metric_columns(db, patient_id, [metric], start, end)
+                pd.Series(columns[metric])
+                timings["columnar"].append(time.perf_counter() - began)
+        print(f"readings: {len(rows)}")
+        return {path: sorted(values) for path, values in timings.items()}
+    finally:
+        await db_pool.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readings", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--metric", default="heart_rate")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", action="store_true", help="time both queries against the database")
+    parser.add_argument("--patient-id", help="patient to read with --live")
+    parser.add_argument("--days", type=float, default=1.0, help="history range read with --live")
+    args = parser.parse_args()
+
+    if args.live:
+        if not args.patient_id:
+            parser.error("--live needs --patient-id")
+        timings = asyncio.run(run_live(args.patient_id, args.metric, args.days, args.runs))
+        for path, values in timings.items():
+            print(f"{path:<9} p50 {values[len(values) // 2]:.4f}s  min {values[0]:.4f}s over {len(values)} runs")
+        return
+
+    print(f"{'readings':>9} {'row s':>9} {'columnar s':>11} {'speedup':>9}")
+    for readings in args.readings:
+        result = run_offline(readings, args.metric, args.runs, args.seed)
+        print(f"{result['readings']:>9} {result['row_seconds']:>9.4f} {result['columnar_seconds']:>11.5f} "
+              f"{result['speedup']:>8.0f}x")
+
+if __name__ == "__main__":
+    main()
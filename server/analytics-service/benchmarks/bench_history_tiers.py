@@ -0,0 +1,158 @@
+# benchmarks/bench_history_tiers.py
+"""
+Storage and query cost of the raw, minute and hour history tiers.
+
+    python -m benchmarks.bench_history_tiers --days 365 --interval-seconds 30
+    python -m benchmarks.bench_history_tiers --live --patient-id <uuid> --days 365 --runs 5
+
+Offline, one synthetic patient is sampled every --interval-seconds for
+--days. The benchmark rolls the readings up into minute and hour buckets the
+way migration 006 does. For each tier it reports the rows and an estimate of
+the uncompressed heap size, then times decoding its binary COPY stream and
+summarising the whole range. The size estimate uses fixed-width tuples with
+no index and no compression. --live reports real sizes from TimescaleDB
+(hypertable_size, compression stats). It also times get_patient_metrics
+over the range at each resolution.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from benchmarks.synthetic import pgcopy_binary, vital_signs
+from src.services.columnar_fetch import decode_binary_copy
+from src.services.history_tiers import BUCKET_FIELDS, bucket_columns, raw_to_buckets
+from src.services.time_series_service import (
+    HISTORY_METRICS, VITAL_COLUMNS, analyze_history_buckets, analyze_history_columns
+)
+
+# Tuple header and item pointer, then the fixed-width columns
+ROW_OVERHEAD_BYTES = 24 + 4
+# id, patient_id, timestamp, created_at and the vitals
+RAW_ROW_BYTES = ROW_OVERHEAD_BYTES + 16 + 16 + 8 + 8 + 8 * len(VITAL_COLUMNS)
+# patient_id, bucket and count/sum/sum_squares/min/max per vital
+BUCKET_ROW_BYTES = ROW_OVERHEAD_BYTES + 16 + 8 + 8 * len(BUCKET_FIELDS) * len(VITAL_COLUMNS)
+
+def _best_of(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def _roll_up(buckets, metrics, size: int):
+    """Fold consecutive runs of `size` buckets together, as the aggregates do"""
+    starts = np.arange(0, len(buckets[f"{metrics[0]}_count"]), size)
+    rolled = {}
+    for column in bucket_columns(metrics):
+        reduce = np.fmin if column.endswith("_min") else np.fmax if column.endswith("_max") else np.add
+        rolled[column] = reduce.reduceat(buckets[column], starts)
+    return rolled
+
+def run_offline(days: float, interval_seconds: int, runs: int, seed: int) -> list:
+    readings = int(days * 86400 / interval_seconds)
+    metrics = list(HISTORY_METRICS)
+    raw = {metric: values[0] for metric, values in vital_signs(1, readings, metrics=metrics, seed=seed).items()}
+    minute = _roll_up(raw_to_buckets(raw, metrics), metrics, max(60 // interval_seconds, 1))
+    hour = _roll_up(minute, metrics, 60)
+
+    raw_buffer = pgcopy_binary(raw)
+    columns = bucket_columns(metrics)
+    results = [{
+        "tier": "raw",
+        "rows": readings,
+        "bytes": readings * RAW_ROW_BYTES,
+        "decode": _best_of(lambda: decode_binary_copy(raw_buffer, metrics), runs),
+        "analyze": _best_of(lambda: analyze_history_columns(raw), runs)
+    }]
+    for name, buckets in (("minute", minute), ("hour", hour)):
+        buffer = pgcopy_binary(buckets)
+        results.append({
+            "tier": name,
+            "rows": len(buckets[columns[0]]),
+            "bytes": len(buckets[columns[0]]) * BUCKET_ROW_BYTES,
+            "decode": _best_of(lambda: decode_binary_copy(buffer, columns), runs),
+            "analyze": _best_of(lambda: analyze_history_buckets(buckets, metrics), runs)
+        })
+    return results
+
+async def run_live(patient_id: str, days: float, runs: int) -> None:
+    from src.core.config import db_pool, get_db
+    from src.services.time_series_service import TimeSeriesService
+
+    await db_pool.connect()
+    try:
+        async with get_db("bench.history_tiers") as db:
+            sources = {"raw": "health_metrics"}
+            for row in await db.fetch_all(
+                """
+                    SELECT view_name, materialization_hypertable_schema, materialization_hypertable_name
+                    FROM timescaledb_information.continuous_aggregates
+                    WHERE view_name IN ('health_metrics_1m', 'health_metrics_1h')
+                """
+            ):
+                sources[row["view_name"]] = (
+                    f"{row['materialization_hypertable_schema']}.{row['materialization_hypertable_name']}"
+                )
+            for name, hypertable in sources.items():
+                size = await db.fetch_val(f"SELECT hypertable_size('{hypertable}')")
+                print(f"{name:<18} {(size or 0) / 2**20:>10.1f} MiB")
+            stats = await db.fetch_one(
+                """
+                    SELECT
+                        SUM(before_compression_total_bytes) AS before,
+                        SUM(after_compression_total_bytes) AS after
+                    FROM chunk_compression_stats('health_metrics')
+                    WHERE compression_status = 'Compressed'
+                """
+            )
+            if stats and stats["after"]:
+                print(f"compressed chunks  {stats['before'] / 2**20:.1f} MiB -> {stats['after'] / 2**20:.1f} MiB "
+                      f"({stats['before'] / stats['after']:.1f}x)")
+
+        service = TimeSeriesService()
+        end = datetime.now(timezone.utc)
+        start = end - timedelta(days=days)
+        print(f"\n{'resolution':<10} {'served by':<9} {'p50 s':>8} {'min s':>8}")
+        for resolution in ("raw", "minute", "hour", "day"):
+            timings, served = [], "-"
+            for _ in range(runs):
+                began = time.perf_counter()
+                result = await service.get_patient_metrics(patient_id, start, end, resolution=resolution)
+                timings.append(time.perf_counter() - began)
+                if result:
+                    served = result[0]["resolution"]
+            timings.sort()
+            print(f"{resolution:<10} {served:<9} {timings[len(timings) // 2]:>8.4f} {timings[0]:>8.4f}")
+    finally:
+        await db_pool.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=float, default=365.0)
+    parser.add_argument("--interval-seconds", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", action="store_true", help="report real sizes and query times from the database")
+    parser.add_argument("--patient-id", help="patient to read with --live")
+    args = parser.parse_args()
+
+    if args.live:
+        if not args.patient_id:
+            parser.error("--live needs --patient-id")
+        asyncio.run(run_live(args.patient_id, args.days, args.runs))
+        return
+
+    results = run_offline(args.days, args.interval_seconds, args.runs, args.seed)
+    raw = results[0]
+    print(f"{'tier':<7} {'rows':>10} {'est. MiB':>9} {'decode s':>9} {'analyze s':>10} {'vs raw':>7}")
+    for result in results:
+        total = result["decode"] + result["analyze"]
+        print(f"{result['tier']:<7} {result['rows']:>10} {result['bytes'] / 2**20:>9.1f} {result['decode']:>9.4f} "
+              f"{result['analyze']:>10.4f} {(raw['decode'] + raw['analyze']) / total:>6.0f}x")
+
+if __name__ == "__main__":
+    main()
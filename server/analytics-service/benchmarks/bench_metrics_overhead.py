@@ -0,0 +1,81 @@
+# benchmarks/bench_metrics_overhead.py
+"""
+Cost of the Prometheus instrumentation on the hot paths.
+
+    python -m benchmarks.bench_metrics_overhead
+    PROMETHEUS_MULTIPROC_DIR=$(mktemp -d) python -m benchmarks.bench_metrics_overhead
+
+Times a minimal ASGI request with and without PrometheusMiddleware, and a
+fetch_all on a no-op connection with and without InstrumentedConnection.
+Exits 1 when either overhead exceeds its budget (see src/core/metrics.py).
+Run it in multiprocess mode too: there every observation writes to an
+mmapped file.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from src.core.metrics import InstrumentedConnection, PrometheusMiddleware
+
+class _Route:
+    path = "/bench/{id}"
+
+async def _endpoint(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+class _Connection:
+    async def fetch_all(self, query, values=None):
+        return []
+
+async def _send(message):
+    pass
+
+async def _receive():
+    return {"type": "http.request", "body": b""}
+
+async def _per_call(fn, n: int) -> float:
+    for _ in range(min(n, 1000)):
+        await fn()
+    start = time.perf_counter()
+    for _ in range(n):
+        await fn()
+    return (time.perf_counter() - start) / n
+
+async def measure(n: int) -> dict:
+    scope = {"type": "http", "method": "GET", "path": "/bench/1"}
+    bare_app, instrumented_app = _endpoint, PrometheusMiddleware(_endpoint)
+    bare_db, instrumented_db = _Connection(), InstrumentedConnection(_Connection(), "bench.fetch")
+
+    results = {}
+    for name, bare, instrumented in (
+        ("request", lambda: bare_app(dict(scope), _receive, _send),
+         lambda: instrumented_app(dict(scope), _receive, _send)),
+        ("query", lambda: bare_db.fetch_all("SELECT 1"), lambda: instrumented_db.fetch_all("SELECT 1")),
+    ):
+        # Best of three to damp scheduler noise
+        overhead = min([await _per_call(instrumented, n) - await _per_call(bare, n) for _ in range(3)])
+        results[name] = max(overhead, 0.0)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--request-budget-us", type=float, default=50)
+    parser.add_argument("--query-budget-us", type=float, default=10)
+    args = parser.parse_args()
+
+    results = asyncio.run(measure(args.calls))
+    budgets = {"request": args.request_budget_us, "query": args.query_budget_us}
+    over = False
+    for name, seconds in results.items():
+        micros = seconds * 1e6
+        status = "ok" if micros <= budgets[name] else "OVER BUDGET"
+        over |= micros > budgets[name]
+        print(f"{name:<8} overhead {micros:7.2f} us  (budget {budgets[name]:.0f} us)  {status}")
+    sys.exit(1 if over else 0)
+
+if __name__ == "__main__":
+    main()
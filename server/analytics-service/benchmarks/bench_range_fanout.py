@@ -0,0 +1,78 @@
+# benchmarks/bench_range_fanout.py
+"""
+Long-window department utilization and summary scans at several fan-out levels.
+
+    python -m benchmarks.bench_range_fanout --department-id <uuid> --days 365 --concurrency 1 2 4 8
+    python -m benchmarks.bench_range_fanout --department-id <uuid> --raw --runs 5
+
+Runs against DB_*. Each concurrency level sets QUERY_FANOUT_CONCURRENCY;
+level 1 reads the same chunk-aligned pieces one after another. Utilization
+is read per --period over the last --days. With --raw, utilization ignores
+rollup watermarks and reads department_metrics only, which is the case the
+fan-out targets. The monthly summary's utilization and conditions sections
+are timed without the cache. Keep DB_POOL_MAX_SIZE above the highest level.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.core.config import db_pool, settings
+from src.services.analytics_service import AnalyticsService
+from src.services.rollup_service import PERIOD_INTERVALS, rollup_service
+
+async def _time(fn, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)
+
+async def run(department_id: str, days: float, period: str, levels: list, runs: int, raw: bool) -> None:
+    if raw:
+        async def no_watermarks(db):
+            return {}
+        rollup_service.get_watermarks = no_watermarks
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    service = AnalyticsService()
+    await db_pool.connect()
+    try:
+        print(f"{'query':<22} {'concurrency':>11} {'p50 s':>8} {'min s':>8} {'speedup':>8}")
+        for name, query in (
+            (f"utilization {period}", lambda: rollup_service.query_utilization(
+                department_id, PERIOD_INTERVALS[period], start, end
+            )),
+            ("summary utilization", lambda: service._query_summary_section(
+                "utilization", [("monthly", None), ("monthly", department_id)], end
+            )),
+            ("summary conditions", lambda: service._query_summary_section(
+                "conditions", [("monthly", None), ("monthly", department_id)], end
+            )),
+        ):
+            baseline = None
+            for level in levels:
+                settings.QUERY_FANOUT_CONCURRENCY = level
+                await query()  # warm the plan and page caches
+                timings = await _time(query, runs)
+                p50 = timings[len(timings) // 2]
+                baseline = baseline or p50
+                print(f"{name:<22} {level:>11} {p50:>8.4f} {timings[0]:>8.4f} {baseline / p50:>7.1f}x")
+    finally:
+        await db_pool.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--department-id", required=True)
+    parser.add_argument("--days", type=float, default=365.0)
+    parser.add_argument("--period", choices=list(PERIOD_INTERVALS), default="daily")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--raw", action="store_true", help="read utilization from department_metrics only")
+    args = parser.parse_args()
+    asyncio.run(run(args.department_id, args.days, args.period, args.concurrency, args.runs, args.raw))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_responses.py
+"""
+Dashboard response encoding: FastAPI's default JSON path vs. orjson, and body sizes per encoding.
+
+    python -m benchmarks.bench_responses --days 30 365 --runs 20
+
+The payload is a department utilization series with hourly periods over
+--days. The default path is what FastAPI does for a returned list:
+jsonable_encoder, then JSONResponse.render. The fast path is
+src.core.responses.dumps. The compressed sizes show what conditional_json
+sends for each Accept-Encoding. A 304 sends no body at all.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from src.core import responses
+
+def _best_of(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def utilization_payload(days: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "period": (start + timedelta(hours=hour)).isoformat(),
+            "average_patients": float(rng.normal(40, 5)),
+            "utilization_rate": float(rng.uniform(0.4, 0.95)),
+            "peak_patients": int(rng.integers(30, 60)),
+            "average_wait_time": float(rng.gamma(2, 10))
+        }
+        for hour in range(days * 24)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, nargs="+", default=[30, 365])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'days':>5} {'rows':>6} {'default ms':>11} {'orjson ms':>10} {'speedup':>8} {'json KiB':>9} "
+          f"{'gzip KiB':>9} {'gzip ms':>8} {'br KiB':>9} {'br ms':>8}")
+    for days in args.days:
+        payload = utilization_payload(days)
+        default = _best_of(lambda: JSONResponse(jsonable_encoder(payload)).body, args.runs)
+        fast = _best_of(lambda: responses.dumps(payload), args.runs)
+        body = responses.dumps(payload)
+        cells = []
+        for encoding in ("gzip", "br"):
+            if encoding not in responses.available_encodings():
+                cells.append(f"{'-':>9} {'-':>8}")
+                continue
+            seconds = _best_of(lambda: responses.compress(body, encoding), args.runs)
+            cells.append(f"{len(responses.compress(body, encoding)) / 1024:>9.1f} {seconds * 1e3:>8.2f}")
+        print(f"{days:>5} {len(payload):>6} {default * 1e3:>11.2f} {fast * 1e3:>10.2f} {default / fast:>7.1f}x "
+              f"{len(body) / 1024:>9.1f} {' '.join(cells)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/harness.py
+"""
+Timing, memory and baseline comparison for the benchmark suite.
+
+A case is a setup function returning the callable to time (so input
+generation is not measured) plus the number of items (points, patients)
+one call processes. Each case is timed over several repeats of a calibrated
+number of calls; the fastest repeat is kept since it is the least disturbed
+by the rest of the machine. Peak memory of one call is measured separately
+with tracemalloc, which also sees NumPy allocations.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import gc
+import json
+import platform
+import time
+import tracemalloc
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[], Tuple[Callable[[], Any], int]]
+    unit: str = "points"
+    tags: Tuple[str, ...] = field(default_factory=tuple)
+
+def time_call(fn: Callable[[], Any], repeat: int = 5, min_time: float = 0.2) -> float:
+    """
+    Seconds per call: calls are batched until one batch takes at least
+    `min_time`, then the fastest of `repeat` batches is used
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def peak_memory(fn: Callable[[], Any]) -> int:
+    """
+    Peak traced allocation, in bytes, of one call
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def run_case(case: Case, repeat: int, min_time: float) -> Dict[str, Any]:
+    fn, items = case.setup()
+    fn()  # warm-up: imports, caches, first-call allocation
+    seconds = time_call(fn, repeat, min_time)
+    return {
+        "seconds_per_call": seconds,
+        "throughput": items / seconds if seconds else float("inf"),
+        "unit": f"{case.unit}/s",
+        "peak_memory_bytes": peak_memory(fn)
+    }
+
+def machine() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "node": platform.node()
+    }
+
+def load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+def save_baseline(path: Path, results: Dict[str, Dict[str, Any]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"machine": machine(), "results": results}, indent=2, sort_keys=True) + "\n")
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    max_slowdown: float,
+    max_memory_growth: float
+) -> List[str]:
+    """
+    Regressions of `results` against `baseline` (both keyed by case name):
+    throughput lower by more than `max_slowdown`, or peak memory higher by
+    more than `max_memory_growth` (fractions, e.g. 0.25). Cases missing from
+    either side are not compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        ratio = result["throughput"] / reference["throughput"]
+        if ratio < 1 - max_slowdown:
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.4g} {result['unit']} is "
+                f"{1 - ratio:.0%} below baseline {reference['throughput']:.4g}"
+            )
+        # Small allocations are dominated by interpreter noise
+        if reference["peak_memory_bytes"] >= 1 << 16:
+            growth = result["peak_memory_bytes"] / reference["peak_memory_bytes"] - 1
+            if growth > max_memory_growth:
+                regressions.append(
+                    f"{name}: peak memory {result['peak_memory_bytes'] / 2**20:.1f} MiB is "
+                    f"{growth:.0%} above baseline {reference['peak_memory_bytes'] / 2**20:.1f} MiB"
+                )
+    return regressions
@@ -0,0 +1,164 @@
+# benchmarks/suite.py
+"""
+Benchmark suite for the analytics and ML hot paths, with regression gating.
+
+    python -m benchmarks.suite                      # run and print
+    python -m benchmarks.suite --save-baseline      # record this machine's baseline
+    python -m benchmarks.suite --check              # fail (exit 1) on regressions
+    python -m benchmarks.suite --full -k trend_strength
+
+Runs offline on synthetic vital signs (no database). Series lengths go from
+10 to 100k points by default and to 1M with --full (Holt-Winters trends stop
+at 10k and 100k respectively). Baselines are per machine: record one before
+a change and --check after it, on the same machine. MLService cases run when ../ml-service and its dependencies are
+importable and are skipped otherwise.
+"""
+from pathlib import Path
+from typing import List
+import argparse
+import sys
+import warnings
+
+import pandas as pd
+
+from benchmarks.harness import Case, compare, load_baseline, run_case, save_baseline
+from benchmarks.synthetic import vital_series, vital_signs
+from src.services.time_series_service import TimeSeriesService
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "baseline.json"
+ML_SERVICE_SRC = Path(__file__).resolve().parents[2] / "ml-service" / "src"
+
+LENGTHS = [10, 1_000, 10_000, 100_000]
+FULL_LENGTHS = [10, 1_000, 10_000, 100_000, 1_000_000]
+# Holt-Winters fitting is iterative (about 3s at 100k points); longer
+# _calculate_metric_trend cases only run with --full
+TREND_MAX_LENGTH = 10_000
+FULL_TREND_MAX_LENGTH = 100_000
+PATIENT_COUNTS = [100, 10_000]
+FULL_PATIENT_COUNTS = [100, 10_000, 100_000]
+
+def _series(length: int) -> pd.Series:
+    return pd.Series(vital_series(length, seed=length))
+
+def analytics_cases(lengths: List[int], patient_counts: List[int], trend_max_length: int) -> List[Case]:
+    service = TimeSeriesService()
+    cases = []
+    for length in lengths:
+        def metric_trend(length=length):
+            values = _series(length)
+
+            def call():
+                with warnings.catch_warnings():
+                    # statsmodels convergence warnings on short series
+                    warnings.simplefilter("ignore")
+                    return service._calculate_metric_trend(values)
+            return call, length
+
+        if length <= trend_max_length:
+            cases.append(Case(f"metric_trend[{length}]", metric_trend))
+        cases.append(Case(
+            f"analyze_metric_history[{length}]",
+            lambda length=length: (lambda values=_series(length): service._analyze_metric_history(values), length)
+        ))
+        cases.append(Case(
+            f"trend_strength[{length}]",
+            lambda length=length: (lambda values=_series(length): service._calculate_trend_strength(values), length)
+        ))
+
+    for patients in patient_counts:
+        def batch_trends(patients=patients):
+            values = vital_signs(patients, 288, metrics=("heart_rate",), seed=patients)["heart_rate"]
+            return lambda: service.calculate_batch_trends(values), patients
+        cases.append(Case(f"batch_trends[{patients}x288]", batch_trends, unit="patients"))
+    return cases
+
+def ml_cases(patient_counts: List[int]) -> List[Case]:
+    if str(ML_SERVICE_SRC) not in sys.path:
+        sys.path.append(str(ML_SERVICE_SRC))
+    try:
+        from models.schemas import PatientMetrics, RiskPredictionRequest
+        from services.ml_service import MLService
+    except ImportError as e:
+        print(f"skipping MLService cases: {e}", file=sys.stderr)
+        return []
+
+    service = MLService()
+
+    def requests(n: int):
+        vitals = vital_signs(n, 1, missing_rate=0.0, seed=n)
+        return [
+            RiskPredictionRequest(
+                patient_age=30 + i % 60,
+                metrics=PatientMetrics(**{metric: float(values[i, 0]) for metric, values in vitals.items()})
+            )
+            for i in range(n)
+        ]
+
+    cases = [Case(
+        "predict_risk[1]",
+        lambda: (lambda request=requests(1)[0]: service.predict_risk(request, seed=0), 1),
+        unit="patients"
+    )]
+    for patients in patient_counts:
+        cases.append(Case(
+            f"predict_risk_batch[{patients}]",
+            lambda patients=patients: (
+                lambda batch=requests(patients): service.predict_risk_batch(batch, seed=0), patients
+            ),
+            unit="patients"
+        ))
+    return cases
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--full", action="store_true", help="include 1M-point series and 100k patients")
+    parser.add_argument("-k", dest="filter", help="only cases whose name contains this")
+    parser.add_argument("--no-ml", action="store_true", help="skip MLService cases")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed batch of calls")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a case regressed against the baseline")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="allowed throughput drop (fraction)")
+    parser.add_argument("--max-memory-growth", type=float, default=0.25, help="allowed peak memory growth (fraction)")
+    args = parser.parse_args(argv)
+
+    lengths = FULL_LENGTHS if args.full else LENGTHS
+    patient_counts = FULL_PATIENT_COUNTS if args.full else PATIENT_COUNTS
+    cases = analytics_cases(lengths, patient_counts, FULL_TREND_MAX_LENGTH if args.full else TREND_MAX_LENGTH)
+    if not args.no_ml:
+        cases += ml_cases(patient_counts)
+    if args.filter:
+        cases = [case for case in cases if args.filter in case.name]
+
+    baseline = load_baseline(args.baseline)
+    reference = baseline["results"] if baseline else {}
+    results = {}
+    print(f"{'case':<34} {'per call':>12} {'throughput':>22} {'peak MiB':>9} {'vs base':>8}")
+    for case in cases:
+        result = run_case(case, args.repeat, args.min_time)
+        results[case.name] = result
+        change = ""
+        if case.name in reference:
+            change = f"{result['throughput'] / reference[case.name]['throughput'] - 1:+.0%}"
+        print(f"{case.name:<34} {result['seconds_per_call'] * 1e3:>10.3f}ms "
+              f"{result['throughput']:>14.4g} {result['unit']:<7} "
+              f"{result['peak_memory_bytes'] / 2**20:>9.2f} {change:>8}")
+
+    if args.save_baseline:
+        # Keep baseline entries for cases not run this time (-k, --no-ml)
+        save_baseline(args.baseline, {**reference, **results})
+        print(f"baseline written to {args.baseline}")
+
+    if args.check:
+        if baseline is None:
+            print(f"no baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+            return 2
+        regressions = compare(results, reference, args.max_slowdown, args.max_memory_growth)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# benchmarks/synthetic.py
+from typing import Dict, Optional
+import numpy as np
+
+# Baseline mean, between-patient spread, within-patient noise, clinical bounds
+VITAL_PROFILES = {
+    "heart_rate": (78.0, 10.0, 3.0, (30.0, 200.0)),
+    "blood_pressure_systolic": (122.0, 14.0, 5.0, (70.0, 220.0)),
+    "blood_pressure_diastolic": (78.0, 9.0, 4.0, (40.0, 130.0)),
+    "temperature": (36.9, 0.3, 0.1, (34.0, 41.5)),
+    "oxygen_saturation": (97.0, 1.5, 0.8, (70.0, 100.0)),
+    "respiratory_rate": (16.0, 2.5, 1.2, (6.0, 40.0)),
+}
+
+def vital_signs(
+    n_patients: int,
+    length: int,
+    metrics=tuple(VITAL_PROFILES),
+    missing_rate: float = 0.02,
+    seed: Optional[int] = 0
+) -> Dict[str, np.ndarray]:
+    """
+    Synthetic chronological vital-sign series, one (n_patients, length) array
+    per metric. Each patient gets its own baseline, a linear drift (some
+    patients deteriorate, some recover), a slow circadian component, AR(1)
+    measurement noise and randomly missing readings (NaN).
+    """
+    rng = np.random.default_rng(seed)
+    steps = np.arange(length)
+    series = {}
+    for metric in metrics:
+        base, spread, noise, (low, high) = VITAL_PROFILES[metric]
+        baseline = rng.normal(base, spread, (n_patients, 1))
+        drift = rng.normal(0, noise / max(length, 1) * 5, (n_patients, 1)) * steps
+        phase = rng.uniform(0, 2 * np.pi, (n_patients, 1))
+        circadian = 0.5 * noise * np.sin(2 * np.pi * steps / max(length, 24) + phase)
+
+        shocks = rng.normal(0, noise, (n_patients, length))
+        ar_noise = np.empty_like(shocks)
+        ar_noise[:, 0] = shocks[:, 0]
+        for t in range(1, length):
+            ar_noise[:, t] = 0.6 * ar_noise[:, t - 1] + shocks[:, t]
+
+        values = np.clip(baseline + drift + circadian + ar_noise, low, high)
+        if missing_rate > 0:
+            values[rng.random(values.shape) < missing_rate] = np.nan
+        series[metric] = values
+    return series
+
+def vital_series(length: int, metric: str = "heart_rate", seed: Optional[int] = 0) -> np.ndarray:
+    """
+    A single synthetic series without missing readings
+    """
+    return vital_signs(1, length, metrics=(metric,), missing_rate=0.0, seed=seed)[metric][0]
+
+def pgcopy_binary(columns: Dict[str, np.ndarray], timestamps: Optional[np.ndarray] = None) -> bytes:
+    """
+    The binary COPY stream Postgres sends for columnar_fetch.metric_columns_query
+    (NaN for missing readings, as the query's COALESCE produces)
+    """
+    from src.services.columnar_fetch import PGCOPY_SIGNATURE, POSTGRES_EPOCH_US, copy_row_dtype
+
+    metrics = list(columns)
+    with_timestamp = timestamps is not None
+    n = len(timestamps) if with_timestamp else len(columns[metrics[0]])
+    rows = np.zeros(n, dtype=copy_row_dtype(metrics, with_timestamp))
+    rows["field_count"] = len(metrics) + with_timestamp
+    if with_timestamp:
+        rows["timestamp_length"] = 8
+        rows["timestamp"] = timestamps.astype("datetime64[us]").astype(np.int64) - POSTGRES_EPOCH_US
+    for metric in metrics:
+        rows[f"{metric}_length"] = 8
+        rows[metric] = columns[metric]
+    header = PGCOPY_SIGNATURE + (0).to_bytes(4, "big") + (0).to_bytes(4, "big")
+    return header + rows.tobytes() + (-1).to_bytes(2, "big", signed=True)
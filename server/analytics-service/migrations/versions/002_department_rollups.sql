@@ -0,0 +1,51 @@
+-- migrations/versions/002_department_rollups.sql
+-- Hourly and daily rollups of department_metrics.
+-- Rollups keep sums, sample counts and maxima rather than averages, so any
+-- coarser period (and any mix of rollup and raw rows) can be recombined as
+-- weighted averages. They are refreshed by the analytics-service rollup
+-- scheduler, which records how far each one is materialized.
+
+-- Superseded by department_metrics_daily; it was never read or refreshed
+DROP MATERIALIZED VIEW IF EXISTS daily_department_stats;
+
+CREATE MATERIALIZED VIEW department_metrics_hourly
+WITH (timescaledb.continuous, timescaledb.materialized_only = true) AS
+SELECT
+    department_id,
+    time_bucket(INTERVAL '1 hour', timestamp) AS bucket,
+    COUNT(patient_count) AS patient_samples,
+    SUM(patient_count) AS patient_sum,
+    MAX(patient_count) AS peak_patients,
+    COUNT(utilization_rate) AS utilization_samples,
+    SUM(utilization_rate) AS utilization_sum,
+    COUNT(avg_wait_time) AS wait_samples,
+    SUM(EXTRACT(epoch FROM avg_wait_time)) AS wait_seconds_sum
+FROM department_metrics
+GROUP BY department_id, time_bucket(INTERVAL '1 hour', timestamp)
+WITH NO DATA;
+
+CREATE MATERIALIZED VIEW department_metrics_daily
+WITH (timescaledb.continuous, timescaledb.materialized_only = true) AS
+SELECT
+    department_id,
+    time_bucket(INTERVAL '1 day', timestamp) AS bucket,
+    COUNT(patient_count) AS patient_samples,
+    SUM(patient_count) AS patient_sum,
+    MAX(patient_count) AS peak_patients,
+    COUNT(utilization_rate) AS utilization_samples,
+    SUM(utilization_rate) AS utilization_sum,
+    COUNT(avg_wait_time) AS wait_samples,
+    SUM(EXTRACT(epoch FROM avg_wait_time)) AS wait_seconds_sum
+FROM department_metrics
+GROUP BY department_id, time_bucket(INTERVAL '1 day', timestamp)
+WITH NO DATA;
+
+CREATE INDEX idx_department_metrics_hourly ON department_metrics_hourly(department_id, bucket);
+CREATE INDEX idx_department_metrics_daily ON department_metrics_daily(department_id, bucket);
+
+-- Everything before refreshed_until is materialized in the rollup
+CREATE TABLE rollup_watermarks (
+    rollup_name TEXT PRIMARY KEY,
+    refreshed_until TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,18 @@
+-- migrations/versions/003_health_metric_sketches.sql
+-- Per patient, metric and UTC day: moments plus a serialized t-digest
+-- (see src/services/quantile_sketch.py). Maintained at ingest by
+-- analytics-service and merged to answer long-range history queries
+-- without scanning raw readings.
+CREATE TABLE health_metric_daily_sketches (
+    patient_id UUID NOT NULL,
+    metric VARCHAR(50) NOT NULL,
+    day DATE NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_squares DOUBLE PRECISION NOT NULL DEFAULT 0,
+    -- sum of (position of the reading within the day * value), for trend strength
+    sum_index_products DOUBLE PRECISION NOT NULL DEFAULT 0,
+    digest BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (patient_id, metric, day)
+);
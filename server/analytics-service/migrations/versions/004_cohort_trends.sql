@@ -0,0 +1,41 @@
+-- migrations/versions/004_cohort_trends.sql
+-- Support for population-level (cohort) trends.
+
+-- Which department a patient was in and when. A cohort is every patient
+-- whose stay overlaps the requested window. Maintained from admission,
+-- transfer and discharge events (POST /api/admissions/transfers).
+CREATE TABLE patient_departments (
+    patient_id UUID NOT NULL,
+    department_id UUID NOT NULL,
+    admitted_at TIMESTAMPTZ NOT NULL,
+    discharged_at TIMESTAMPTZ,
+    PRIMARY KEY (patient_id, admitted_at)
+);
+
+CREATE INDEX idx_patient_departments_dept ON patient_departments(department_id, admitted_at, discharged_at);
+
+-- Hourly per-patient sums and counts of every vital. Real-time aggregation
+-- (materialized_only = false) unions in rows newer than the last refresh,
+-- so cohort trends never lag ingest; the rollup scheduler refreshes it.
+CREATE MATERIALIZED VIEW patient_metrics_hourly
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    patient_id,
+    time_bucket(INTERVAL '1 hour', timestamp) AS bucket,
+    COUNT(heart_rate) AS heart_rate_count,
+    SUM(heart_rate) AS heart_rate_sum,
+    COUNT(blood_pressure_systolic) AS blood_pressure_systolic_count,
+    SUM(blood_pressure_systolic) AS blood_pressure_systolic_sum,
+    COUNT(blood_pressure_diastolic) AS blood_pressure_diastolic_count,
+    SUM(blood_pressure_diastolic) AS blood_pressure_diastolic_sum,
+    COUNT(temperature) AS temperature_count,
+    SUM(temperature) AS temperature_sum,
+    COUNT(oxygen_saturation) AS oxygen_saturation_count,
+    SUM(oxygen_saturation) AS oxygen_saturation_sum,
+    COUNT(respiratory_rate) AS respiratory_rate_count,
+    SUM(respiratory_rate) AS respiratory_rate_sum
+FROM health_metrics
+GROUP BY patient_id, time_bucket(INTERVAL '1 hour', timestamp)
+WITH NO DATA;
+
+CREATE INDEX idx_patient_metrics_hourly ON patient_metrics_hourly(patient_id, bucket);
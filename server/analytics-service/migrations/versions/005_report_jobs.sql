@@ -0,0 +1,27 @@
+-- migrations/versions/005_report_jobs.sql
+-- Asynchronous report jobs. A job is identified for deduplication by
+-- params_hash (report type, normalized parameters and output format): while
+-- one is queued, running or succeeded (and not yet expired), identical
+-- submissions return it instead of creating another.
+CREATE TABLE report_jobs (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    report_type VARCHAR(50) NOT NULL,
+    params JSONB NOT NULL,
+    params_hash CHAR(64) NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    chunks_total INTEGER,
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    rows_written BIGINT NOT NULL DEFAULT 0,
+    result_path TEXT,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    expires_at TIMESTAMPTZ
+);
+
+CREATE UNIQUE INDEX idx_report_jobs_dedup ON report_jobs(params_hash)
+    WHERE status IN ('queued', 'running', 'succeeded');
+CREATE INDEX idx_report_jobs_queue ON report_jobs(created_at) WHERE status = 'queued';
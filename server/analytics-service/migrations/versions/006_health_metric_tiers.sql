@@ -0,0 +1,109 @@
+-- migrations/versions/006_health_metric_tiers.sql
+-- Storage tiers for health_metrics, read by the history planner in
+-- src/services/history_tiers.py:
+--   raw         full resolution, compressed once chunks are 7 days old,
+--               read back HISTORY_RAW_RETENTION_DAYS
+--   minute      per patient and minute, read back HISTORY_MINUTE_RETENTION_DAYS
+--   hour        per patient and hour
+-- plus the daily sketches of 003. Aggregates keep counts, sums, sums of
+-- squares and extremes, so mean, std, min and max over any mix of tiers
+-- stay exact. Every tier is kept indefinitely unless retention is enabled
+-- (see the end of this file).
+
+-- Compressed chunks are columnar per patient, so one patient's history
+-- decompresses on its own and in timestamp order
+ALTER TABLE health_metrics SET (
+    timescaledb.compress,
+    timescaledb.compress_segmentby = 'patient_id',
+    timescaledb.compress_orderby = 'timestamp'
+);
+SELECT add_compression_policy('health_metrics', INTERVAL '7 days');
+
+-- Real-time aggregates: rows newer than the last refresh are aggregated
+-- from health_metrics at query time. Refreshed by the rollup scheduler.
+CREATE MATERIALIZED VIEW health_metrics_1m
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    patient_id,
+    time_bucket(INTERVAL '1 minute', timestamp) AS bucket,
+    COUNT(heart_rate) AS heart_rate_count,
+    SUM(heart_rate) AS heart_rate_sum,
+    SUM(heart_rate * heart_rate) AS heart_rate_sum_squares,
+    MIN(heart_rate) AS heart_rate_min,
+    MAX(heart_rate) AS heart_rate_max,
+    COUNT(blood_pressure_systolic) AS blood_pressure_systolic_count,
+    SUM(blood_pressure_systolic) AS blood_pressure_systolic_sum,
+    SUM(blood_pressure_systolic * blood_pressure_systolic) AS blood_pressure_systolic_sum_squares,
+    MIN(blood_pressure_systolic) AS blood_pressure_systolic_min,
+    MAX(blood_pressure_systolic) AS blood_pressure_systolic_max,
+    COUNT(blood_pressure_diastolic) AS blood_pressure_diastolic_count,
+    SUM(blood_pressure_diastolic) AS blood_pressure_diastolic_sum,
+    SUM(blood_pressure_diastolic * blood_pressure_diastolic) AS blood_pressure_diastolic_sum_squares,
+    MIN(blood_pressure_diastolic) AS blood_pressure_diastolic_min,
+    MAX(blood_pressure_diastolic) AS blood_pressure_diastolic_max,
+    COUNT(temperature) AS temperature_count,
+    SUM(temperature) AS temperature_sum,
+    SUM(temperature * temperature) AS temperature_sum_squares,
+    MIN(temperature) AS temperature_min,
+    MAX(temperature) AS temperature_max,
+    COUNT(oxygen_saturation) AS oxygen_saturation_count,
+    SUM(oxygen_saturation) AS oxygen_saturation_sum,
+    SUM(oxygen_saturation * oxygen_saturation) AS oxygen_saturation_sum_squares,
+    MIN(oxygen_saturation) AS oxygen_saturation_min,
+    MAX(oxygen_saturation) AS oxygen_saturation_max,
+    COUNT(respiratory_rate) AS respiratory_rate_count,
+    SUM(respiratory_rate) AS respiratory_rate_sum,
+    SUM(respiratory_rate * respiratory_rate) AS respiratory_rate_sum_squares,
+    MIN(respiratory_rate) AS respiratory_rate_min,
+    MAX(respiratory_rate) AS respiratory_rate_max
+FROM health_metrics
+GROUP BY patient_id, time_bucket(INTERVAL '1 minute', timestamp)
+WITH NO DATA;
+
+CREATE INDEX idx_health_metrics_1m ON health_metrics_1m(patient_id, bucket);
+
+-- Built on the minute tier, so it outlives it
+CREATE MATERIALIZED VIEW health_metrics_1h
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    patient_id,
+    time_bucket(INTERVAL '1 hour', bucket) AS bucket,
+    SUM(heart_rate_count) AS heart_rate_count,
+    SUM(heart_rate_sum) AS heart_rate_sum,
+    SUM(heart_rate_sum_squares) AS heart_rate_sum_squares,
+    MIN(heart_rate_min) AS heart_rate_min,
+    MAX(heart_rate_max) AS heart_rate_max,
+    SUM(blood_pressure_systolic_count) AS blood_pressure_systolic_count,
+    SUM(blood_pressure_systolic_sum) AS blood_pressure_systolic_sum,
+    SUM(blood_pressure_systolic_sum_squares) AS blood_pressure_systolic_sum_squares,
+    MIN(blood_pressure_systolic_min) AS blood_pressure_systolic_min,
+    MAX(blood_pressure_systolic_max) AS blood_pressure_systolic_max,
+    SUM(blood_pressure_diastolic_count) AS blood_pressure_diastolic_count,
+    SUM(blood_pressure_diastolic_sum) AS blood_pressure_diastolic_sum,
+    SUM(blood_pressure_diastolic_sum_squares) AS blood_pressure_diastolic_sum_squares,
+    MIN(blood_pressure_diastolic_min) AS blood_pressure_diastolic_min,
+    MAX(blood_pressure_diastolic_max) AS blood_pressure_diastolic_max,
+    SUM(temperature_count) AS temperature_count,
+    SUM(temperature_sum) AS temperature_sum,
+    SUM(temperature_sum_squares) AS temperature_sum_squares,
+    MIN(temperature_min) AS temperature_min,
+    MAX(temperature_max) AS temperature_max,
+    SUM(oxygen_saturation_count) AS oxygen_saturation_count,
+    SUM(oxygen_saturation_sum) AS oxygen_saturation_sum,
+    SUM(oxygen_saturation_sum_squares) AS oxygen_saturation_sum_squares,
+    MIN(oxygen_saturation_min) AS oxygen_saturation_min,
+    MAX(oxygen_saturation_max) AS oxygen_saturation_max,
+    SUM(respiratory_rate_count) AS respiratory_rate_count,
+    SUM(respiratory_rate_sum) AS respiratory_rate_sum,
+    SUM(respiratory_rate_sum_squares) AS respiratory_rate_sum_squares,
+    MIN(respiratory_rate_min) AS respiratory_rate_min,
+    MAX(respiratory_rate_max) AS respiratory_rate_max
+FROM health_metrics_1m
+GROUP BY patient_id, time_bucket(INTERVAL '1 hour', bucket)
+WITH NO DATA;
+
+CREATE INDEX idx_health_metrics_1h ON health_metrics_1h(patient_id, bucket);
+
+-- No retention policy is installed here: dropping chunks deletes readings
+-- for good. Retention is opt-in through HISTORY_RETENTION_ENABLED and
+-- `python -m src.services.retention` (see src/services/retention.py).
@@ -0,0 +1,7 @@
+-- migrations/versions/007_range_scan_indexes.sql
+-- Metrics summaries read treatment_outcomes by created_at, and long windows
+-- are read as chunk-aligned pieces on concurrent connections (see
+-- QUERY_FANOUT_* settings). department_metrics is a hypertable, so each
+-- piece only scans its own chunks. treatment_outcomes is a plain table and
+-- needs this index, or every piece would scan the whole table.
+CREATE INDEX idx_treatment_outcomes_created ON treatment_outcomes(created_at);
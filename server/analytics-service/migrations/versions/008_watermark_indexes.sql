@@ -0,0 +1,8 @@
+-- migrations/versions/008_watermark_indexes.sql
+-- Dashboard ETags are built from the latest write to each table a response
+-- reads (see src/core/responses.py). department_metrics and health_metrics
+-- answer MAX(timestamp) from their existing time indexes and
+-- treatment_outcomes from idx_treatment_outcomes_created (007).
+-- patient_analytics needs its own index on updated_at, which the summary
+-- window filter also uses.
+CREATE INDEX idx_patient_analytics_updated ON patient_analytics(updated_at);
@@ -0,0 +1,85 @@
+-- migrations/versions/009_risk_scoring.sql
+-- Scheduled bulk risk scoring (src/services/risk_scoring.py). Each run
+-- re-scores the patients with readings since the previous run and upserts
+-- their scores into patient_analytics, which keeps one row per patient.
+
+-- Keep each patient's latest row before making patient_id unique. Older
+-- rows are moved, not deleted, to patient_analytics_archive; review them
+-- there and drop the table once they are no longer needed.
+CREATE TABLE patient_analytics_archive (
+    LIKE patient_analytics INCLUDING DEFAULTS,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+WITH superseded AS (
+    DELETE FROM patient_analytics pa
+    USING patient_analytics newer
+    WHERE
+        newer.patient_id = pa.patient_id
+        AND (COALESCE(newer.updated_at, '-infinity'), newer.id) > (COALESCE(pa.updated_at, '-infinity'), pa.id)
+    RETURNING pa.*
+)
+INSERT INTO patient_analytics_archive (
+    id, patient_id, risk_score, condition_count, last_visit, readmission_risk, updated_at
+)
+SELECT
+    id, patient_id, risk_score, condition_count, last_visit, readmission_risk, updated_at
+FROM superseded;
+
+CREATE UNIQUE INDEX idx_patient_analytics_patient ON patient_analytics(patient_id);
+
+-- patient_risk_trends becomes a table updated incrementally as scores are
+-- written: each score is folded into its patient and week. As a view over
+-- patient_analytics it would only ever see each patient's latest score.
+DROP MATERIALIZED VIEW IF EXISTS patient_risk_trends;
+
+CREATE TABLE patient_risk_trends (
+    patient_id UUID NOT NULL,
+    week TIMESTAMPTZ NOT NULL,
+    risk_score_sum FLOAT NOT NULL,
+    risk_score_count INTEGER NOT NULL,
+    avg_risk_score FLOAT GENERATED ALWAYS AS (risk_score_sum / NULLIF(risk_score_count, 0)) STORED,
+    max_risk_score FLOAT NOT NULL,
+    min_risk_score FLOAT NOT NULL,
+    PRIMARY KEY (patient_id, week)
+);
+
+INSERT INTO patient_risk_trends (patient_id, week, risk_score_sum, risk_score_count, max_risk_score, min_risk_score)
+SELECT
+    patient_id,
+    date_trunc('week', updated_at),
+    SUM(risk_score),
+    COUNT(risk_score),
+    MAX(risk_score),
+    MIN(risk_score)
+FROM (
+    -- Superseded scores still count towards their week
+    SELECT patient_id, risk_score, updated_at FROM patient_analytics
+    UNION ALL
+    SELECT patient_id, risk_score, updated_at FROM patient_analytics_archive
+) scores
+WHERE risk_score IS NOT NULL AND updated_at IS NOT NULL
+GROUP BY patient_id, date_trunc('week', updated_at);
+
+-- One row per scoring run. A run scores patients in patient_id order and
+-- commits after_patient_id with each batch, so an interrupted run resumes
+-- after the last committed patient.
+CREATE TABLE risk_scoring_runs (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    -- Readings up to started_at are read; patients with one since
+    -- changed_since are scored
+    started_at TIMESTAMPTZ NOT NULL,
+    changed_since TIMESTAMPTZ NOT NULL,
+    after_patient_id UUID,
+    patients_scored INTEGER NOT NULL DEFAULT 0,
+    patients_skipped INTEGER NOT NULL DEFAULT 0,
+    -- Consecutive rejections of the page after after_patient_id by
+    -- ml-service; at RISK_SCORING_PAGE_ATTEMPTS its patients are skipped
+    page_failures INTEGER NOT NULL DEFAULT 0,
+    -- Time spent in batches, excluding any gap before a resume
+    scoring_seconds FLOAT NOT NULL DEFAULT 0,
+    completed_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_risk_scoring_runs_started ON risk_scoring_runs(started_at DESC);
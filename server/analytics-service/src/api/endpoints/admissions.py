@@ -0,0 +1,29 @@
+# src/api/endpoints/admissions.py
+from fastapi import APIRouter, HTTPException
+from typing import List
+from src.core.config import settings
+from src.core.errors import ServiceUnavailableError
+from src.models.schemas import PatientTransfer
+from src.services.department_stays import DepartmentStayService
+
+router = APIRouter()
+department_stay_service = DepartmentStayService()
+
+@router.post("/transfers", status_code=201)
+async def record_transfers(transfers: List[PatientTransfer]):
+    """
+    Record admissions, transfers between departments and discharges
+    (department_id null). Department membership drives cohort trends.
+    """
+    if len(transfers) > settings.INGEST_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.INGEST_MAX_ROWS} rows"
+        )
+
+    try:
+        return await department_stay_service.record_transfers(transfers)
+    except ServiceUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
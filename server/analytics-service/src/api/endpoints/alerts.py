@@ -0,0 +1,32 @@
+# src/api/endpoints/alerts.py
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List
+from src.services.alert_service import alert_service
+
+router = APIRouter()
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+@router.get("/stream")
+async def stream_alerts(
+    patient_id: List[str] = Query([], description="Patients to follow (repeatable)"),
+    department_id: List[str] = Query([], description="Departments to follow (repeatable)")
+):
+    """
+    Server-Sent Events stream of vital sign alerts for the given patients
+    and departments. Sends an `alert` event when a threshold or trend rule
+    is triggered or resolved and a `lagged` event with the number of alerts
+    missed when the client reads too slowly.
+    """
+    if not patient_id and not department_id:
+        raise HTTPException(status_code=400, detail="Subscribe to at least one patient_id or department_id")
+
+    subscription = alert_service.broker.subscribe(
+        [f"patient:{p}" for p in patient_id] + [f"department:{d}" for d in department_id]
+    )
+    return StreamingResponse(
+        alert_service.stream(subscription),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
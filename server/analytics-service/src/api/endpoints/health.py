@@ -1,7 +1,12 @@
 # src/api/endpoints/health.py
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from datetime import datetime
 import psutil
+from src.core.config import db_pool, cpu_executor, warmup
+from src.services.alert_service import alert_service
+from src.services.cache_service import cache
+from src.services.risk_scoring import risk_scoring_scheduler
 
 router = APIRouter()
 
@@ -18,5 +23,23 @@ async def health_check():
             "cpu_percent": psutil.cpu_percent(),
             "memory_percent": psutil.virtual_memory().percent,
             "disk_usage_percent": psutil.disk_usage('/').percent
-        }
-    }
\ No newline at end of file
+        },
+        "database_pool": db_pool.stats(),
+        "cache": cache.stats(),
+        "cpu_executor": cpu_executor.stats(),
+        "alerts": alert_service.stats(),
+        "warmup": warmup.stats(),
+        "risk_scoring": risk_scoring_scheduler.stats()
+    }
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    200 once the database pool is connected and the warm-up has finished,
+    503 before that
+    """
+    ready = db_pool.database.is_connected and warmup.ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming", "warmup": warmup.stats()}
+    )
\ No newline at end of file
@@ -1,10 +1,19 @@
 # src/api/endpoints/metrics.py
-from fastapi import APIRouter, Query, HTTPException
-from typing import List, Optional
-from datetime import datetime, timedelta
-from src.models.schemas import HealthMetric, MetricsSummary
+from fastapi import APIRouter, Query, HTTPException, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple, Dict, Any
+from datetime import datetime, timedelta, timezone
+import json
+from pydantic import ValidationError
+from src.core.config import settings
+from src.core.errors import ServiceUnavailableError
+from src.core.responses import conditional_json, etag_for
+from src.models.schemas import HealthMetric, MetricsSummary, MetricsSummaryBatch, MetricsSummaryRequest, BatchIngestResponse
 from src.services.analytics_service import AnalyticsService
 from src.services.time_series_service import TimeSeriesService
+from src.services.history_export import (
+    ARROW_MEDIA_TYPE, NDJSON_MEDIA_TYPE, arrow_available, arrow_stream, ndjson_stream
+)
 
 router = APIRouter()
 analytics_service = AnalyticsService()
@@ -12,17 +21,42 @@ time_series_service = TimeSeriesService()
 
 @router.get("/summary", response_model=MetricsSummary)
 async def get_metrics_summary(
+    request: Request,
     time_period: str = Query(..., description="Time period for summary (daily, weekly, monthly)"),
     department_id: Optional[str] = Query(None, description="Filter by department ID")
 ):
     """
-    Get a summary of key metrics for the specified time period
+    Get a summary of key metrics for the specified time period.
+    Conditional on If-None-Match (see src/core/responses.py).
     """
     try:
-        return await analytics_service.get_metrics_summary(time_period, department_id)
+        watermark = await analytics_service.summary_watermark(department_id)
+        return await conditional_json(
+            request,
+            etag_for("summary", time_period, department_id, watermark),
+            lambda: analytics_service.get_metrics_summary(time_period, department_id)
+        )
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/summary/batch", response_model=MetricsSummaryBatch)
+async def get_metrics_summaries(request: MetricsSummaryRequest):
+    """
+    Summaries for several periods and departments in one call, e.g. the
+    daily, weekly and monthly cards of a dashboard
+    """
+    try:
+        summaries = await analytics_service.get_metrics_summaries(request.time_periods, request.department_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ServiceUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"summaries": summaries}
+
 @router.post("/health-metrics", status_code=201)
 async def record_health_metrics(metric: HealthMetric):
     """
@@ -30,50 +64,203 @@ async def record_health_metrics(metric: HealthMetric):
     """
     try:
         return await time_series_service.record_health_metrics(metric)
+    except ServiceUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/health-metrics/batch", response_model=BatchIngestResponse)
+async def record_health_metrics_batch(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    trends: str = Query("deferred", pattern="^(none|deferred|inline)$",
+                        description="none, deferred (after the response) or inline")
+):
+    """
+    Record a batch of health metrics sent as a JSON array or as NDJSON
+    (Content-Type: application/x-ndjson). Trends are recomputed at most
+    once per patient in the batch.
+    """
+    rows = _parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    if len(rows) > settings.INGEST_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.INGEST_MAX_ROWS} rows"
+        )
+
+    metrics, results = _validate_batch_rows(rows)
+
+    try:
+        written = await time_series_service.record_health_metrics_batch(
+            [metric for _, metric in metrics]
+        )
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    recorded_at = datetime.now(timezone.utc)
+
+    accepted_metrics = []
+    for (index, metric), outcome in zip(metrics, written):
+        results[index] = {"index": index, **outcome}
+        if outcome["status"] == "accepted":
+            accepted_metrics.append(metric)
+
+    response = {
+        "accepted": sum(1 for r in results if r["status"] == "accepted"),
+        "rejected": sum(1 for r in results if r["status"] == "rejected"),
+        "results": results,
+        "trends": None
+    }
+
+    if accepted_metrics and trends == "inline":
+        response["trends"] = await time_series_service.calculate_trends_for_metrics(accepted_metrics, recorded_at)
+    elif accepted_metrics and trends == "deferred":
+        background_tasks.add_task(time_series_service.calculate_trends_for_metrics, accepted_metrics, recorded_at)
+
+    return response
+
+def _stream_patient_metrics(
+    patient_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    metric_type: Optional[str],
+    format: str
+) -> StreamingResponse:
+    try:
+        metrics = time_series_service.history_metrics(metric_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    chunks = time_series_service.iter_patient_metric_chunks(patient_id, start_date, end_date, metrics)
+    if format == "arrow":
+        if not arrow_available():
+            raise HTTPException(status_code=406, detail="Arrow output requires pyarrow")
+        return StreamingResponse(arrow_stream(chunks, metrics), media_type=ARROW_MEDIA_TYPE)
+    return StreamingResponse(
+        ndjson_stream(chunks, metrics, start_date, end_date),
+        media_type=NDJSON_MEDIA_TYPE
+    )
+
+def _parse_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """
+    Decode a JSON array or NDJSON request body into a list of raw rows.
+    Undecodable NDJSON lines are kept as their raw text so they can be
+    rejected individually instead of failing the whole batch.
+    """
+    if "ndjson" in content_type:
+        rows = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(line.decode("utf-8", errors="replace"))
+        return rows
+
+    try:
+        rows = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of health metrics")
+    return rows
+
+def _validate_batch_rows(rows: List[Any]) -> Tuple[List[Tuple[int, HealthMetric]], List[Dict[str, Any]]]:
+    """
+    Validate each row against HealthMetric. Returns the valid (index, metric)
+    pairs and a result list pre-filled with rejections for invalid rows.
+    """
+    metrics = []
+    results: List[Dict[str, Any]] = [None] * len(rows)
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {"index": index, "status": "rejected", "error": "Expected a JSON object"}
+            continue
+        try:
+            metrics.append((index, HealthMetric(**row)))
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            results[index] = {"index": index, "status": "rejected", "error": errors}
+    return metrics, results
 
 @router.get("/patient/{patient_id}/history")
 async def get_patient_metrics(
+    request: Request,
     patient_id: str,
     start_date: datetime = Query(...),
     end_date: datetime = Query(...),
-    metric_type: Optional[str] = Query(None)
+    metric_type: Optional[str] = Query(None),
+    format: Optional[str] = Query(
+        None, pattern="^(ndjson|arrow)$",
+        description="Stream raw readings as NDJSON (ending with a summary line) or Arrow IPC"
+    ),
+    resolution: Optional[str] = Query(
+        None, pattern="^(raw|minute|hour|day)$",
+        description="Coarsest history tier the summary may use; defaults by range length"
+    )
 ):
     """
-    Get historical health metrics for a specific patient
+    Get historical health metrics for a specific patient.
+    The JSON summary is conditional on If-None-Match.
     """
+    if format:
+        return _stream_patient_metrics(patient_id, start_date, end_date, metric_type, format)
+
     try:
-        return await time_series_service.get_patient_metrics(
-            patient_id, 
-            start_date, 
-            end_date, 
-            metric_type
+        watermark = await time_series_service.history_watermark(patient_id)
+        return await conditional_json(
+            request,
+            etag_for("history", patient_id, start_date, end_date, metric_type, resolution, watermark),
+            lambda: time_series_service.get_patient_metrics(
+                patient_id, 
+                start_date, 
+                end_date, 
+                metric_type,
+                resolution
+            )
         )
+    except ServiceUnavailableError:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/department/{department_id}/utilization")
 async def get_department_utilization(
+    request: Request,
     department_id: str,
     period: str = Query(..., description="hourly, daily, or weekly"),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None
 ):
     """
-    Get department utilization metrics over time
+    Get department utilization metrics over time.
+    Conditional on If-None-Match.
     """
     try:
         if not end_date:
-            end_date = datetime.now()
+            # Whole minutes, so repeated dashboard requests share a cache key
+            end_date = datetime.now().replace(second=0, microsecond=0)
         if not start_date:
             start_date = end_date - timedelta(days=30)
             
-        return await analytics_service.get_department_utilization(
-            department_id,
-            period,
-            start_date,
-            end_date
+        watermark = await analytics_service.department_watermark(department_id)
+        return await conditional_json(
+            request,
+            etag_for("utilization", department_id, period, start_date, end_date, watermark),
+            lambda: analytics_service.get_department_utilization(
+                department_id,
+                period,
+                start_date,
+                end_date
+            )
         )
+    except ServiceUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
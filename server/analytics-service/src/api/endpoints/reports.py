@@ -0,0 +1,60 @@
+# src/api/endpoints/reports.py
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import FileResponse
+from pathlib import Path
+from uuid import UUID
+from src.core.errors import ServiceUnavailableError
+from src.models.schemas import ReportJob, ReportJobRequest
+from src.services.report_service import MEDIA_TYPES, ReportError, report_service
+
+router = APIRouter()
+
+@router.post("", response_model=ReportJob, status_code=202)
+async def submit_report(request: ReportJobRequest, response: Response):
+    """
+    Queue a report. Identical requests (same type, parameters and format)
+    return the existing job while it is queued, running or its result is
+    still cached.
+    """
+    try:
+        job = await report_service.submit(request.report_type, request.params, request.format)
+    except ReportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ServiceUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job["deduplicated"] and job["status"] == "succeeded":
+        response.status_code = 200
+    response.headers["Location"] = f"/api/reports/{job['id']}"
+    return job
+
+@router.get("/{job_id}", response_model=ReportJob)
+async def get_report_job(job_id: UUID):
+    """
+    Job status and progress
+    """
+    job = await report_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+@router.get("/{job_id}/download")
+async def download_report(job_id: UUID):
+    """
+    The finished report file
+    """
+    job = await report_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Report failed: {job['error']}")
+    if job["status"] in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Report is {job['status']}")
+    if job["status"] == "expired" or not job["result_path"] or not Path(job["result_path"]).is_file():
+        raise HTTPException(status_code=410, detail="Report result has expired; submit it again")
+    return FileResponse(
+        job["result_path"],
+        media_type=MEDIA_TYPES[job["format"]],
+        filename=f"{job['report_type']}-{job['id']}.{job['format']}"
+    )
@@ -0,0 +1,34 @@
+# src/api/endpoints/trends.py
+from fastapi import APIRouter, Query, HTTPException
+from typing import Optional
+from src.core.errors import ServiceUnavailableError
+from src.services.cohort_service import CohortTrendService
+
+router = APIRouter()
+cohort_service = CohortTrendService()
+
+@router.get("/cohort")
+async def get_cohort_trends(
+    metric: str = Query(..., description="Vital to trend, e.g. oxygen_saturation"),
+    department_id: Optional[str] = Query(None, description="Restrict to patients in this department"),
+    hours: float = Query(24, gt=0, le=24 * 31, description="Window length ending now"),
+    bucket_minutes: int = Query(60, ge=5, le=1440, description="Bucket size; whole hours use the hourly aggregate"),
+    stable_band: Optional[float] = Query(
+        None, ge=0, description="Slopes (per hour) within +/- this band count as stable"
+    ),
+    min_buckets: int = Query(3, ge=2, description="Buckets a patient needs to get a slope")
+):
+    """
+    Population-level trends: distribution of per-patient slopes, share of
+    patients rising/falling/stable, steepest movers and the cohort mean per bucket
+    """
+    try:
+        return await cohort_service.get_cohort_trends(
+            metric, department_id, hours, bucket_minutes, stable_band, min_buckets
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ServiceUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
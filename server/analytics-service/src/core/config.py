@@ -2,7 +2,10 @@
 from pydantic import BaseModel
 import os
 from databases import Database
-from contextlib import asynccontextmanager
+from src.core.database import DatabasePool
+from src.core.executor import CpuExecutor
+from src.core.metrics import CPU_EXECUTOR_IN_FLIGHT, DB_POOL_CONNECTIONS, MetricsSampler
+from src.core.warmup import Warmup
 
 class Settings(BaseModel):
     DB_HOST: str = os.getenv("DB_HOST", "localhost")
@@ -14,6 +17,114 @@ class Settings(BaseModel):
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     AUTH_SERVICE_URL: str = os.getenv("AUTH_SERVICE_URL", "http://localhost:4001")
 
+    # Connection pool
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    DB_POOL_ACQUIRE_TIMEOUT: float = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+    DB_POOL_MAX_INACTIVE_LIFETIME: float = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+    # CPU-bound analytics pool ("thread" or "process")
+    CPU_EXECUTOR_KIND: str = os.getenv("CPU_EXECUTOR_KIND", "thread")
+    CPU_EXECUTOR_WORKERS: int = int(os.getenv("CPU_EXECUTOR_WORKERS", "4"))
+    CPU_EXECUTOR_MAX_QUEUE: int = int(os.getenv("CPU_EXECUTOR_MAX_QUEUE", "32"))
+    CPU_EXECUTOR_RETRY_AFTER: int = int(os.getenv("CPU_EXECUTOR_RETRY_AFTER", "2"))
+
+    # Ingestion
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+    INGEST_MAX_ROWS: int = int(os.getenv("INGEST_MAX_ROWS", "50000"))
+
+    # Rows per server-side cursor fetch when streaming patient history
+    HISTORY_STREAM_CHUNK_SIZE: int = int(os.getenv("HISTORY_STREAM_CHUNK_SIZE", "5000"))
+
+    # Query result cache (in-process LRU in front of Redis)
+    CACHE_TTL_SECONDS: float = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+    CACHE_LOCAL_TTL_SECONDS: float = float(os.getenv("CACHE_LOCAL_TTL_SECONDS", "5"))
+    CACHE_LOCAL_MAX_ENTRIES: int = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "1024"))
+
+    # Dashboard responses: ETags also roll over every epoch (keep it at
+    # CACHE_TTL_SECONDS), and bodies from this size on are compressed
+    ETAG_EPOCH_SECONDS: float = float(os.getenv("ETAG_EPOCH_SECONDS", "60"))
+    COMPRESSION_MIN_BYTES: int = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+    # Department rollups
+    ROLLUP_SCHEDULER_ENABLED: bool = os.getenv("ROLLUP_SCHEDULER_ENABLED", "true").lower() == "true"
+    ROLLUP_REFRESH_INTERVAL_SECONDS: float = float(os.getenv("ROLLUP_REFRESH_INTERVAL_SECONDS", "300"))
+    ROLLUP_REFRESH_LOOKBACK_HOURS: float = float(os.getenv("ROLLUP_REFRESH_LOOKBACK_HOURS", "6"))
+
+    # Range fan-out: long raw scans are cut at chunk boundaries (the default
+    # 7-day chunk_time_interval) and the pieces read concurrently
+    QUERY_FANOUT_CHUNK_DAYS: float = float(os.getenv("QUERY_FANOUT_CHUNK_DAYS", "7"))
+    QUERY_FANOUT_MIN_RANGE_DAYS: float = float(os.getenv("QUERY_FANOUT_MIN_RANGE_DAYS", "14"))
+    QUERY_FANOUT_CONCURRENCY: int = int(os.getenv("QUERY_FANOUT_CONCURRENCY", "4"))
+
+    # Prometheus: how often pool, executor and cache state is sampled
+    METRICS_SAMPLE_INTERVAL_SECONDS: float = float(os.getenv("METRICS_SAMPLE_INTERVAL_SECONDS", "5"))
+
+    # Report jobs
+    REPORT_WORKER_ENABLED: bool = os.getenv("REPORT_WORKER_ENABLED", "true").lower() == "true"
+    REPORT_OUTPUT_DIR: str = os.getenv("REPORT_OUTPUT_DIR", "/tmp/analytics-reports")
+    REPORT_RESULT_TTL_HOURS: float = float(os.getenv("REPORT_RESULT_TTL_HOURS", "24"))
+    REPORT_POLL_INTERVAL_SECONDS: float = float(os.getenv("REPORT_POLL_INTERVAL_SECONDS", "2"))
+    REPORT_STALE_AFTER_SECONDS: float = float(os.getenv("REPORT_STALE_AFTER_SECONDS", "300"))
+
+    # Real-time alert stream
+    ALERT_QUEUE_SIZE: int = int(os.getenv("ALERT_QUEUE_SIZE", "256"))
+    ALERT_MAX_SUBSCRIBERS: int = int(os.getenv("ALERT_MAX_SUBSCRIBERS", "10000"))
+    ALERT_HEARTBEAT_SECONDS: float = float(os.getenv("ALERT_HEARTBEAT_SECONDS", "15"))
+    ALERT_DEPARTMENT_TTL_SECONDS: float = float(os.getenv("ALERT_DEPARTMENT_TTL_SECONDS", "300"))
+    # Active alert rules per patient, shared through Redis, are forgotten
+    # after this long without a reading
+    ALERT_STATE_TTL_SECONDS: float = float(os.getenv("ALERT_STATE_TTL_SECONDS", "86400"))
+
+    # Streaming trend state
+    TREND_WINDOW_HOURS: float = float(os.getenv("TREND_WINDOW_HOURS", "24"))
+    TREND_WINDOW_SLACK: float = float(os.getenv("TREND_WINDOW_SLACK", "0.25"))
+    # Fixed Holt smoothing parameters of the streaming forecast, which
+    # stands in for the statsmodels fit of the batch path
+    TREND_HOLT_ALPHA: float = float(os.getenv("TREND_HOLT_ALPHA", "0.5"))
+    TREND_HOLT_BETA: float = float(os.getenv("TREND_HOLT_BETA", "0.1"))
+    TREND_STATE_MAX_PATIENTS: int = int(os.getenv("TREND_STATE_MAX_PATIENTS", "100000"))
+
+    # Daily quantile sketches for long-range history
+    SKETCH_COMPRESSION: float = float(os.getenv("SKETCH_COMPRESSION", "200"))
+    SKETCH_UPDATE_ON_INGEST: bool = os.getenv("SKETCH_UPDATE_ON_INGEST", "true").lower() == "true"
+    # History ranges spanning at least this many whole UTC days are answered from sketches
+    SKETCH_MIN_RANGE_DAYS: int = int(os.getenv("SKETCH_MIN_RANGE_DAYS", "2"))
+    # Each rollup refresh checks this many days of sketches against the hour
+    # tier, sweeping the raw retention period, and rebuilds at most
+    # SKETCH_BACKFILL_BATCH_SIZE patient days missing readings
+    SKETCH_BACKFILL_DAYS: int = int(os.getenv("SKETCH_BACKFILL_DAYS", "7"))
+    SKETCH_BACKFILL_BATCH_SIZE: int = int(os.getenv("SKETCH_BACKFILL_BATCH_SIZE", "500"))
+
+    # History tiers: raw readings are read back this many days and minute
+    # buckets this many, older ranges come from coarser tiers. Chunks past
+    # them are only dropped with retention enabled, once
+    # `python -m src.services.retention` installs the policies
+    HISTORY_RAW_RETENTION_DAYS: float = float(os.getenv("HISTORY_RAW_RETENTION_DAYS", "90"))
+    HISTORY_MINUTE_RETENTION_DAYS: float = float(os.getenv("HISTORY_MINUTE_RETENTION_DAYS", "365"))
+    HISTORY_RETENTION_ENABLED: bool = os.getenv("HISTORY_RETENTION_ENABLED", "false").lower() == "true"
+
+    # Scheduled risk scoring through ml-service's batch endpoint. The job
+    # signs its own service token, so JWT_SECRET_KEY must match ml-service's.
+    ML_SERVICE_URL: str = os.getenv("ML_SERVICE_URL", "http://localhost:4002")
+    JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-secret-key-for-development")
+    RISK_SCORING_ENABLED: bool = os.getenv("RISK_SCORING_ENABLED", "true").lower() == "true"
+    RISK_SCORING_INTERVAL_SECONDS: float = float(os.getenv("RISK_SCORING_INTERVAL_SECONDS", "900"))
+    RISK_SCORING_BATCH_SIZE: int = int(os.getenv("RISK_SCORING_BATCH_SIZE", "2000"))
+    # Vitals older than this before a run are not used
+    RISK_SCORING_LOOKBACK_HOURS: float = float(os.getenv("RISK_SCORING_LOOKBACK_HOURS", "24"))
+    RISK_SCORING_HTTP_TIMEOUT: float = float(os.getenv("RISK_SCORING_HTTP_TIMEOUT", "30"))
+    # A page ml-service rejects this many times in a row is skipped
+    RISK_SCORING_PAGE_ATTEMPTS: int = int(os.getenv("RISK_SCORING_PAGE_ATTEMPTS", "3"))
+
+    # Cold start: heavy modules imported in the background after startup
+    # (/ready answers 503 until they are), and the budget the startup test
+    # holds `import src.main` to
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    STARTUP_BUDGET_SECONDS: float = float(os.getenv("STARTUP_BUDGET_SECONDS", "2.5"))
+    STARTUP_BUDGET_RSS_MB: float = float(os.getenv("STARTUP_BUDGET_RSS_MB", "128"))
+
     @property
     def database_url(self):
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -21,12 +132,41 @@ class Settings(BaseModel):
 settings = Settings()
 
 # Database connection pool
-database = Database(settings.database_url)
-
-@asynccontextmanager
-async def get_db():
-    try:
-        await database.connect()
-        yield database
-    finally:
-        await database.disconnect()
\ No newline at end of file
+database = Database(
+    settings.database_url,
+    min_size=settings.DB_POOL_MIN_SIZE,
+    max_size=settings.DB_POOL_MAX_SIZE,
+    max_inactive_connection_lifetime=settings.DB_POOL_MAX_INACTIVE_LIFETIME,
+    statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE
+)
+db_pool = DatabasePool(
+    database,
+    min_size=settings.DB_POOL_MIN_SIZE,
+    max_size=settings.DB_POOL_MAX_SIZE,
+    acquire_timeout=settings.DB_POOL_ACQUIRE_TIMEOUT
+)
+
+# Offload CPU-bound work: `await cpu_executor.run(fn, *args)`
+cpu_executor = CpuExecutor(
+    kind=settings.CPU_EXECUTOR_KIND,
+    max_workers=settings.CPU_EXECUTOR_WORKERS,
+    max_queue=settings.CPU_EXECUTOR_MAX_QUEUE,
+    retry_after=settings.CPU_EXECUTOR_RETRY_AFTER
+)
+
+# Borrow a pooled connection: `async with get_db("service.method") as db: ...`
+# (the label names the borrower in query timing metrics)
+get_db = db_pool.acquire
+
+def _sample_pool() -> None:
+    DB_POOL_CONNECTIONS.labels("in_use").set(db_pool.in_use)
+    DB_POOL_CONNECTIONS.labels("waiting").set(db_pool.waiting)
+    DB_POOL_CONNECTIONS.labels("max").set(db_pool.max_size)
+
+metrics_sampler = MetricsSampler(settings.METRICS_SAMPLE_INTERVAL_SECONDS)
+metrics_sampler.register("db_pool", _sample_pool)
+metrics_sampler.register("cpu_executor", lambda: CPU_EXECUTOR_IN_FLIGHT.set(cpu_executor.in_flight))
+
+# Modules deferred to first use and imported by the startup warm-up
+HEAVY_MODULES = ["pandas", "statsmodels.tsa.holtwinters"]
+warmup = Warmup(HEAVY_MODULES)
@@ -0,0 +1,110 @@
+# src/core/database.py
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+import asyncio
+import time
+
+from databases import Database
+from src.core.errors import PoolTimeoutError
+from src.core.metrics import DB_POOL_WAIT_SECONDS, InstrumentedConnection
+
+class DatabasePool:
+    """
+    Lifecycle-managed connection pool around a `databases.Database`.
+    The pool is opened once (at startup, or lazily on first use) and stays
+    open; callers borrow a connection for the duration of a `get_db()` block
+    and hand it back afterwards. Nested borrows within one task share the
+    task's connection. Occupancy and acquire wait times are tracked, and
+    queries are timed under the borrower's label (the service method).
+    """
+
+    def __init__(self, database: Database, min_size: int, max_size: int, acquire_timeout: float):
+        self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self._connect_lock = asyncio.Lock()
+        self._holders: Dict[asyncio.Task, int] = {}
+
+        self.waiting = 0
+        self.acquired_total = 0
+        self.timeouts_total = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._recent_waits = deque(maxlen=1000)
+
+    async def connect(self) -> None:
+        async with self._connect_lock:
+            if not self.database.is_connected:
+                await self.database.connect()
+
+    async def disconnect(self) -> None:
+        async with self._connect_lock:
+            if self.database.is_connected:
+                await self.database.disconnect()
+
+    @asynccontextmanager
+    async def acquire(self, label: str = "other"):
+        """
+        Borrow a pooled connection for the current task
+        """
+        if not self.database.is_connected:
+            await self.connect()
+
+        task = asyncio.current_task()
+        if task in self._holders:
+            self._holders[task] += 1
+            try:
+                yield InstrumentedConnection(self.database.connection(), label)
+            finally:
+                self._holders[task] -= 1
+            return
+
+        connection = self.database.connection()
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(connection.__aenter__(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts_total += 1
+            raise PoolTimeoutError(
+                f"No database connection available within {self.acquire_timeout}s"
+            )
+        finally:
+            self.waiting -= 1
+        self._record_wait(time.perf_counter() - start)
+
+        self._holders[task] = 1
+        try:
+            yield InstrumentedConnection(connection, label)
+        finally:
+            del self._holders[task]
+            await connection.__aexit__(None, None, None)
+
+    def _record_wait(self, seconds: float) -> None:
+        self.acquired_total += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+        self._recent_waits.append(seconds)
+        DB_POOL_WAIT_SECONDS.observe(seconds)
+
+    @property
+    def in_use(self) -> int:
+        return len(self._holders)
+
+    def stats(self) -> Dict[str, Any]:
+        recent = sorted(self._recent_waits)
+        p95 = recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+        return {
+            "connected": self.database.is_connected,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "acquired_total": self.acquired_total,
+            "timeouts_total": self.timeouts_total,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "wait_seconds_p95": round(p95, 6)
+        }
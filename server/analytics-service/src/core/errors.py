@@ -0,0 +1,20 @@
+# src/core/errors.py
+
+class ServiceUnavailableError(Exception):
+    """
+    Raised when the service is temporarily out of capacity.
+    Mapped to a 503 response with a Retry-After header.
+    """
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class PoolTimeoutError(ServiceUnavailableError):
+    """No database connection became available within the acquire timeout"""
+
+class ExecutorSaturatedError(ServiceUnavailableError):
+    """Every CPU worker is busy and the executor's queue is full"""
+
+class SubscriberLimitError(ServiceUnavailableError):
+    """The alert stream already has its maximum number of subscribers"""
@@ -0,0 +1,156 @@
+# src/core/executor.py
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import asyncio
+import multiprocessing
+import threading
+import time
+
+from src.core.errors import ExecutorSaturatedError
+from src.core.metrics import CPU_TASK_SECONDS, CPU_TASK_WAIT_SECONDS
+
+def _timed_call(fn: Callable, args: Tuple[Any, ...]) -> Tuple[Any, float, float]:
+    # time.monotonic is system-wide on Linux, so worker processes' stamps
+    # are comparable with the submitting process's
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+class _TaskTimings:
+    __slots__ = ("count", "errors", "run_seconds_total", "run_seconds_max", "recent_runs", "recent_waits")
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.run_seconds_total = 0.0
+        self.run_seconds_max = 0.0
+        self.recent_runs: Deque[float] = deque(maxlen=window)
+        self.recent_waits: Deque[float] = deque(maxlen=window)
+
+    def record(self, wait: float, run: float) -> None:
+        self.count += 1
+        self.run_seconds_total += run
+        self.run_seconds_max = max(self.run_seconds_max, run)
+        self.recent_runs.append(run)
+        self.recent_waits.append(wait)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "run_seconds_total": round(self.run_seconds_total, 6),
+            "run_seconds_max": round(self.run_seconds_max, 6),
+            "run_seconds_p99": round(_percentile(self.recent_runs, 0.99), 6),
+            "wait_seconds_p99": round(_percentile(self.recent_waits, 0.99), 6)
+        }
+
+class CpuExecutor:
+    """
+    Runs CPU-bound analytics (model fits, quantiles, state rebuilds) off the
+    event loop on a thread or process pool.
+
+    At most `max_workers` tasks run and `max_queue` more wait; further
+    submissions raise ExecutorSaturatedError (503 with Retry-After) instead of
+    queueing without bound. With kind="process", callables and arguments
+    must be picklable (module-level functions, plain data).
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 4,
+        max_queue: int = 32,
+        retry_after: int = 1,
+        timing_window: int = 1000
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.timing_window = timing_window
+        self._pool: Optional[Executor] = None
+        # Decremented from pool threads as tasks finish
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._rejected = 0
+        self._tasks: Dict[str, _TaskTimings] = {}
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="analytics-cpu"
+                )
+        return self._pool
+
+    async def run(self, fn: Callable, *args: Any, name: Optional[str] = None) -> Any:
+        """
+        Run fn(*args) on the pool and return its result. A task keeps its
+        slot until it finishes, even if the caller stops waiting (cancelled
+        or timed out) while it runs.
+        """
+        with self._in_flight_lock:
+            saturated = self._in_flight >= self.max_workers + self.max_queue
+            if not saturated:
+                self._in_flight += 1
+        if saturated:
+            self._rejected += 1
+            raise ExecutorSaturatedError(
+                "Analytics workers are saturated, retry shortly",
+                retry_after=self.retry_after
+            )
+
+        name = name or fn.__name__
+        timings = self._tasks.setdefault(name, _TaskTimings(self.timing_window))
+        submitted = time.monotonic()
+        try:
+            future = self._get_pool().submit(_timed_call, fn, args)
+        except Exception:
+            self._release()
+            raise
+        # Runs when the task finishes, or at once if cancelled while queued
+        future.add_done_callback(lambda _: self._release())
+        try:
+            result, started, finished = await asyncio.wrap_future(future)
+        except Exception:
+            timings.errors += 1
+            raise
+        timings.record(started - submitted, finished - started)
+        CPU_TASK_WAIT_SECONDS.labels(name).observe(started - submitted)
+        CPU_TASK_SECONDS.labels(name).observe(finished - started)
+        return result
+
+    def _release(self) -> None:
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "rejected_total": self._rejected,
+            "tasks": {name: timings.to_dict() for name, timings in self._tasks.items()}
+        }
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))] if ordered else 0.0
@@ -0,0 +1,276 @@
+# src/core/metrics.py
+"""
+Prometheus instrumentation.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory (cleared before the service starts). Every worker then
+writes its samples there and /metrics aggregates all of them, whichever
+worker serves the scrape. Gauges declare how worker values combine.
+
+Hot-path budget (checked by benchmarks/bench_metrics_overhead.py): under
+50 microseconds per request for the middleware and under 10 per timed
+query or block. Pool, cache and executor state is sampled in the
+background rather than updated on every operation.
+"""
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, make_asgi_app, multiprocess
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "analytics_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram(
+    "analytics_db_query_duration_seconds", "Database call latency by service method",
+    ["method", "operation"], buckets=LATENCY_BUCKETS
+)
+DATAFRAME_SECONDS = Histogram(
+    "analytics_dataframe_conversion_seconds", "Time converting rows to pandas objects",
+    ["operation"], buckets=FAST_BUCKETS
+)
+MODEL_FIT_SECONDS = Histogram(
+    "analytics_model_fit_seconds", "Time fitting forecasting models",
+    ["model"], buckets=FAST_BUCKETS
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "analytics_db_pool_acquire_wait_seconds", "Time waiting for a pooled connection",
+    buckets=FAST_BUCKETS
+)
+CPU_TASK_SECONDS = Histogram(
+    "analytics_cpu_task_duration_seconds", "CPU executor task run time",
+    ["task"], buckets=FAST_BUCKETS
+)
+CPU_TASK_WAIT_SECONDS = Histogram(
+    "analytics_cpu_task_wait_seconds", "CPU executor queueing time",
+    ["task"], buckets=FAST_BUCKETS
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "analytics_db_pool_connections", "Pooled connections by state (in_use, waiting, max)",
+    ["state"], multiprocess_mode="livesum"
+)
+CPU_EXECUTOR_IN_FLIGHT = Gauge(
+    "analytics_cpu_executor_in_flight", "CPU executor tasks running or queued",
+    multiprocess_mode="livesum"
+)
+CACHE_ENTRIES = Gauge(
+    "analytics_cache_local_entries", "Entries in the in-process cache",
+    multiprocess_mode="livesum"
+)
+CACHE_EVENTS = Counter(
+    "analytics_cache_events_total", "Cache lookups and maintenance by outcome", ["event"]
+)
+ALERT_EVENTS = Counter(
+    "analytics_alert_events_total", "Vital sign alerts raised or resolved", ["rule", "status"]
+)
+ALERT_FRAMES = Counter(
+    "analytics_alert_frames_total", "Alert frames queued to subscribers by outcome", ["outcome"]
+)
+CONDITIONAL_RESPONSES = Counter(
+    "analytics_conditional_responses_total",
+    "Dashboard responses by outcome: not_modified or the body's encoding", ["outcome"]
+)
+ALERT_SUBSCRIBERS = Gauge(
+    "analytics_alert_subscribers", "Open alert stream subscriptions", multiprocess_mode="livesum"
+)
+REPORT_JOBS_SUBMITTED = Counter(
+    "analytics_report_jobs_submitted_total", "Report job submissions",
+    ["report_type", "deduplicated"]
+)
+# Every worker samples the same shared queue, so the aggregate is the
+# freshest live sample rather than a sum
+REPORT_QUEUE_DEPTH = Gauge(
+    "analytics_report_jobs_queued", "Report jobs waiting for a worker", multiprocess_mode="livemax"
+)
+REPORT_JOBS_RUNNING = Gauge(
+    "analytics_report_jobs_running", "Report jobs running", multiprocess_mode="livesum"
+)
+REPORT_QUEUE_WAIT = Histogram(
+    "analytics_report_job_queue_wait_seconds", "Time from submission to start",
+    ["report_type"], buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900)
+)
+REPORT_RUNTIME = Histogram(
+    "analytics_report_job_runtime_seconds", "Time from start to finish",
+    ["report_type", "status"], buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900, 1800)
+)
+RISK_SCORING_PATIENTS = Counter(
+    "analytics_risk_scoring_patients_total",
+    "Patients processed by risk scoring: scored, skipped for missing vitals, or failed with their page",
+    ["outcome"]
+)
+RISK_SCORING_BATCH_SECONDS = Histogram(
+    "analytics_risk_scoring_batch_seconds", "Time per risk scoring page by stage (fetch, score, write)",
+    ["stage"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+# Set by whichever worker holds the scoring lock; the others report none
+RISK_SCORING_THROUGHPUT = Gauge(
+    "analytics_risk_scoring_patients_per_second", "Throughput of the last completed risk scoring run",
+    multiprocess_mode="livemax"
+)
+
+def metrics_app():
+    """
+    ASGI app serving /metrics, aggregated across workers in multiprocess mode
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return make_asgi_app(registry)
+    return make_asgi_app()
+
+def mark_worker_dead() -> None:
+    """
+    Drop this worker's live gauges from the aggregate (call on shutdown)
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - start)
+
+class PrometheusMiddleware:
+    """
+    Records request latency by method, route template and status. Requests
+    that match no route are labelled "unmatched" to bound label cardinality.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - start)
+
+class InstrumentedConnection:
+    """
+    Wraps a `databases` connection so each call is timed under the service
+    method that borrowed it; everything else passes through
+    """
+
+    def __init__(self, connection: Any, method: str):
+        self.connection = connection
+        self._method = method
+
+    async def _timed(self, operation: str, call: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.labels(self._method, operation).observe(time.perf_counter() - start)
+
+    async def execute(self, *args, **kwargs):
+        return await self._timed("execute", self.connection.execute, *args, **kwargs)
+
+    async def execute_many(self, *args, **kwargs):
+        return await self._timed("execute_many", self.connection.execute_many, *args, **kwargs)
+
+    async def fetch_all(self, *args, **kwargs):
+        return await self._timed("fetch_all", self.connection.fetch_all, *args, **kwargs)
+
+    async def fetch_one(self, *args, **kwargs):
+        return await self._timed("fetch_one", self.connection.fetch_one, *args, **kwargs)
+
+    async def fetch_val(self, *args, **kwargs):
+        return await self._timed("fetch_val", self.connection.fetch_val, *args, **kwargs)
+
+    async def copy_from_query(self, *args, **kwargs):
+        # asyncpg's COPY TO, for reads decoded without building Records
+        return await self._timed("copy", self.connection.raw_connection.copy_from_query, *args, **kwargs)
+
+    async def iterate(self, *args, **kwargs):
+        # Times the whole iteration, including the consumer's work between rows
+        start = time.perf_counter()
+        try:
+            async for row in self.connection.iterate(*args, **kwargs):
+                yield row
+        finally:
+            DB_QUERY_SECONDS.labels(self._method, "iterate").observe(time.perf_counter() - start)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.connection, name)
+
+class MetricsSampler:
+    """
+    Periodically copies pool, executor and cache state into gauges and
+    counters, keeping that bookkeeping off the request path
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sources: Dict[str, Callable[[], None]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, sample: Callable[[], None]) -> None:
+        self._sources[name] = sample
+
+    def sample(self) -> None:
+        for name, sample in self._sources.items():
+            try:
+                sample()
+            except Exception as e:
+                logger.warning("Sampling %s metrics failed: %s", name, e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+def counter_sampler(counter: Counter, read: Callable[[], Dict[str, int]]) -> Callable[[], None]:
+    """
+    Sampler turning a dict of running totals into Counter increments
+    """
+    last: Dict[str, int] = {}
+
+    def sample() -> None:
+        for key, total in read().items():
+            delta = total - last.get(key, 0)
+            if delta > 0:
+                counter.labels(key).inc(delta)
+            last[key] = total
+    return sample
@@ -0,0 +1,136 @@
+# src/core/responses.py
+"""
+JSON encoding, compression and conditional responses for dashboard reads.
+
+Bodies are encoded with orjson straight from service results, skipping
+FastAPI's jsonable_encoder pass. NaN and infinity become null, so the output
+is always valid JSON. gzip, or brotli when the `brotli` package is
+installed, is negotiated from Accept-Encoding.
+
+Dashboard endpoints tag responses with a weak ETag built from the request
+parameters and a data watermark, such as the latest reading timestamp of
+the department or patient. They also mix in the current ETAG_EPOCH_SECONDS
+window. A matching If-None-Match is answered with 304 before the service
+queries run. The epoch bounds how long a 304 can hide changes a watermark
+does not see: sliding windows moving on, or readings back-filled behind the
+latest timestamp. That is no longer than the response cache keeps them.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import gzip
+import hashlib
+import time
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.core.config import settings
+from src.core.metrics import CONDITIONAL_RESPONSES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson; the app's default response class
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def available_encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    The preferred available encoding the client accepts (highest q, then br
+    over gzip), or None for identity
+    """
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    candidates = [
+        (accepted.get(encoding, accepted.get("*", 0.0)), -rank, encoding)
+        for rank, encoding in enumerate(available_encodings())
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+def etag_for(*parts: Any) -> str:
+    """
+    Weak ETag over the given parts and the current ETAG_EPOCH_SECONDS window
+    """
+    epoch = int(time.time() // settings.ETAG_EPOCH_SECONDS)
+    digest = hashlib.blake2b(dumps([*parts, epoch]), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison against an If-None-Match header
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+async def conditional_json(
+    request: Request,
+    etag: str,
+    compute: Callable[[], Awaitable[Any]]
+) -> Response:
+    """
+    304 when the client already holds `etag`, otherwise the result of
+    `compute()` as JSON, compressed when the client accepts it and the body
+    reaches COMPRESSION_MIN_BYTES
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        CONDITIONAL_RESPONSES.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+
+    body = dumps(await compute())
+    encoding = None
+    if len(body) >= settings.COMPRESSION_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    CONDITIONAL_RESPONSES.labels(encoding or "identity").inc()
+    return Response(body, media_type="application/json", headers=headers)
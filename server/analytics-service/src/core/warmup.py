@@ -0,0 +1,65 @@
+# src/core/warmup.py
+from typing import Any, Dict, Optional, Sequence
+import asyncio
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    """
+    Imports modules the service defers to first use (see HEAVY_MODULES in
+    config) on a worker thread after startup. Until that finishes `ready`
+    is False, so readiness probes hold traffic back from a cold worker.
+    Never started (warm-up disabled), the modules load on first use and the
+    worker is ready at once.
+    """
+
+    def __init__(self, modules: Sequence[str]):
+        self.modules = list(modules)
+        self.state = "disabled"
+        self.error: Optional[str] = None
+        self.import_seconds: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ("disabled", "warm")
+
+    def start(self) -> None:
+        if self._task is None:
+            self.state = "warming"
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        try:
+            await asyncio.to_thread(self._import_all)
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error("Warm-up failed: %s", e)
+            return
+        self.state = "warm"
+        logger.info("Warm-up finished in %.2fs", sum(self.import_seconds.values()))
+
+    def _import_all(self) -> None:
+        for module in self.modules:
+            start = time.perf_counter()
+            importlib.import_module(module)
+            self.import_seconds[module] = time.perf_counter() - start
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "import_seconds": {module: round(seconds, 3) for module, seconds in self.import_seconds.items()},
+            "error": self.error
+        }
@@ -1,14 +1,25 @@
 # src/main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import make_asgi_app
-from api.endpoints import health, metrics, trends, reports
-from core.config import database
+from fastapi.responses import JSONResponse
+# Import through the `src` package (PYTHONPATH=/app) so the services and
+# main share one module instance, and therefore one connection pool
+from src.api.endpoints import admissions, alerts, health, metrics, trends, reports
+from src.core.config import cpu_executor, db_pool, metrics_sampler, settings, warmup
+from src.core.errors import ServiceUnavailableError
+from src.core.metrics import PrometheusMiddleware, mark_worker_dead, metrics_app
+from src.core.responses import FastJSONResponse
+from src.services.alert_service import alert_service
+from src.services.cache_service import cache
+from src.services.report_service import report_worker
+from src.services.risk_scoring import risk_scoring_scheduler
+from src.services.rollup_service import rollup_scheduler
 
 app = FastAPI(
     title="Healthcare Analytics Service",
     description="Advanced analytics and time-series processing for healthcare data",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -20,16 +31,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency by route and status
+app.add_middleware(PrometheusMiddleware)
+
 # API Routes
 app.include_router(health.router, tags=["health"])
 app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
 app.include_router(trends.router, prefix="/api/trends", tags=["trends"])
 app.include_router(reports.router, prefix="/api/reports", tags=["reports"])
+app.include_router(alerts.router, prefix="/api/alerts", tags=["alerts"])
+app.include_router(admissions.router, prefix="/api/admissions", tags=["admissions"])
+
+# Prometheus metrics
+app.mount("/metrics", metrics_app())
+
+@app.exception_handler(ServiceUnavailableError)
+async def service_unavailable_handler(request: Request, exc: ServiceUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 @app.on_event("startup")
 async def startup():
-    await database.connect()
+    await db_pool.connect()
+    metrics_sampler.start()
+    alert_service.start()
+    if settings.ROLLUP_SCHEDULER_ENABLED:
+        rollup_scheduler.start()
+    if settings.REPORT_WORKER_ENABLED:
+        report_worker.start()
+    if settings.RISK_SCORING_ENABLED:
+        risk_scoring_scheduler.start()
+    if settings.WARMUP_ENABLED:
+        warmup.start()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
\ No newline at end of file
+    await warmup.stop()
+    await rollup_scheduler.stop()
+    await report_worker.stop()
+    await risk_scoring_scheduler.stop()
+    await alert_service.stop()
+    await cache.close()
+    await db_pool.disconnect()
+    cpu_executor.shutdown()
+    await metrics_sampler.stop()
+    mark_worker_dead()
\ No newline at end of file
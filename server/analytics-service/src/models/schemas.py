@@ -0,0 +1,75 @@
+# src/models/schemas.py
+from pydantic import BaseModel, Field
+from typing import List, Optional, Any, Dict
+from datetime import datetime
+from uuid import UUID
+
+class HealthMetric(BaseModel):
+    patient_id: UUID
+    timestamp: datetime
+    heart_rate: Optional[float] = None
+    blood_pressure_systolic: Optional[float] = None
+    blood_pressure_diastolic: Optional[float] = None
+    temperature: Optional[float] = None
+    oxygen_saturation: Optional[float] = None
+    respiratory_rate: Optional[float] = None
+
+class PatientTransfer(BaseModel):
+    patient_id: UUID
+    department_id: Optional[UUID] = Field(
+        None, description="Department the patient was admitted or moved to; null for a discharge"
+    )
+    timestamp: datetime
+
+class MetricsSummary(BaseModel):
+    time_period: str
+    department_id: Optional[str] = None
+    total_patients: int
+    avg_risk_score: float
+    high_risk_count: int
+    department_utilization: float
+    top_conditions: List[str]
+
+class MetricsSummaryRequest(BaseModel):
+    time_periods: List[str] = Field(..., min_length=1)
+    department_ids: List[Optional[str]] = Field(
+        default=[None], min_length=1, description="Department IDs; null for all departments"
+    )
+
+class MetricsSummaryBatch(BaseModel):
+    summaries: List[MetricsSummary]
+
+class IngestRowResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[UUID] = None
+    error: Optional[str] = None
+
+class BatchIngestResponse(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[IngestRowResult]
+    trends: Optional[Any] = Field(
+        None, description="Per-patient trends when trend computation ran inline"
+    )
+
+class ReportJobRequest(BaseModel):
+    report_type: str = Field(..., description="department_utilization_monthly or treatment_outcomes_by_diagnosis")
+    format: str = Field("csv", pattern="^(csv|parquet)$")
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+class ReportJob(BaseModel):
+    id: UUID
+    report_type: str
+    params: Dict[str, Any]
+    format: str
+    status: str
+    chunks_total: Optional[int] = None
+    chunks_done: int = 0
+    rows_written: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    deduplicated: bool = False
@@ -0,0 +1,525 @@
+# src/services/alert_service.py
+"""
+Real-time vital sign alerts streamed to subscribers over Server-Sent Events.
+
+Readings are checked as they are recorded against the thresholds ml-service
+scores risk with, and the patient's trend forecasts against the same
+thresholds. An event is raised when a rule starts or stops being breached,
+not on every reading. Each event is encoded to its SSE frame once and the
+same bytes are queued for every subscriber of the patient or department.
+
+Subscribers have bounded queues. A slow consumer loses its oldest frames
+and is told how many it missed; one that falls a full queue behind is
+disconnected. With Redis configured, events are relayed through a pub/sub
+channel so subscribers on every worker receive them, and the rules each
+patient breaches are kept in Redis so every worker sees the same state.
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from src.core.config import get_db, metrics_sampler, settings
+from src.core.errors import SubscriberLimitError
+from src.core.metrics import ALERT_EVENTS, ALERT_FRAMES, ALERT_SUBSCRIBERS, counter_sampler
+from src.models.schemas import HealthMetric
+from src.services.cache_service import cache
+from src.services.rollup_service import as_utc
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FRAME = b": keepalive\n\n"
+
+# (patient_id, reading timestamp in epoch microseconds or None for trend
+# checks, [(rule key, breached)])
+StateUpdate = Tuple[str, Optional[int], List[Tuple[str, bool]]]
+
+@dataclass(frozen=True)
+class AlertRule:
+    name: str
+    factor: str
+    metric: str
+    direction: str  # "above" or "below"
+    threshold: float
+
+    def breached(self, value: float) -> bool:
+        return value > self.threshold if self.direction == "above" else value < self.threshold
+
+# The vital sign thresholds of ml-service's RISK_RULES (MLService._rule_masks)
+ALERT_RULES = [
+    AlertRule("high_systolic_pressure", "High blood pressure", "blood_pressure_systolic", "above", 140),
+    AlertRule("high_diastolic_pressure", "High blood pressure", "blood_pressure_diastolic", "above", 90),
+    AlertRule("elevated_heart_rate", "Elevated heart rate", "heart_rate", "above", 100),
+    AlertRule("low_oxygen_saturation", "Low oxygen saturation", "oxygen_saturation", "below", 95),
+]
+
+class LocalAlertState:
+    """
+    The rules each patient breaches and the timestamp of their latest
+    evaluated reading, in this process. The least recently seen patients
+    are forgotten beyond `max_patients`. Only consistent with one worker;
+    see RedisAlertState.
+    """
+
+    def __init__(self, max_patients: int):
+        self.max_patients = max_patients
+        self._patients: "OrderedDict[str, Tuple[Optional[int], Set[str]]]" = OrderedDict()
+
+    async def apply(self, updates: List[StateUpdate]) -> List[List[str]]:
+        """
+        Apply updates in order; returns the keys each one flipped. A reading
+        older than its patient's latest evaluated one flips nothing.
+        """
+        return [self._apply(*update) for update in updates]
+
+    def _apply(self, patient_id: str, timestamp: Optional[int], states: List[Tuple[str, bool]]) -> List[str]:
+        last, active = self._patients.get(patient_id, (None, set()))
+        if timestamp is not None and last is not None and timestamp < last:
+            return []
+        flipped = []
+        for key, breached in states:
+            if breached == (key in active):
+                continue
+            if breached:
+                active.add(key)
+            else:
+                active.discard(key)
+            flipped.append(key)
+        self._patients[patient_id] = (timestamp if timestamp is not None else last, active)
+        self._patients.move_to_end(patient_id)
+        while len(self._patients) > self.max_patients:
+            self._patients.popitem(last=False)
+        return flipped
+
+# KEYS[1]: the patient's hash; ARGV: reading timestamp ("" for trend
+# checks), TTL seconds, then rule key and breached ("1"/"0") pairs
+APPLY_STATE_SCRIPT = """
+local timestamp = ARGV[1]
+if timestamp ~= "" then
+    local last = redis.call("HGET", KEYS[1], "@last")
+    if last and tonumber(last) > tonumber(timestamp) then
+        return {}
+    end
+    redis.call("HSET", KEYS[1], "@last", timestamp)
+end
+local flipped = {}
+for i = 3, #ARGV, 2 do
+    local breached = ARGV[i + 1] == "1"
+    if breached ~= (redis.call("HEXISTS", KEYS[1], ARGV[i]) == 1) then
+        if breached then
+            redis.call("HSET", KEYS[1], ARGV[i], "1")
+        else
+            redis.call("HDEL", KEYS[1], ARGV[i])
+        end
+        table.insert(flipped, ARGV[i])
+    end
+end
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+return flipped
+"""
+
+class RedisAlertState:
+    """
+    LocalAlertState kept in one Redis hash per patient and updated by a Lua
+    script, so each update is atomic and every worker sees the same state: a
+    breach seen on one worker is resolved by a reading landing on another.
+    A batch of updates is sent in one pipeline and applied in order. Hashes
+    expire `ttl` seconds after their last update. While Redis fails,
+    `fallback` is used.
+    """
+
+    def __init__(self, redis: Any, ttl: float, fallback: LocalAlertState, prefix: str = "analytics:alert_state:"):
+        self.redis = redis
+        self.ttl = ttl
+        self.fallback = fallback
+        self.prefix = prefix
+        self._script = redis.register_script(APPLY_STATE_SCRIPT)
+
+    async def apply(self, updates: List[StateUpdate]) -> List[List[str]]:
+        if not updates:
+            return []
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for patient_id, timestamp, states in updates:
+                args = ["" if timestamp is None else timestamp, int(self.ttl)]
+                for key, breached in states:
+                    args += [key, "1" if breached else "0"]
+                await self._script(keys=[self.prefix + patient_id], args=args, client=pipe)
+            results = await pipe.execute()
+        except Exception as e:
+            logger.warning("Alert state update in Redis failed, using local state: %s", e)
+            return await self.fallback.apply(updates)
+        return [[key.decode() if isinstance(key, bytes) else key for key in flipped] for flipped in results]
+
+class AlertEvaluator:
+    """
+    Returns an event for every change in the rules a patient breaches.
+    Threshold rules follow the latest reading of their metric; readings
+    older than the patient's latest evaluated one are ignored, so backfilled
+    batches do not flip the state. Trend rules follow the forecast of the
+    patient's trend state, breached when the forecast crosses the threshold
+    while moving towards it. Which rules are active is kept in `state`.
+    """
+
+    def __init__(self, rules: List[AlertRule], max_patients: int, state: Any = None):
+        self.rules = rules
+        self.max_patients = max_patients
+        self.state = state or LocalAlertState(max_patients)
+
+    async def check_readings(self, metrics: Iterable[HealthMetric]) -> List[Dict[str, Any]]:
+        checks, updates = [], []
+        for metric in metrics:
+            values = {
+                rule.name: getattr(metric, rule.metric) for rule in self.rules
+                if getattr(metric, rule.metric) is not None
+            }
+            checks.append((metric, values))
+            updates.append((
+                str(metric.patient_id),
+                int(as_utc(metric.timestamp).timestamp() * 1_000_000),
+                [(f"threshold:{rule.name}", rule.breached(values[rule.name])) for rule in self.rules if rule.name in values]
+            ))
+
+        events = []
+        for (metric, values), flipped in zip(checks, await self.state.apply(updates)):
+            for rule in self._flipped_rules(flipped, "threshold"):
+                value = values[rule.name]
+                event = self._event(str(metric.patient_id), rule, "threshold", rule.breached(value), value)
+                event["timestamp"] = metric.timestamp.isoformat()
+                events.append(event)
+        return events
+
+    async def check_reading(self, metric: HealthMetric) -> List[Dict[str, Any]]:
+        return await self.check_readings([metric])
+
+    async def check_trends(self, patient_id: str, snapshot: Dict[str, Any]) -> List[Dict[str, Any]]:
+        patient_id = str(patient_id)
+        trends = snapshot.get("trends") or {}
+        timestamp = datetime.now(timezone.utc).isoformat()
+        forecasts, states = {}, []
+        for rule in self.rules:
+            trend = trends.get(rule.metric)
+            if trend is None:
+                continue
+            towards = "increasing" if rule.direction == "above" else "decreasing"
+            forecast = trend["forecast_next"]
+            breached = trend["trend_direction"] == towards and rule.breached(forecast)
+            forecasts[rule.name] = (forecast, breached)
+            states.append((f"trend:{rule.name}", breached))
+        if not states:
+            return []
+
+        [flipped] = await self.state.apply([(patient_id, None, states)])
+        events = []
+        for rule in self._flipped_rules(flipped, "trend"):
+            forecast, breached = forecasts[rule.name]
+            event = self._event(patient_id, rule, "trend", breached, forecast)
+            event["timestamp"] = timestamp
+            events.append(event)
+        return events
+
+    def _flipped_rules(self, flipped: List[str], kind: str) -> List[AlertRule]:
+        """
+        Rules among the flipped keys, in rule order
+        """
+        keys = set(flipped)
+        return [rule for rule in self.rules if f"{kind}:{rule.name}" in keys]
+
+    @staticmethod
+    def _event(patient_id: str, rule: AlertRule, kind: str, breached: bool, value: float) -> Dict[str, Any]:
+        return {
+            "patient_id": patient_id,
+            "status": "triggered" if breached else "resolved",
+            "kind": kind,
+            "rule": rule.name,
+            "factor": rule.factor,
+            "metric": rule.metric,
+            "value": float(value),
+            "threshold": rule.threshold
+        }
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    return b"event: alert\ndata: " + json.dumps(event, separators=(",", ":")).encode() + b"\n\n"
+
+def lagged_frame(missed: int) -> bytes:
+    return b'event: lagged\ndata: {"missed":' + str(missed).encode() + b"}\n\n"
+
+class Subscription:
+    """
+    One subscriber's bounded queue of encoded frames
+    """
+    __slots__ = ("topics", "max_queue", "_frames", "_ready", "_missed", "dropped", "closed")
+
+    def __init__(self, topics: Tuple[str, ...], max_queue: int):
+        self.topics = topics
+        self.max_queue = max_queue
+        self._frames: Deque[bytes] = deque()
+        self._ready = asyncio.Event()
+        self._missed = 0
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, frame: bytes) -> int:
+        """
+        Queue a frame without blocking; returns the number of frames dropped
+        """
+        if self.closed:
+            return 0
+        dropped = 0
+        if len(self._frames) >= self.max_queue:
+            self._frames.popleft()
+            self._missed += 1
+            self.dropped += 1
+            dropped = 1
+            if self._missed >= self.max_queue:
+                # A full queue behind: cut the consumer off rather than
+                # keep streaming it stale alerts
+                self.close()
+                return dropped
+        self._frames.append(frame)
+        self._ready.set()
+        return dropped
+
+    def close(self) -> None:
+        self.closed = True
+        self._frames.clear()
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        """
+        Every queued frame (preceded by a lagged frame if some were dropped),
+        HEARTBEAT_FRAME if none arrives within `timeout`, or None once closed
+        """
+        if not self._frames and not self.closed:
+            self._ready.clear()
+            # A timer rather than asyncio.wait_for, which costs a task per wait
+            timer = asyncio.get_running_loop().call_later(timeout, self._ready.set)
+            try:
+                await self._ready.wait()
+            finally:
+                timer.cancel()
+        if self.closed:
+            return None
+        if not self._frames:
+            return HEARTBEAT_FRAME
+        frames = b"".join(self._frames)
+        self._frames.clear()
+        if self._missed:
+            frames = lagged_frame(self._missed) + frames
+            self._missed = 0
+        return frames
+
+class AlertBroker:
+    """
+    Topic index of subscriptions (patient:<id>, department:<id>)
+    """
+
+    def __init__(self, max_queue: int, max_subscribers: int):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self.subscribers = 0
+        self.counters = {"delivered": 0, "dropped": 0, "disconnected": 0}
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        if self.subscribers >= self.max_subscribers:
+            raise SubscriberLimitError(f"Alert stream is at its limit of {self.max_subscribers} subscribers")
+        subscription = Subscription(tuple(dict.fromkeys(topics)), self.max_queue)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        self.subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        removed = False
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                removed = True
+                if not subscribers:
+                    del self._topics[topic]
+        if removed:
+            self.subscribers -= 1
+        subscription.close()
+
+    def fan_out(self, topics: Iterable[str], frame: bytes) -> int:
+        """
+        Queue one frame for every subscriber of any of the topics (once per
+        subscriber); returns the number of subscribers reached
+        """
+        matched = [self._topics[topic] for topic in topics if topic in self._topics]
+        if not matched:
+            return 0
+        targets = matched[0] if len(matched) == 1 else set().union(*matched)
+        cut_off = []
+        for subscription in targets:
+            self.counters["dropped"] += subscription.offer(frame)
+            if subscription.closed:
+                cut_off.append(subscription)
+        reached = len(targets) - len(cut_off)
+        for subscription in cut_off:
+            self.unsubscribe(subscription)
+        self.counters["disconnected"] += len(cut_off)
+        self.counters["delivered"] += reached
+        return reached
+
+class AlertService:
+    """
+    Evaluates readings, attaches the patient's current department and
+    publishes events to local subscribers, or through Redis to all workers
+    while the relay is connected
+    """
+
+    def __init__(
+        self,
+        evaluator: AlertEvaluator,
+        broker: AlertBroker,
+        heartbeat: float,
+        department_ttl: float,
+        redis: Any = None,
+        channel: str = "analytics:alerts"
+    ):
+        self.evaluator = evaluator
+        self.broker = broker
+        self.heartbeat = heartbeat
+        self.department_ttl = department_ttl
+        self.redis = redis
+        self.channel = channel
+        self._departments: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+        self._relay_connected = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def observe_readings(self, metrics: Iterable[HealthMetric]) -> None:
+        await self._publish(await self.evaluator.check_readings(metrics))
+
+    async def observe_trends(self, patient_id: str, snapshot: Dict[str, Any]) -> None:
+        await self._publish(await self.evaluator.check_trends(patient_id, snapshot))
+
+    async def _publish(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            ALERT_EVENTS.labels(event["rule"], event["status"]).inc()
+            try:
+                event["department_id"] = await self._department(event["patient_id"])
+            except Exception as e:
+                logger.warning("Department lookup for alert failed: %s", e)
+                event["department_id"] = None
+
+            topics = [f"patient:{event['patient_id']}"]
+            if event["department_id"]:
+                topics.append(f"department:{event['department_id']}")
+            frame = encode_event(event)
+
+            if self._relay_connected:
+                try:
+                    await self.redis.publish(self.channel, json.dumps(topics).encode() + b"\n" + frame)
+                    continue
+                except Exception as e:
+                    logger.warning("Publishing alert to Redis failed, delivering locally: %s", e)
+            self.broker.fan_out(topics, frame)
+
+    async def _department(self, patient_id: str) -> Optional[str]:
+        cached = self._departments.get(patient_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        async with get_db("alerts.patient_department") as db:
+            department_id = await db.fetch_val(
+                """
+                    SELECT department_id
+                    FROM patient_departments
+                    WHERE patient_id = :patient_id AND discharged_at IS NULL
+                    ORDER BY admitted_at DESC
+                    LIMIT 1
+                """,
+                {"patient_id": patient_id}
+            )
+        department_id = str(department_id) if department_id is not None else None
+        self._departments[patient_id] = (time.monotonic() + self.department_ttl, department_id)
+        self._departments.move_to_end(patient_id)
+        while len(self._departments) > self.evaluator.max_patients:
+            self._departments.popitem(last=False)
+        return department_id
+
+    def forget_departments(self, patient_ids: Iterable[str]) -> None:
+        """
+        Drop cached departments after transfers, so the patients' next
+        alerts reach their new department's subscribers on this worker
+        (other workers pick it up within department_ttl)
+        """
+        for patient_id in patient_ids:
+            self._departments.pop(str(patient_id), None)
+
+    async def stream(self, subscription: Subscription):
+        """
+        SSE body for one subscription; unsubscribes when the client goes away
+        """
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                frame = await subscription.next(self.heartbeat)
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.broker.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self.broker.subscribers,
+            "relay_connected": self._relay_connected,
+            **self.broker.counters
+        }
+
+    def start(self) -> None:
+        if self.redis is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # Relay: fan out every worker's alerts to this worker's subscribers
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                self._relay_connected = True
+                async for message in pubsub.listen():
+                    header, frame = message["data"].split(b"\n", 1)
+                    self.broker.fan_out(json.loads(header), frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Alert relay error: %s", e)
+            finally:
+                self._relay_connected = False
+                await pubsub.aclose()
+            await asyncio.sleep(1)
+
+_alert_redis = None if settings.REDIS_URL.startswith("memory://") else cache.redis
+_alert_state = LocalAlertState(settings.TREND_STATE_MAX_PATIENTS)
+alert_service = AlertService(
+    AlertEvaluator(
+        ALERT_RULES,
+        settings.TREND_STATE_MAX_PATIENTS,
+        _alert_state if _alert_redis is None else RedisAlertState(
+            _alert_redis, settings.ALERT_STATE_TTL_SECONDS, fallback=_alert_state
+        )
+    ),
+    AlertBroker(settings.ALERT_QUEUE_SIZE, settings.ALERT_MAX_SUBSCRIBERS),
+    heartbeat=settings.ALERT_HEARTBEAT_SECONDS,
+    department_ttl=settings.ALERT_DEPARTMENT_TTL_SECONDS,
+    redis=_alert_redis
+)
+metrics_sampler.register("alert_frames", counter_sampler(ALERT_FRAMES, lambda: alert_service.broker.counters))
+metrics_sampler.register("alert_subscribers", lambda: ALERT_SUBSCRIBERS.set(alert_service.broker.subscribers))
@@ -1,84 +1,230 @@
 # src/services/analytics_service.py
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
-import pandas as pd
-import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple
+import asyncio
 from sqlalchemy import text
 from src.models.schemas import MetricsSummary
-from src.core.config import get_db
+from src.core.config import get_db, settings
+from src.services.cache_service import CacheService, cache as default_cache
+from src.services.rollup_service import PERIOD_INTERVALS, QuerySegment, fan_out, fanout_segments, rollup_service
+
+SUMMARY_PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'monthly': timedelta(days=30)
+}
+
+# Independent parts of a summary, each queried and cached on its own
+SUMMARY_SECTIONS = ('patients', 'utilization', 'conditions')
+
+# Sections whose partial aggregates add up across sub-ranges, so long scans
+# can fan out; patients counts distinct patients and is scanned whole
+FANOUT_SECTIONS = ('utilization', 'conditions')
+
+SUMMARY_DEFAULTS = {
+    'patients': {"total_patients": 0, "avg_risk_score": 0.0, "high_risk_count": 0},
+    'utilization': {"department_utilization": 0.0},
+    'conditions': {"top_conditions": []}
+}
+
+TOP_CONDITIONS = 5
+
+# Sections narrowed by a department filter. Patients and conditions stay
+# hospital-wide: attributing them through patient_departments would
+# undercount until every admission reaches the transfer feed
+DEPARTMENT_SECTIONS = ('utilization',)
+
+def summary_section_query(section: str, periods: List[str], by_department: bool, inclusive_end: bool = True) -> str:
+    """
+    One scan answering `section` for every period at once: the range of the
+    longest period is read and each period's aggregates are FILTERed to its
+    own window. With `by_department` (DEPARTMENT_SECTIONS only), rows are
+    filtered to and grouped per requested department. The scan covers
+    [:scan_start, :scan_end], or [:scan_start, :scan_end) without
+    `inclusive_end` (a piece of a fanned-out scan).
+    """
+    if by_department and section not in DEPARTMENT_SECTIONS:
+        raise ValueError(f"Summary section {section} is not filtered by department")
+
+    if section == 'patients':
+        source, timestamp = "patient_analytics pa", "pa.updated_at"
+        columns = [
+            f"""
+                COUNT(DISTINCT pa.patient_id) FILTER (WHERE {timestamp} >= :start_{p}) AS {p}_total_patients,
+                AVG(pa.risk_score) FILTER (WHERE {timestamp} >= :start_{p}) AS {p}_avg_risk,
+                COUNT(*) FILTER (WHERE {timestamp} >= :start_{p} AND pa.risk_score > 75) AS {p}_high_risk"""
+            for p in periods
+        ]
+        group = []
+    elif section == 'utilization':
+        source, timestamp = "department_metrics dm", "dm.timestamp"
+        columns = [
+            f"""
+                SUM(dm.utilization_rate) FILTER (WHERE {timestamp} >= :start_{p}) AS {p}_utilization_sum,
+                COUNT(dm.utilization_rate) FILTER (WHERE {timestamp} >= :start_{p}) AS {p}_utilization_samples"""
+            for p in periods
+        ]
+        group = []
+    elif section == 'conditions':
+        source, timestamp = "treatment_outcomes t", "t.created_at"
+        columns = [
+            f"COUNT(*) FILTER (WHERE {timestamp} >= :start_{p}) AS {p}_count"
+            for p in periods
+        ]
+        group = ["t.diagnosis_code"]
+    else:
+        raise ValueError(f"Unknown summary section: {section}")
+
+    where = ""
+    if by_department:
+        where = "AND dm.department_id = ANY(CAST(:dept_ids AS uuid[]))"
+        group.insert(0, "dm.department_id")
+
+    select = [f"{column} AS {column.split('.')[1]}" for column in group] + columns
+    group_by = f"GROUP BY {', '.join(group)}" if group else ""
+    return f"""
+        SELECT {', '.join(select)}
+        FROM {source}
+        WHERE {timestamp} >= :scan_start AND {timestamp} {"<=" if inclusive_end else "<"} :scan_end {where}
+        {group_by}
+    """
+
+def summary_section_values(section: str, rows: List[Any], periods: List[str], by_department: bool) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+    """
+    Combine the rows of summary_section_query, from one scan or from the
+    pieces of a fanned-out one, into one section value per (period,
+    department); department is None without `by_department`. Utilization
+    sums and samples and per-diagnosis counts add up across pieces; the top
+    conditions are ranked on the totals.
+    """
+    values: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+    if section == 'conditions':
+        counts: Dict[Tuple[str, Optional[str]], Dict[str, int]] = {}
+        for row in rows:
+            department = str(row['department_id']) if by_department else None
+            for p in periods:
+                if row[f"{p}_count"]:
+                    codes = counts.setdefault((p, department), {})
+                    codes[row['diagnosis_code']] = codes.get(row['diagnosis_code'], 0) + row[f"{p}_count"]
+        for combo, codes in counts.items():
+            ranked = sorted((-count, code) for code, count in codes.items())
+            values[combo] = {"top_conditions": [code for _, code in ranked[:TOP_CONDITIONS]]}
+        return values
+
+    if section == 'utilization':
+        totals: Dict[Tuple[str, Optional[str]], List[float]] = {}
+        for row in rows:
+            department = str(row['department_id']) if by_department else None
+            for p in periods:
+                total = totals.setdefault((p, department), [0.0, 0])
+                total[0] += float(row[f"{p}_utilization_sum"] or 0.0)
+                total[1] += row[f"{p}_utilization_samples"] or 0
+        for combo, (total, samples) in totals.items():
+            values[combo] = {"department_utilization": total / samples if samples else 0.0}
+        return values
+
+    for row in rows:
+        department = str(row['department_id']) if by_department else None
+        for p in periods:
+            values[(p, department)] = {
+                "total_patients": row[f"{p}_total_patients"] or 0,
+                "avg_risk_score": float(row[f"{p}_avg_risk"] or 0.0),
+                "high_risk_count": row[f"{p}_high_risk"] or 0
+            }
+    return values
 
 class AnalyticsService:
+    def __init__(self, cache: Optional[CacheService] = None):
+        self.cache = cache or default_cache
+
     async def get_metrics_summary(self, time_period: str, department_id: Optional[str] = None) -> MetricsSummary:
         """
         Generate a summary of key metrics for the specified time period
         """
-        async with get_db() as db:
-            # Calculate time window
-            end_date = datetime.now()
-            if time_period == 'daily':
-                start_date = end_date - timedelta(days=1)
-            elif time_period == 'weekly':
-                start_date = end_date - timedelta(weeks=1)
-            elif time_period == 'monthly':
-                start_date = end_date - timedelta(days=30)
-            else:
+        summaries = await self.get_metrics_summaries([time_period], [department_id])
+        return summaries[0]
+
+    async def get_metrics_summaries(
+        self,
+        time_periods: List[str],
+        department_ids: List[Optional[str]]
+    ) -> List[MetricsSummary]:
+        """
+        Summaries for every combination of period and department (None for
+        all departments). Sections are queried concurrently and cached per
+        (period, department); the misses of a section share one scan.
+        """
+        for time_period in time_periods:
+            if time_period not in SUMMARY_PERIODS:
                 raise ValueError(f"Invalid time period: {time_period}")
 
-            # Build query
-            query = """
-                WITH patient_metrics AS (
-                    SELECT 
-                        COUNT(DISTINCT patient_id) as total_patients,
-                        AVG(risk_score) as avg_risk,
-                        COUNT(CASE WHEN risk_score > 75 THEN 1 END) as high_risk
-                    FROM patient_analytics
-                    WHERE updated_at BETWEEN :start_date AND :end_date
-                ),
-                dept_metrics AS (
-                    SELECT AVG(utilization_rate) as avg_utilization
-                    FROM department_metrics
-                    WHERE timestamp BETWEEN :start_date AND :end_date
-                    {dept_filter}
-                ),
-                conditions AS (
-                    SELECT diagnosis_code, COUNT(*) as count
-                    FROM treatment_outcomes
-                    WHERE created_at BETWEEN :start_date AND :end_date
-                    GROUP BY diagnosis_code
-                    ORDER BY count DESC
-                    LIMIT 5
-                )
-                SELECT 
-                    pm.total_patients,
-                    pm.avg_risk,
-                    pm.high_risk,
-                    dm.avg_utilization,
-                    array_agg(c.diagnosis_code) as top_conditions
-                FROM patient_metrics pm
-                CROSS JOIN dept_metrics dm
-                CROSS JOIN conditions c
-                GROUP BY pm.total_patients, pm.avg_risk, pm.high_risk, dm.avg_utilization
-            """
-
-            dept_filter = "AND department_id = :dept_id" if department_id else ""
-            query = query.format(dept_filter=dept_filter)
-
-            params = {
-                "start_date": start_date,
-                "end_date": end_date,
-                "dept_id": department_id
-            }
+        combos = list(dict.fromkeys((p, d) for p in time_periods for d in department_ids))
+        end_date = datetime.now(timezone.utc)
+        sections = await asyncio.gather(*(
+            self.cache.get_or_compute_many(
+                {combo: f"summary:{combo[0]}:{combo[1] or 'all'}:{section}" for combo in combos},
+                lambda missing, section=section: self._query_summary_section(section, missing, end_date)
+            )
+            for section in SUMMARY_SECTIONS
+        ))
+        return [
+            MetricsSummary(
+                time_period=p,
+                department_id=d,
+                **{key: value for section in sections for key, value in section[(p, d)].items()}
+            )
+            for p, d in combos
+        ]
 
-            result = await db.fetch_one(query, params)
+    async def _query_summary_section(
+        self,
+        section: str,
+        combos: List[Tuple[str, Optional[str]]],
+        end_date: datetime
+    ) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+        """
+        Compute one section for the given (period, department) pairs: one
+        query for all-department pairs and, for DEPARTMENT_SECTIONS, one
+        grouped by department for the rest, run concurrently. Long scans of FANOUT_SECTIONS are further
+        split into chunk-aligned pieces read concurrently.
+        """
+        async def scan(periods: List[str], department_ids: List[str]):
+            by_department = bool(department_ids)
+            params = {f"start_{p}": end_date - SUMMARY_PERIODS[p] for p in periods}
+            if by_department:
+                params["dept_ids"] = department_ids
+
+            whole = QuerySegment("raw", min(params[f"start_{p}"] for p in periods), end_date, inclusive_end=True)
+            pieces = fanout_segments([whole]) if section in FANOUT_SECTIONS else [whole]
+
+            async def read(piece: QuerySegment) -> List[Any]:
+                query = summary_section_query(section, periods, by_department, piece.inclusive_end)
+                async with get_db(f"analytics.summary_{section}") as db:
+                    return await db.fetch_all(query, {**params, "scan_start": piece.start, "scan_end": piece.end})
 
-            return MetricsSummary(
-                time_period=time_period,
-                total_patients=result['total_patients'],
-                avg_risk_score=float(result['avg_risk']),
-                high_risk_count=result['high_risk'],
-                department_utilization=float(result['avg_utilization']),
-                top_conditions=result['top_conditions']
+            parts = await fan_out(
+                [lambda piece=piece: read(piece) for piece in pieces], settings.QUERY_FANOUT_CONCURRENCY
             )
+            return summary_section_values(section, [row for rows in parts for row in rows], periods, by_department)
+
+        # Sections without a department filter answer every department with
+        # the all-departments value
+        by_department = section in DEPARTMENT_SECTIONS
+        scans = []
+        overall = sorted({p for p, d in combos if d is None or not by_department})
+        if overall:
+            scans.append(scan(overall, []))
+        departments = sorted({d for p, d in combos if d is not None}) if by_department else []
+        if departments:
+            scans.append(scan(sorted({p for p, d in combos if d is not None}), departments))
+
+        computed: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+        for values in await asyncio.gather(*scans):
+            computed.update(values)
+        return {
+            (p, d): computed.get((p, d if by_department else None), SUMMARY_DEFAULTS[section])
+            for p, d in combos
+        }
 
     async def get_department_utilization(
         self,
@@ -90,47 +236,52 @@ class AnalyticsService:
         """
         Get department utilization metrics aggregated by the specified period
         """
-        async with get_db() as db:
-            interval = {
-                'hourly': '1 hour',
-                'daily': '1 day',
-                'weekly': '1 week'
-            }.get(period)
-
-            if not interval:
-                raise ValueError(f"Invalid period: {period}")
-
-            query = """
-                SELECT 
-                    time_bucket(:interval, timestamp) as period,
-                    AVG(patient_count) as avg_patients,
-                    AVG(utilization_rate) as avg_utilization,
-                    MAX(patient_count) as peak_patients,
-                    AVG(EXTRACT(epoch FROM avg_wait_time))/60 as avg_wait_minutes
-                FROM department_metrics
-                WHERE 
-                    department_id = :dept_id
-                    AND timestamp BETWEEN :start_date AND :end_date
-                GROUP BY time_bucket(:interval, timestamp)
-                ORDER BY period
-            """
-
-            params = {
-                "interval": interval,
-                "dept_id": department_id,
-                "start_date": start_date,
-                "end_date": end_date
-            }
+        interval = PERIOD_INTERVALS.get(period)
+
+        if not interval:
+            raise ValueError(f"Invalid period: {period}")
+
+        # Served from the coarsest materialized rollup, with raw rows only
+        # for the unaligned head and the not-yet-rolled-up tail
+        return await self.cache.get_or_compute(
+            f"utilization:{department_id}:{period}:{start_date.isoformat()}:{end_date.isoformat()}",
+            lambda: rollup_service.query_utilization(department_id, interval, start_date, end_date)
+        )
 
-            results = await db.fetch_all(query, params)
-            
-            return [
-                {
-                    "period": row['period'].isoformat(),
-                    "average_patients": float(row['avg_patients']),
-                    "utilization_rate": float(row['avg_utilization']),
-                    "peak_patients": int(row['peak_patients']),
-                    "average_wait_time": float(row['avg_wait_minutes'])
-                }
-                for row in results
-            ]
\ No newline at end of file
+    async def summary_watermark(self, department_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Latest write to the table behind each summary section (department
+        metrics of `department_id` only, when given), for ETags
+        """
+        department_filter = "WHERE department_id = :dept_id" if department_id else ""
+        async with get_db("analytics.summary_watermark") as db:
+            row = await db.fetch_one(
+                f"""
+                    SELECT
+                        (SELECT MAX(updated_at) FROM patient_analytics) AS patients,
+                        (SELECT MAX(timestamp) FROM department_metrics {department_filter}) AS utilization,
+                        (SELECT MAX(created_at) FROM treatment_outcomes) AS conditions
+                """,
+                {"dept_id": department_id} if department_id else None
+            )
+        return {name: row[name] for name in SUMMARY_SECTIONS} if row else {}
+
+    async def department_watermark(self, department_id: str) -> Optional[datetime]:
+        """
+        Timestamp of the department's latest metrics, for ETags
+        """
+        async with get_db("analytics.department_watermark") as db:
+            return await db.fetch_val(
+                "SELECT MAX(timestamp) FROM department_metrics WHERE department_id = :dept_id",
+                {"dept_id": department_id}
+            )
+
+    async def invalidate_sections(self, sections: List[str]) -> int:
+        """
+        Drop cached summary sections across all periods and departments,
+        after the table behind them was written (patients: risk scoring's
+        patient_analytics upsert). Utilization and conditions are written by
+        other services and, like utilization series, go stale for at most
+        CACHE_TTL_SECONDS.
+        """
+        return await self.cache.invalidate([f"summary:*:*:{section}" for section in sections])
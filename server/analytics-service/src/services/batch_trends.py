@@ -0,0 +1,138 @@
+# src/services/batch_trends.py
+from typing import Dict, Any, List, Optional, Sequence, Union
+import numpy as np
+
+SeriesBatch = Union[np.ndarray, Sequence[Sequence[float]]]
+
+def pad_series(series: SeriesBatch) -> np.ndarray:
+    """
+    Convert a ragged list of series (or an already padded 2-D array) into a
+    float array of shape (n_series, max_length), padded with NaN on the right.
+    Other arrays are rejected: a 1-D array is a single series, not a batch.
+    """
+    if isinstance(series, np.ndarray):
+        if series.ndim != 2:
+            raise ValueError(f"Expected a 2-D array of series, got {series.ndim}-D")
+        return series.astype(float, copy=False)
+
+    rows = [np.asarray(s, dtype=float) for s in series]
+    width = max((len(row) for row in rows), default=0)
+    padded = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        padded[i, :len(row)] = row
+    return padded
+
+def _compact(values: np.ndarray) -> np.ndarray:
+    """
+    Move each row's non-NaN values to the front, keeping their order, so
+    missing readings are dropped the same way `Series.dropna()` drops them
+    """
+    order = np.argsort(np.isnan(values), axis=1, kind="stable")
+    return np.take_along_axis(values, order, axis=1)
+
+def calculate_batch_trends(
+    series: SeriesBatch,
+    alpha: float,
+    beta: float
+) -> Dict[str, np.ndarray]:
+    """
+    Trend statistics for many chronological series at once.
+    NaN entries are treated as missing. Returns arrays of length n_series:
+    count, current, mean, std (ddof=1), slope and correlation against the
+    sample index, volatility and a one-step Holt forecast using the same
+    fixed smoothing parameters as the streaming trend state.
+    """
+    values = _compact(pad_series(series))
+    n_series, width = values.shape
+    if width == 0:
+        # No readings at all (e.g. only empty series)
+        missing = np.full(n_series, np.nan)
+        return {
+            "count": np.zeros(n_series, dtype=int),
+            **{key: missing.copy() for key in ("current", "mean", "std", "correlation", "forecast")},
+            "slope": np.zeros(n_series),
+            "volatility": np.zeros(n_series)
+        }
+    counts = np.count_nonzero(~np.isnan(values), axis=1)
+    mask = np.arange(width)[None, :] < counts[:, None]
+    filled = np.where(mask, values, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        safe_counts = np.maximum(counts, 1)
+        rows = np.arange(n_series)
+        current = np.where(counts > 0, filled[rows, np.maximum(counts - 1, 0)], np.nan)
+        mean = np.where(counts > 0, filled.sum(axis=1) / safe_counts, np.nan)
+
+        deviations = np.where(mask, filled - mean[:, None], 0.0)
+        sum_sq = (deviations ** 2).sum(axis=1)
+        std = np.where(counts > 1, np.sqrt(sum_sq / np.maximum(counts - 1, 1)), np.nan)
+
+        # Least squares against index 0..n-1 in closed form
+        index_deviation = np.where(mask, np.arange(width)[None, :] - (counts[:, None] - 1) / 2, 0.0)
+        index_sum_sq = counts * (counts.astype(float) ** 2 - 1) / 12
+        co_moment = (index_deviation * deviations).sum(axis=1)
+        slope = np.where(index_sum_sq > 0, co_moment / index_sum_sq, 0.0)
+        correlation = co_moment / np.sqrt(index_sum_sq * sum_sq)
+
+        volatility = np.where(mean != 0, std / mean, 0.0)
+
+    forecast = np.where(counts >= 5, _holt_forecast(filled, counts, alpha, beta), current)
+
+    return {
+        "count": counts,
+        "current": current,
+        "mean": mean,
+        "std": std,
+        "slope": slope,
+        "correlation": correlation,
+        "volatility": volatility,
+        "forecast": forecast
+    }
+
+def _holt_forecast(values: np.ndarray, counts: np.ndarray, alpha: float, beta: float) -> np.ndarray:
+    """
+    One-step Holt forecasts, advancing every series one time step per
+    iteration; series shorter than the current step are left untouched
+    """
+    n_series, width = values.shape
+    if width == 0:
+        return np.full(n_series, np.nan)
+    level = values[:, 0].copy()
+    trend = np.zeros(n_series)
+    if width > 1:
+        has_second = counts >= 2
+        trend = np.where(has_second, values[:, 1] - values[:, 0], 0.0)
+        level = np.where(has_second, values[:, 1], level)
+
+    for t in range(2, width):
+        active = counts > t
+        if not active.any():
+            break
+        new_level = alpha * values[:, t] + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+
+    return level + trend
+
+def batch_trends_to_records(trends: Dict[str, np.ndarray], min_points: int = 3) -> List[Optional[Dict[str, Any]]]:
+    """
+    Convert batch results to per-series dicts shaped like
+    TimeSeriesService._calculate_metric_trend (plus trend_strength).
+    Series with fewer than `min_points` values map to None.
+    """
+    records: List[Optional[Dict[str, Any]]] = []
+    for i in range(len(trends["count"])):
+        if trends["count"][i] < min_points:
+            records.append(None)
+            continue
+        records.append({
+            "current_value": float(trends["current"][i]),
+            "mean": float(trends["mean"][i]),
+            "std": float(trends["std"][i]),
+            "trend_direction": "increasing" if trends["slope"][i] > 0 else "decreasing",
+            "volatility": float(trends["volatility"][i]),
+            "forecast_next": float(trends["forecast"][i]),
+            "trend_strength": float(trends["correlation"][i])
+        })
+    return records
@@ -0,0 +1,266 @@
+# src/services/cache_service.py
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from src.core.config import metrics_sampler, settings
+from src.core.metrics import CACHE_ENTRIES, CACHE_EVENTS, counter_sampler
+
+logger = logging.getLogger(__name__)
+
+class LocalRedis:
+    """
+    In-process stand-in for the subset of the redis.asyncio API the cache
+    uses. Selected with REDIS_URL=memory:// and used by the tests.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ex: Optional[float] = None) -> bool:
+        self._data[key] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    async def scan_iter(self, match: str = "*", count: Optional[int] = None):
+        for key in list(self._data):
+            if fnmatchcase(key, match):
+                yield key
+
+    async def close(self) -> None:
+        self._data.clear()
+
+class CacheService:
+    """
+    Two-tier cache for analytics query results.
+    A small in-process LRU with a short TTL sits in front of Redis. Concurrent
+    misses for the same key are coalesced so the query runs once. Values must
+    be JSON-serializable and should be treated as read-only by callers.
+    Invalidation clears this process's LRU and Redis; other workers' LRU
+    entries expire within the local TTL.
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        prefix: str = "analytics:",
+        local_max_entries: int = 1024,
+        local_ttl: float = 5.0,
+        redis_ttl: float = 60.0
+    ):
+        self.redis = redis
+        self.prefix = prefix
+        self.local_max_entries = local_max_entries
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "redis_errors": 0
+        }
+
+    @classmethod
+    def from_settings(cls) -> "CacheService":
+        if settings.REDIS_URL.startswith("memory://"):
+            redis = LocalRedis()
+        else:
+            import redis.asyncio as aioredis
+            redis = aioredis.from_url(settings.REDIS_URL)
+        return cls(
+            redis,
+            local_max_entries=settings.CACHE_LOCAL_MAX_ENTRIES,
+            local_ttl=settings.CACHE_LOCAL_TTL_SECONDS,
+            redis_ttl=settings.CACHE_TTL_SECONDS
+        )
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Return the cached value for `key`, computing and storing it on a miss
+        """
+        hit, value = self._get_local(key)
+        if hit:
+            self.counters["local_hits"] += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, compute, ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody awaited is not logged
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def get_or_compute_many(
+        self,
+        keys: Dict[Hashable, str],
+        compute: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        ttl: Optional[float] = None
+    ) -> Dict[Hashable, Any]:
+        """
+        get_or_compute for several entries at once. `keys` maps entry ids to
+        cache keys; the misses are computed together by a single call to
+        `compute`, which receives the missing ids and returns their values.
+        """
+        unsettled = set(keys)
+        missing: List[Hashable] = []
+        all_settled = asyncio.Event()
+
+        def settle(item_id: Hashable) -> None:
+            unsettled.discard(item_id)
+            if not unsettled:
+                all_settled.set()
+
+        async def run_batch() -> Dict[Hashable, Any]:
+            # Only once every entry has either hit or joined the batch
+            await all_settled.wait()
+            return await compute(missing) if missing else {}
+
+        batch = asyncio.ensure_future(run_batch())
+
+        async def load(item_id: Hashable) -> Any:
+            missing.append(item_id)
+            settle(item_id)
+            return (await asyncio.shield(batch))[item_id]
+
+        async def lookup(item_id: Hashable) -> Any:
+            try:
+                return await self.get_or_compute(keys[item_id], lambda: load(item_id), ttl)
+            finally:
+                settle(item_id)
+
+        try:
+            values = await asyncio.gather(*(lookup(item_id) for item_id in keys))
+        finally:
+            if not batch.done():
+                batch.cancel()
+        return dict(zip(keys, values))
+
+    async def _load(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: Optional[float]) -> Any:
+        cached = await self._redis_call(self.redis.get, self.prefix + key)
+        if cached is not None:
+            self.counters["redis_hits"] += 1
+            value = json.loads(cached)
+            self._set_local(key, value)
+            return value
+
+        self.counters["misses"] += 1
+        value = await compute()
+        payload = json.dumps(value, default=str)
+        await self._redis_call(self.redis.set, self.prefix + key, payload, ex=ttl or self.redis_ttl)
+        # Store the decoded payload so local hits look exactly like Redis hits
+        value = json.loads(payload)
+        self._set_local(key, value)
+        return value
+
+    async def invalidate(self, patterns: Iterable[str]) -> int:
+        """
+        Drop every key matching any of the glob patterns from both tiers.
+        Redis is scanned once per pattern.
+        """
+        patterns = list(patterns)
+        removed = 0
+        for key in [k for k in self._local if any(fnmatchcase(k, p) for p in patterns)]:
+            del self._local[key]
+            removed += 1
+
+        for pattern in patterns:
+            keys = []
+            try:
+                async for key in self.redis.scan_iter(match=self.prefix + pattern, count=500):
+                    keys.append(key)
+                if keys:
+                    removed += await self.redis.delete(*keys)
+            except Exception as e:
+                self.counters["redis_errors"] += 1
+                logger.warning("Cache invalidation of %s failed: %s", pattern, e)
+
+        self.counters["invalidations"] += 1
+        return removed
+
+    async def close(self) -> None:
+        self._local.clear()
+        close = getattr(self.redis, "aclose", None) or self.redis.close
+        await close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["local_hits"] + self.counters["redis_hits"] + self.counters["misses"]
+        hits = self.counters["local_hits"] + self.counters["redis_hits"]
+        return {
+            **self.counters,
+            "local_entries": len(self._local),
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _get_local(self, key: str) -> Tuple[bool, Any]:
+        entry = self._local.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._local[key]
+            return False, None
+        self._local.move_to_end(key)
+        return True, value
+
+    def _set_local(self, key: str, value: Any) -> None:
+        self._local[key] = (time.monotonic() + self.local_ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_max_entries:
+            self._local.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def _redis_call(self, method: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        # Redis is an optimization: on failure, behave as a miss
+        try:
+            return await method(*args, **kwargs)
+        except Exception as e:
+            self.counters["redis_errors"] += 1
+            logger.warning("Redis cache call failed: %s", e)
+            return None
+
+# Shared by all services in this process
+cache = CacheService.from_settings()
+metrics_sampler.register("cache_events", counter_sampler(CACHE_EVENTS, lambda: cache.counters))
+metrics_sampler.register("cache_entries", lambda: CACHE_ENTRIES.set(cache.stats()["local_entries"]))
@@ -0,0 +1,226 @@
+# src/services/cohort_service.py
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.config import cpu_executor, get_db
+from src.services.cache_service import CacheService, cache as default_cache
+from src.services.rollup_service import floor_to
+
+COHORT_METRICS = [
+    'heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'temperature', 'oxygen_saturation', 'respiratory_rate'
+]
+
+# Slopes (units per hour) within +/- this band count as stable
+DEFAULT_STABLE_BANDS = {
+    'heart_rate': 0.5,
+    'blood_pressure_systolic': 0.5,
+    'blood_pressure_diastolic': 0.5,
+    'temperature': 0.02,
+    'oxygen_saturation': 0.05,
+    'respiratory_rate': 0.1
+}
+
+HOURLY = timedelta(hours=1)
+
+def cohort_query(metric: str, bucket: timedelta, department_id: Optional[str]) -> str:
+    """
+    One pass over the cohort's readings, grouped two ways: per patient
+    (bucket count, least-squares slope per hour and mean of the bucket means)
+    and per bucket (population mean and patients reporting).
+    Whole-hour buckets read the patient_metrics_hourly aggregate.
+    """
+    if department_id:
+        cohort = """
+            cohort AS (
+                SELECT DISTINCT patient_id
+                FROM patient_departments
+                WHERE
+                    department_id = :dept_id
+                    AND admitted_at < :end_date
+                    AND (discharged_at IS NULL OR discharged_at >= :start_date)
+            ),"""
+        join = "JOIN cohort USING (patient_id)"
+    else:
+        cohort, join = "", ""
+
+    if bucket % HOURLY == timedelta(0):
+        buckets = f"""
+            buckets AS (
+                SELECT
+                    patient_id,
+                    time_bucket(CAST(:bucket AS interval), bucket) AS period,
+                    SUM({metric}_sum) / NULLIF(SUM({metric}_count), 0) AS value
+                FROM patient_metrics_hourly
+                {join}
+                WHERE bucket >= :start_date AND bucket < :end_date
+                GROUP BY 1, 2
+            )"""
+    else:
+        buckets = f"""
+            buckets AS (
+                SELECT
+                    patient_id,
+                    time_bucket(CAST(:bucket AS interval), timestamp) AS period,
+                    AVG({metric}) AS value
+                FROM health_metrics
+                {join}
+                WHERE timestamp >= :start_date AND timestamp < :end_date
+                GROUP BY 1, 2
+            )"""
+
+    return f"""
+        WITH {cohort}{buckets}
+        SELECT
+            patient_id,
+            period,
+            COUNT(value) AS buckets,
+            regr_slope(value, EXTRACT(epoch FROM period) / 3600) AS slope,
+            AVG(value) AS mean_value
+        FROM buckets
+        WHERE value IS NOT NULL
+        GROUP BY GROUPING SETS ((patient_id), (period))
+    """
+
+def summarize_cohort(
+    patient_rows: Sequence[Tuple[str, int, Optional[float], float]],
+    period_rows: Sequence[Tuple[datetime, int, float]],
+    stable_band: float,
+    min_buckets: int = 3,
+    top_n: int = 10
+) -> Dict[str, Any]:
+    """
+    Vectorized post-processing of the per-patient and per-bucket rows.
+    Patients with fewer than `min_buckets` buckets have no meaningful slope
+    and are excluded from slope statistics.
+    """
+    population = [
+        {"period": period.isoformat(), "mean": float(mean), "patients": int(count)}
+        for period, count, mean in sorted(period_rows)
+    ]
+    if not patient_rows:
+        return {"patients": 0, "population": population}
+
+    ids = np.array([row[0] for row in patient_rows], dtype=object)
+    counts = np.array([row[1] for row in patient_rows], dtype=np.int64)
+    slopes = np.array([np.nan if row[2] is None else row[2] for row in patient_rows], dtype=float)
+    means = np.array([row[3] for row in patient_rows], dtype=float)
+
+    valid = (counts >= min_buckets) & np.isfinite(slopes)
+    ids, slopes, means = ids[valid], slopes[valid], means[valid]
+    n = int(slopes.size)
+    if n == 0:
+        return {"patients": 0, "population": population}
+
+    rising = slopes > stable_band
+    falling = slopes < -stable_band
+    p10, p25, p50, p75, p90 = np.percentile(slopes, [10, 25, 50, 75, 90])
+    k = min(top_n, n)
+    declining = np.argpartition(slopes, k - 1)[:k]
+    declining = declining[np.argsort(slopes[declining])]
+    increasing = np.argpartition(-slopes, k - 1)[:k]
+    increasing = increasing[np.argsort(-slopes[increasing])]
+
+    return {
+        "patients": n,
+        "mean_value": float(means.mean()),
+        "slope_per_hour": {
+            "mean": float(slopes.mean()),
+            "p10": float(p10),
+            "p25": float(p25),
+            "median": float(p50),
+            "p75": float(p75),
+            "p90": float(p90)
+        },
+        "share_rising": float(rising.mean()),
+        "share_falling": float(falling.mean()),
+        "share_stable": float(1.0 - rising.mean() - falling.mean()),
+        "steepest_declines": [
+            {"patient_id": str(ids[i]), "slope_per_hour": float(slopes[i])} for i in declining if slopes[i] < 0
+        ],
+        "steepest_rises": [
+            {"patient_id": str(ids[i]), "slope_per_hour": float(slopes[i])} for i in increasing if slopes[i] > 0
+        ],
+        "population": population
+    }
+
+class CohortTrendService:
+    """
+    Population-level trends for a department (or every patient). Per-patient
+    slopes come from time_bucket aggregates in one SQL pass; only one row per
+    patient and per bucket reaches Python, where statistics are vectorized.
+    """
+
+    def __init__(self, cache: Optional[CacheService] = None):
+        self.cache = cache or default_cache
+
+    async def get_cohort_trends(
+        self,
+        metric: str,
+        department_id: Optional[str] = None,
+        hours: float = 24,
+        bucket_minutes: int = 60,
+        stable_band: Optional[float] = None,
+        min_buckets: int = 3,
+        end_date: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        if metric not in COHORT_METRICS:
+            raise ValueError(f"Invalid metric type: {metric}")
+        if stable_band is None:
+            stable_band = DEFAULT_STABLE_BANDS[metric]
+
+        bucket = timedelta(minutes=bucket_minutes)
+        end = floor_to(end_date or datetime.now(timezone.utc), bucket)
+        start = floor_to(end - timedelta(hours=hours), bucket)
+        return await self.cache.get_or_compute(
+            f"cohort:{department_id or 'all'}:{metric}:{start.isoformat()}:{end.isoformat()}"
+            f":{bucket_minutes}:{stable_band}:{min_buckets}",
+            lambda: self._query_cohort_trends(metric, department_id, start, end, bucket, stable_band, min_buckets)
+        )
+
+    async def invalidate_metrics(self, metrics: Sequence[str]) -> int:
+        """
+        Drop cached cohort trends of these vitals, after readings of them
+        were written
+        """
+        return await self.cache.invalidate([f"cohort:*:{metric}:*" for metric in metrics])
+
+    async def _query_cohort_trends(
+        self,
+        metric: str,
+        department_id: Optional[str],
+        start: datetime,
+        end: datetime,
+        bucket: timedelta,
+        stable_band: float,
+        min_buckets: int
+    ) -> Dict[str, Any]:
+        params = {"bucket": bucket, "start_date": start, "end_date": end}
+        if department_id:
+            params["dept_id"] = department_id
+        async with get_db("cohort.query_cohort_trends") as db:
+            rows = await db.fetch_all(cohort_query(metric, bucket, department_id), params)
+
+        patient_rows: List[Tuple] = []
+        period_rows: List[Tuple] = []
+        for row in rows:
+            if row['period'] is None:
+                patient_rows.append((str(row['patient_id']), row['buckets'], row['slope'], row['mean_value']))
+            else:
+                period_rows.append((row['period'], row['buckets'], row['mean_value']))
+
+        summary = await cpu_executor.run(
+            summarize_cohort, patient_rows, period_rows, stable_band, min_buckets,
+            name="cohort_summary"
+        )
+        return {
+            "department_id": department_id,
+            "metric": metric,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "bucket_minutes": int(bucket.total_seconds() // 60),
+            "stable_band_per_hour": stable_band,
+            **summary
+        }
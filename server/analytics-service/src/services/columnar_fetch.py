@@ -0,0 +1,117 @@
+# src/services/columnar_fetch.py
+"""
+Column-projected reads of health_metrics (and its aggregate tiers) decoded
+straight into NumPy arrays.
+
+The query runs as `COPY (...) TO STDOUT (FORMAT binary)` into an in-memory
+buffer instead of through fetch_all, so no Record, float or datetime object
+is built per row. Only the requested columns are selected, NULL metrics are
+sent as NaN, and every row then has the same width. That lets the whole
+buffer be decoded with a single NumPy structured dtype.
+"""
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Dict, Optional, Sequence
+from uuid import UUID
+
+import numpy as np
+
+PGCOPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# Postgres binary timestamps count microseconds from 2000-01-01 UTC
+POSTGRES_EPOCH_US = 946_684_800_000_000
+
+def metric_columns_query(
+    metrics: Sequence[str],
+    with_timestamp: bool = False,
+    upper: Optional[str] = "<="
+) -> str:
+    """
+    One patient's readings from $2 up to $3 (inclusive for upper "<=",
+    exclusive for "<", unbounded for None), oldest first. Metric names must
+    already be validated against VITAL_COLUMNS.
+    """
+    columns = ["timestamp"] if with_timestamp else []
+    columns += [f"COALESCE({metric}, CAST('NaN' AS double precision)) AS {metric}" for metric in metrics]
+    end = f"AND timestamp {upper} $3" if upper else ""
+    return f"""
+        SELECT {", ".join(columns)}
+        FROM health_metrics
+        WHERE
+            patient_id = $1
+            AND timestamp >= $2
+            {end}
+        ORDER BY timestamp
+    """
+
+def copy_row_dtype(columns: Sequence[str], with_timestamp: bool = False) -> np.dtype:
+    """
+    Layout of one binary COPY row: field count, then a length and an
+    8-byte big-endian value per column
+    """
+    fields = [("field_count", ">i2")]
+    if with_timestamp:
+        fields += [("timestamp_length", ">i4"), ("timestamp", ">i8")]
+    for column in columns:
+        fields += [(f"{column}_length", ">i4"), (column, ">f8")]
+    return np.dtype(fields)
+
+def decode_binary_copy(
+    buffer: bytes,
+    columns: Sequence[str],
+    with_timestamp: bool = False
+) -> Dict[str, np.ndarray]:
+    """
+    Decode a binary COPY of non-NULL double precision columns (led by a
+    timestamptz "timestamp" when selected) into float64 and datetime64[us]
+    UTC arrays
+    """
+    if not buffer.startswith(PGCOPY_SIGNATURE):
+        raise ValueError("Not a binary COPY stream")
+    extension_length = int.from_bytes(buffer[15:19], "big")
+    body = memoryview(buffer)[19 + extension_length:-2]
+
+    dtype = copy_row_dtype(columns, with_timestamp)
+    if len(body) % dtype.itemsize:
+        raise ValueError("Binary COPY rows are not fixed-width; a selected column was NULL")
+    rows = np.frombuffer(body, dtype=dtype)
+    width = len(columns) + with_timestamp
+    if len(rows) and ((rows["field_count"] != width).any() or any(
+        (rows[f"{name}_length"] != 8).any()
+        for name in (["timestamp"] if with_timestamp else []) + list(columns)
+    )):
+        raise ValueError("Unexpected binary COPY row layout")
+
+    decoded = {column: rows[column].astype(np.float64) for column in columns}
+    if with_timestamp:
+        decoded["timestamp"] = (rows["timestamp"].astype(np.int64) + POSTGRES_EPOCH_US).view("datetime64[us]")
+    return decoded
+
+async def fetch_columns(
+    db,
+    query: str,
+    args: Sequence[Any],
+    columns: Sequence[str],
+    with_timestamp: bool = False
+) -> Dict[str, np.ndarray]:
+    """
+    Run `query` (positional $n parameters) as a binary COPY and decode it
+    """
+    output = BytesIO()
+    await db.copy_from_query(query, *args, output=output, format="binary")
+    return decode_binary_copy(output.getvalue(), columns, with_timestamp)
+
+async def fetch_metric_columns(
+    db,
+    patient_id: str,
+    metrics: Sequence[str],
+    start: datetime,
+    end: Optional[datetime] = None,
+    upper: str = "<=",
+    with_timestamp: bool = False
+) -> Dict[str, np.ndarray]:
+    """
+    A patient's metric columns from start (to end, if given) as NumPy arrays
+    """
+    args = [UUID(str(patient_id)), start] + ([end] if end is not None else [])
+    query = metric_columns_query(metrics, with_timestamp, upper if end is not None else None)
+    return await fetch_columns(db, query, args, metrics, with_timestamp)
@@ -0,0 +1,75 @@
+# src/services/department_stays.py
+from typing import Any, Dict, List
+
+from src.core.config import get_db
+from src.models.schemas import PatientTransfer
+from src.services.alert_service import alert_service
+
+# Ends the stay the patient was in at :timestamp. Stays are keyed by
+# admission time, so a late event closes the stay that was open then
+# without touching later ones.
+CLOSE_STAY = """
+    UPDATE patient_departments
+    SET discharged_at = :timestamp
+    WHERE
+        patient_id = :patient_id
+        AND admitted_at = (
+            SELECT MAX(admitted_at) FROM patient_departments
+            WHERE patient_id = :patient_id AND admitted_at < :timestamp
+        )
+        AND (discharged_at IS NULL OR discharged_at > :timestamp)
+"""
+
+# Starts a stay at :timestamp. A stay it splits hands over its discharge;
+# otherwise the stay lasts until the patient's next recorded admission (if a
+# later event already arrived). Replaying an event is a no-op.
+OPEN_STAY = """
+    INSERT INTO patient_departments (patient_id, department_id, admitted_at, discharged_at)
+    VALUES (
+        :patient_id, :department_id, :timestamp,
+        COALESCE(
+            (
+                SELECT discharged_at FROM patient_departments
+                WHERE
+                    patient_id = :patient_id
+                    AND admitted_at = (
+                        SELECT MAX(admitted_at) FROM patient_departments
+                        WHERE patient_id = :patient_id AND admitted_at < :timestamp
+                    )
+                    AND discharged_at > :timestamp
+            ),
+            (
+                SELECT MIN(admitted_at) FROM patient_departments
+                WHERE patient_id = :patient_id AND admitted_at > :timestamp
+            )
+        )
+    )
+    ON CONFLICT (patient_id, admitted_at) DO UPDATE SET department_id = EXCLUDED.department_id
+"""
+
+class DepartmentStayService:
+    """
+    Maintains patient_departments from admission, transfer and discharge
+    events: each event closes the stay open at its timestamp and, unless it
+    is a discharge, opens one in the new department. Cohort trends and the
+    department alert topics read these stays.
+    """
+
+    async def record_transfers(self, transfers: List[PatientTransfer]) -> Dict[str, Any]:
+        """
+        Apply the events in timestamp order, all in one transaction
+        """
+        async with get_db("department_stays.record_transfers") as db:
+            async with db.transaction():
+                for transfer in sorted(transfers, key=lambda t: t.timestamp):
+                    values = {"patient_id": transfer.patient_id, "timestamp": transfer.timestamp}
+                    # Opened first, to inherit the discharge of the stay it closes
+                    if transfer.department_id is not None:
+                        await db.execute(OPEN_STAY, {**values, "department_id": transfer.department_id})
+                    await db.execute(CLOSE_STAY, values)
+
+        alert_service.forget_departments(transfer.patient_id for transfer in transfers)
+        return {
+            "recorded": len(transfers),
+            "patients": len({transfer.patient_id for transfer in transfers})
+        }
@@ -0,0 +1,132 @@
+# src/services/history_export.py
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Sequence
+import json
+
+import numpy as np
+
+from src.services.quantile_sketch import TDigest
+from src.services.trend_state import RunningStats
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+class HistorySummary:
+    """
+    History statistics accumulated chunk by chunk, so memory stays constant
+    however long the requested range is. Median and quartiles are t-digest
+    estimates (see TDigest for the error bound).
+    """
+
+    def __init__(self, metrics: Sequence[str], compression: float = 200.0):
+        self.metrics = list(metrics)
+        self.stats = {metric: RunningStats() for metric in self.metrics}
+        self.digests = {metric: TDigest(compression) for metric in self.metrics}
+        self.data_points = 0
+
+    def update(self, rows: Sequence[Any]) -> None:
+        self.data_points += len(rows)
+        for position, metric in enumerate(self.metrics, start=1):
+            stats = self.stats[metric]
+            values = [float(row[position]) for row in rows if row[position] is not None]
+            for value in values:
+                stats.update(value)
+            self.digests[metric].update(values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        analysis = {}
+        for metric, stats in self.stats.items():
+            if stats.count == 0:
+                continue
+            p25, median, p75 = self.digests[metric].quantile(np.array([0.25, 0.5, 0.75]))
+            analysis[metric] = {
+                "count": stats.count,
+                "min": float(stats.min),
+                "max": float(stats.max),
+                "mean": float(stats.mean),
+                "std": float(stats.std),
+                "median": float(median),
+                "percentile_25": float(p25),
+                "percentile_75": float(p75),
+                "trend_strength": float(stats.correlation)
+            }
+        return {"metrics": analysis, "data_points": self.data_points}
+
+async def ndjson_stream(
+    chunks: AsyncIterator[List[Any]],
+    metrics: Sequence[str],
+    start_date: datetime,
+    end_date: datetime
+) -> AsyncIterator[bytes]:
+    """
+    One JSON object per reading, followed by a final {"summary": ...} line
+    """
+    summary = HistorySummary(metrics)
+    columns = ["timestamp", *metrics]
+    async for rows in chunks:
+        summary.update(rows)
+        lines = []
+        for row in rows:
+            reading = dict(zip(columns, row))
+            reading["timestamp"] = reading["timestamp"].isoformat()
+            lines.append(json.dumps(reading))
+        yield ("\n".join(lines) + "\n").encode()
+
+    yield (json.dumps({"summary": {
+        **summary.to_dict(),
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat()
+    }}) + "\n").encode()
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class _ChunkSink:
+    """
+    Write-only file object handing the IPC writer's output back chunk by
+    chunk, so only the current record batch is held in memory
+    """
+    closed = False
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+async def arrow_stream(chunks: AsyncIterator[List[Any]], metrics: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+    Arrow IPC stream with one record batch per chunk. Requires pyarrow.
+    """
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [pa.field("timestamp", pa.timestamp("us", tz="UTC"))]
+        + [pa.field(metric, pa.float64()) for metric in metrics]
+    )
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    async for rows in chunks:
+        columns = list(zip(*rows))
+        writer.write_batch(pa.record_batch(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        ))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,166 @@
+# src/services/history_tiers.py
+"""
+Storage tiers of patient history and the planner choosing among them.
+
+From finest to coarsest: raw health_metrics (compressed after a week),
+per-minute and per-hour aggregates (migration 006), then the daily sketches
+(migration 003). The raw and minute tiers are dropped after their retention
+periods. plan_history reads a range from the requested tier wherever it
+still holds data, and hands older parts of the range to the next coarser
+tier that does.
+
+Aggregate rows keep a count, sum, sum of squares, minimum and maximum per
+metric. Raw readings convert to one-reading buckets, so a mix of tiers
+combines exactly for mean, std, min and max.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+from uuid import UUID
+
+import numpy as np
+
+from src.services.columnar_fetch import fetch_columns, fetch_metric_columns
+from src.services.rollup_service import as_utc, ceil_to, floor_to
+
+@dataclass(frozen=True)
+class HistoryTier:
+    name: str
+    source: str
+    bucket: timedelta
+
+# Finest first; "day" resolution is served by the daily sketches
+HISTORY_TIERS = [
+    HistoryTier("raw", "health_metrics", timedelta(0)),
+    HistoryTier("minute", "health_metrics_1m", timedelta(minutes=1)),
+    HistoryTier("hour", "health_metrics_1h", timedelta(hours=1)),
+]
+TIERS = {tier.name: tier for tier in HISTORY_TIERS}
+RESOLUTIONS = [*TIERS, "day"]
+
+BUCKET_FIELDS = ("count", "sum", "sum_squares", "min", "max")
+
+@dataclass(frozen=True)
+class HistorySegment:
+    """
+    A slice of the requested range read from one tier. Covers [start, end),
+    or [start, end] when `inclusive_end` is set (the tail of the range).
+    """
+    tier: str
+    start: datetime
+    end: datetime
+    inclusive_end: bool = False
+
+def plan_history(
+    start_date: datetime,
+    end_date: datetime,
+    resolution: str,
+    retained_since: Dict[str, datetime]
+) -> List[HistorySegment]:
+    """
+    Cover [start_date, end_date] with the `resolution` tier back to
+    retained_since[tier] (tiers missing from it keep everything), and the
+    parts before that with the next coarser tier. Hand-overs fall on the
+    coarser tier's bucket boundaries. Segments are returned oldest first.
+    """
+    start, end = as_utc(start_date), as_utc(end_date)
+    names = [tier.name for tier in HISTORY_TIERS]
+    candidates = names[names.index(resolution):]
+
+    segments = []
+    segment_end, inclusive = end, True
+    for i, name in enumerate(candidates):
+        boundary = retained_since.get(name)
+        if boundary is None or boundary <= start or i == len(candidates) - 1:
+            segments.append(HistorySegment(name, start, segment_end, inclusive))
+            break
+        boundary = ceil_to(boundary, TIERS[candidates[i + 1]].bucket)
+        if boundary < segment_end:
+            segments.append(HistorySegment(name, boundary, segment_end, inclusive))
+            segment_end, inclusive = boundary, False
+    return segments[::-1]
+
+def bucket_columns(metrics: Sequence[str]) -> List[str]:
+    return [f"{metric}_{field}" for metric in metrics for field in BUCKET_FIELDS]
+
+def bucket_query(segment: HistorySegment, metrics: Sequence[str]) -> str:
+    """
+    One patient's aggregate rows of an aggregate tier, oldest first, with
+    every column non-NULL as the binary COPY decoder needs
+    """
+    columns = []
+    for metric in metrics:
+        columns += [
+            f"CAST({metric}_count AS double precision) AS {metric}_count",
+            f"COALESCE({metric}_sum, 0) AS {metric}_sum",
+            f"COALESCE({metric}_sum_squares, 0) AS {metric}_sum_squares",
+            f"COALESCE({metric}_min, CAST('NaN' AS double precision)) AS {metric}_min",
+            f"COALESCE({metric}_max, CAST('NaN' AS double precision)) AS {metric}_max",
+        ]
+    upper = "<=" if segment.inclusive_end else "<"
+    return f"""
+        SELECT {", ".join(columns)}
+        FROM {TIERS[segment.tier].source}
+        WHERE
+            patient_id = $1
+            AND bucket >= $2
+            AND bucket {upper} $3
+        ORDER BY bucket
+    """
+
+def raw_to_buckets(columns: Dict[str, np.ndarray], metrics: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    Raw metric columns (NaN where missing) as one-reading buckets
+    """
+    buckets = {}
+    for metric in metrics:
+        values = columns[metric]
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        buckets[f"{metric}_count"] = present.astype(np.float64)
+        buckets[f"{metric}_sum"] = filled
+        buckets[f"{metric}_sum_squares"] = filled * filled
+        buckets[f"{metric}_min"] = values
+        buckets[f"{metric}_max"] = values
+    return buckets
+
+async def fetch_segment(db, patient_id: str, segment: HistorySegment, metrics: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    A segment's rows as bucket columns. Buckets starting before the segment
+    but overlapping it are included, so its first bucket is whole.
+    """
+    if segment.tier == "raw":
+        upper = "<=" if segment.inclusive_end else "<"
+        columns = await fetch_metric_columns(db, patient_id, metrics, segment.start, segment.end, upper)
+        return raw_to_buckets(columns, metrics)
+    start = floor_to(segment.start, TIERS[segment.tier].bucket)
+    return await fetch_columns(
+        db, bucket_query(segment, metrics),
+        [UUID(str(patient_id)), start, segment.end], bucket_columns(metrics)
+    )
+
+def weighted_quantiles(values: np.ndarray, weights: np.ndarray, qs: Sequence[float]) -> np.ndarray:
+    """
+    Linearly interpolated quantiles of `values` each repeated `weights`
+    times (pandas' default on that expanded series), without expanding it
+    """
+    order = np.argsort(values, kind="stable")
+    values, cumulative = values[order], np.cumsum(weights[order])
+    positions = np.asarray(qs, dtype=np.float64) * (cumulative[-1] - 1)
+    lower = np.floor(positions)
+    low = values[np.searchsorted(cumulative, lower, side="right")]
+    high = values[np.searchsorted(cumulative, np.minimum(lower + 1, cumulative[-1] - 1), side="right")]
+    return low + (high - low) * (positions - lower)
+
+def concat_buckets(parts: List[Dict[str, np.ndarray]], metrics: Sequence[str]) -> Dict[str, np.ndarray]:
+    return {
+        column: np.concatenate([part[column] for part in parts]) if parts else np.empty(0)
+        for column in bucket_columns(metrics)
+    }
+
+def tier_retention(now: datetime, raw_days: float, minute_days: float) -> Dict[str, datetime]:
+    return {"raw": now - timedelta(days=raw_days), "minute": now - timedelta(days=minute_days)}
+
+def coarsest(segments: Sequence[HistorySegment]) -> Optional[str]:
+    names = [tier.name for tier in HISTORY_TIERS]
+    return max((segment.tier for segment in segments), key=names.index, default=None)
@@ -0,0 +1,110 @@
+# src/services/quantile_sketch.py
+from typing import Iterable, Optional, Union
+import math
+import numpy as np
+
+class TDigest:
+    """
+    Mergeable quantile sketch (t-digest with the arcsine scale function).
+
+    Values are summarized by weighted centroids. A compression pass sorts
+    the centroids and merges neighbours whose quantile midpoints fall into
+    the same unit of the scale function
+        k(q) = compression / (2 * pi) * asin(2q - 1)
+    so centroids are small near the tails and larger around the median.
+    Compression is vectorized with NumPy.
+
+    Error bound: a centroid spans at most about two k-units after repeated
+    merging, so the rank error of quantile(q) is at most
+        2 * pi * sqrt(q * (1 - q)) / compression
+    (about 1.6% of rank at the median for the default compression of 200).
+    Observed errors are typically an order of magnitude smaller. Min and max
+    are exact. A digest holds roughly `compression / 2` centroids.
+    """
+
+    def __init__(
+        self,
+        compression: float = 200.0,
+        means: Optional[np.ndarray] = None,
+        weights: Optional[np.ndarray] = None,
+        min: float = math.inf,
+        max: float = -math.inf
+    ):
+        self.compression = float(compression)
+        self.means = np.asarray(means if means is not None else [], dtype=float)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=float)
+        self.min = float(min)
+        self.max = float(max)
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: Union[Iterable[float], np.ndarray]) -> "TDigest":
+        """
+        Add raw values (NaN ignored) in place
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.means, self.weights = self._compress(
+            np.concatenate([self.means, values]),
+            np.concatenate([self.weights, np.ones(values.size)])
+        )
+        return self
+
+    @classmethod
+    def merge(cls, digests: Iterable["TDigest"], compression: Optional[float] = None) -> "TDigest":
+        digests = [d for d in digests if d.weights.size]
+        if compression is None:
+            compression = digests[0].compression if digests else 200.0
+        merged = cls(compression)
+        if not digests:
+            return merged
+        merged.min = min(d.min for d in digests)
+        merged.max = max(d.max for d in digests)
+        merged.means, merged.weights = merged._compress(
+            np.concatenate([d.means for d in digests]),
+            np.concatenate([d.weights for d in digests])
+        )
+        return merged
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        midpoints = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * midpoints - 1, -1, 1)))
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(k)) + 1])
+        grouped_weights = np.add.reduceat(weights, starts)
+        grouped_means = np.add.reduceat(means * weights, starts) / grouped_weights
+        return grouped_means, grouped_weights
+
+    def quantile(self, q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Estimate quantile(s) q in [0, 1]; NaN for an empty digest
+        """
+        if self.weights.size == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float("nan")
+        total = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centres, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        result = np.interp(np.asarray(q, dtype=float) * total, positions, values)
+        return float(result) if np.ndim(q) == 0 else result
+
+    def to_bytes(self) -> bytes:
+        header = np.array([self.compression, self.min, self.max, self.means.size], dtype=float)
+        return np.concatenate([header, self.means, self.weights]).astype("<f8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        if not data:
+            return cls()
+        array = np.frombuffer(data, dtype="<f8")
+        compression, minimum, maximum, size = array[:4]
+        size = int(size)
+        return cls(compression, array[4:4 + size], array[4 + size:4 + 2 * size], minimum, maximum)
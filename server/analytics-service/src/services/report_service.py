@@ -0,0 +1,510 @@
+# src/services/report_service.py
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+
+from pydantic import BaseModel, ValidationError, model_validator
+
+from src.core.config import get_db, settings
+from src.core.errors import ServiceUnavailableError
+from src.core.metrics import (
+    REPORT_JOBS_RUNNING, REPORT_JOBS_SUBMITTED, REPORT_QUEUE_DEPTH, REPORT_QUEUE_WAIT, REPORT_RUNTIME
+)
+from src.services.rollup_service import PARTIAL_COLUMNS, ROLLUP_COLUMNS, floor_to
+
+logger = logging.getLogger(__name__)
+
+class ReportError(Exception):
+    pass
+
+# Parameters
+
+class DepartmentUtilizationParams(BaseModel):
+    start_month: date
+    end_month: date
+    department_id: Optional[UUID] = None
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.end_month < self.start_month:
+            raise ValueError("end_month is before start_month")
+        return self
+
+class TreatmentOutcomesParams(BaseModel):
+    start_date: date
+    end_date: date
+    diagnosis_codes: Optional[List[str]] = None
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.end_date <= self.start_date:
+            raise ValueError("end_date must be after start_date")
+        if self.diagnosis_codes:
+            self.diagnosis_codes = sorted(set(self.diagnosis_codes))
+        return self
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+def next_month(value: date) -> date:
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def month_chunks(start: date, end: date) -> List[Tuple[date, date]]:
+    """
+    [start, end) split at month boundaries
+    """
+    chunks = []
+    current = start
+    while current < end:
+        boundary = min(next_month(current), end)
+        chunks.append((current, boundary))
+        current = boundary
+    return chunks
+
+@dataclass(frozen=True)
+class ReportDefinition:
+    """
+    A report computed one chunk (month) at a time. `columns` are
+    (name, type) with type one of string, int, float, date.
+    """
+    name: str
+    params_model: type
+    columns: List[Tuple[str, str]]
+    chunks: Callable[[Any], List[Tuple[date, date]]]
+    run_chunk: Callable[[Any, Any, Tuple[date, date]], Any]
+
+async def _utilization_chunk(db, params: DepartmentUtilizationParams, chunk: Tuple[date, date]) -> List[Dict[str, Any]]:
+    """
+    Whole materialized days come from department_metrics_daily, the rest of
+    the month from department_metrics. Aggregates of integer sums come back
+    as numeric, so they are cast to the report's column types.
+    """
+    start = datetime.combine(chunk[0], datetime.min.time(), tzinfo=timezone.utc)
+    end = datetime.combine(chunk[1], datetime.min.time(), tzinfo=timezone.utc)
+    watermark = await db.fetch_val(
+        "SELECT refreshed_until FROM rollup_watermarks WHERE rollup_name = 'department_metrics_daily'"
+    )
+    split = start if watermark is None else min(max(floor_to(watermark, timedelta(days=1)), start), end)
+    dept_filter = "AND department_id = :dept_id" if params.department_id else ""
+    query = f"""
+        SELECT
+            department_id,
+            CAST(SUM(patient_sum) / NULLIF(SUM(patient_samples), 0) AS double precision) AS average_patients,
+            CAST(SUM(utilization_sum) / NULLIF(SUM(utilization_samples), 0) AS double precision) AS utilization_rate,
+            MAX(peak_patients) AS peak_patients,
+            CAST(SUM(wait_seconds_sum) / 60 / NULLIF(SUM(wait_samples), 0) AS double precision) AS average_wait_minutes,
+            CAST(SUM(patient_samples) AS bigint) AS samples
+        FROM (
+            SELECT department_id, {ROLLUP_COLUMNS}
+            FROM department_metrics_daily
+            WHERE bucket >= :start_date AND bucket < :split {dept_filter}
+            GROUP BY department_id
+            UNION ALL
+            SELECT department_id, {PARTIAL_COLUMNS}
+            FROM department_metrics
+            WHERE timestamp >= :split AND timestamp < :end_date {dept_filter}
+            GROUP BY department_id
+        ) partials
+        GROUP BY department_id
+        ORDER BY department_id
+    """
+    values = {"start_date": start, "split": split, "end_date": end}
+    if params.department_id:
+        values["dept_id"] = params.department_id
+    rows = await db.fetch_all(query, values)
+    return [
+        {
+            "month": chunk[0],
+            "department_id": str(row['department_id']),
+            "average_patients": row['average_patients'],
+            "utilization_rate": row['utilization_rate'],
+            "peak_patients": row['peak_patients'],
+            "average_wait_minutes": row['average_wait_minutes'],
+            "samples": row['samples']
+        }
+        for row in rows
+    ]
+
+async def _outcomes_chunk(db, params: TreatmentOutcomesParams, chunk: Tuple[date, date]) -> List[Dict[str, Any]]:
+    code_filter = "AND diagnosis_code = ANY(CAST(:codes AS text[]))" if params.diagnosis_codes else ""
+    query = f"""
+        SELECT
+            diagnosis_code,
+            COUNT(*) AS treatments,
+            COUNT(DISTINCT patient_id) AS patients,
+            CAST(AVG(success_rating) AS double precision) AS average_success_rating,
+            CAST(AVG(CASE WHEN cardinality(complications) > 0 THEN 1.0 ELSE 0.0 END) AS double precision)
+                AS complication_rate,
+            CAST(AVG(EXTRACT(epoch FROM end_date - start_date) / 86400) AS double precision) AS average_duration_days
+        FROM treatment_outcomes
+        WHERE start_date >= :start_date AND start_date < :end_date {code_filter}
+        GROUP BY diagnosis_code
+        ORDER BY diagnosis_code
+    """
+    values = {
+        "start_date": datetime.combine(chunk[0], datetime.min.time(), tzinfo=timezone.utc),
+        "end_date": datetime.combine(chunk[1], datetime.min.time(), tzinfo=timezone.utc)
+    }
+    if params.diagnosis_codes:
+        values["codes"] = params.diagnosis_codes
+    rows = await db.fetch_all(query, values)
+    return [{"month": month_start(chunk[0]), **{key: row[key] for key in (
+        "diagnosis_code", "treatments", "patients", "average_success_rating",
+        "complication_rate", "average_duration_days"
+    )}} for row in rows]
+
+REPORTS: Dict[str, ReportDefinition] = {
+    definition.name: definition for definition in [
+        ReportDefinition(
+            name="department_utilization_monthly",
+            params_model=DepartmentUtilizationParams,
+            columns=[
+                ("month", "date"), ("department_id", "string"), ("average_patients", "float"),
+                ("utilization_rate", "float"), ("peak_patients", "int"),
+                ("average_wait_minutes", "float"), ("samples", "int")
+            ],
+            chunks=lambda p: month_chunks(month_start(p.start_month), next_month(p.end_month)),
+            run_chunk=_utilization_chunk
+        ),
+        ReportDefinition(
+            name="treatment_outcomes_by_diagnosis",
+            params_model=TreatmentOutcomesParams,
+            columns=[
+                ("month", "date"), ("diagnosis_code", "string"), ("treatments", "int"),
+                ("patients", "int"), ("average_success_rating", "float"),
+                ("complication_rate", "float"), ("average_duration_days", "float")
+            ],
+            chunks=lambda p: month_chunks(p.start_date, p.end_date),
+            run_chunk=_outcomes_chunk
+        ),
+    ]
+}
+
+def normalize_request(report_type: str, params: Dict[str, Any], format: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Validate parameters and return them in canonical form with the hash
+    that identifies identical requests
+    """
+    definition = REPORTS.get(report_type)
+    if definition is None:
+        raise ReportError(f"Unknown report type: {report_type}")
+    if format == "parquet" and not parquet_available():
+        raise ReportError("Parquet output requires pyarrow")
+    try:
+        model = definition.params_model(**params)
+    except ValidationError as e:
+        raise ReportError(str(e))
+    canonical = json.loads(model.json())
+    key = json.dumps({"report_type": report_type, "params": canonical, "format": format}, sort_keys=True)
+    return canonical, hashlib.sha256(key.encode()).hexdigest()
+
+# Output
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+COERCE = {"int": int, "float": float}
+
+def coerce_rows(rows: List[Dict[str, Any]], columns: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Rows with int and float columns converted from whatever the driver
+    returned (Decimal for numeric aggregates)
+    """
+    casts = [(name, COERCE[kind]) for name, kind in columns if kind in COERCE]
+    return [
+        {**row, **{name: cast(row[name]) for name, cast in casts if row.get(name) is not None}}
+        for row in rows
+    ]
+
+class CsvReportWriter:
+    """
+    Writers do blocking file I/O; ReportService.run calls them on a thread
+    """
+
+    def __init__(self, path: Path, columns: List[Tuple[str, str]]):
+        self.columns = columns
+        self.names = [name for name, _ in columns]
+        self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.names)
+        self._writer.writeheader()
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.writerows(coerce_rows(rows, self.columns))
+
+    def close(self) -> None:
+        self._file.close()
+
+class ParquetReportWriter:
+    """
+    One Parquet row group per chunk
+    """
+
+    def __init__(self, path: Path, columns: List[Tuple[str, str]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {"string": pa.string(), "int": pa.int64(), "float": pa.float64(), "date": pa.date32()}
+        self.columns = columns
+        self._pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self._writer = pq.ParquetWriter(str(path), self.schema)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        if rows:
+            self._writer.write_table(self._pa.Table.from_pylist(coerce_rows(rows, self.columns), schema=self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+WRITERS = {"csv": CsvReportWriter, "parquet": ParquetReportWriter}
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Jobs
+
+# Inserts retried when the conflicting job is gone before it can be read
+SUBMIT_ATTEMPTS = 3
+
+JOB_COLUMNS = """
+    id, report_type, params, format, status, chunks_total, chunks_done, rows_written,
+    result_path, error, created_at, started_at, finished_at, expires_at
+"""
+
+def _job(row: Any) -> Dict[str, Any]:
+    job = {key: row[key] for key in (
+        "id", "report_type", "params", "format", "status", "chunks_total", "chunks_done",
+        "rows_written", "result_path", "error", "created_at", "started_at", "finished_at", "expires_at"
+    )}
+    if isinstance(job["params"], str):
+        job["params"] = json.loads(job["params"])
+    return job
+
+class ReportService:
+    """
+    Report jobs stored in report_jobs. Submissions are deduplicated by
+    parameter hash; any worker process may claim a queued job
+    (FOR UPDATE SKIP LOCKED). A running job whose heartbeat is older than
+    REPORT_STALE_AFTER_SECONDS is assumed lost and queued again.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+
+    async def submit(self, report_type: str, params: Dict[str, Any], format: str) -> Dict[str, Any]:
+        canonical, params_hash = normalize_request(report_type, params, format)
+        async with get_db("reports.submit") as db:
+            await self._expire(db)
+            for _ in range(SUBMIT_ATTEMPTS):
+                row = await db.fetch_one(
+                    f"""
+                        INSERT INTO report_jobs (report_type, params, params_hash, format)
+                        VALUES (:report_type, CAST(:params AS jsonb), :params_hash, :format)
+                        ON CONFLICT (params_hash) WHERE status IN ('queued', 'running', 'succeeded')
+                        DO NOTHING
+                        RETURNING {JOB_COLUMNS}
+                    """,
+                    {"report_type": report_type, "params": json.dumps(canonical),
+                     "params_hash": params_hash, "format": format}
+                )
+                deduplicated = row is None
+                if not deduplicated:
+                    break
+                row = await db.fetch_one(
+                    f"""
+                        SELECT {JOB_COLUMNS} FROM report_jobs
+                        WHERE params_hash = :params_hash AND status IN ('queued', 'running', 'succeeded')
+                    """,
+                    {"params_hash": params_hash}
+                )
+                # None when the job we conflicted with failed or expired in between
+                if row is not None:
+                    break
+            else:
+                raise ServiceUnavailableError("Report job submission kept conflicting, retry shortly")
+            if not deduplicated:
+                await self._sample_queue_depth(db)
+        REPORT_JOBS_SUBMITTED.labels(report_type, str(deduplicated).lower()).inc()
+        return {**_job(row), "deduplicated": deduplicated}
+
+    async def get(self, job_id: UUID) -> Optional[Dict[str, Any]]:
+        async with get_db("reports.get") as db:
+            row = await db.fetch_one(
+                f"SELECT {JOB_COLUMNS} FROM report_jobs WHERE id = :id", {"id": job_id}
+            )
+        return _job(row) if row else None
+
+    async def queue_depth(self) -> int:
+        async with get_db("reports.queue_depth") as db:
+            return await self._sample_queue_depth(db)
+
+    @staticmethod
+    async def _sample_queue_depth(db: Any) -> int:
+        depth = await db.fetch_val("SELECT COUNT(*) FROM report_jobs WHERE status = 'queued'")
+        REPORT_QUEUE_DEPTH.set(depth)
+        return depth
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        async with get_db("reports.claim") as db:
+            await db.execute(
+                """
+                    UPDATE report_jobs SET status = 'queued', started_at = NULL
+                    WHERE status = 'running' AND heartbeat_at < NOW() - CAST(:stale AS interval)
+                """,
+                {"stale": timedelta(seconds=settings.REPORT_STALE_AFTER_SECONDS)}
+            )
+            row = await db.fetch_one(
+                f"""
+                    UPDATE report_jobs
+                    SET status = 'running', started_at = NOW(), heartbeat_at = NOW(),
+                        chunks_done = 0, rows_written = 0
+                    WHERE id = (
+                        SELECT id FROM report_jobs
+                        WHERE status = 'queued'
+                        ORDER BY created_at
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING {JOB_COLUMNS}
+                """
+            )
+        return _job(row) if row else None
+
+    async def run(self, job: Dict[str, Any]) -> None:
+        """
+        Compute a claimed job chunk by chunk into a temporary file, then move
+        it into place and mark the job succeeded (or failed)
+        """
+        definition = REPORTS[job["report_type"]]
+        params = definition.params_model(**job["params"])
+        chunks = definition.chunks(params)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"{job['id']}.{job['format']}"
+        partial = path.with_suffix(path.suffix + ".part")
+
+        REPORT_QUEUE_WAIT.labels(job["report_type"]).observe(
+            max((job["started_at"] - job["created_at"]).total_seconds(), 0)
+        )
+        REPORT_JOBS_RUNNING.inc()
+        started = time.perf_counter()
+        status = "failed"
+        try:
+            # File I/O and Parquet encoding run on a thread, off the event loop
+            writer = await asyncio.to_thread(WRITERS[job["format"]], partial, definition.columns)
+            rows_written = 0
+            try:
+                for done, chunk in enumerate(chunks, start=1):
+                    # One borrow per chunk so a long report does not pin a connection
+                    async with get_db("reports.run") as db:
+                        rows = await definition.run_chunk(db, params, chunk)
+                    await asyncio.to_thread(writer.write, rows)
+                    rows_written += len(rows)
+                    await self._progress(job["id"], len(chunks), done, rows_written)
+            finally:
+                await asyncio.to_thread(writer.close)
+            os.replace(partial, path)
+            await self._finish(job["id"], "succeeded", result_path=str(path))
+            status = "succeeded"
+        except Exception as e:
+            logger.exception("Report job %s failed", job["id"])
+            partial.unlink(missing_ok=True)
+            await self._finish(job["id"], "failed", error=str(e))
+        finally:
+            REPORT_JOBS_RUNNING.dec()
+            REPORT_RUNTIME.labels(job["report_type"], status).observe(time.perf_counter() - started)
+
+    async def _progress(self, job_id: UUID, chunks_total: int, chunks_done: int, rows_written: int) -> None:
+        async with get_db("reports.progress") as db:
+            await db.execute(
+                """
+                    UPDATE report_jobs
+                    SET chunks_total = :chunks_total, chunks_done = :chunks_done,
+                        rows_written = :rows_written, heartbeat_at = NOW()
+                    WHERE id = :id
+                """,
+                {"id": job_id, "chunks_total": chunks_total, "chunks_done": chunks_done,
+                 "rows_written": rows_written}
+            )
+
+    async def _finish(self, job_id: UUID, status: str, result_path: Optional[str] = None,
+                      error: Optional[str] = None) -> None:
+        async with get_db("reports.finish") as db:
+            await db.execute(
+                """
+                    UPDATE report_jobs
+                    SET status = :status, result_path = :result_path, error = :error,
+                        finished_at = NOW(), expires_at = NOW() + CAST(:ttl AS interval)
+                    WHERE id = :id
+                """,
+                {"id": job_id, "status": status, "result_path": result_path, "error": error,
+                 "ttl": timedelta(hours=settings.REPORT_RESULT_TTL_HOURS)}
+            )
+
+    async def _expire(self, db) -> None:
+        """
+        Retire succeeded jobs past their TTL so they stop matching new
+        submissions, and delete their files
+        """
+        rows = await db.fetch_all(
+            """
+                UPDATE report_jobs SET status = 'expired'
+                WHERE status = 'succeeded' AND expires_at < NOW()
+                RETURNING result_path
+            """
+        )
+        for row in rows:
+            if row['result_path']:
+                Path(row['result_path']).unlink(missing_ok=True)
+
+class ReportWorker:
+    """
+    Background task claiming and running queued report jobs, polling every
+    REPORT_POLL_INTERVAL_SECONDS when the queue is empty. The queue depth
+    gauge is sampled on every pass and on each new submission.
+    """
+
+    def __init__(self, service: ReportService, poll_interval: float):
+        self.service = service
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # Sampled before every claim, so the gauge tracks a backlog
+                # as it drains
+                await self.service.queue_depth()
+                job = await self.service.claim()
+                if job is not None:
+                    await self.service.run(job)
+                    continue
+            except Exception as e:
+                logger.warning("Report worker error: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+report_service = ReportService(settings.REPORT_OUTPUT_DIR)
+report_worker = ReportWorker(report_service, settings.REPORT_POLL_INTERVAL_SECONDS)
@@ -0,0 +1,83 @@
+# src/services/retention.py
+"""
+Opt-in retention for the raw and minute history tiers.
+
+Dropping chunks deletes clinical readings permanently, so no migration
+installs a retention policy. Operators who want one set
+HISTORY_RETENTION_ENABLED=true and run, from the service root:
+
+    python -m src.services.retention --dry-run   # print the statements
+    python -m src.services.retention             # apply them
+
+health_metrics then keeps HISTORY_RAW_RETENTION_DAYS of readings and
+health_metrics_1m HISTORY_MINUTE_RETENTION_DAYS of buckets, the same
+settings the history planner reads, so they cannot drift apart. Re-run
+after changing either setting; existing policies are replaced.
+--remove drops them again.
+
+Rollup refreshes only reach back ROLLUP_REFRESH_LOOKBACK_HOURS, so
+dropping old raw or minute chunks never removes the coarser aggregates
+built from them.
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+from src.core.config import db_pool, get_db, settings
+
+# Hypertable or continuous aggregate -> setting holding its retention in days
+RETENTION_SETTINGS = {
+    'health_metrics': 'HISTORY_RAW_RETENTION_DAYS',
+    'health_metrics_1m': 'HISTORY_MINUTE_RETENTION_DAYS'
+}
+
+def retention_statements(install: bool) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Statements replacing each tier's retention policy with the configured
+    one, or only removing it without `install`
+    """
+    statements = []
+    for relation, setting in RETENTION_SETTINGS.items():
+        statements.append((
+            "SELECT remove_retention_policy(CAST(:relation AS regclass), if_exists => true)",
+            {"relation": relation}
+        ))
+        if install:
+            statements.append((
+                "SELECT add_retention_policy(CAST(:relation AS regclass), drop_after => CAST(:drop_after AS interval))",
+                {"relation": relation, "drop_after": timedelta(days=getattr(settings, setting))}
+            ))
+    return statements
+
+async def apply_retention(install: bool) -> None:
+    async with get_db("retention.apply") as db:
+        async with db.transaction():
+            for query, values in retention_statements(install):
+                await db.execute(query, values)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Install the configured history retention policies")
+    parser.add_argument("--dry-run", action="store_true", help="Print the statements without running them")
+    parser.add_argument("--remove", action="store_true", help="Remove the policies instead")
+    args = parser.parse_args()
+
+    if not args.remove and not settings.HISTORY_RETENTION_ENABLED:
+        parser.exit(1, "HISTORY_RETENTION_ENABLED is not set; no retention policy installed\n")
+
+    statements = retention_statements(install=not args.remove)
+    if args.dry_run:
+        for query, values in statements:
+            print(query, values)
+        return
+
+    async def run() -> None:
+        try:
+            await apply_retention(install=not args.remove)
+        finally:
+            await db_pool.disconnect()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
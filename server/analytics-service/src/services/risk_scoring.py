@@ -0,0 +1,400 @@
+# src/services/risk_scoring.py
+"""
+Scheduled bulk risk scoring.
+
+A run reads the latest vitals of every patient with a reading since the
+previous run from health_metrics. It pages through them in patient_id order
+(keyset pages of RISK_SCORING_BATCH_SIZE) and scores each page with one call
+to ml-service's batch endpoint. Each page is then written in one
+transaction: scores upserted into patient_analytics, folded into
+patient_risk_trends, and the run's checkpoint in risk_scoring_runs advanced.
+The next page is read while the current one is scored and written.
+
+A run that fails part way stays open and the next run picks it up after its
+last committed patient. A page ml-service rejects (an error response rather
+than no response) RISK_SCORING_PAGE_ATTEMPTS times in a row is skipped, its
+patients counted as skipped, so one bad page cannot hold a run open. Only
+one worker scores at a time. Once a run has scored patients, the cached
+patients sections of metrics summaries are dropped.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+import asyncio
+import logging
+import math
+import time
+
+from src.core.config import get_db, settings
+from src.core.metrics import RISK_SCORING_BATCH_SECONDS, RISK_SCORING_PATIENTS, RISK_SCORING_THROUGHPUT
+from src.core.responses import dumps
+from src.services.analytics_service import AnalyticsService
+from src.services.rollup_service import as_utc
+from src.services.time_series_service import VITAL_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Vitals ml-service requires; patients missing any of them are skipped
+REQUIRED_VITALS = ['heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'oxygen_saturation']
+
+BATCH_ENDPOINT = "/predictions/risk-assessment/batch"
+SERVICE_TOKEN_TTL_SECONDS = 3600
+
+RUN_COLUMNS = (
+    "id", "started_at", "changed_since", "after_patient_id",
+    "patients_scored", "patients_skipped", "page_failures", "scoring_seconds", "completed_at"
+)
+
+class ScoringRejectedError(Exception):
+    """ml-service answered a batch with an error status"""
+
+def latest_vitals_query(resume: bool) -> str:
+    """
+    The most recent non-null value of each vital per patient, for a page of
+    patients in patient_id order (after :after_patient_id when resuming)
+    that have a reading since :changed_since
+    """
+    latest = ",\n".join(
+        f"(array_agg({column} ORDER BY timestamp DESC) FILTER (WHERE {column} IS NOT NULL))[1] AS {column}"
+        for column in VITAL_COLUMNS
+    )
+    after = "AND patient_id > :after_patient_id" if resume else ""
+    return f"""
+        SELECT patient_id, {latest}
+        FROM health_metrics
+        WHERE timestamp >= :window_start AND timestamp <= :started_at {after}
+        GROUP BY patient_id
+        HAVING MAX(timestamp) >= :changed_since
+        ORDER BY patient_id
+        LIMIT :batch_size
+    """
+
+def scoring_requests(rows: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    Batch endpoint requests for the rows having every required vital.
+    Non-finite values, which would be sent as null, count as missing.
+    Ages are not known to this service and are left out.
+    """
+    requests = []
+    for row in rows:
+        metrics = {
+            column: row[column] if row[column] is not None and math.isfinite(row[column]) else None
+            for column in VITAL_COLUMNS
+        }
+        if all(metrics[column] is not None for column in REQUIRED_VITALS):
+            requests.append({"patient_id": row["patient_id"], "metrics": metrics})
+    return requests
+
+def _run(row: Any) -> Dict[str, Any]:
+    return {key: row[key] for key in RUN_COLUMNS}
+
+class MLScoringClient:
+    """
+    Calls ml-service's batch risk endpoint. Requests carry a service token
+    signed with the JWT secret the two services share.
+    """
+
+    def __init__(self, base_url: str, secret: str, timeout: float):
+        self.base_url = base_url
+        self.secret = secret
+        self.timeout = timeout
+        self._client = None
+        self._token: Optional[str] = None
+        self._token_exp = 0.0
+
+    def service_token(self) -> str:
+        from jose import jwt
+
+        now = time.time()
+        if self._token is None or now > self._token_exp - 60:
+            self._token_exp = now + SERVICE_TOKEN_TTL_SECONDS
+            self._token = jwt.encode(
+                {"userId": "analytics-service", "email": None, "role": "service", "exp": int(self._token_exp)},
+                self.secret, algorithm="HS256"
+            )
+        return self._token
+
+    async def score(self, requests: List[Dict[str, Any]], seed: int) -> List[Dict[str, Any]]:
+        """
+        Predictions for `requests`, in request order
+        """
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        response = await self._client.post(
+            BATCH_ENDPOINT,
+            content=dumps({"patients": requests, "seed": seed}),
+            headers={"Authorization": f"Bearer {self.service_token()}", "Content-Type": "application/json"}
+        )
+        if response.is_error:
+            raise ScoringRejectedError(f"ml-service answered {response.status_code}: {response.text[:200]}")
+        return response.json()["predictions"]
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class RiskScoringService:
+    def __init__(
+        self,
+        client: MLScoringClient,
+        batch_size: int,
+        lookback: timedelta,
+        page_attempts: int = 3,
+        analytics: Optional[AnalyticsService] = None
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.lookback = lookback
+        self.page_attempts = page_attempts
+        self.analytics = analytics or AnalyticsService()
+
+    async def run(self, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Resume the open run, or start one covering patients with readings
+        since the previous run started (or the last RISK_SCORING_LOOKBACK_HOURS
+        for the first run), and score it to completion. Returns the run's
+        totals, or None when another worker is scoring.
+        """
+        now = as_utc(now or datetime.now(timezone.utc))
+        async with get_db("risk_scoring.run") as db:
+            if not await db.fetch_val("SELECT pg_try_advisory_lock(hashtext('risk_scoring'))"):
+                return None
+            try:
+                latest = await db.fetch_one(f"""
+                    SELECT {', '.join(RUN_COLUMNS)}
+                    FROM risk_scoring_runs
+                    ORDER BY started_at DESC
+                    LIMIT 1
+                """)
+                resumed = latest is not None and latest["completed_at"] is None
+                if resumed:
+                    run = _run(latest)
+                else:
+                    run = _run(await db.fetch_one(
+                        f"""
+                            INSERT INTO risk_scoring_runs (started_at, changed_since)
+                            VALUES (:started_at, :changed_since)
+                            RETURNING {', '.join(RUN_COLUMNS)}
+                        """,
+                        {
+                            "started_at": now,
+                            "changed_since": latest["started_at"] if latest is not None else now - self.lookback
+                        }
+                    ))
+                return await self._score(db, run, resumed)
+            finally:
+                await db.fetch_val("SELECT pg_advisory_unlock(hashtext('risk_scoring'))")
+
+    async def _fetch(self, run: Dict[str, Any], after_patient_id: Optional[Any]) -> List[Any]:
+        values = {
+            "window_start": run["started_at"] - self.lookback,
+            "started_at": run["started_at"],
+            "changed_since": run["changed_since"],
+            "batch_size": self.batch_size
+        }
+        if after_patient_id is not None:
+            values["after_patient_id"] = after_patient_id
+        started = time.perf_counter()
+        # Its own connection: pages are read while the previous one is written
+        async with get_db("risk_scoring.fetch") as db:
+            rows = await db.fetch_all(latest_vitals_query(after_patient_id is not None), values)
+        RISK_SCORING_BATCH_SECONDS.labels("fetch").observe(time.perf_counter() - started)
+        return rows
+
+    async def _score(self, db, run: Dict[str, Any], resumed: bool) -> Dict[str, Any]:
+        # The same seed when resumed, so the run's scores do not depend on where it stopped
+        seed = int(run["started_at"].timestamp())
+        page = asyncio.ensure_future(self._fetch(run, run["after_patient_id"]))
+        checkpointed = time.perf_counter()
+        try:
+            while page is not None:
+                rows, page = await page, None
+                if not rows:
+                    break
+                if len(rows) == self.batch_size:
+                    page = asyncio.ensure_future(self._fetch(run, rows[-1]["patient_id"]))
+
+                requests = scoring_requests(rows)
+                started = time.perf_counter()
+                failed = 0
+                try:
+                    predictions = await self.client.score(requests, seed) if requests else []
+                except ScoringRejectedError as e:
+                    await self._page_rejected(db, run, e)
+                    failed, requests, predictions = len(requests), [], []
+                RISK_SCORING_BATCH_SECONDS.labels("score").observe(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                async with db.transaction():
+                    if predictions:
+                        await self._write_scores(db, requests, predictions)
+                    elapsed = time.perf_counter() - checkpointed
+                    await db.execute(
+                        """
+                            UPDATE risk_scoring_runs
+                            SET
+                                after_patient_id = :after_patient_id,
+                                patients_scored = patients_scored + :scored,
+                                patients_skipped = patients_skipped + :skipped,
+                                page_failures = 0,
+                                scoring_seconds = scoring_seconds + :seconds,
+                                updated_at = NOW()
+                            WHERE id = :id
+                        """,
+                        {
+                            "id": run["id"],
+                            "after_patient_id": rows[-1]["patient_id"],
+                            "scored": len(predictions),
+                            "skipped": len(rows) - len(predictions),
+                            "seconds": elapsed
+                        }
+                    )
+                checkpointed = time.perf_counter()
+                RISK_SCORING_BATCH_SECONDS.labels("write").observe(checkpointed - started)
+                RISK_SCORING_PATIENTS.labels("scored").inc(len(predictions))
+                RISK_SCORING_PATIENTS.labels("skipped").inc(len(rows) - len(predictions) - failed)
+                RISK_SCORING_PATIENTS.labels("failed").inc(failed)
+                run["after_patient_id"] = rows[-1]["patient_id"]
+                run["page_failures"] = 0
+                run["patients_scored"] += len(predictions)
+                run["patients_skipped"] += len(rows) - len(predictions)
+                run["scoring_seconds"] += elapsed
+        finally:
+            if page is not None:
+                page.cancel()
+
+        await db.execute(
+            "UPDATE risk_scoring_runs SET completed_at = NOW(), updated_at = NOW() WHERE id = :id",
+            {"id": run["id"]}
+        )
+        if run["patients_scored"]:
+            await self.analytics.invalidate_sections(['patients'])
+        patients_per_second = run["patients_scored"] / run["scoring_seconds"] if run["scoring_seconds"] else 0.0
+        RISK_SCORING_THROUGHPUT.set(patients_per_second)
+        return {
+            "run_id": str(run["id"]),
+            "resumed": resumed,
+            "patients_scored": run["patients_scored"],
+            "patients_skipped": run["patients_skipped"],
+            "scoring_seconds": round(run["scoring_seconds"], 3),
+            "patients_per_second": round(patients_per_second, 1)
+        }
+
+    async def _page_rejected(self, db, run: Dict[str, Any], error: ScoringRejectedError) -> None:
+        """
+        Count a rejection of the current page. Raises, leaving the run to be
+        resumed at the page, until it has been rejected `page_attempts`
+        times; then returns and the page is skipped.
+        """
+        run["page_failures"] += 1
+        if run["page_failures"] < self.page_attempts:
+            await db.execute(
+                "UPDATE risk_scoring_runs SET page_failures = :failures, updated_at = NOW() WHERE id = :id",
+                {"id": run["id"], "failures": run["page_failures"]}
+            )
+            raise error
+        logger.warning(
+            "Skipping risk scoring page after patient %s, rejected %d times: %s",
+            run["after_patient_id"], run["page_failures"], error
+        )
+
+    @staticmethod
+    async def _write_scores(db, requests: List[Dict[str, Any]], predictions: List[Dict[str, Any]]) -> None:
+        """
+        Upsert a page's scores and fold them into the patients' current week
+        of patient_risk_trends
+        """
+        patient_ids = [request["patient_id"] for request in requests]
+        risk_scores = [prediction["risk_score"] for prediction in predictions]
+        await db.execute(
+            """
+                INSERT INTO patient_analytics (patient_id, risk_score, readmission_risk, updated_at)
+                SELECT u.patient_id, u.risk_score, u.readmission_risk, NOW()
+                FROM unnest(
+                    CAST(:patient_ids AS uuid[]), CAST(:risk_scores AS float8[]), CAST(:readmission_risks AS float8[])
+                ) AS u(patient_id, risk_score, readmission_risk)
+                ON CONFLICT (patient_id) DO UPDATE
+                SET
+                    risk_score = EXCLUDED.risk_score,
+                    readmission_risk = COALESCE(EXCLUDED.readmission_risk, patient_analytics.readmission_risk),
+                    updated_at = EXCLUDED.updated_at
+            """,
+            {
+                "patient_ids": patient_ids,
+                "risk_scores": risk_scores,
+                # ml-service reports readmission risk x100; the table keeps probabilities
+                "readmission_risks": [
+                    prediction["readmission_risk"] / 100 if prediction.get("readmission_risk") is not None else None
+                    for prediction in predictions
+                ]
+            }
+        )
+        await db.execute(
+            """
+                INSERT INTO patient_risk_trends AS t
+                    (patient_id, week, risk_score_sum, risk_score_count, max_risk_score, min_risk_score)
+                SELECT u.patient_id, date_trunc('week', NOW()), u.risk_score, 1, u.risk_score, u.risk_score
+                FROM unnest(CAST(:patient_ids AS uuid[]), CAST(:risk_scores AS float8[])) AS u(patient_id, risk_score)
+                ON CONFLICT (patient_id, week) DO UPDATE
+                SET
+                    risk_score_sum = t.risk_score_sum + EXCLUDED.risk_score_sum,
+                    risk_score_count = t.risk_score_count + EXCLUDED.risk_score_count,
+                    max_risk_score = GREATEST(t.max_risk_score, EXCLUDED.max_risk_score),
+                    min_risk_score = LEAST(t.min_risk_score, EXCLUDED.min_risk_score)
+            """,
+            {"patient_ids": patient_ids, "risk_scores": risk_scores}
+        )
+
+class RiskScoringScheduler:
+    """
+    Background task calling RiskScoringService.run every
+    RISK_SCORING_INTERVAL_SECONDS
+    """
+
+    def __init__(self, service: RiskScoringService, interval_seconds: float):
+        self.service = service
+        self.interval_seconds = interval_seconds
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.service.client.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                result = await self.service.run()
+                if result is not None:
+                    self.last_run = result
+                    logger.info(
+                        "Risk scoring run %s: %d patients scored, %d skipped, %.1f patients/s",
+                        result["run_id"], result["patients_scored"], result["patients_skipped"],
+                        result["patients_per_second"]
+                    )
+            except Exception as e:
+                logger.warning("Risk scoring failed: %s", e)
+            await asyncio.sleep(self.interval_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self._task is not None, "last_run": self.last_run}
+
+risk_scoring_service = RiskScoringService(
+    MLScoringClient(settings.ML_SERVICE_URL, settings.JWT_SECRET_KEY, settings.RISK_SCORING_HTTP_TIMEOUT),
+    settings.RISK_SCORING_BATCH_SIZE,
+    timedelta(hours=settings.RISK_SCORING_LOOKBACK_HOURS),
+    page_attempts=settings.RISK_SCORING_PAGE_ATTEMPTS
+)
+risk_scoring_scheduler = RiskScoringScheduler(risk_scoring_service, settings.RISK_SCORING_INTERVAL_SECONDS)
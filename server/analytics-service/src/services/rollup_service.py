@@ -0,0 +1,398 @@
+# src/services/rollup_service.py
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Iterable, Sequence, TypeVar
+import asyncio
+import logging
+
+from src.core.config import get_db, settings
+from src.services.sketch_store import SketchStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+PERIOD_INTERVALS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1)
+}
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    bucket: timedelta
+
+# Coarsest first
+ROLLUPS = [
+    Rollup("department_metrics_daily", timedelta(days=1)),
+    Rollup("department_metrics_hourly", timedelta(hours=1)),
+]
+
+@dataclass(frozen=True)
+class QuerySegment:
+    """
+    A slice of the requested range answered by one source: a rollup name or
+    "raw" for department_metrics. Covers [start, end), or [start, end] when
+    `inclusive_end` is set (the tail of a BETWEEN range).
+    """
+    source: str
+    start: datetime
+    end: datetime
+    inclusive_end: bool = False
+
+# Partial aggregates every source returns, recombined by merge_partials
+PARTIAL_COLUMNS = """
+    COUNT(patient_count) AS patient_samples,
+    SUM(patient_count) AS patient_sum,
+    MAX(patient_count) AS peak_patients,
+    COUNT(utilization_rate) AS utilization_samples,
+    SUM(utilization_rate) AS utilization_sum,
+    COUNT(avg_wait_time) AS wait_samples,
+    SUM(EXTRACT(epoch FROM avg_wait_time)) AS wait_seconds_sum
+"""
+
+ROLLUP_COLUMNS = """
+    SUM(patient_samples) AS patient_samples,
+    SUM(patient_sum) AS patient_sum,
+    MAX(peak_patients) AS peak_patients,
+    SUM(utilization_samples) AS utilization_samples,
+    SUM(utilization_sum) AS utilization_sum,
+    SUM(wait_samples) AS wait_samples,
+    SUM(wait_seconds_sum) AS wait_seconds_sum
+"""
+
+# Refreshed alongside the department rollups, but read directly as
+# real-time aggregates rather than through plan_segments
+PATIENT_ROLLUPS = [
+    Rollup("patient_metrics_hourly", timedelta(hours=1)),
+    # History tiers (migration 006); the hourly one is built on the minute one
+    Rollup("health_metrics_1m", timedelta(minutes=1)),
+    Rollup("health_metrics_1h", timedelta(hours=1)),
+]
+
+# rollup_watermarks entry holding where the next sketch backfill pass starts
+SKETCH_BACKFILL = "health_metric_daily_sketches"
+
+def as_utc(value: datetime) -> datetime:
+    """Naive datetimes are taken to be UTC, like the database session"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def floor_to(value: datetime, bucket: timedelta) -> datetime:
+    return EPOCH + ((as_utc(value) - EPOCH) // bucket) * bucket
+
+def ceil_to(value: datetime, bucket: timedelta) -> datetime:
+    floored = floor_to(value, bucket)
+    return floored if floored == as_utc(value) else floored + bucket
+
+def choose_rollup(interval: timedelta) -> Optional[Rollup]:
+    """
+    The coarsest rollup whose buckets nest exactly inside `interval`
+    """
+    for rollup in ROLLUPS:
+        if interval % rollup.bucket == timedelta(0):
+            return rollup
+    return None
+
+def plan_segments(
+    interval: timedelta,
+    start_date: datetime,
+    end_date: datetime,
+    watermarks: Dict[str, datetime]
+) -> List[QuerySegment]:
+    """
+    Split [start_date, end_date] into an unaligned raw head, a run of whole
+    rollup buckets that are already materialized, and a raw tail covering
+    whatever the rollup has not caught up with yet
+    """
+    start, end = as_utc(start_date), as_utc(end_date)
+    rollup = choose_rollup(interval)
+    watermark = watermarks.get(rollup.name) if rollup else None
+    if rollup is None or watermark is None:
+        return [QuerySegment("raw", start, end, inclusive_end=True)]
+
+    rollup_start = ceil_to(start, rollup.bucket)
+    rollup_end = min(floor_to(end, rollup.bucket), floor_to(watermark, rollup.bucket))
+    if rollup_end <= rollup_start:
+        return [QuerySegment("raw", start, end, inclusive_end=True)]
+
+    segments = []
+    if start < rollup_start:
+        segments.append(QuerySegment("raw", start, rollup_start))
+    segments.append(QuerySegment(rollup.name, rollup_start, rollup_end))
+    segments.append(QuerySegment("raw", rollup_end, end, inclusive_end=True))
+    return segments
+
+def split_segment(segment: QuerySegment, chunk: timedelta, min_length: timedelta) -> List[QuerySegment]:
+    """
+    Cut a segment spanning at least `min_length` at multiples of `chunk`
+    from the epoch, which are hypertable chunk boundaries when `chunk` is
+    the chunk interval, so every piece scans its own chunks. The last piece
+    keeps the segment's inclusive end.
+    """
+    if segment.end - segment.start < min_length:
+        return [segment]
+
+    pieces = []
+    start, boundary = segment.start, floor_to(segment.start, chunk) + chunk
+    while boundary < segment.end:
+        pieces.append(QuerySegment(segment.source, start, boundary))
+        start, boundary = boundary, boundary + chunk
+    pieces.append(QuerySegment(segment.source, start, segment.end, segment.inclusive_end))
+    return pieces
+
+def fanout_segments(segments: Iterable[QuerySegment]) -> List[QuerySegment]:
+    """
+    Split the raw segments of a plan for concurrent reads (rollup segments
+    are small already)
+    """
+    chunk = timedelta(days=settings.QUERY_FANOUT_CHUNK_DAYS)
+    min_length = timedelta(days=settings.QUERY_FANOUT_MIN_RANGE_DAYS)
+    return [
+        piece
+        for segment in segments
+        for piece in (split_segment(segment, chunk, min_length) if segment.source == "raw" else [segment])
+    ]
+
+async def fan_out(calls: Sequence[Callable[[], Awaitable[T]]], concurrency: int) -> List[T]:
+    """
+    Await every call, at most `concurrency` at a time, each in its own task
+    and so on its own pooled connection. Results come back in call order.
+    If one call fails, the others are cancelled and its error is raised.
+    """
+    if len(calls) == 1:
+        return [await calls[0]()]
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(call: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await call()
+
+    tasks = [asyncio.ensure_future(run(call)) for call in calls]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def segment_query(segment: QuerySegment) -> str:
+    """
+    SQL returning partial aggregates per `:interval` period for one segment
+    """
+    upper = "<=" if segment.inclusive_end else "<"
+    if segment.source == "raw":
+        return f"""
+            SELECT
+                time_bucket(CAST(:interval AS interval), timestamp) AS period,
+                {PARTIAL_COLUMNS}
+            FROM department_metrics
+            WHERE
+                department_id = :dept_id
+                AND timestamp >= :start_date
+                AND timestamp {upper} :end_date
+            GROUP BY 1
+        """
+    return f"""
+        SELECT
+            time_bucket(CAST(:interval AS interval), bucket) AS period,
+            {ROLLUP_COLUMNS}
+        FROM {segment.source}
+        WHERE
+            department_id = :dept_id
+            AND bucket >= :start_date
+            AND bucket {upper} :end_date
+        GROUP BY 1
+    """
+
+def merge_partials(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    Combine partial aggregates for the same period from several segments
+    into the utilization rows returned by the API, ordered by period
+    """
+    merged: Dict[datetime, Dict[str, float]] = {}
+    for row in rows:
+        period = row['period']
+        acc = merged.setdefault(period, {
+            "patient_samples": 0, "patient_sum": 0.0, "peak_patients": None,
+            "utilization_samples": 0, "utilization_sum": 0.0,
+            "wait_samples": 0, "wait_seconds_sum": 0.0
+        })
+        for column in ("patient_samples", "patient_sum", "utilization_samples",
+                       "utilization_sum", "wait_samples", "wait_seconds_sum"):
+            acc[column] += float(row[column] or 0)
+        if row['peak_patients'] is not None:
+            acc["peak_patients"] = max(acc["peak_patients"] or 0, row['peak_patients'])
+
+    return [
+        {
+            "period": period.isoformat(),
+            "average_patients": _ratio(acc["patient_sum"], acc["patient_samples"]),
+            "utilization_rate": _ratio(acc["utilization_sum"], acc["utilization_samples"]),
+            "peak_patients": int(acc["peak_patients"]) if acc["peak_patients"] is not None else None,
+            "average_wait_time": _ratio(acc["wait_seconds_sum"] / 60, acc["wait_samples"])
+        }
+        for period, acc in sorted(merged.items())
+    ]
+
+def _ratio(total: float, count: float) -> Optional[float]:
+    return float(total / count) if count else None
+
+class RollupService:
+    """
+    Refreshes the department rollups and answers utilization queries from
+    the coarsest rollup that fits, reading raw rows only for the parts of
+    the range the rollup does not cover. Long raw parts are read as
+    chunk-aligned pieces on concurrent connections.
+    """
+
+    async def get_watermarks(self, db) -> Dict[str, datetime]:
+        rows = await db.fetch_all("SELECT rollup_name, refreshed_until FROM rollup_watermarks")
+        return {row['rollup_name']: row['refreshed_until'] for row in rows}
+
+    async def query_utilization(
+        self,
+        department_id: str,
+        interval: timedelta,
+        start_date: datetime,
+        end_date: datetime
+    ) -> List[Dict[str, Any]]:
+        async with get_db("rollups.query_utilization") as db:
+            segments = plan_segments(interval, start_date, end_date, await self.get_watermarks(db))
+
+        async def read(segment: QuerySegment) -> List[Any]:
+            async with get_db("rollups.query_utilization") as db:
+                return await db.fetch_all(segment_query(segment), {
+                    "interval": interval,
+                    "dept_id": department_id,
+                    "start_date": segment.start,
+                    "end_date": segment.end
+                })
+
+        parts = await fan_out(
+            [lambda segment=segment: read(segment) for segment in fanout_segments(segments)],
+            settings.QUERY_FANOUT_CONCURRENCY
+        )
+        # Periods split across pieces are recombined like any other partials
+        return merge_partials(row for rows in parts for row in rows)
+
+    async def refresh(self, now: Optional[datetime] = None) -> Dict[str, datetime]:
+        """
+        Incrementally refresh every rollup up to its last complete bucket.
+        The window reaches back ROLLUP_REFRESH_LOOKBACK_HOURS (at least one
+        bucket) before the previous watermark to pick up late-arriving rows.
+        Then backfill the next SKETCH_BACKFILL_DAYS of daily sketches. Only
+        one worker refreshes at a time.
+        """
+        now = as_utc(now or datetime.now(timezone.utc))
+        lookback = timedelta(hours=settings.ROLLUP_REFRESH_LOOKBACK_HOURS)
+        refreshed = {}
+        async with get_db("rollups.refresh") as db:
+            if not await db.fetch_val("SELECT pg_try_advisory_lock(hashtext('rollup_refresh'))"):
+                return refreshed
+            try:
+                watermarks = await self.get_watermarks(db)
+                # Finest first: the hourly rollup is what the tail of most queries needs
+                for rollup in [*reversed(ROLLUPS), *PATIENT_ROLLUPS]:
+                    window_end = floor_to(now, rollup.bucket)
+                    previous = watermarks.get(rollup.name)
+                    window_start = previous - max(lookback, rollup.bucket) if previous else None
+                    await db.execute(
+                        f"""
+                            CALL refresh_continuous_aggregate(
+                                '{rollup.name}',
+                                CAST(:window_start AS timestamptz),
+                                CAST(:window_end AS timestamptz)
+                            )
+                        """,
+                        {"window_start": window_start, "window_end": window_end}
+                    )
+                    await self._set_watermark(db, rollup.name, window_end)
+                    refreshed[rollup.name] = window_end
+
+                cursor = await self._backfill_sketches(db, now, watermarks.get(SKETCH_BACKFILL))
+                await self._set_watermark(db, SKETCH_BACKFILL, cursor)
+                refreshed[SKETCH_BACKFILL] = cursor
+            finally:
+                await db.fetch_val("SELECT pg_advisory_unlock(hashtext('rollup_refresh'))")
+        return refreshed
+
+    async def _backfill_sketches(self, db, now: datetime, cursor: Optional[datetime]) -> datetime:
+        """
+        Rebuild the daily sketches the hour tier shows to be missing
+        readings, for SKETCH_BACKFILL_DAYS days from `cursor`. The cursor
+        sweeps the days whose raw readings are retained and starts over
+        once past today. Returns the next pass's cursor.
+        """
+        # Imported here: time_series_service imports this module
+        from src.services.time_series_service import VITAL_COLUMNS
+
+        day = timedelta(days=1)
+        retained = ceil_to(now - timedelta(days=settings.HISTORY_RAW_RETENTION_DAYS), day)
+        today = floor_to(now, day)
+        start = cursor if cursor is not None and retained <= cursor <= today else retained
+        end = min(start + settings.SKETCH_BACKFILL_DAYS * day, today + day)
+
+        rebuilt = await SketchStore(settings.SKETCH_COMPRESSION).backfill(
+            db, VITAL_COLUMNS, start.date(), end.date(), settings.SKETCH_BACKFILL_BATCH_SIZE
+        )
+        if rebuilt:
+            logger.info("Backfilled daily sketches of %d patient days", len(rebuilt))
+        if len(rebuilt) == settings.SKETCH_BACKFILL_BATCH_SIZE:
+            # More may be left on the last day reached
+            _, last_day = rebuilt[-1]
+            return datetime.combine(last_day, datetime.min.time(), tzinfo=timezone.utc)
+        return end
+
+    @staticmethod
+    async def _set_watermark(db, name: str, refreshed_until: datetime) -> None:
+        await db.execute(
+            """
+                INSERT INTO rollup_watermarks (rollup_name, refreshed_until, updated_at)
+                VALUES (:name, :refreshed_until, NOW())
+                ON CONFLICT (rollup_name) DO UPDATE
+                SET refreshed_until = EXCLUDED.refreshed_until, updated_at = NOW()
+            """,
+            {"name": name, "refreshed_until": refreshed_until}
+        )
+
+class RollupScheduler:
+    """
+    Background task calling RollupService.refresh every
+    ROLLUP_REFRESH_INTERVAL_SECONDS
+    """
+
+    def __init__(self, service: RollupService, interval_seconds: float):
+        self.service = service
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                refreshed = await self.service.refresh()
+                if refreshed:
+                    logger.info("Refreshed rollups: %s", refreshed)
+            except Exception as e:
+                logger.warning("Rollup refresh failed: %s", e)
+            await asyncio.sleep(self.interval_seconds)
+
+rollup_service = RollupService()
+rollup_scheduler = RollupScheduler(rollup_service, settings.ROLLUP_REFRESH_INTERVAL_SECONDS)
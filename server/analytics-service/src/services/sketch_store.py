@@ -0,0 +1,336 @@
+# src/services/sketch_store.py
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+
+import numpy as np
+
+from src.services.columnar_fetch import fetch_metric_columns
+from src.services.quantile_sketch import TDigest
+
+class DailySketch:
+    """
+    Mergeable summary of one patient metric over one UTC day: count, sum,
+    sum of squares, sum of (position in day * value) and a t-digest.
+    Positions follow ingest order, which is chronological for monitor feeds.
+    """
+    __slots__ = ("count", "sum", "sum_squares", "sum_index_products", "digest")
+
+    def __init__(
+        self,
+        count: int = 0,
+        sum: float = 0.0,
+        sum_squares: float = 0.0,
+        sum_index_products: float = 0.0,
+        digest: Optional[TDigest] = None,
+        compression: float = 200.0
+    ):
+        self.count = count
+        self.sum = sum
+        self.sum_squares = sum_squares
+        self.sum_index_products = sum_index_products
+        self.digest = digest if digest is not None else TDigest(compression)
+
+    def extend(self, values: Sequence[float]) -> "DailySketch":
+        """
+        Append chronologically ordered values (NaN ignored)
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        positions = self.count + np.arange(values.size)
+        self.sum_index_products += float(positions @ values)
+        self.sum += float(values.sum())
+        self.sum_squares += float(values @ values)
+        self.count += int(values.size)
+        self.digest.update(values)
+        return self
+
+def summarize_sketches(sketches: Sequence[DailySketch]) -> Optional[Dict[str, Any]]:
+    """
+    Combine chronologically ordered sketches into the statistics returned by
+    TimeSeriesService._analyze_metric_history. Everything except median and
+    quartiles is exact (up to rounding); trend_strength is the correlation
+    with the reading's position across the whole range.
+    """
+    sketches = [s for s in sketches if s.count]
+    if not sketches:
+        return None
+
+    n = sum(s.count for s in sketches)
+    total = sum(s.sum for s in sketches)
+    total_squares = sum(s.sum_squares for s in sketches)
+    index_products, offset = 0.0, 0
+    for sketch in sketches:
+        index_products += offset * sketch.sum + sketch.sum_index_products
+        offset += sketch.count
+
+    mean = total / n
+    value_ss = max(total_squares - n * mean * mean, 0.0)
+    index_mean = (n - 1) / 2
+    index_ss = n * (n * n - 1) / 12
+    co_moment = index_products - n * index_mean * mean
+    denominator = math.sqrt(index_ss * value_ss)
+
+    digest = TDigest.merge([s.digest for s in sketches])
+    p25, median, p75 = digest.quantile(np.array([0.25, 0.5, 0.75]))
+    return {
+        "min": float(digest.min),
+        "max": float(digest.max),
+        "mean": float(mean),
+        "median": float(median),
+        "std": math.sqrt(value_ss / (n - 1)) if n > 1 else float("nan"),
+        "percentile_25": float(p25),
+        "percentile_75": float(p75),
+        "trend_strength": float(co_moment / denominator) if denominator > 0 else float("nan"),
+        "count": n
+    }
+
+def summarize_metric_sketches(sketches: Dict[str, Sequence[DailySketch]]) -> Dict[str, Dict[str, Any]]:
+    """
+    summarize_sketches for each metric, skipping metrics without readings
+    """
+    summaries = {metric: summarize_sketches(metric_sketches) for metric, metric_sketches in sketches.items()}
+    return {metric: summary for metric, summary in summaries.items() if summary is not None}
+
+def uncovered_days_query(metrics: Sequence[str], per_patient: bool) -> str:
+    """
+    (patient_id, day) pairs in [:first_day, :end_day) whose daily sketches of
+    `metrics` do not hold as many readings as the hour tier, which counts
+    every row of health_metrics (those not yet materialized included).
+    These are days ingested before migration 003, loaded with COPY or
+    ingested with SKETCH_UPDATE_ON_INGEST off, and not yet backfilled.
+    Only :patient_id's days with `per_patient`; otherwise the first :limit
+    pairs, oldest first.
+    """
+    readings = " + ".join(f"COALESCE(SUM({metric}_count), 0)" for metric in metrics)
+    patient = "AND patient_id = :patient_id" if per_patient else ""
+    limit = "" if per_patient else "LIMIT :limit"
+    return f"""
+        WITH hourly AS (
+            SELECT patient_id, CAST(bucket AT TIME ZONE 'UTC' AS date) AS day, {readings} AS readings
+            FROM health_metrics_1h
+            WHERE
+                bucket >= CAST(CAST(:first_day AS date) AS timestamp) AT TIME ZONE 'UTC'
+                AND bucket < CAST(CAST(:end_day AS date) AS timestamp) AT TIME ZONE 'UTC'
+                {patient}
+            GROUP BY patient_id, CAST(bucket AT TIME ZONE 'UTC' AS date)
+        ),
+        sketched AS (
+            SELECT patient_id, day, SUM(count) AS readings
+            FROM health_metric_daily_sketches
+            WHERE
+                metric = ANY(CAST(:metrics AS text[]))
+                AND day >= :first_day
+                AND day < :end_day
+                {patient}
+            GROUP BY patient_id, day
+        )
+        SELECT h.patient_id, h.day
+        FROM hourly h
+        LEFT JOIN sketched s USING (patient_id, day)
+        WHERE h.readings <> COALESCE(s.readings, 0)
+        ORDER BY h.day, h.patient_id
+        {limit}
+    """
+
+class SketchStore:
+    """
+    Reads and writes health_metric_daily_sketches. Writes lock the affected
+    rows (in key order) and merge in Python, so they must run inside a
+    transaction.
+    """
+
+    def __init__(self, compression: float):
+        self.compression = compression
+
+    async def record(self, db, readings: Sequence[Any], metrics: Sequence[str]) -> int:
+        """
+        Fold readings (objects with patient_id, timestamp and metric
+        attributes) into their daily sketches. Returns the rows touched.
+        """
+        groups: Dict[Tuple[str, str, date], List[float]] = defaultdict(list)
+        for reading in sorted(readings, key=lambda r: _utc(r.timestamp)):
+            day = _utc(reading.timestamp).date()
+            for metric in metrics:
+                value = getattr(reading, metric)
+                if value is not None:
+                    groups[(str(reading.patient_id), metric, day)].append(value)
+        if not groups:
+            return 0
+
+        keys = sorted(groups)
+        existing = await self._lock(db, keys)
+        updated = [
+            existing.get(key) or DailySketch(compression=self.compression)
+            for key in keys
+        ]
+        for key, sketch in zip(keys, updated):
+            sketch.extend(groups[key])
+
+        await self._write(db, keys, updated)
+        return len(keys)
+
+    async def rebuild(self, db, patient_id: Any, day: date, metrics: Sequence[str]) -> None:
+        """
+        Replace a patient's sketches of one day with ones built from its raw
+        readings, in timestamp order. The rows are locked before the readings
+        are read, so ingest racing the rebuild folds its readings in after
+        it commits.
+        """
+        keys = [(str(patient_id), metric, day) for metric in sorted(metrics)]
+        await self._lock(db, keys)
+        start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+        columns = await fetch_metric_columns(db, str(patient_id), metrics, start, start + timedelta(days=1), "<")
+        await self._write(db, keys, [
+            DailySketch(compression=self.compression).extend(columns[metric]) for _, metric, _ in keys
+        ])
+
+    async def uncovered_days(
+        self,
+        db,
+        patient_id: str,
+        metrics: Sequence[str],
+        first_day: date,
+        end_day: date
+    ) -> List[date]:
+        """
+        Days in [first_day, end_day) whose sketches are missing some of the
+        patient's readings
+        """
+        rows = await db.fetch_all(uncovered_days_query(metrics, per_patient=True), {
+            "patient_id": patient_id, "metrics": list(metrics), "first_day": first_day, "end_day": end_day
+        })
+        return [row['day'] for row in rows]
+
+    async def backfill(
+        self,
+        db,
+        metrics: Sequence[str],
+        first_day: date,
+        end_day: date,
+        limit: int
+    ) -> List[Tuple[Any, date]]:
+        """
+        Rebuild the sketches of up to `limit` uncovered patient days in
+        [first_day, end_day), oldest first, each in its own transaction.
+        Their raw readings must still be retained. Returns the days rebuilt.
+        """
+        rows = await db.fetch_all(uncovered_days_query(metrics, per_patient=False), {
+            "metrics": list(metrics), "first_day": first_day, "end_day": end_day, "limit": limit
+        })
+        for row in rows:
+            async with db.transaction():
+                await self.rebuild(db, row['patient_id'], row['day'], metrics)
+        return [(row['patient_id'], row['day']) for row in rows]
+
+    async def _lock(self, db, keys: Sequence[Tuple[str, str, date]]) -> Dict[Tuple[str, str, date], DailySketch]:
+        """
+        Create missing rows for `keys` (sorted), lock them all and return the
+        non-empty sketches among them
+        """
+        key_values = self._key_values(keys)
+        await db.execute(
+            """
+                INSERT INTO health_metric_daily_sketches (patient_id, metric, day, digest)
+                SELECT k.patient_id, k.metric, k.day, CAST('' AS bytea)
+                FROM unnest(
+                    CAST(:patient_ids AS uuid[]), CAST(:metrics AS text[]), CAST(:days AS date[])
+                ) AS k(patient_id, metric, day)
+                ON CONFLICT (patient_id, metric, day) DO NOTHING
+            """,
+            key_values
+        )
+        rows = await db.fetch_all(
+            """
+                SELECT s.*
+                FROM health_metric_daily_sketches s
+                JOIN unnest(
+                    CAST(:patient_ids AS uuid[]), CAST(:metrics AS text[]), CAST(:days AS date[])
+                ) AS k(patient_id, metric, day) USING (patient_id, metric, day)
+                ORDER BY s.patient_id, s.metric, s.day
+                FOR UPDATE OF s
+            """,
+            key_values
+        )
+        return {(str(r['patient_id']), r['metric'], r['day']): self._from_row(r) for r in rows}
+
+    async def _write(self, db, keys: Sequence[Tuple[str, str, date]], sketches: Sequence[DailySketch]) -> None:
+        await db.execute(
+            """
+                UPDATE health_metric_daily_sketches s
+                SET
+                    count = u.count,
+                    sum = u.sum,
+                    sum_squares = u.sum_squares,
+                    sum_index_products = u.sum_index_products,
+                    digest = u.digest,
+                    updated_at = NOW()
+                FROM unnest(
+                    CAST(:patient_ids AS uuid[]), CAST(:metrics AS text[]), CAST(:days AS date[]),
+                    CAST(:counts AS bigint[]), CAST(:sums AS float8[]), CAST(:sum_squares AS float8[]),
+                    CAST(:sum_index_products AS float8[]), CAST(:digests AS bytea[])
+                ) AS u(patient_id, metric, day, count, sum, sum_squares, sum_index_products, digest)
+                WHERE s.patient_id = u.patient_id AND s.metric = u.metric AND s.day = u.day
+            """,
+            {
+                **self._key_values(keys),
+                "counts": [s.count for s in sketches],
+                "sums": [s.sum for s in sketches],
+                "sum_squares": [s.sum_squares for s in sketches],
+                "sum_index_products": [s.sum_index_products for s in sketches],
+                "digests": [s.digest.to_bytes() for s in sketches]
+            }
+        )
+
+    @staticmethod
+    def _key_values(keys: Sequence[Tuple[str, str, date]]) -> Dict[str, List[Any]]:
+        return {
+            "patient_ids": [k[0] for k in keys],
+            "metrics": [k[1] for k in keys],
+            "days": [k[2] for k in keys]
+        }
+
+    async def load(
+        self,
+        db,
+        patient_id: str,
+        metrics: Sequence[str],
+        first_day: date,
+        end_day: date
+    ) -> Dict[str, List[DailySketch]]:
+        """
+        Daily sketches for days in [first_day, end_day), oldest first
+        """
+        rows = await db.fetch_all(
+            """
+                SELECT *
+                FROM health_metric_daily_sketches
+                WHERE
+                    patient_id = :patient_id
+                    AND metric = ANY(CAST(:metrics AS text[]))
+                    AND day >= :first_day
+                    AND day < :end_day
+                ORDER BY day
+            """,
+            {"patient_id": patient_id, "metrics": list(metrics), "first_day": first_day, "end_day": end_day}
+        )
+        sketches: Dict[str, List[DailySketch]] = {metric: [] for metric in metrics}
+        for row in rows:
+            sketches[row['metric']].append(self._from_row(row))
+        return sketches
+
+    def _from_row(self, row: Any) -> DailySketch:
+        return DailySketch(
+            count=row['count'],
+            sum=row['sum'],
+            sum_squares=row['sum_squares'],
+            sum_index_products=row['sum_index_products'],
+            digest=TDigest.from_bytes(bytes(row['digest'])) if row['count'] else None,
+            compression=self.compression
+        )
+
+def _utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -1,18 +1,56 @@
 # src/services/time_series_service.py
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
-import pandas as pd
+from datetime import datetime, timedelta, timezone, date
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Iterable, AsyncIterator, Sequence
+from uuid import UUID, uuid4
 import numpy as np
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
 from src.models.schemas import HealthMetric
-from src.core.config import get_db
+from src.core.config import cpu_executor, get_db, settings
+from src.core.metrics import DATAFRAME_SECONDS, MODEL_FIT_SECONDS, timed
+from src.services.trend_state import TrendStateStore, PatientTrendState, TREND_METRICS, build_trend_state_from_columns
+from src.services.batch_trends import SeriesBatch, calculate_batch_trends, batch_trends_to_records
+from src.services.rollup_service import as_utc, ceil_to, floor_to
+from src.services.sketch_store import SketchStore, DailySketch, summarize_metric_sketches
+from src.services.columnar_fetch import fetch_metric_columns
+from src.services.history_tiers import (
+    RESOLUTIONS, coarsest, concat_buckets, fetch_segment, plan_history, tier_retention, weighted_quantiles
+)
+from src.services.alert_service import alert_service
+from src.services.cohort_service import CohortTrendService
+
+# pandas and statsmodels are imported on first use (or by the startup
+# warm-up), keeping them out of the service's cold start
+if TYPE_CHECKING:
+    import pandas as pd
+
+VITAL_COLUMNS = [
+    'heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'temperature', 'oxygen_saturation', 'respiratory_rate'
+]
+
+HISTORY_METRICS = [
+    'heart_rate', 'blood_pressure_systolic',
+    'blood_pressure_diastolic', 'oxygen_saturation'
+]
+
+DAY = timedelta(days=1)
 
 class TimeSeriesService:
+    def __init__(self):
+        self.trend_store = TrendStateStore(
+            window=timedelta(hours=settings.TREND_WINDOW_HOURS),
+            slack=settings.TREND_WINDOW_SLACK,
+            alpha=settings.TREND_HOLT_ALPHA,
+            beta=settings.TREND_HOLT_BETA,
+            max_patients=settings.TREND_STATE_MAX_PATIENTS
+        )
+        self.sketch_store = SketchStore(settings.SKETCH_COMPRESSION)
+        self.cohorts = CohortTrendService()
+
     async def record_health_metrics(self, metric: HealthMetric) -> Dict[str, Any]:
         """
-        Record new health metrics and calculate trends
+        Record new health metrics, calculate trends and raise any alerts
         """
-        async with get_db() as db:
+        async with get_db("time_series.record_health_metrics") as db:
             query = """
                 INSERT INTO health_metrics (
                     patient_id, timestamp, heart_rate, blood_pressure_systolic,
@@ -26,60 +64,176 @@ class TimeSeriesService:
                 RETURNING id
             """
             values = metric.dict()
-            result = await db.fetch_one(query, values)
-            
-            # Calculate trends based on recent data
-            trends = await self.calculate_trends(metric.patient_id)
-            
-            return {
-                "id": result['id'],
-                "status": "recorded",
-                "trends": trends
-            }
-
-    async def calculate_trends(self, patient_id: str) -> Dict[str, Any]:
-        """
-        Calculate trends from recent patient data
-        """
-        async with get_db() as db:
-            # Get last 24 hours of data
-            query = """
-                SELECT *
-                FROM health_metrics
-                WHERE 
-                    patient_id = :patient_id
-                    AND timestamp > NOW() - INTERVAL '24 hours'
-                ORDER BY timestamp DESC
-            """
-            results = await db.fetch_all(query, {"patient_id": patient_id})
-            
-            if not results:
-                return {"status": "insufficient_data"}
-
-            # Convert to pandas DataFrame for analysis
-            df = pd.DataFrame(results)
-            
-            trends = {}
-            metrics = ['heart_rate', 'blood_pressure_systolic', 'oxygen_saturation']
-            
-            for metric in metrics:
-                if metric in df.columns:
-                    values = df[metric].dropna()
-                    if len(values) >= 3:  # Need at least 3 points for trend
-                        trend = self._calculate_metric_trend(values)
-                        trends[metric] = trend
-
-            return {
-                "status": "analyzed",
-                "trends": trends
-            }
-
-    def _calculate_metric_trend(self, values: pd.Series) -> Dict[str, Any]:
-        """
-        Calculate trend metrics for a single health measurement
+            async with db.transaction():
+                result = await db.fetch_one(query, values)
+                if settings.SKETCH_UPDATE_ON_INGEST:
+                    await self.sketch_store.record(db, [metric], VITAL_COLUMNS)
+        await self._invalidate_cached([metric])
+
+        # Calculate trends based on recent data
+        trends = await self.calculate_trends(metric.patient_id, [metric], datetime.now(timezone.utc))
+        await alert_service.observe_readings([metric])
+        await alert_service.observe_trends(metric.patient_id, trends)
+
+        return {
+            "id": result['id'],
+            "status": "recorded",
+            "trends": trends
+        }
+
+    async def record_health_metrics_batch(self, metrics: List[HealthMetric]) -> List[Dict[str, Any]]:
+        """
+        Record many health metrics using multi-row inserts.
+        Returns one result per input row, in input order. Rows are written in
+        chunks of INGEST_BATCH_SIZE, each in one transaction with its daily
+        sketch updates; if a chunk fails, every row in it is rejected.
+        Accepted readings invalidate cached cohort trends and are checked
+        against the alert thresholds.
+        """
+        results: List[Dict[str, Any]] = []
+        accepted: List[HealthMetric] = []
+        chunk_size = settings.INGEST_BATCH_SIZE
+
+        async with get_db("time_series.record_health_metrics_batch") as db:
+            for offset in range(0, len(metrics), chunk_size):
+                chunk = metrics[offset:offset + chunk_size]
+                ids = [uuid4() for _ in chunk]
+                try:
+                    async with db.transaction():
+                        await db.execute(self._batch_insert_query(), self._batch_insert_values(ids, chunk))
+                        if settings.SKETCH_UPDATE_ON_INGEST:
+                            await self.sketch_store.record(db, chunk, VITAL_COLUMNS)
+                except Exception as e:
+                    results.extend({"status": "rejected", "error": str(e)} for _ in chunk)
+                    continue
+                results.extend({"status": "accepted", "id": row_id} for row_id in ids)
+                accepted.extend(chunk)
+
+        await self._invalidate_cached(accepted)
+        await alert_service.observe_readings(sorted(accepted, key=lambda m: m.timestamp))
+        return results
+
+    async def _invalidate_cached(self, metrics: Sequence[HealthMetric]) -> None:
+        """
+        Drop cached results built from health_metrics (cohort trends) for
+        the vitals these committed readings carry
+        """
+        vitals = [column for column in VITAL_COLUMNS if any(getattr(m, column) is not None for m in metrics)]
+        if vitals:
+            await self.cohorts.invalidate_metrics(vitals)
+
+    async def calculate_trends_for_metrics(
+        self,
+        metrics: Iterable[HealthMetric],
+        recorded_at: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Calculate trends once per distinct patient after a batch ingest
+        committed at `recorded_at` (default now), and check the new trends
+        against the alert rules
+        """
+        recorded_at = recorded_at or datetime.now(timezone.utc)
+        readings_by_patient: Dict[str, List[HealthMetric]] = {}
+        for metric in metrics:
+            readings_by_patient.setdefault(str(metric.patient_id), []).append(metric)
+
+        trends = {}
+        for patient_id, readings in readings_by_patient.items():
+            readings.sort(key=lambda m: m.timestamp)
+            trends[patient_id] = await self.calculate_trends(patient_id, readings, recorded_at)
+            await alert_service.observe_trends(patient_id, trends[patient_id])
+        return trends
+
+    @staticmethod
+    def _batch_insert_query() -> str:
+        columns = ", ".join(VITAL_COLUMNS)
+        arrays = ",\n                ".join(
+            f"CAST(:{column} AS float8[])" for column in VITAL_COLUMNS
+        )
+        return f"""
+            INSERT INTO health_metrics (id, patient_id, timestamp, {columns})
+            SELECT * FROM unnest(
+                CAST(:ids AS uuid[]),
+                CAST(:patient_ids AS uuid[]),
+                CAST(:timestamps AS timestamptz[]),
+                {arrays}
+            )
+        """
+
+    @staticmethod
+    def _batch_insert_values(ids: List[UUID], metrics: List[HealthMetric]) -> Dict[str, Any]:
+        values: Dict[str, Any] = {
+            "ids": ids,
+            "patient_ids": [m.patient_id for m in metrics],
+            "timestamps": [m.timestamp for m in metrics],
+        }
+        for column in VITAL_COLUMNS:
+            values[column] = [getattr(m, column) for m in metrics]
+        return values
+
+    async def calculate_trends(
+        self,
+        patient_id: str,
+        new_readings: Optional[List[HealthMetric]] = None,
+        recorded_at: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Calculate trends from recent patient data.
+        Served from the patient's running trend state, which first catches
+        up on readings stored since its newest one, whichever worker stored
+        them. The state is rebuilt from the last 24 hours in the database
+        when missing (e.g. after a restart), stale, or when `new_readings`
+        (committed at `recorded_at`) include one older than its newest
+        reading that it cannot already have seen. Readings outside the
+        window are ignored.
+        """
+        patient_id = str(patient_id)
+        async with self.trend_store.lock(patient_id):
+            state = self.trend_store.get(patient_id)
+            if state is not None and self.trend_store.needs_rebuild(
+                state, new_readings or [], recorded_at or datetime.now(timezone.utc)
+            ):
+                state = None
+            if state is None:
+                state = await self._rebuild_trend_state(patient_id)
+            else:
+                async with get_db("time_series.catch_up_trend_state") as db:
+                    columns = await fetch_metric_columns(
+                        db, patient_id, TREND_METRICS, state.last_timestamp or state.window_start,
+                        with_timestamp=True
+                    )
+                state.update_columns(columns)
+            return state.snapshot()
+
+    async def _rebuild_trend_state(self, patient_id: str) -> PatientTrendState:
+        built_at = datetime.now(timezone.utc)
+        window_start = built_at - self.trend_store.window
+        async with get_db("time_series.rebuild_trend_state") as db:
+            columns = await fetch_metric_columns(db, patient_id, TREND_METRICS, window_start, with_timestamp=True)
+
+        state = await cpu_executor.run(
+            build_trend_state_from_columns, columns, window_start, self.trend_store.alpha, self.trend_store.beta,
+            name="trend_rebuild"
+        )
+        state.built_at = built_at
+        return self.trend_store.install(patient_id, state)
+
+    def calculate_batch_trends(self, series: SeriesBatch) -> List[Optional[Dict[str, Any]]]:
+        """
+        Trends for many chronological series at once, e.g. one metric for every
+        patient on a ward. Accepts a ragged list or a NaN-padded 2-D array and
+        returns one _calculate_metric_trend-shaped dict (or None) per series.
+        """
+        trends = calculate_batch_trends(series, settings.TREND_HOLT_ALPHA, settings.TREND_HOLT_BETA)
+        return batch_trends_to_records(trends)
+
+    def _calculate_metric_trend(self, values: "pd.Series") -> Dict[str, Any]:
+        """
+        Calculate trend metrics for a single health measurement.
+        Values must be in chronological order (oldest first).
         """
         # Basic statistics
-        current = float(values.iloc[0])
+        current = float(values.iloc[-1])
         mean = float(values.mean())
         std = float(values.std())
         
@@ -91,9 +245,12 @@ class TimeSeriesService:
         
         # Simple forecasting using Exponential Smoothing
         if len(values) >= 5:
-            model = ExponentialSmoothing(values, trend='add', seasonal=None)
-            fitted = model.fit()
-            forecast = fitted.forecast(1)[0]
+            from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+            with timed(MODEL_FIT_SECONDS, "holt_winters"):
+                model = ExponentialSmoothing(values, trend='add', seasonal=None)
+                fitted = model.fit()
+            forecast = np.asarray(fitted.forecast(1))[0]
         else:
             forecast = current
         
@@ -111,75 +268,278 @@ class TimeSeriesService:
         patient_id: str,
         start_date: datetime,
         end_date: datetime,
-        metric_type: Optional[str] = None
+        metric_type: Optional[str] = None,
+        resolution: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        Get historical metrics with analysis
+        Get historical metrics with analysis.
+        `resolution` (raw, minute, hour or day) is the coarsest storage tier
+        the analysis may read. Parts of the range older than that tier's
+        retention come from the next coarser tier still holding them, and
+        the response reports the coarsest tier used. By default, ranges
+        covering at least SKETCH_MIN_RANGE_DAYS whole UTC days are answered
+        from the daily sketches and shorter ones from raw readings. While
+        some day's sketches are missing readings the hour tier holds (until
+        the rollup scheduler backfills them), the range is read from the
+        hour tier instead. Only raw-only answers are exact throughout. Aggregate tiers give
+        exact mean, std, min and max, with quartiles and trend strength
+        taken over bucket means. Sketches estimate median and quartiles.
         """
-        async with get_db() as db:
-            query = """
-                SELECT *
-                FROM health_metrics
-                WHERE 
-                    patient_id = :patient_id
-                    AND timestamp BETWEEN :start_date AND :end_date
-                ORDER BY timestamp
-            """
-            results = await db.fetch_all(
-                query,
-                {
-                    "patient_id": patient_id,
-                    "start_date": start_date,
-                    "end_date": end_date
-                }
-            )
+        metrics = self.history_metrics(metric_type)
+        if resolution is not None and resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
 
-            if not results:
-                return []
+        retained_since = tier_retention(
+            datetime.now(timezone.utc),
+            settings.HISTORY_RAW_RETENTION_DAYS,
+            settings.HISTORY_MINUTE_RETENTION_DAYS
+        )
+        day_start = ceil_to(start_date, DAY)
+        first_day = day_start.date()
+        end_day = floor_to(end_date, DAY).date()
+        whole_days = (end_day - first_day).days
+        if resolution is None:
+            resolution = "day" if whole_days >= settings.SKETCH_MIN_RANGE_DAYS else "raw"
+        if resolution == "day":
+            # The partial first day is read raw, so it must still be retained
+            if whole_days >= 1 and (day_start == as_utc(start_date) or as_utc(start_date) >= retained_since["raw"]):
+                history = await self._get_patient_metrics_from_sketches(
+                    patient_id, start_date, end_date, metrics, first_day, end_day
+                )
+                if history is not None:
+                    return history
+            resolution = "hour"
 
-            df = pd.DataFrame(results)
-            
-            # If specific metric requested, filter analysis
-            metrics = [metric_type] if metric_type else [
-                'heart_rate', 'blood_pressure_systolic',
-                'blood_pressure_diastolic', 'oxygen_saturation'
-            ]
-            
-            analysis = {}
-            for metric in metrics:
-                if metric in df.columns:
-                    values = df[metric].dropna()
-                    if len(values) > 0:
-                        analysis[metric] = self._analyze_metric_history(values)
+        segments = plan_history(start_date, end_date, resolution, retained_since)
+        raw_only = coarsest(segments) == "raw"
+        async with get_db("time_series.get_patient_metrics") as db:
+            if raw_only:
+                columns = await fetch_metric_columns(db, patient_id, metrics, start_date, end_date)
+            else:
+                parts = [await fetch_segment(db, patient_id, segment, metrics) for segment in segments]
 
+        if raw_only:
+            data_points = len(columns[metrics[0]])
+            if not data_points:
+                return []
+            analysis = await cpu_executor.run(analyze_history_columns, columns, name="history_analysis")
             return [{
                 "metrics": analysis,
                 "start_date": start_date.isoformat(),
                 "end_date": end_date.isoformat(),
-                "data_points": len(df)
+                "data_points": data_points,
+                "resolution": "raw"
             }]
 
-    def _analyze_metric_history(self, values: pd.Series) -> Dict[str, Any]:
+        analysis = await cpu_executor.run(
+            analyze_history_buckets, concat_buckets(parts, metrics), metrics, name="history_bucket_analysis"
+        )
+        return self._counted_history(analysis, start_date, end_date, coarsest(segments))
+
+    async def history_watermark(self, patient_id: str) -> Optional[datetime]:
         """
-        Perform detailed analysis on historical metric data
+        Timestamp of the patient's latest reading, for ETags
         """
-        return {
-            "min": float(values.min()),
-            "max": float(values.max()),
-            "mean": float(values.mean()),
-            "median": float(values.median()),
-            "std": float(values.std()),
-            "percentile_25": float(values.quantile(0.25)),
-            "percentile_75": float(values.quantile(0.75)),
-            "trend_strength": float(self._calculate_trend_strength(values))
-        }
+        async with get_db("time_series.history_watermark") as db:
+            return await db.fetch_val(
+                "SELECT MAX(timestamp) FROM health_metrics WHERE patient_id = :patient_id",
+                {"patient_id": patient_id}
+            )
+
+    async def _get_patient_metrics_from_sketches(
+        self,
+        patient_id: str,
+        start_date: datetime,
+        end_date: datetime,
+        metrics: List[str],
+        first_day: date,
+        end_day: date
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        History merged from daily sketches, with the partial first and last
+        days read raw. None when some day's sketches are missing readings.
+        """
+        day_start = ceil_to(start_date, DAY)
+        day_end = floor_to(end_date, DAY)
+        async with get_db("time_series.get_patient_metrics_from_sketches") as db:
+            if await self.sketch_store.uncovered_days(db, patient_id, metrics, first_day, end_day):
+                return None
+            daily = await self.sketch_store.load(db, patient_id, metrics, first_day, end_day)
+            head = await self._raw_metric_sketches(db, patient_id, metrics, as_utc(start_date), day_start, "<")
+            tail = await self._raw_metric_sketches(db, patient_id, metrics, day_end, as_utc(end_date), "<=")
+
+        analysis = await cpu_executor.run(
+            summarize_metric_sketches,
+            {metric: [head[metric], *daily[metric], tail[metric]] for metric in metrics},
+            name="history_sketch_merge"
+        )
+        return self._counted_history(analysis, start_date, end_date, "day")
+
+    @staticmethod
+    def _counted_history(
+        analysis: Dict[str, Dict[str, Any]],
+        start_date: datetime,
+        end_date: datetime,
+        resolution: str
+    ) -> List[Dict[str, Any]]:
+        if not analysis:
+            return []
+
+        return [{
+            "metrics": {
+                metric: {k: v for k, v in summary.items() if k != "count"}
+                for metric, summary in analysis.items()
+            },
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            # Readings with at least the best-covered metric present
+            "data_points": max(summary["count"] for summary in analysis.values()),
+            "resolution": resolution
+        }]
+
+    async def _raw_metric_sketches(
+        self,
+        db,
+        patient_id: str,
+        metrics: List[str],
+        start: datetime,
+        end: datetime,
+        upper: str
+    ) -> Dict[str, DailySketch]:
+        """
+        Sketch raw readings in [start, end) (or [start, end] for upper "<=")
+        """
+        sketches = {metric: DailySketch(compression=settings.SKETCH_COMPRESSION) for metric in metrics}
+        if start > end:
+            return sketches
+        columns = await fetch_metric_columns(db, patient_id, metrics, start, end, upper)
+        for metric in metrics:
+            sketches[metric].extend(columns[metric])
+        return sketches
+
+    def history_metrics(self, metric_type: Optional[str] = None) -> List[str]:
+        """
+        Metric columns covered by a history request
+        """
+        if metric_type is None:
+            return list(HISTORY_METRICS)
+        if metric_type not in VITAL_COLUMNS:
+            raise ValueError(f"Invalid metric type: {metric_type}")
+        return [metric_type]
 
-    def _calculate_trend_strength(self, values: pd.Series) -> float:
+    async def iter_patient_metric_chunks(
+        self,
+        patient_id: str,
+        start_date: datetime,
+        end_date: datetime,
+        metrics: List[str],
+        chunk_size: Optional[int] = None
+    ) -> AsyncIterator[List[Any]]:
+        """
+        Yield (timestamp, *metrics) rows in chronological chunks, read through
+        a server-side cursor so at most one chunk is held in memory
         """
-        Calculate the strength of the trend using regression
-        Returns a value between -1 and 1 indicating trend strength and direction
+        chunk_size = chunk_size or settings.HISTORY_STREAM_CHUNK_SIZE
+        query = f"""
+            SELECT timestamp, {", ".join(metrics)}
+            FROM health_metrics
+            WHERE 
+                patient_id = $1
+                AND timestamp BETWEEN $2 AND $3
+            ORDER BY timestamp
         """
-        x = np.arange(len(values))
-        slope, _ = np.polyfit(x, values, 1)
-        correlation = np.corrcoef(x, values)[0, 1]
-        return correlation
\ No newline at end of file
+        async with get_db("time_series.iter_patient_metric_chunks") as db:
+            connection = db.raw_connection
+            async with connection.transaction(readonly=True):
+                cursor = await connection.cursor(query, UUID(str(patient_id)), start_date, end_date)
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    def _analyze_metric_history(self, values: "pd.Series") -> Dict[str, Any]:
+        """
+        Perform detailed analysis on historical metric data
+        """
+        return analyze_metric_history(values)
+
+    def _calculate_trend_strength(self, values: "pd.Series") -> float:
+        return calculate_trend_strength(values)
+
+# CPU-bound analysis lives in module-level functions of plain data so the
+# CPU executor can run it on a worker thread or process
+
+def analyze_history_columns(columns: Dict[str, Sequence[Optional[float]]]) -> Dict[str, Any]:
+    """
+    analyze_metric_history for each metric column (list with None or array
+    with NaN for missing readings) with at least one value
+    """
+    import pandas as pd
+
+    analysis = {}
+    for metric, column in columns.items():
+        with timed(DATAFRAME_SECONDS, "history_column"):
+            values = pd.Series(column, dtype=float).dropna().reset_index(drop=True)
+        if len(values) > 0:
+            analysis[metric] = analyze_metric_history(values)
+    return analysis
+
+def analyze_history_buckets(buckets: Dict[str, np.ndarray], metrics: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    analyze_metric_history from history tier buckets (see history_tiers),
+    plus each metric's reading "count", skipping metrics without readings.
+    Mean, std, min and max are exact; quartiles are taken over bucket means
+    weighted by their readings, and trend strength over the bucket means.
+    """
+    analysis = {}
+    for metric in metrics:
+        count = buckets[f"{metric}_count"]
+        present = count > 0
+        if not present.any():
+            continue
+        count = count[present]
+        total = buckets[f"{metric}_sum"][present]
+        means = total / count
+
+        n = float(count.sum())
+        mean = float(total.sum()) / n
+        value_ss = max(float(buckets[f"{metric}_sum_squares"][present].sum()) - n * mean * mean, 0.0)
+        p25, median, p75 = weighted_quantiles(means, count, (0.25, 0.5, 0.75))
+        analysis[metric] = {
+            "min": float(buckets[f"{metric}_min"][present].min()),
+            "max": float(buckets[f"{metric}_max"][present].max()),
+            "mean": mean,
+            "median": float(median),
+            "std": float(np.sqrt(value_ss / (n - 1))) if n > 1 else float("nan"),
+            "percentile_25": float(p25),
+            "percentile_75": float(p75),
+            "trend_strength": float(calculate_trend_strength(means)) if len(means) > 1 else float("nan"),
+            "count": int(n)
+        }
+    return analysis
+
+def analyze_metric_history(values: "pd.Series") -> Dict[str, Any]:
+    """
+    Perform detailed analysis on historical metric data
+    """
+    return {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "median": float(values.median()),
+        "std": float(values.std()),
+        "percentile_25": float(values.quantile(0.25)),
+        "percentile_75": float(values.quantile(0.75)),
+        "trend_strength": float(calculate_trend_strength(values))
+    }
+
+def calculate_trend_strength(values: "pd.Series") -> float:
+    """
+    Calculate the strength of the trend using regression
+    Returns a value between -1 and 1 indicating trend strength and direction
+    """
+    x = np.arange(len(values))
+    slope, _ = np.polyfit(x, values, 1)
+    correlation = np.corrcoef(x, values)[0, 1]
+    return correlation
\ No newline at end of file
@@ -0,0 +1,336 @@
+# src/services/trend_state.py
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Iterable
+import asyncio
+import math
+
+import numpy as np
+
+TREND_METRICS = ['heart_rate', 'blood_pressure_systolic', 'oxygen_saturation']
+
+class RunningStats:
+    """
+    Single-pass statistics over a stream of values.
+    Keeps Welford mean/variance of the values and the co-moment with their
+    position in the stream, so the least-squares slope and the correlation
+    against the sample index are available in O(1) per value.
+    """
+    __slots__ = ("count", "mean", "m2", "index_mean", "index_m2", "co_moment", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.index_mean = 0.0
+        self.index_m2 = 0.0
+        self.co_moment = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, value: float) -> None:
+        index = self.count
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        index_delta = index - self.index_mean
+        self.index_mean += index_delta / self.count
+        self.index_m2 += index_delta * (index - self.index_mean)
+        self.co_moment += index_delta * (value - self.mean)
+
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1, as pandas)"""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan')
+
+    @property
+    def slope(self) -> float:
+        """Least-squares slope of value against sample index"""
+        return self.co_moment / self.index_m2 if self.index_m2 > 0 else 0.0
+
+    @property
+    def correlation(self) -> float:
+        """Pearson correlation between sample index and value"""
+        denominator = math.sqrt(self.index_m2 * self.m2)
+        return self.co_moment / denominator if denominator > 0 else float('nan')
+
+class HoltState:
+    """
+    Holt's linear (additive trend) exponential smoothing with fixed
+    smoothing parameters, updated one observation at a time.
+
+    The batch path refits alpha, beta and the initial level and trend with
+    statsmodels on every call, so forecast_next is no longer the fitted
+    model's. On noisy vital-sign series the two forecasts typically differ
+    by about a tenth of the series' standard deviation (see the tolerance
+    test); refitting per reading is what this state exists to avoid.
+    """
+    __slots__ = ("alpha", "beta", "level", "trend", "count")
+
+    def __init__(self, alpha: float, beta: float):
+        self.alpha = alpha
+        self.beta = beta
+        self.level = 0.0
+        self.trend = 0.0
+        self.count = 0
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        if self.count == 1:
+            self.level = value
+            return
+        if self.count == 2:
+            self.trend = value - self.level
+            self.level = value
+            return
+        previous_level = self.level
+        self.level = self.alpha * value + (1 - self.alpha) * (self.level + self.trend)
+        self.trend = self.beta * (self.level - previous_level) + (1 - self.beta) * self.trend
+
+    def forecast(self, steps: int = 1) -> float:
+        return self.level + steps * self.trend
+
+class MetricTrendState:
+    """
+    Running trend state for one patient metric
+    """
+    __slots__ = ("stats", "holt", "current")
+
+    def __init__(self, alpha: float, beta: float):
+        self.stats = RunningStats()
+        self.holt = HoltState(alpha, beta)
+        self.current: Optional[float] = None
+
+    def update(self, value: float) -> None:
+        self.stats.update(value)
+        self.holt.update(value)
+        self.current = value
+
+    def to_trend(self) -> Dict[str, Any]:
+        """
+        Same shape as TimeSeriesService._calculate_metric_trend
+        """
+        mean = self.stats.mean
+        std = self.stats.std
+        forecast = self.holt.forecast(1) if self.stats.count >= 5 else self.current
+        return {
+            "current_value": float(self.current),
+            "mean": float(mean),
+            "std": float(std),
+            "trend_direction": "increasing" if self.stats.slope > 0 else "decreasing",
+            "volatility": float(std / mean) if mean != 0 else 0,
+            "forecast_next": float(forecast)
+        }
+
+class PatientTrendState:
+    """
+    Trend state for all tracked metrics of one patient, covering the
+    readings seen since window_start. Readings must be folded in timestamp
+    order: last_timestamp is the newest one folded, and built_at when the
+    state was read from the database.
+    """
+
+    def __init__(self, window_start: datetime, alpha: float, beta: float):
+        self.window_start = window_start
+        self.metrics = {metric: MetricTrendState(alpha, beta) for metric in TREND_METRICS}
+        self.last_timestamp: Optional[datetime] = None
+        self.built_at: Optional[datetime] = None
+
+    def update(self, reading: Any) -> None:
+        for metric, state in self.metrics.items():
+            value = _reading_value(reading, metric)
+            if value is not None:
+                state.update(float(value))
+        timestamp = _reading_value(reading, "timestamp")
+        if timestamp is not None:
+            self.last_timestamp = as_utc(timestamp)
+
+    def update_columns(self, columns: Dict[str, Any]) -> None:
+        """
+        Fold chronological metric columns (NaN where a reading lacks the
+        metric) with their "timestamp" column, skipping readings not newer
+        than last_timestamp
+        """
+        timestamps = columns["timestamp"]
+        if self.last_timestamp is not None:
+            newer = timestamps > np.datetime64(self.last_timestamp.replace(tzinfo=None), "us")
+            columns = {name: column[newer] for name, column in columns.items()}
+            timestamps = columns["timestamp"]
+        for metric, metric_state in self.metrics.items():
+            column = columns.get(metric)
+            if column is None:
+                continue
+            for value in column[~np.isnan(column)].tolist():
+                metric_state.update(value)
+        if len(timestamps):
+            self.last_timestamp = _from_datetime64(timestamps[-1])
+
+    def snapshot(self) -> Dict[str, Any]:
+        trends = {
+            metric: state.to_trend()
+            for metric, state in self.metrics.items()
+            if state.stats.count >= 3  # Need at least 3 points for trend
+        }
+        if not any(state.stats.count for state in self.metrics.values()):
+            return {"status": "insufficient_data"}
+        return {"status": "analyzed", "trends": trends}
+
+class TrendStateStore:
+    """
+    Per-process store of patient trend states.
+    A state is updated in O(1) per reading. Because running statistics cannot
+    forget old readings, a state is considered stale once its window has grown
+    past `window * (1 + slack)` and is then rebuilt from the database, so the
+    statistics always cover between `window` and `window * (1 + slack)` of data.
+    A state only ever folds readings newer than its last one; an older one
+    inside the window means a rebuild (see needs_rebuild).
+    The least recently used patients are evicted beyond `max_patients`.
+    """
+
+    def __init__(
+        self,
+        window: timedelta,
+        slack: float,
+        alpha: float,
+        beta: float,
+        max_patients: int
+    ):
+        self.window = window
+        self.slack = slack
+        self.alpha = alpha
+        self.beta = beta
+        self.max_patients = max_patients
+        self._states: "OrderedDict[str, PatientTrendState]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def lock(self, patient_id: str) -> asyncio.Lock:
+        if patient_id not in self._locks:
+            self._locks[patient_id] = asyncio.Lock()
+        return self._locks[patient_id]
+
+    def needs_rebuild(
+        self,
+        state: PatientTrendState,
+        readings: Iterable[Any],
+        recorded_at: datetime,
+        now: Optional[datetime] = None
+    ) -> bool:
+        """
+        Whether `readings`, recorded at `recorded_at`, arrived out of order
+        for `state`: inside the window but older than its newest reading,
+        and recorded after it was read from the database (so not already
+        part of it). Readings outside the window never count.
+        """
+        if state.last_timestamp is None:
+            return False
+        window_start = (now or datetime.now(timezone.utc)) - self.window
+        if state.built_at is not None and as_utc(recorded_at) < state.built_at:
+            return False
+        for reading in readings:
+            timestamp = _reading_value(reading, "timestamp")
+            if timestamp is not None and window_start <= as_utc(timestamp) < state.last_timestamp:
+                return True
+        return False
+
+    def get(self, patient_id: str, now: Optional[datetime] = None) -> Optional[PatientTrendState]:
+        """
+        Return the live state for a patient, or None if it must be rebuilt
+        """
+        state = self._states.get(patient_id)
+        if state is None:
+            return None
+        now = now or datetime.now(timezone.utc)
+        if now - state.window_start > self.window * (1 + self.slack):
+            return None
+        self._states.move_to_end(patient_id)
+        return state
+
+    def rebuild(
+        self,
+        patient_id: str,
+        readings: Iterable[Any],
+        now: Optional[datetime] = None
+    ) -> PatientTrendState:
+        """
+        Replace a patient's state with one built from chronologically
+        ordered readings covering the last `window`
+        """
+        now = now or datetime.now(timezone.utc)
+        state = build_trend_state(readings, now - self.window, self.alpha, self.beta)
+        state.built_at = now
+        return self.install(patient_id, state)
+
+    def install(self, patient_id: str, state: PatientTrendState) -> PatientTrendState:
+        """
+        Store a state built elsewhere (e.g. by build_trend_state on a worker)
+        """
+        self._states[patient_id] = state
+        self._states.move_to_end(patient_id)
+        while len(self._states) > self.max_patients:
+            evicted, _ = self._states.popitem(last=False)
+            lock = self._locks.get(evicted)
+            if lock is not None and not lock.locked():
+                del self._locks[evicted]
+        return state
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+def build_trend_state(
+    readings: Iterable[Any],
+    window_start: datetime,
+    alpha: float,
+    beta: float
+) -> PatientTrendState:
+    """
+    Fold chronologically ordered readings into a fresh state. A plain
+    function of plain data, so it can run on a worker process.
+    """
+    state = PatientTrendState(window_start, alpha, beta)
+    for reading in readings:
+        state.update(reading)
+    return state
+
+def build_trend_state_from_columns(
+    columns: Dict[str, Any],
+    window_start: datetime,
+    alpha: float,
+    beta: float
+) -> PatientTrendState:
+    """
+    build_trend_state for chronological metric columns (NaN where a reading
+    lacks the metric). Metrics are folded independently, so column order
+    gives the same state as row order.
+    """
+    state = PatientTrendState(window_start, alpha, beta)
+    if "timestamp" in columns:
+        state.update_columns(columns)
+        return state
+    for metric, metric_state in state.metrics.items():
+        column = columns.get(metric)
+        if column is None:
+            continue
+        for value in column[~np.isnan(column)].tolist():
+            metric_state.update(value)
+    return state
+
+def as_utc(value: datetime) -> datetime:
+    # Naive timestamps (e.g. from HealthMetric payloads) are taken as UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def _from_datetime64(value: np.datetime64) -> datetime:
+    return value.astype("datetime64[us]").astype(datetime).replace(tzinfo=timezone.utc)
+
+def _reading_value(reading: Any, metric: str) -> Optional[float]:
+    # Database records are indexed by column name, HealthMetric models by attribute
+    try:
+        return reading[metric]
+    except (TypeError, KeyError):
+        return getattr(reading, metric, None)
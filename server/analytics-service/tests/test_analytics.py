@@ -0,0 +1,2361 @@
+# tests/test_analytics.py
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from uuid import UUID, uuid4
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import pgcopy_binary
+from src.api.endpoints import metrics as metrics_endpoint
+from src.core.config import settings
+from src.core.database import DatabasePool
+from src.core.errors import ExecutorSaturatedError, PoolTimeoutError, ServiceUnavailableError
+from src.core.executor import CpuExecutor
+from src.models.schemas import HealthMetric, MetricsSummary
+from src.services import time_series_service as ts_module
+from src.services import alert_service as alert_module
+from src.services import analytics_service as analytics_module
+from src.services.analytics_service import AnalyticsService
+from src.services.cache_service import CacheService, LocalRedis
+from src.services import cohort_service as cohort_module
+from src.services.cohort_service import CohortTrendService, cohort_query, summarize_cohort
+from src.services.columnar_fetch import PGCOPY_SIGNATURE, decode_binary_copy, metric_columns_query
+from src.services.history_tiers import bucket_columns, plan_history, raw_to_buckets, tier_retention, weighted_quantiles
+from src.services import report_service as report_module
+from src.services import rollup_service as rollup_module
+from src.services.history_export import arrow_stream, ndjson_stream
+from src.services.quantile_sketch import TDigest
+from src.services.report_service import ReportError
+from src.services.rollup_service import QuerySegment, fan_out, plan_segments, merge_partials, split_segment
+from src.services.sketch_store import DailySketch, SketchStore, summarize_sketches
+from src.services.time_series_service import TimeSeriesService, analyze_history_buckets
+from src.services.trend_state import RunningStats, MetricTrendState, TrendStateStore
+
+
+class FakeDatabase:
+    """Records executed statements; optionally fails on chosen calls."""
+
+    def __init__(self, fail_on=()):
+        self.executed = []
+        self.fail_on = set(fail_on)
+
+    async def execute(self, query, values=None):
+        call = len(self.executed)
+        self.executed.append((query, values))
+        if call in self.fail_on:
+            raise RuntimeError("insert failed")
+
+    async def fetch_all(self, query, values=None):
+        self.executed.append((query, values))
+        return []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def use_fake_db(monkeypatch, module, db):
+    @asynccontextmanager
+    async def fake_get_db(label=None):
+        yield db
+
+    monkeypatch.setattr(module, "get_db", fake_get_db)
+
+
+def make_metric(patient_id=None, **vitals):
+    return HealthMetric(
+        patient_id=patient_id or uuid4(),
+        timestamp=datetime(2024, 1, 1),
+        **vitals
+    )
+
+
+# Batch ingestion
+
+def test_parse_batch_body_ndjson_keeps_bad_lines():
+    body = b'{"a": 1}\n\nnot json\n{"b": 2}\n'
+    rows = metrics_endpoint._parse_batch_body(body, "application/x-ndjson")
+    assert rows == [{"a": 1}, "not json", {"b": 2}]
+
+
+def test_parse_batch_body_requires_array():
+    with pytest.raises(metrics_endpoint.HTTPException):
+        metrics_endpoint._parse_batch_body(b'{"a": 1}', "application/json")
+
+
+def test_validate_batch_rows_reports_each_rejection():
+    good = {"patient_id": str(uuid4()), "timestamp": "2024-01-01T00:00:00", "heart_rate": 80}
+    rows = [good, {"patient_id": "nope"}, "garbage", good]
+
+    metrics, results = metrics_endpoint._validate_batch_rows(rows)
+
+    assert [index for index, _ in metrics] == [0, 3]
+    assert results[0] is None and results[3] is None
+    assert results[1]["status"] == "rejected" and "patient_id" in results[1]["error"]
+    assert results[2]["status"] == "rejected"
+
+
+@pytest.mark.asyncio
+async def test_record_health_metrics_batch_chunks_and_rejects_failed_chunk(monkeypatch):
+    db = FakeDatabase(fail_on={1})
+    use_fake_db(monkeypatch, ts_module, db)
+    monkeypatch.setattr(settings, "INGEST_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "SKETCH_UPDATE_ON_INGEST", False)
+    metrics = [make_metric(heart_rate=70 + i) for i in range(5)]
+
+    results = await TimeSeriesService().record_health_metrics_batch(metrics)
+
+    assert len(db.executed) == 3
+    assert [r["status"] for r in results] == [
+        "accepted", "accepted", "rejected", "rejected", "accepted"
+    ]
+    query, values = db.executed[0]
+    assert "unnest" in query
+    assert values["heart_rate"] == [70, 71]
+    assert values["ids"] == [results[0]["id"], results[1]["id"]]
+
+
+# Streaming trend state
+
+def _series(n=200, slope=0.05, noise=0.5, seed=7):
+    rng = np.random.default_rng(seed)
+    return 60 + slope * np.arange(n) + rng.normal(0, noise, n)
+
+
+def test_running_stats_match_batch_statistics():
+
+    values = _series()
+    stats = RunningStats()
+    for value in values:
+        stats.update(float(value))
+
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.std == pytest.approx(values.std(ddof=1), rel=1e-9)
+    assert stats.slope == pytest.approx(np.polyfit(np.arange(len(values)), values, 1)[0], rel=1e-9)
+    assert stats.correlation == pytest.approx(np.corrcoef(np.arange(len(values)), values)[0, 1], rel=1e-9)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+@pytest.mark.parametrize("slope", [0.05, -0.05])
+def test_streaming_trend_matches_calculate_metric_trend(slope):
+
+    values = _series(slope=slope)
+    state = MetricTrendState(settings.TREND_HOLT_ALPHA, settings.TREND_HOLT_BETA)
+    for value in values:
+        state.update(float(value))
+
+    streaming = state.to_trend()
+    reference = TimeSeriesService()._calculate_metric_trend(pd.Series(values))
+
+    assert streaming.keys() == reference.keys()
+    assert streaming["trend_direction"] == reference["trend_direction"]
+    for key in ("current_value", "mean", "std", "volatility"):
+        assert streaming[key] == pytest.approx(reference[key], rel=1e-9)
+    # Fixed smoothing parameters vs. statsmodels' fitted ones
+    assert streaming["forecast_next"] == pytest.approx(reference["forecast_next"], rel=0.02)
+
+
+def test_streaming_forecast_stays_close_to_fitted_holt_on_vital_signs():
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    # A day of 5-minute heart rates: autocorrelated swings around a slow
+    # drift plus measurement noise, on which statsmodels fits beta near 0
+    deviations = []
+    for seed in range(20):
+        rng = np.random.default_rng(seed)
+        swings = np.zeros(288)
+        for i in range(1, len(swings)):
+            swings[i] = 0.9 * swings[i - 1] + rng.normal(0, 1.5)
+        values = 75 + 0.02 * np.arange(len(swings)) + swings + rng.normal(0, 1.0, len(swings))
+
+        state = MetricTrendState(settings.TREND_HOLT_ALPHA, settings.TREND_HOLT_BETA)
+        for value in values:
+            state.update(float(value))
+        fitted = ExponentialSmoothing(pd.Series(values), trend='add', seasonal=None).fit()
+
+        deviations.append(
+            abs(state.to_trend()["forecast_next"] - np.asarray(fitted.forecast(1))[0]) / values.std(ddof=1)
+        )
+
+    assert np.mean(deviations) < 0.2
+    assert max(deviations) < 0.6
+
+
+def test_trend_store_goes_stale_after_window_and_evicts():
+
+    store = TrendStateStore(timedelta(hours=24), 0.25, 0.5, 0.1, max_patients=2)
+    now = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    readings = [{"heart_rate": 70.0 + i, "blood_pressure_systolic": None, "oxygen_saturation": 98.0}
+                for i in range(3)]
+
+    state = store.rebuild("p1", readings, now=now)
+    assert state.snapshot()["trends"]["heart_rate"]["current_value"] == 72.0
+    assert "blood_pressure_systolic" not in state.snapshot()["trends"]
+
+    assert store.get("p1", now=now + timedelta(hours=5)) is state
+    assert store.get("p1", now=now + timedelta(hours=7)) is None
+
+    store.rebuild("p2", [], now=now)
+    store.rebuild("p3", [], now=now)
+    assert len(store) == 2 and store.get("p1", now=now) is None
+    assert store.get("p2", now=now).snapshot() == {"status": "insufficient_data"}
+
+
+class TrendHistoryDatabase:
+    """health_metrics of one patient as (timestamp, heart rate) pairs"""
+
+    def __init__(self, readings):
+        self.readings = list(readings)
+        self.fetches = []
+
+    async def copy_from_query(self, query, *args, output, format):
+        self.fetches.append(args)
+        rows = sorted(reading for reading in self.readings if reading[0] >= args[1])
+        output.write(pgcopy_binary(
+            {
+                "heart_rate": np.array([heart_rate for _, heart_rate in rows], dtype=float),
+                "blood_pressure_systolic": np.full(len(rows), 120.0),
+                "oxygen_saturation": np.full(len(rows), 97.0),
+            },
+            np.array([timestamp.replace(tzinfo=None) for timestamp, _ in rows], dtype="datetime64[us]")
+        ))
+
+
+@pytest.mark.asyncio
+async def test_calculate_trends_rebuilds_once_then_catches_up_incrementally(monkeypatch):
+    service = TimeSeriesService()
+    patient_id = uuid4()
+    base = datetime.now(timezone.utc) - timedelta(hours=2)
+    db = TrendHistoryDatabase((base + timedelta(minutes=i), 70.0 + i) for i in range(4))
+    use_fake_db(monkeypatch, ts_module, db)
+
+    first = await service.calculate_trends(patient_id)
+    # Stored by another worker: picked up although not passed in
+    db.readings.append((base + timedelta(minutes=10), 90.0))
+    second = await service.calculate_trends(patient_id)
+
+    assert len(db.fetches) == 2 and db.fetches[1][1] == base + timedelta(minutes=3)
+    assert first["trends"]["heart_rate"]["current_value"] == 73.0
+    assert second["trends"]["heart_rate"]["current_value"] == 90.0
+    assert second["trends"]["heart_rate"]["mean"] == pytest.approx(np.mean([70, 71, 72, 73, 90]))
+    assert "oxygen_saturation" in second["trends"]
+
+
+@pytest.mark.asyncio
+async def test_trend_state_rebuilds_only_for_unseen_out_of_order_readings(monkeypatch):
+    service = TimeSeriesService()
+    patient_id = uuid4()
+    base = datetime.now(timezone.utc) - timedelta(hours=2)
+    db = TrendHistoryDatabase((base + timedelta(minutes=i), 70.0 + i) for i in range(4))
+    use_fake_db(monkeypatch, ts_module, db)
+    await service.calculate_trends(patient_id)
+    built_at = service.trend_store.get(str(patient_id)).built_at
+
+    def reading(minutes, heart_rate):
+        return HealthMetric(patient_id=patient_id, timestamp=base + timedelta(minutes=minutes), heart_rate=heart_rate)
+
+    # A deferred batch task for readings the rebuild already read
+    await service.calculate_trends(patient_id, [reading(2, 72.0)], built_at - timedelta(seconds=1))
+    # Week-old readings are outside the window
+    await service.calculate_trends(patient_id, [reading(-7 * 1440, 50.0)], datetime.now(timezone.utc))
+    assert [args[1] == base + timedelta(minutes=3) for args in db.fetches[1:]] == [True, True]
+
+    # Backfilled after the state was built: rebuilt, in timestamp order
+    db.readings.append((base + timedelta(minutes=1, seconds=30), 100.0))
+    trends = await service.calculate_trends(
+        patient_id, [reading(1.5, 100.0)], datetime.now(timezone.utc)
+    )
+
+    assert len(db.fetches) == 4 and db.fetches[3][1] < base
+    assert trends["trends"]["heart_rate"]["current_value"] == 73.0
+    assert trends["trends"]["heart_rate"]["mean"] == pytest.approx(np.mean([70, 71, 100, 72, 73]))
+
+
+# Vectorized batch trends
+
+def test_batch_trends_match_per_series_calculations():
+    rng = np.random.default_rng(3)
+    ragged = [60 + rng.normal(0, 2, n) + 0.1 * np.arange(n) for n in (2, 3, 5, 40, 120)]
+    ragged[3][[4, 10]] = np.nan
+    service = TimeSeriesService()
+
+    records = service.calculate_batch_trends(ragged)
+
+    assert records[0] is None
+    for values, record in zip(ragged[1:], records[1:]):
+        clean = pd.Series(values).dropna().reset_index(drop=True)
+        reference = service._calculate_metric_trend(clean) if len(clean) < 5 else None
+
+        state = MetricTrendState(settings.TREND_HOLT_ALPHA, settings.TREND_HOLT_BETA)
+        for value in clean:
+            state.update(float(value))
+        streaming = state.to_trend()
+
+        for key in ("current_value", "mean", "std", "volatility", "forecast_next"):
+            assert record[key] == pytest.approx(streaming[key], rel=1e-9)
+        assert record["trend_direction"] == streaming["trend_direction"]
+        assert record["trend_strength"] == pytest.approx(service._calculate_trend_strength(clean), rel=1e-9)
+        if reference:
+            assert record["forecast_next"] == reference["forecast_next"]
+
+
+def test_batch_trends_accepts_padded_array():
+    padded = np.array([[1.0, 2.0, 3.0, np.nan], [4.0, 3.0, 2.0, 1.0]])
+
+    records = TimeSeriesService().calculate_batch_trends(padded)
+
+    assert [r["current_value"] for r in records] == [3.0, 1.0]
+    assert [r["trend_direction"] for r in records] == ["increasing", "decreasing"]
+
+
+def test_batch_trends_of_empty_series_are_none():
+    from src.services.batch_trends import calculate_batch_trends
+
+    assert TimeSeriesService().calculate_batch_trends([[]]) == [None]
+    assert TimeSeriesService().calculate_batch_trends([[], []]) == [None, None]
+    assert TimeSeriesService().calculate_batch_trends(np.empty((2, 0))) == [None, None]
+    assert calculate_batch_trends([[]], 0.5, 0.1)["count"].tolist() == [0]
+
+
+def test_batch_trends_reject_one_dimensional_arrays():
+    with pytest.raises(ValueError, match="2-D"):
+        TimeSeriesService().calculate_batch_trends(np.array([1.0, 2.0, 3.0]))
+
+
+# Connection pool
+
+class FakePoolDatabase:
+    """One shared connection guarded by a semaphore, like a pool of size 1"""
+
+    def __init__(self):
+        self.is_connected = False
+        self.connects = 0
+        self.slots = asyncio.Semaphore(1)
+        self.connections = {}
+
+    async def connect(self):
+        self.connects += 1
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    def connection(self):
+        task = asyncio.current_task()
+        if task not in self.connections:
+            self.connections[task] = FakeConnection(self, task)
+        return self.connections[task]
+
+
+class FakeConnection:
+    def __init__(self, database, task):
+        self.database = database
+        self.task = task
+
+    async def __aenter__(self):
+        await self.database.slots.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.database.slots.release()
+        del self.database.connections[self.task]
+
+
+@pytest.mark.asyncio
+async def test_pool_connects_once_and_shares_connection_for_nested_borrows():
+    database = FakePoolDatabase()
+    pool = DatabasePool(database, min_size=1, max_size=1, acquire_timeout=1)
+
+    async with pool.acquire() as outer:
+        async with pool.acquire() as inner:
+            assert inner.connection is outer.connection
+            assert pool.stats()["in_use"] == 1
+    async with pool.acquire():
+        pass
+
+    stats = pool.stats()
+    assert database.connects == 1 and database.is_connected
+    assert stats["in_use"] == 0 and stats["acquired_total"] == 2
+
+
+@pytest.mark.asyncio
+async def test_pool_acquire_times_out_when_exhausted():
+    database = FakePoolDatabase()
+    pool = DatabasePool(database, min_size=1, max_size=1, acquire_timeout=0.05)
+    held = asyncio.Event()
+    release = asyncio.Event()
+
+    async def hold():
+        async with pool.acquire():
+            held.set()
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await held.wait()
+    with pytest.raises(PoolTimeoutError):
+        async with pool.acquire():
+            pass
+    release.set()
+    await holder
+
+    stats = pool.stats()
+    assert stats["timeouts_total"] == 1 and stats["waiting"] == 0
+
+
+# Query cache
+
+@pytest.mark.asyncio
+async def test_cache_coalesces_concurrent_misses_and_counts_hits():
+    cache = CacheService(LocalRedis())
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": calls}
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(10)))
+    assert calls == 1 and all(r == {"value": 1} for r in results)
+    assert await cache.get_or_compute("k", compute) == {"value": 1}
+
+    # A second process sharing Redis fills its local tier from Redis
+    other = CacheService(cache.redis)
+    assert await other.get_or_compute("k", compute) == {"value": 1}
+
+    assert cache.stats()["coalesced"] == 9
+    assert cache.stats()["local_hits"] == 1
+    assert other.stats()["redis_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_lru_and_invalidates_by_pattern():
+    cache = CacheService(LocalRedis(), local_max_entries=2)
+
+    async def value():
+        return 1
+
+    for key in ("utilization:d1:daily", "utilization:d2:daily", "summary:daily:d1"):
+        await cache.get_or_compute(key, value)
+    assert cache.stats()["evictions"] == 1
+
+    removed = await cache.invalidate(["utilization:d1:*", "summary:*:d1"])
+
+    assert removed == 3  # one local entry, two Redis keys
+    assert [k async for k in cache.redis.scan_iter()] == ["analytics:utilization:d2:daily"]
+
+
+@pytest.mark.asyncio
+async def test_cache_falls_back_to_compute_when_redis_fails():
+    class BrokenRedis(LocalRedis):
+        async def get(self, key):
+            raise ConnectionError("down")
+
+    cache = CacheService(BrokenRedis())
+
+    async def value():
+        return [1, 2]
+
+    assert await cache.get_or_compute("k", value) == [1, 2]
+    assert cache.stats()["redis_errors"] == 1
+
+
+class SummaryDatabase:
+    """Answers section queries with one row per requested period."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def fetch_all(self, query, values=None):
+        # text() rejects bind parameters the query does not use
+        assert all(f":{key}" in query for key in values)
+        self.queries.append((query, values))
+        periods = [key[len("start_"):] for key in values if key.startswith("start_")]
+        departments = values.get("dept_ids") or [None]
+        rows = []
+        for department in departments:
+            row = {"department_id": department}
+            for p in periods:
+                row.update({
+                    f"{p}_total_patients": 3, f"{p}_avg_risk": 40.0, f"{p}_high_risk": 1,
+                    f"{p}_utilization_sum": 7.0, f"{p}_utilization_samples": 10, f"{p}_count": {"daily": 1, "weekly": 5}.get(p, 9)
+                })
+            if "FROM treatment_outcomes" in query:
+                rows.extend([{**row, "diagnosis_code": "I10"}, {**row, "diagnosis_code": "E11", "daily_count": 2}])
+            else:
+                rows.append(row)
+        return rows
+
+
+@pytest.mark.asyncio
+async def test_metrics_summary_sections_are_cached_per_period_and_department(monkeypatch):
+    db = SummaryDatabase()
+    use_fake_db(monkeypatch, analytics_module, db)
+    service = AnalyticsService(CacheService(LocalRedis()))
+
+    first = await service.get_metrics_summary("daily", "d1")
+    await service.get_metrics_summary("daily", "d1")
+    await service.get_metrics_summary("weekly", "d1")
+    await service.invalidate_sections(['patients'])
+    await service.get_metrics_summary("daily", "d1")
+
+    assert first.total_patients == 3 and first.department_id == "d1"
+    assert first.top_conditions == ["E11", "I10"]
+    # Three sections, each queried once per uncached (period, department),
+    # and the invalidated patients section once more
+    assert len(db.queries) == 7
+    assert sum("FROM patient_analytics" in query for query, _ in db.queries) == 3
+    # Only utilization is filtered by department
+    assert all(values.get("dept_ids", ["d1"]) == ["d1"] for _, values in db.queries)
+    assert all(("dept_ids" in values) == ("FROM department_metrics" in query) for query, values in db.queries)
+
+    with pytest.raises(ValueError):
+        await service.get_metrics_summary("yearly")
+
+
+@pytest.mark.asyncio
+async def test_metrics_summaries_share_one_scan_per_section(monkeypatch):
+    db = SummaryDatabase()
+    use_fake_db(monkeypatch, analytics_module, db)
+    service = AnalyticsService(CacheService(LocalRedis()))
+    await service.get_metrics_summary("weekly", None)
+
+    summaries = await service.get_metrics_summaries(["daily", "weekly", "monthly"], [None, "d1", "d2"])
+
+    assert [(s.time_period, s.department_id) for s in summaries[:3]] == [
+        ("daily", None), ("daily", "d1"), ("daily", "d2")
+    ]
+    assert summaries[0].top_conditions == ["E11", "I10"]
+    assert summaries[1].top_conditions == ["E11", "I10"]
+    assert summaries[-1].top_conditions == ["E11", "I10"]
+    assert summaries[1].department_utilization == pytest.approx(0.7)
+    queries = db.queries[3:]
+    # Utilization: one scan for all departments (weekly was cached) and one
+    # grouped by department; the hospital-wide sections scan once
+    utilization = [values for query, values in queries if "FROM department_metrics" in query]
+    assert all(sorted(k for k in values if k.startswith("start_")) == ["start_daily", "start_monthly"]
+               for values in utilization if "dept_ids" not in values)
+    patients = [values for query, values in queries if "FROM patient_analytics" in query]
+    assert len(patients) == 1 and "dept_ids" not in patients[0]
+    assert patients[0]["scan_start"] == patients[0]["start_monthly"]
+    assert summaries[1].total_patients == summaries[0].total_patients
+
+    # The 30-day utilization and condition scans fan out into pieces that
+    # tile the monthly window
+    for source, groupings in (("FROM department_metrics", (False, True)), ("FROM treatment_outcomes", (False,))):
+        for by_department in groupings:
+            pieces = [values for query, values in queries
+                      if source in query and ("dept_ids" in values) == by_department]
+            assert len(pieces) > 1
+            assert pieces[0]["scan_start"] == pieces[0]["start_monthly"]
+            assert all(a["scan_end"] == b["scan_start"] for a, b in zip(pieces, pieces[1:]))
+
+
+def test_summary_section_query_filters_only_utilization_by_department():
+    query = analytics_module.summary_section_query("utilization", ["daily", "weekly"], True)
+    assert "dept_ids" in query and "GROUP BY dm.department_id" in query
+    assert "FILTER (WHERE" in query and ":start_weekly" in query
+    for section in ("patients", "conditions"):
+        assert "dept_ids" not in analytics_module.summary_section_query(section, ["daily"], False)
+        with pytest.raises(ValueError):
+            analytics_module.summary_section_query(section, ["daily"], True)
+
+
+class FixtureSummaryDatabase:
+    """Evaluates summary section queries over in-memory tables."""
+
+    SOURCES = {
+        "FROM patient_analytics": ("patient_analytics", "updated_at"),
+        "FROM department_metrics": ("department_metrics", "timestamp"),
+        "FROM treatment_outcomes": ("treatment_outcomes", "created_at")
+    }
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    async def fetch_all(self, query, values=None):
+        table, column = next(source for marker, source in self.SOURCES.items() if marker in query)
+        end = values["scan_end"]
+        rows = [
+            row for row in self.tables[table]
+            if values["scan_start"] <= row[column] and (row[column] <= end if "<= :scan_end" in query else row[column] < end)
+        ]
+        departments = values.get("dept_ids")
+        if departments:
+            rows = [row for row in rows if row["department_id"] in departments]
+
+        groups = {}
+        for row in rows:
+            key = (row["department_id"] if departments else None, row.get("diagnosis_code"))
+            groups.setdefault(key, []).append(row)
+        periods = [key[len("start_"):] for key in values if key.startswith("start_")]
+        result = []
+        for (department, code), group in groups.items():
+            out = {"department_id": department, "diagnosis_code": code}
+            for p in periods:
+                window = [row for row in group if row[column] >= values[f"start_{p}"]]
+                if table == "patient_analytics":
+                    risks = [row["risk_score"] for row in window]
+                    out.update({
+                        f"{p}_total_patients": len({row["patient_id"] for row in window}),
+                        f"{p}_avg_risk": sum(risks) / len(risks) if risks else None,
+                        f"{p}_high_risk": sum(risk > 75 for risk in risks)
+                    })
+                elif table == "department_metrics":
+                    out.update({
+                        f"{p}_utilization_sum": sum(row["utilization_rate"] for row in window) if window else None,
+                        f"{p}_utilization_samples": len(window)
+                    })
+                else:
+                    out[f"{p}_count"] = len(window)
+            result.append(out)
+        return result
+
+
+def baseline_summary(tables, time_period, department_id, end):
+    """The original single-query summary: only utilization is narrowed to the department."""
+    start = end - analytics_module.SUMMARY_PERIODS[time_period]
+    patients = [row for row in tables["patient_analytics"] if start <= row["updated_at"] <= end]
+    utilization = [
+        row["utilization_rate"] for row in tables["department_metrics"]
+        if start <= row["timestamp"] <= end and (department_id is None or row["department_id"] == department_id)
+    ]
+    counts = {}
+    for row in tables["treatment_outcomes"]:
+        if start <= row["created_at"] <= end:
+            counts[row["diagnosis_code"]] = counts.get(row["diagnosis_code"], 0) + 1
+    risks = [row["risk_score"] for row in patients]
+    return {
+        "total_patients": len({row["patient_id"] for row in patients}),
+        "avg_risk_score": pytest.approx(sum(risks) / len(risks)),
+        "high_risk_count": sum(risk > 75 for risk in risks),
+        "department_utilization": pytest.approx(sum(utilization) / len(utilization)),
+        "top_conditions": sorted(counts, key=lambda code: -counts[code])[:5]
+    }
+
+
+@pytest.mark.asyncio
+async def test_department_summaries_match_the_baseline_query(monkeypatch):
+    now = datetime.now(timezone.utc)
+    ago = lambda hours: now - timedelta(hours=hours)
+    patients = [uuid4() for _ in range(4)]
+    tables = {
+        "patient_analytics": [
+            {"patient_id": patients[0], "updated_at": ago(3), "risk_score": 80.0},
+            {"patient_id": patients[1], "updated_at": ago(5), "risk_score": 20.0},
+            {"patient_id": patients[1], "updated_at": ago(40), "risk_score": 30.0},
+            {"patient_id": patients[2], "updated_at": ago(100), "risk_score": 90.0},
+            {"patient_id": patients[3], "updated_at": ago(400), "risk_score": 10.0},
+        ],
+        "department_metrics": [
+            {"department_id": department, "timestamp": ago(hours), "utilization_rate": rate}
+            for department, hours, rate in [
+                ("d1", 2, 0.9), ("d1", 30, 0.5), ("d1", 150, 0.2),
+                ("d2", 4, 0.4), ("d2", 60, 0.6), ("d2", 300, 0.8)
+            ]
+        ],
+        "treatment_outcomes": [
+            {"diagnosis_code": code, "created_at": ago(hours)}
+            for code, count, hours in [
+                ("I10", 6, 6), ("E11", 5, 12), ("J44", 4, 20), ("N18", 3, 50), ("I50", 2, 90), ("F32", 1, 10)
+            ]
+            for _ in range(count)
+        ]
+    }
+    use_fake_db(monkeypatch, analytics_module, FixtureSummaryDatabase(tables))
+    service = AnalyticsService(CacheService(LocalRedis()))
+
+    periods, departments = ["daily", "weekly", "monthly"], [None, "d1", "d2"]
+    summaries = await service.get_metrics_summaries(periods, departments)
+
+    for summary in summaries:
+        expected = baseline_summary(tables, summary.time_period, summary.department_id, now)
+        assert {key: getattr(summary, key) for key in expected} == expected
+    # Department filters change utilization only
+    daily = {summary.department_id: summary for summary in summaries if summary.time_period == "daily"}
+    assert daily["d1"].total_patients == daily[None].total_patients == 2
+    assert daily["d1"].department_utilization != daily["d2"].department_utilization
+
+@pytest.mark.asyncio
+async def test_get_or_compute_many_computes_misses_in_one_call():
+    cache = CacheService(LocalRedis())
+    calls = []
+
+    async def compute(missing):
+        calls.append(sorted(missing))
+        return {item: item * 10 for item in missing}
+
+    assert await cache.get_or_compute_many({1: "a", 2: "b"}, compute) == {1: 10, 2: 20}
+    assert await cache.get_or_compute_many({1: "a", 2: "b", 3: "c"}, compute) == {1: 10, 2: 20, 3: 30}
+    assert await cache.get_or_compute_many({1: "a", 3: "c"}, compute) == {1: 10, 3: 30}
+    assert calls == [[1, 2], [3]]
+
+
+# Prometheus instrumentation
+
+def _sample(name, **labels):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.asyncio
+async def test_instrumented_connection_times_queries_by_borrower():
+    from src.core.metrics import InstrumentedConnection
+
+    labels = {"method": "tests.borrower", "operation": "fetch_all"}
+    before = _sample("analytics_db_query_duration_seconds_count", **labels)
+    db = FakeDatabase()
+    connection = InstrumentedConnection(db, "tests.borrower")
+
+    assert await connection.fetch_all("SELECT 1") == []
+    async with connection.transaction():
+        pass
+
+    assert _sample("analytics_db_query_duration_seconds_count", **labels) == before + 1
+    assert db.executed == [("SELECT 1", None)]
+
+
+def test_request_latency_is_labelled_by_route_template():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from src.core.metrics import PrometheusMiddleware
+
+    app = FastAPI()
+    app.add_middleware(PrometheusMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = _sample("analytics_http_request_duration_seconds_count", **labels)
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nowhere")
+
+    assert _sample("analytics_http_request_duration_seconds_count", **labels) == before + 2
+    assert _sample("analytics_http_request_duration_seconds_count",
+                   method="GET", route="unmatched", status="404") >= 1
+
+
+
+# Dashboard responses
+
+def test_encoding_negotiation_honours_quality_values():
+    from src.core import responses
+
+    assert responses.negotiate_encoding("gzip, deflate") == "gzip"
+    assert responses.negotiate_encoding("gzip;q=0, deflate") is None
+    assert responses.negotiate_encoding("identity") is None
+    assert responses.negotiate_encoding(None) is None
+    assert responses.negotiate_encoding("*;q=0.5") == responses.available_encodings()[0]
+    assert responses.negotiate_encoding("br;q=1.0, gzip;q=0.8") == ("br" if responses.brotli else "gzip")
+
+    body = responses.dumps({"value": float("nan"), "array": np.array([1.5, 2.0]), "at": datetime(2024, 1, 1),
+                            "summary": MetricsSummary(time_period="daily", total_patients=1, avg_risk_score=2.0,
+                                                      high_risk_count=0, department_utilization=0.5,
+                                                      top_conditions=[])})
+    decoded = json.loads(body)
+    assert decoded["value"] is None and decoded["array"] == [1.5, 2.0]
+    assert decoded["at"] == "2024-01-01T00:00:00" and decoded["summary"]["department_utilization"] == 0.5
+
+
+def test_dashboard_responses_revalidate_against_the_data_watermark(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    # One ETag epoch for the whole test
+    monkeypatch.setattr(settings, "ETAG_EPOCH_SECONDS", 1e9)
+    watermark = {"at": datetime(2024, 1, 1, tzinfo=timezone.utc)}
+    computed = []
+
+    async def department_watermark(department_id):
+        return watermark["at"]
+
+    async def get_department_utilization(department_id, period, start_date, end_date):
+        computed.append(department_id)
+        return [{"period": f"2024-01-{day:02d}", "utilization_rate": 0.5} for day in range(1, 29)]
+
+    monkeypatch.setattr(metrics_endpoint.analytics_service, "department_watermark", department_watermark)
+    monkeypatch.setattr(metrics_endpoint.analytics_service, "get_department_utilization", get_department_utilization)
+    app = FastAPI()
+    app.include_router(metrics_endpoint.router)
+    client = TestClient(app)
+    url = "/department/d1/utilization?period=daily&start_date=2024-01-01T00:00:00&end_date=2024-01-29T00:00:00"
+
+    first = client.get(url, headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.headers["content-encoding"] == "gzip"
+    assert len(first.json()) == 28 and etag.startswith('W/"')
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+    assert computed == ["d1"]
+
+    watermark["at"] += timedelta(minutes=1)
+    changed = client.get(url, headers={"If-None-Match": etag, "Accept-Encoding": "identity"})
+    assert changed.status_code == 200 and "content-encoding" not in changed.headers
+    assert changed.headers["etag"] != etag and computed == ["d1", "d1"]
+
+
+# Department rollups
+
+UTC = timezone.utc
+
+
+def test_plan_segments_uses_coarsest_rollup_and_raw_head_and_tail():
+    start = datetime(2024, 1, 1, 6, 30, tzinfo=UTC)
+    end = datetime(2024, 1, 20, 12, 0, tzinfo=UTC)
+    watermarks = {
+        "department_metrics_daily": datetime(2024, 1, 15, tzinfo=UTC),
+        "department_metrics_hourly": datetime(2024, 1, 20, 10, tzinfo=UTC),
+    }
+
+    weekly = plan_segments(timedelta(weeks=1), start, end, watermarks)
+    hourly = plan_segments(timedelta(hours=1), start, end, watermarks)
+
+    assert weekly == [
+        QuerySegment("raw", start, datetime(2024, 1, 2, tzinfo=UTC)),
+        QuerySegment("department_metrics_daily", datetime(2024, 1, 2, tzinfo=UTC),
+                     datetime(2024, 1, 15, tzinfo=UTC)),
+        QuerySegment("raw", datetime(2024, 1, 15, tzinfo=UTC), end, inclusive_end=True),
+    ]
+    assert [s.source for s in hourly] == ["raw", "department_metrics_hourly", "raw"]
+    assert hourly[1].end == datetime(2024, 1, 20, 10, tzinfo=UTC)
+
+
+def test_plan_segments_falls_back_to_raw_without_materialized_rollup():
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 1, 20)
+
+    assert plan_segments(timedelta(days=1), start, end, {}) == [
+        QuerySegment("raw", start.replace(tzinfo=UTC), end.replace(tzinfo=UTC), inclusive_end=True)
+    ]
+
+
+def test_merge_partials_weights_averages_by_sample_count():
+    period = datetime(2024, 1, 1, tzinfo=UTC)
+    rows = [
+        {"period": period, "patient_samples": 24, "patient_sum": 240, "peak_patients": 14,
+         "utilization_samples": 24, "utilization_sum": 12.0, "wait_samples": 24, "wait_seconds_sum": 24 * 600},
+        {"period": period, "patient_samples": 1, "patient_sum": 35, "peak_patients": 35,
+         "utilization_samples": 1, "utilization_sum": 1.0, "wait_samples": 0, "wait_seconds_sum": None},
+    ]
+
+    [merged] = merge_partials(rows)
+
+    assert merged["average_patients"] == pytest.approx(275 / 25)
+    assert merged["utilization_rate"] == pytest.approx(13 / 25)
+    assert merged["peak_patients"] == 35
+    assert merged["average_wait_time"] == pytest.approx(10.0)
+
+
+@pytest.mark.asyncio
+async def test_query_utilization_reads_each_planned_segment(monkeypatch):
+    queries = []
+
+    class RollupDatabase:
+        async def fetch_all(self, query, values=None):
+            if "rollup_watermarks" in query:
+                return [{"rollup_name": "department_metrics_daily",
+                         "refreshed_until": datetime(2024, 1, 10, tzinfo=UTC)}]
+            queries.append((query, values))
+            return []
+
+    use_fake_db(monkeypatch, rollup_module, RollupDatabase())
+
+    await rollup_module.RollupService().query_utilization(
+        "d1", timedelta(days=1), datetime(2024, 1, 1), datetime(2024, 1, 12, 8)
+    )
+
+    assert ["FROM department_metrics_daily" in q for q, _ in queries] == [True, False]
+    assert queries[1][1]["start_date"] == datetime(2024, 1, 10, tzinfo=UTC)
+
+
+def test_split_segment_cuts_long_ranges_at_chunk_boundaries():
+    segment = QuerySegment("raw", datetime(2024, 1, 3, 12, tzinfo=UTC), datetime(2024, 1, 20, tzinfo=UTC), True)
+    week = timedelta(weeks=1)
+
+    pieces = split_segment(segment, week, timedelta(days=14))
+
+    # Weekly chunks start on Thursdays, counted from the epoch
+    assert [(p.start.day, p.end.day, p.inclusive_end) for p in pieces] == [
+        (3, 4, False), (4, 11, False), (11, 18, False), (18, 20, True)
+    ]
+    assert pieces[0].start == segment.start and pieces[-1].end == segment.end
+    assert split_segment(segment, week, timedelta(days=30)) == [segment]
+
+
+@pytest.mark.asyncio
+async def test_fan_out_bounds_concurrency_and_keeps_call_order():
+    running, peak = 0, 0
+
+    async def call(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001 * (5 - i))
+        running -= 1
+        return i
+
+    assert await fan_out([lambda i=i: call(i) for i in range(5)], 2) == [0, 1, 2, 3, 4]
+    assert peak == 2
+
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def fail():
+        raise PoolTimeoutError(1)
+
+    with pytest.raises(PoolTimeoutError):
+        await fan_out([slow, fail], 2)
+    assert cancelled == [True]
+
+
+@pytest.mark.asyncio
+async def test_query_utilization_fans_long_raw_ranges_out_over_connections(monkeypatch):
+    pieces, borrowed = [], []
+
+    class RawDatabase:
+        async def fetch_all(self, query, values=None):
+            if "rollup_watermarks" in query:
+                return []
+            pieces.append(values)
+            await asyncio.sleep(0)
+            # Each piece reports a partial for the same weekly period
+            return [{"period": datetime(2024, 1, 1, tzinfo=UTC), "patient_samples": 2, "patient_sum": 20,
+                     "peak_patients": 10 + len(pieces), "utilization_samples": 2, "utilization_sum": 1.0,
+                     "wait_samples": 0, "wait_seconds_sum": None}]
+
+    @asynccontextmanager
+    async def fake_get_db(label=None):
+        borrowed.append(asyncio.current_task())
+        yield RawDatabase()
+
+    monkeypatch.setattr(rollup_module, "get_db", fake_get_db)
+
+    [merged] = await rollup_module.RollupService().query_utilization(
+        "d1", timedelta(weeks=1), datetime(2024, 1, 1), datetime(2024, 2, 1)
+    )
+
+    assert len(pieces) == 5
+    assert all(a["end_date"] == b["start_date"] for a, b in zip(pieces, pieces[1:]))
+    # Watermarks on the caller's connection, then one task per piece
+    assert len(set(borrowed)) == 6
+    assert merged["average_patients"] == 10.0 and merged["peak_patients"] == 15
+
+
+def test_summary_values_add_up_pieces_before_ranking_conditions():
+    rows = [
+        {"diagnosis_code": "I10", "monthly_count": 3}, {"diagnosis_code": "E11", "monthly_count": 2},
+        {"diagnosis_code": "E11", "monthly_count": 2}, {"diagnosis_code": "J45", "monthly_count": 4},
+    ]
+    utilization = [
+        {"monthly_utilization_sum": 6.0, "monthly_utilization_samples": 8},
+        {"monthly_utilization_sum": 1.0, "monthly_utilization_samples": 2},
+        {"monthly_utilization_sum": None, "monthly_utilization_samples": 0},
+    ]
+
+    conditions = analytics_module.summary_section_values("conditions", rows, ["monthly"], False)
+    merged = analytics_module.summary_section_values("utilization", utilization, ["monthly"], False)
+
+    assert conditions[("monthly", None)] == {"top_conditions": ["E11", "J45", "I10"]}
+    assert merged[("monthly", None)]["department_utilization"] == pytest.approx(0.7)
+
+
+# Streaming history export
+
+def _history_rows(n=25):
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    rows = [(start + timedelta(seconds=i), 70.0 + i % 7, None if i % 5 == 0 else 96.0 + i % 3)
+            for i in range(n)]
+    return rows
+
+
+async def _chunked(rows, size):
+    for offset in range(0, len(rows), size):
+        yield rows[offset:offset + size]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_stream_emits_rows_then_incremental_summary():
+    rows = _history_rows()
+    metrics = ["heart_rate", "oxygen_saturation"]
+
+    body = b"".join([chunk async for chunk in ndjson_stream(
+        _chunked(rows, 4), metrics, datetime(2024, 1, 1), datetime(2024, 1, 2)
+    )])
+    lines = [json.loads(line) for line in body.splitlines()]
+
+    assert len(lines) == len(rows) + 1
+    assert lines[0]["oxygen_saturation"] is None
+    summary = lines[-1]["summary"]
+    assert summary["data_points"] == len(rows)
+    for position, metric in enumerate(metrics, start=1):
+        values = pd.Series([r[position] for r in rows], dtype=float).dropna().reset_index(drop=True)
+        reference = TimeSeriesService()._analyze_metric_history(values)
+        for key in ("min", "max", "mean", "std", "trend_strength"):
+            assert summary["metrics"][metric][key] == pytest.approx(reference[key], rel=1e-9)
+        assert summary["metrics"][metric]["median"] == pytest.approx(reference["median"], abs=1.0)
+
+
+@pytest.mark.asyncio
+async def test_arrow_stream_round_trips_record_batches():
+    pa = pytest.importorskip("pyarrow")
+    rows = _history_rows()
+
+    body = b"".join([chunk async for chunk in arrow_stream(_chunked(rows, 10), ["heart_rate", "oxygen_saturation"])])
+    table = pa.ipc.open_stream(body).read_all()
+
+    assert table.num_rows == len(rows)
+    assert table.column("heart_rate").to_pylist() == [r[1] for r in rows]
+    assert table.column("oxygen_saturation").null_count == 5
+
+
+# Column-projected fetch
+
+def test_binary_copy_decodes_projected_columns_with_nan_and_timestamps():
+    timestamps = np.array(["2024-01-01T00:00", "2024-01-01T00:05", "2024-01-01T00:10"], dtype="datetime64[us]")
+    heart_rate = np.array([70.0, np.nan, 74.5])
+    buffer = pgcopy_binary({"heart_rate": heart_rate}, timestamps)
+
+    columns = decode_binary_copy(buffer, ["heart_rate"], with_timestamp=True)
+
+    np.testing.assert_array_equal(columns["timestamp"], timestamps)
+    np.testing.assert_array_equal(columns["heart_rate"], heart_rate)
+    assert columns["heart_rate"].dtype == np.float64
+    assert decode_binary_copy(pgcopy_binary({"heart_rate": np.array([])}), ["heart_rate"])["heart_rate"].size == 0
+
+    query = metric_columns_query(["heart_rate"])
+    assert "COALESCE(heart_rate" in query and "temperature" not in query
+    assert "$3" not in metric_columns_query(["heart_rate"], upper=None)
+
+    # A NULL field (length -1, no data) breaks the fixed row width
+    null_row = PGCOPY_SIGNATURE + bytes(8) + (1).to_bytes(2, "big") + (-1).to_bytes(4, "big", signed=True) + b"\xff\xff"
+    with pytest.raises(ValueError):
+        decode_binary_copy(null_row, ["heart_rate"])
+
+
+@pytest.mark.asyncio
+async def test_patient_history_fetches_only_the_requested_metric(monkeypatch):
+    monkeypatch.setattr(settings, "SKETCH_MIN_RANGE_DAYS", 30)
+    service = TimeSeriesService()
+    queries = []
+    values = np.array([70.0, np.nan, 74.0, 71.0, 80.0])
+
+    class ColumnDatabase:
+        async def copy_from_query(self, query, *args, output, format):
+            queries.append(query)
+            output.write(pgcopy_binary({"heart_rate": values}))
+
+    use_fake_db(monkeypatch, ts_module, ColumnDatabase())
+    # Within raw retention
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+
+    [result] = await service.get_patient_metrics(uuid4(), start, start + timedelta(hours=6), "heart_rate")
+
+    assert result["data_points"] == 5
+    assert result["metrics"] == {
+        "heart_rate": TimeSeriesService()._analyze_metric_history(pd.Series([70.0, 74.0, 71.0, 80.0]))
+    }
+    assert result["resolution"] == "raw"
+    assert "blood_pressure_systolic" not in queries[0]
+    with pytest.raises(ValueError):
+        await service.get_patient_metrics(uuid4(), start, start + timedelta(hours=6), "glucose")
+
+
+# History tiers
+
+def test_plan_history_hands_older_parts_to_coarser_tiers():
+    now = datetime(2025, 6, 1, 12, 0, 30, tzinfo=timezone.utc)
+    retained_since = tier_retention(now, 90, 365)
+
+    hour, minute, raw = plan_history(now - timedelta(days=400), now, "raw", retained_since)
+
+    assert [s.tier for s in (hour, minute, raw)] == ["hour", "minute", "raw"]
+    assert hour.start == now - timedelta(days=400) and raw.end == now
+    # Hand-overs fall on the coarser tier's bucket boundaries
+    assert minute.start == datetime(2024, 6, 1, 13, tzinfo=timezone.utc) == hour.end
+    assert raw.start == datetime(2025, 3, 3, 12, 1, tzinfo=timezone.utc) == minute.end
+    assert [s.inclusive_end for s in (hour, minute, raw)] == [False, False, True]
+
+    assert [s.tier for s in plan_history(now - timedelta(days=3), now, "raw", retained_since)] == ["raw"]
+    assert [s.tier for s in plan_history(now - timedelta(days=400), now, "hour", retained_since)] == ["hour"]
+    assert [s.tier for s in plan_history(now - timedelta(days=100), now, "minute", retained_since)] == ["minute"]
+
+
+def test_bucket_analysis_matches_raw_history_analysis():
+    rng = np.random.default_rng(5)
+    values = rng.normal(80, 6, size=600) + np.linspace(0, 5, 600)
+    values[rng.choice(600, size=40, replace=False)] = np.nan
+    present = pd.Series(values).dropna().reset_index(drop=True)
+    reference = TimeSeriesService()._analyze_metric_history(present)
+
+    # One-reading buckets reproduce the raw analysis exactly
+    [exact] = analyze_history_buckets(raw_to_buckets({"heart_rate": values}, ["heart_rate"]), ["heart_rate"]).values()
+    assert exact.pop("count") == len(present)
+    assert exact == pytest.approx(reference, rel=1e-9)
+
+    # Ten-reading buckets keep mean, std, min and max exact
+    unit = raw_to_buckets({"heart_rate": values}, ["heart_rate"])
+    buckets = {
+        column: (np.fmin if column.endswith("_min") else np.fmax if column.endswith("_max") else np.add).reduceat(
+            unit[column], np.arange(0, 600, 10)
+        )
+        for column in bucket_columns(["heart_rate"])
+    }
+    summary = analyze_history_buckets(buckets, ["heart_rate"])["heart_rate"]
+    assert summary["count"] == len(present)
+    for key in ("min", "max", "mean", "std"):
+        assert summary[key] == pytest.approx(reference[key], rel=1e-9)
+    assert summary["percentile_25"] < summary["median"] < summary["percentile_75"]
+
+    weights = np.array([3.0, 1.0, 2.0, 4.0])
+    means = np.array([2.0, 9.0, 5.0, 1.0])
+    qs = [0.0, 0.1, 0.25, 0.5, 0.75, 1.0]
+    expected = pd.Series(np.repeat(means, weights.astype(int))).quantile(qs)
+    np.testing.assert_allclose(weighted_quantiles(means, weights, qs), expected)
+
+
+@pytest.mark.asyncio
+async def test_patient_history_reads_expired_ranges_from_aggregate_tiers(monkeypatch):
+    service = TimeSeriesService()
+    queries = []
+    columns = bucket_columns(["heart_rate"])
+    minute_rows = {column: np.array(value) for column, value in zip(columns, (
+        [2.0, 3.0], [150.0, 240.0], [11252.0, 19202.0], [74.0, 79.0], [76.0, 81.0]
+    ))}
+
+    class TierDatabase:
+        async def copy_from_query(self, query, *args, output, format):
+            queries.append(query)
+            if "health_metrics_1m" in query or "health_metrics_1h" in query:
+                output.write(pgcopy_binary(minute_rows))
+            else:
+                output.write(pgcopy_binary({"heart_rate": np.array([70.0, np.nan, 72.0])}))
+
+    use_fake_db(monkeypatch, ts_module, TierDatabase())
+    now = datetime.now(timezone.utc)
+
+    [result] = await service.get_patient_metrics(
+        uuid4(), now - timedelta(days=120), now, "heart_rate", resolution="raw"
+    )
+
+    assert result["resolution"] == "minute"
+    assert result["data_points"] == 7
+    assert "FROM health_metrics_1m" in queries[0] and "FROM health_metrics_1m" not in queries[1]
+    assert result["metrics"]["heart_rate"]["mean"] == pytest.approx((150 + 240 + 70 + 72) / 7)
+    assert (result["metrics"]["heart_rate"]["min"], result["metrics"]["heart_rate"]["max"]) == (70.0, 81.0)
+
+    # Sketches need the partial first day raw; long expired, it falls back to hours
+    queries.clear()
+    [result] = await service.get_patient_metrics(
+        uuid4(), now - timedelta(days=400, minutes=5), now, "heart_rate", resolution="day"
+    )
+    assert result["resolution"] == "hour"
+    assert len(queries) == 1 and "FROM health_metrics_1h" in queries[0]
+    with pytest.raises(ValueError):
+        await service.get_patient_metrics(uuid4(), now - timedelta(days=1), now, "heart_rate", resolution="week")
+
+
+def test_retention_policies_follow_the_history_settings(monkeypatch):
+    from src.services.retention import retention_statements
+
+    monkeypatch.setattr(settings, "HISTORY_RAW_RETENTION_DAYS", 30.0)
+    statements = retention_statements(install=True)
+    installed = {
+        values["relation"]: values["drop_after"] for query, values in statements if "add_retention_policy" in query
+    }
+
+    assert installed == {
+        "health_metrics": timedelta(days=30),
+        "health_metrics_1m": timedelta(days=settings.HISTORY_MINUTE_RETENTION_DAYS)
+    }
+    # Existing policies are replaced rather than duplicated
+    assert ["remove" in query for query, _ in statements] == [True, False, True, False]
+    assert all("remove_retention_policy" in query for query, _ in retention_statements(install=False))
+
+
+# Real-time alert stream
+
+@pytest.mark.asyncio
+async def test_alert_evaluator_raises_on_transitions_only():
+    evaluator = alert_module.AlertEvaluator(alert_module.ALERT_RULES, max_patients=10)
+    patient_id = uuid4()
+
+    first = await evaluator.check_reading(make_metric(patient_id, heart_rate=120.0, oxygen_saturation=97.0))
+    repeated = await evaluator.check_reading(make_metric(patient_id, heart_rate=125.0))
+    without_heart_rate = await evaluator.check_reading(make_metric(patient_id, oxygen_saturation=92.0))
+    recovered = await evaluator.check_reading(make_metric(patient_id, heart_rate=80.0))
+
+    assert [(e["rule"], e["status"]) for e in first] == [("elevated_heart_rate", "triggered")]
+    assert repeated == []
+    assert [(e["rule"], e["status"]) for e in without_heart_rate] == [("low_oxygen_saturation", "triggered")]
+    assert [(e["rule"], e["status"]) for e in recovered] == [("elevated_heart_rate", "resolved")]
+
+    rising = {"status": "analyzed", "trends": {"heart_rate": {"forecast_next": 104.0, "trend_direction": "increasing"}}}
+    falling = {"status": "analyzed", "trends": {"heart_rate": {"forecast_next": 104.0, "trend_direction": "decreasing"}}}
+    [trend] = await evaluator.check_trends(patient_id, rising)
+    assert (trend["kind"], trend["status"], trend["value"]) == ("trend", "triggered", 104.0)
+    assert [e["status"] for e in await evaluator.check_trends(patient_id, falling)] == ["resolved"]
+
+
+@pytest.mark.asyncio
+async def test_alert_evaluator_ignores_readings_older_than_the_last_evaluated():
+    evaluator = alert_module.AlertEvaluator(alert_module.ALERT_RULES, max_patients=10)
+    patient_id = uuid4()
+
+    def reading(hour, heart_rate):
+        return HealthMetric(patient_id=patient_id, timestamp=datetime(2024, 1, 1, hour, tzinfo=UTC),
+                            heart_rate=heart_rate)
+
+    assert await evaluator.check_readings([reading(10, 80.0)]) == []
+    # A backfilled batch from before the latest reading changes nothing
+    assert await evaluator.check_readings([reading(8, 130.0), reading(9, 125.0)]) == []
+    [event] = await evaluator.check_readings([reading(11, 120.0)])
+    assert (event["status"], event["timestamp"]) == ("triggered", "2024-01-01T11:00:00+00:00")
+
+
+class ScriptRedis:
+    """Applies APPLY_STATE_SCRIPT's updates to in-memory hashes, as Redis would run it"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.failing = False
+
+    def register_script(self, script):
+        assert "HEXISTS" in script
+
+        async def call(keys, args, client):
+            client.calls.append((keys[0], [str(arg) for arg in args]))
+        return call
+
+    def pipeline(self, transaction=True):
+        return ScriptPipeline(self)
+
+    def run(self, key, args):
+        state = self.hashes.setdefault(key, {})
+        timestamp, pairs = args[0], args[2:]
+        if timestamp != "":
+            if "@last" in state and int(state["@last"]) > int(timestamp):
+                return []
+            state["@last"] = timestamp
+        flipped = []
+        for rule, breached in zip(pairs[::2], pairs[1::2]):
+            if (breached == "1") != (rule in state):
+                if breached == "1":
+                    state[rule] = "1"
+                else:
+                    del state[rule]
+                flipped.append(rule.encode())
+        return flipped
+
+
+class ScriptPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def execute(self):
+        if self.redis.failing:
+            raise ConnectionError("redis down")
+        return [self.redis.run(key, args) for key, args in self.calls]
+
+
+@pytest.mark.asyncio
+async def test_alert_state_in_redis_is_shared_by_workers():
+    redis = ScriptRedis()
+
+    def worker():
+        local = alert_module.LocalAlertState(10)
+        return alert_module.AlertEvaluator(
+            alert_module.ALERT_RULES, 10, alert_module.RedisAlertState(redis, ttl=60, fallback=local)
+        )
+
+    first, second = worker(), worker()
+    patient_id = uuid4()
+
+    [triggered] = await first.check_reading(make_metric(patient_id, heart_rate=120.0))
+    # The next readings land on the other worker, which knows the breach
+    assert await second.check_reading(make_metric(patient_id, heart_rate=125.0)) == []
+    [resolved] = await second.check_reading(make_metric(patient_id, heart_rate=80.0))
+    [again] = await first.check_reading(make_metric(patient_id, heart_rate=121.0))
+    assert [e["status"] for e in (triggered, resolved, again)] == ["triggered", "resolved", "triggered"]
+    assert redis.hashes[f"analytics:alert_state:{patient_id}"]["threshold:elevated_heart_rate"] == "1"
+
+    # Without Redis each worker carries on with its own state
+    redis.failing = True
+    [local] = await second.check_reading(make_metric(patient_id, heart_rate=130.0))
+    assert local["status"] == "triggered"
+
+
+@pytest.mark.asyncio
+async def test_alert_fan_out_encodes_once_for_thousands_of_concurrent_subscribers(monkeypatch):
+    encoded = []
+    encode_event = alert_module.encode_event
+    monkeypatch.setattr(alert_module, "encode_event", lambda event: encoded.append(event) or encode_event(event))
+    broker = alert_module.AlertBroker(max_queue=16, max_subscribers=5000)
+    service = alert_module.AlertService(alert_module.AlertEvaluator(alert_module.ALERT_RULES, 100), broker,
+                                        heartbeat=30, department_ttl=60)
+    service._departments["p1"] = (float("inf"), "ward-7")
+    subscriptions = [broker.subscribe(["department:ward-7"]) for _ in range(3000)]
+    subscriptions += [broker.subscribe(["patient:p1", "department:ward-7"]) for _ in range(1000)]
+    received = []
+
+    async def consume(subscription):
+        stream = service.stream(subscription)
+        assert await stream.__anext__() == b"retry: 5000\n\n"
+        received.append(await stream.__anext__())
+        await stream.aclose()
+
+    consumers = [asyncio.create_task(consume(subscription)) for subscription in subscriptions]
+    await asyncio.sleep(0)
+    await service._publish([{"patient_id": "p1", "rule": "elevated_heart_rate", "status": "triggered"}])
+    await asyncio.gather(*consumers)
+
+    assert len(encoded) == 1
+    assert len(received) == 4000 and set(received) == {encode_event(encoded[0])}
+    assert json.loads(received[0].split(b"data: ")[1])["department_id"] == "ward-7"
+    assert broker.subscribers == 0
+    assert broker.counters["delivered"] == 4000
+
+
+@pytest.mark.asyncio
+async def test_slow_alert_subscribers_are_told_what_they_missed_then_cut_off():
+    broker = alert_module.AlertBroker(max_queue=3, max_subscribers=10)
+    slow = broker.subscribe(["patient:p1"])
+    with pytest.raises(ServiceUnavailableError):
+        alert_module.AlertBroker(max_queue=3, max_subscribers=0).subscribe(["patient:p1"])
+
+    for i in range(5):
+        broker.fan_out(["patient:p1"], b"frame %d" % i)
+
+    assert await slow.next(1) == alert_module.lagged_frame(2) + b"frame 2frame 3frame 4"
+    assert await slow.next(0.01) == alert_module.HEARTBEAT_FRAME
+
+    for i in range(6):
+        broker.fan_out(["patient:p1"], b"frame %d" % i)
+
+    assert await slow.next(1) is None
+    assert broker.subscribers == 0
+    assert broker.counters == {"delivered": 10, "dropped": 5, "disconnected": 1}
+
+
+@pytest.mark.asyncio
+async def test_recording_a_breaching_reading_publishes_an_alert(monkeypatch):
+    class StayDatabase(FakeDatabase):
+        async def fetch_one(self, query, values=None):
+            return {"id": uuid4()}
+
+        async def fetch_val(self, query, values=None):
+            return "ward-7"
+
+        async def copy_from_query(self, query, *args, output, format):
+            output.write(pgcopy_binary({"heart_rate": np.array([])}))
+
+    db = StayDatabase()
+    use_fake_db(monkeypatch, ts_module, db)
+    use_fake_db(monkeypatch, alert_module, db)
+    monkeypatch.setattr(settings, "SKETCH_UPDATE_ON_INGEST", False)
+    patient_id = uuid4()
+    subscription = alert_module.alert_service.broker.subscribe(["department:ward-7"])
+    try:
+        await TimeSeriesService().record_health_metrics(make_metric(patient_id, heart_rate=130.0))
+        frame = await subscription.next(1)
+    finally:
+        alert_module.alert_service.broker.unsubscribe(subscription)
+
+    event = json.loads(frame.split(b"data: ")[1])
+    assert event["patient_id"] == str(patient_id)
+    assert (event["rule"], event["status"], event["value"]) == ("elevated_heart_rate", "triggered", 130.0)
+
+
+# Daily quantile sketches
+
+def _rank_error(values, estimate, q):
+    return abs(np.searchsorted(np.sort(values), estimate) / len(values) - q)
+
+
+def _rank_bound(q, compression=200):
+    # Documented in TDigest
+    return 2 * np.pi * np.sqrt(q * (1 - q)) / compression
+
+
+def test_merged_daily_digests_stay_within_documented_rank_error():
+    rng = np.random.default_rng(11)
+    days = [rng.normal(80 + day * 0.3, 8, size=1440) for day in range(30)]
+
+    merged = TDigest.merge([TDigest().update(values) for values in days])
+    values = np.concatenate(days)
+
+    assert merged.count == len(values)
+    assert (merged.min, merged.max) == (values.min(), values.max())
+    for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        assert _rank_error(values, merged.quantile(q), q) <= _rank_bound(q)
+
+    restored = TDigest.from_bytes(merged.to_bytes())
+    assert restored.quantile(0.5) == merged.quantile(0.5)
+    assert len(merged.to_bytes()) < 4096
+
+
+def test_summarize_sketches_matches_full_history_analysis():
+    rng = np.random.default_rng(3)
+    days = [rng.normal(95 - day * 0.2, 1.5, size=size) for day, size in enumerate([300, 1440, 1440, 700])]
+    values = pd.Series(np.concatenate(days))
+
+    summary = summarize_sketches([DailySketch().extend(day) for day in days])
+    reference = TimeSeriesService()._analyze_metric_history(values)
+
+    assert summary["count"] == len(values)
+    for key in ("min", "max", "mean", "std", "trend_strength"):
+        assert summary[key] == pytest.approx(reference[key], rel=1e-6)
+    for key, q in (("percentile_25", 0.25), ("median", 0.5), ("percentile_75", 0.75)):
+        assert _rank_error(values.to_numpy(), summary[key], q) <= _rank_bound(q)
+
+
+@pytest.mark.asyncio
+async def test_sketch_store_record_groups_readings_by_patient_metric_and_day():
+    patient_id = uuid4()
+    readings = [
+        HealthMetric(patient_id=patient_id, timestamp=datetime(2024, 1, 1, 23, 59, tzinfo=UTC), heart_rate=70),
+        HealthMetric(patient_id=patient_id, timestamp=datetime(2024, 1, 2, 0, 1, tzinfo=UTC), heart_rate=74),
+        HealthMetric(patient_id=patient_id, timestamp=datetime(2024, 1, 1, 12, 0, tzinfo=UTC),
+                     heart_rate=72, oxygen_saturation=97),
+    ]
+    db = FakeDatabase()
+
+    touched = await SketchStore(200).record(db, readings, ["heart_rate", "oxygen_saturation"])
+
+    assert touched == 3
+    _, update = db.executed[-1]
+    assert update["metrics"] == ["heart_rate", "heart_rate", "oxygen_saturation"]
+    assert update["days"] == [datetime(2024, 1, 1).date(), datetime(2024, 1, 2).date(), datetime(2024, 1, 1).date()]
+    assert update["counts"] == [2, 1, 1]
+    # Chronological positions within the day: 72 at 0, 70 at 1
+    assert update["sum_index_products"] == [70.0, 0.0, 0.0]
+    assert TDigest.from_bytes(update["digests"][0]).quantile(0.0) == 70.0
+
+
+class SketchHistoryDatabase:
+    """Daily sketches of 70 bpm, with the hour tier reporting `uncovered` days as missing readings."""
+
+    def __init__(self, uncovered=()):
+        self.uncovered = list(uncovered)
+        self.queries = []
+
+    async def fetch_all(self, query, values=None):
+        self.queries.append(query)
+        if "WITH hourly" in query:
+            assert "LIMIT" not in query and values["patient_id"]
+            return [{"patient_id": values["patient_id"], "day": day} for day in self.uncovered]
+        sketch = DailySketch().extend([70.0] * 24)
+        return [
+            {"metric": "heart_rate", "day": values["first_day"] + timedelta(days=i), "count": sketch.count,
+             "sum": sketch.sum, "sum_squares": sketch.sum_squares,
+             "sum_index_products": sketch.sum_index_products, "digest": sketch.digest.to_bytes()}
+            for i in range((values["end_day"] - values["first_day"]).days)
+        ]
+
+    async def copy_from_query(self, query, *args, output, format):
+        self.queries.append(query)
+        if "FROM health_metrics_1h" in query:
+            output.write(pgcopy_binary(dict(zip(bucket_columns(["heart_rate"]), (
+                np.array([24.0]), np.array([1680.0]), np.array([117600.0]), np.array([70.0]), np.array([70.0])
+            )))))
+        else:
+            output.write(pgcopy_binary({"heart_rate": np.array([70.0])}))
+
+
+@pytest.mark.asyncio
+async def test_sketch_history_reads_hour_tier_while_days_are_not_backfilled(monkeypatch):
+    service = TimeSeriesService()
+    now = datetime.now(timezone.utc)
+    start = datetime(now.year, now.month, now.day, tzinfo=UTC) - timedelta(days=5)
+
+    db = SketchHistoryDatabase()
+    use_fake_db(monkeypatch, ts_module, db)
+    [covered] = await service.get_patient_metrics(uuid4(), start, now, "heart_rate")
+    # Five sketched days, plus one reading from each raw read of the partial head and tail
+    assert covered["resolution"] == "day" and covered["data_points"] == 5 * 24 + 2
+    assert not any("FROM health_metrics_1h" in query and "WITH hourly" not in query for query in db.queries)
+
+    db = SketchHistoryDatabase(uncovered=[start.date() + timedelta(days=2)])
+    use_fake_db(monkeypatch, ts_module, db)
+    [fallback] = await service.get_patient_metrics(uuid4(), start, now, "heart_rate")
+    assert fallback["resolution"] == "hour" and fallback["data_points"] == 24
+    assert fallback["metrics"]["heart_rate"]["mean"] == pytest.approx(70.0)
+    # The daily sketches themselves were never read
+    assert not any("ORDER BY day" in query and "WITH hourly" not in query for query in db.queries)
+
+
+class BackfillDatabase(FakeDatabase):
+    """Rollup refresh connection with `uncovered` patient days and two raw readings per day."""
+
+    def __init__(self, uncovered, watermarks=None):
+        super().__init__()
+        self.uncovered = uncovered
+        self.watermarks = watermarks or {}
+        self.copies = []
+
+    async def fetch_val(self, query, values=None):
+        return True
+
+    async def fetch_all(self, query, values=None):
+        self.executed.append((query, values))
+        if "FROM rollup_watermarks" in query:
+            return [{"rollup_name": name, "refreshed_until": value} for name, value in self.watermarks.items()]
+        if "WITH hourly" in query:
+            return self.uncovered[:values["limit"]]
+        return []
+
+    async def copy_from_query(self, query, *args, output, format):
+        self.copies.append(args)
+        readings = {column: np.array([np.nan, np.nan]) for column in ts_module.VITAL_COLUMNS}
+        readings["heart_rate"] = np.array([70.0, 74.0])
+        output.write(pgcopy_binary(readings))
+
+    def statements(self, fragment):
+        return [values for query, values in self.executed if fragment in query]
+
+
+@pytest.mark.asyncio
+async def test_rollup_refresh_backfills_sketches_and_sweeps_the_raw_retention(monkeypatch):
+    now = datetime(2024, 6, 10, 12, tzinfo=UTC)
+    retained = datetime(2024, 3, 13, tzinfo=UTC)
+    patients = [uuid4(), uuid4()]
+    uncovered = [
+        {"patient_id": patients[0], "day": retained.date()},
+        {"patient_id": patients[1], "day": retained.date() + timedelta(days=1)}
+    ]
+    monkeypatch.setattr(settings, "SKETCH_BACKFILL_BATCH_SIZE", 2)
+    db = BackfillDatabase(uncovered)
+    use_fake_db(monkeypatch, rollup_module, db)
+
+    refreshed = await rollup_module.RollupService().refresh(now)
+
+    [check] = db.statements("WITH hourly")
+    assert (check["first_day"], check["end_day"]) == (retained.date(), retained.date() + timedelta(days=7))
+    assert len(check["metrics"]) == len(ts_module.VITAL_COLUMNS)
+    # Each day is rebuilt from its raw readings, in its own locked rows
+    assert [args for args in db.copies] == [
+        (patients[0], retained, retained + timedelta(days=1)),
+        (patients[1], retained + timedelta(days=1), retained + timedelta(days=2))
+    ]
+    rebuilt = db.statements("UPDATE health_metric_daily_sketches")
+    assert len(rebuilt) == 2 and len(db.statements("FOR UPDATE OF s")) == 2
+    heart_rate = rebuilt[0]["metrics"].index("heart_rate")
+    assert rebuilt[0]["counts"][heart_rate] == 2 and sum(rebuilt[0]["counts"]) == 2
+    assert rebuilt[0]["sum_index_products"][heart_rate] == 74.0
+    # A full batch leaves the rest of its last day for the next pass
+    assert refreshed[rollup_module.SKETCH_BACKFILL] == retained + timedelta(days=1)
+
+    monkeypatch.setattr(settings, "SKETCH_BACKFILL_BATCH_SIZE", 10)
+    for cursor, expected in (
+        (retained + timedelta(days=1), retained + timedelta(days=8)),
+        # The sweep ends after today and starts over
+        (datetime(2024, 6, 10, tzinfo=UTC), datetime(2024, 6, 11, tzinfo=UTC)),
+        (datetime(2024, 6, 11, tzinfo=UTC), retained + timedelta(days=7)),
+    ):
+        db = BackfillDatabase([], {rollup_module.SKETCH_BACKFILL: cursor})
+        use_fake_db(monkeypatch, rollup_module, db)
+        refreshed = await rollup_module.RollupService().refresh(now)
+        assert refreshed[rollup_module.SKETCH_BACKFILL] == expected
+
+
+# CPU executor
+
+@pytest.mark.asyncio
+async def test_cpu_executor_rejects_when_workers_and_queue_are_full():
+    executor = CpuExecutor("thread", max_workers=1, max_queue=1, retry_after=3)
+    release = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def block():
+        asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+        return "done"
+
+    running = [asyncio.create_task(executor.run(block, name="block")) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    with pytest.raises(ExecutorSaturatedError) as exc:
+        await executor.run(block, name="block")
+    release.set()
+
+    assert await asyncio.gather(*running) == ["done", "done"]
+    assert exc.value.retry_after == 3
+    stats = executor.stats()
+    assert stats["rejected_total"] == 1 and stats["in_flight"] == 0
+    assert stats["tasks"]["block"]["count"] == 2
+    # The second task waited for the first to finish
+    assert stats["tasks"]["block"]["wait_seconds_p99"] > 0
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cpu_executor_keeps_slot_of_timed_out_task_until_it_finishes():
+    executor = CpuExecutor("thread", max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(executor.run(release.wait, name="block"), timeout=0.05)
+    # The thread is still busy, so the pool is still full
+    assert executor.in_flight == 1
+    with pytest.raises(ExecutorSaturatedError):
+        await executor.run(sum, [1])
+
+    release.set()
+    for _ in range(100):
+        if executor.in_flight == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert executor.in_flight == 0
+    assert await executor.run(sum, [1, 2]) == 3
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cpu_executor_process_pool_runs_picklable_work():
+    executor = CpuExecutor("process", max_workers=1, max_queue=0)
+    try:
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        with pytest.raises(TypeError):
+            await executor.run(sum, ["a"])
+    finally:
+        executor.shutdown()
+
+    assert executor.stats()["tasks"]["sum"]["count"] == 1
+    assert executor.stats()["tasks"]["sum"]["errors"] == 1
+
+
+def test_analyze_history_columns_matches_per_metric_analysis():
+    heart_rate = [70.0, None, 74.0, 71.0, 80.0]
+    columns = {"heart_rate": heart_rate, "oxygen_saturation": [None] * 5}
+
+    analysis = ts_module.analyze_history_columns(columns)
+
+    values = pd.Series([v for v in heart_rate if v is not None])
+    assert analysis == {"heart_rate": TimeSeriesService()._analyze_metric_history(values)}
+
+
+# Cohort trends
+
+def test_cohort_query_reads_hourly_aggregate_only_for_whole_hour_buckets():
+    hourly = cohort_query("oxygen_saturation", timedelta(hours=2), "dept")
+    raw = cohort_query("oxygen_saturation", timedelta(minutes=15), None)
+
+    assert "FROM patient_metrics_hourly" in hourly and "JOIN cohort" in hourly
+    assert "oxygen_saturation_sum" in hourly
+    assert "FROM health_metrics" in raw and "cohort" not in raw
+    assert "GROUPING SETS ((patient_id), (period))" in raw
+
+
+def test_summarize_cohort_shares_percentiles_and_steepest_movers():
+    rng = np.random.default_rng(5)
+    slopes = rng.normal(0, 1, 1000)
+    patient_rows = [(f"p{i}", 24, float(s), 95.0) for i, s in enumerate(slopes)]
+    # Too few buckets, or no slope at all: excluded
+    patient_rows += [("short", 2, 50.0, 95.0), ("flat", 1, None, 95.0)]
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    period_rows = [(start + timedelta(hours=1), 990, 95.5), (start, 1000, 96.0)]
+
+    summary = summarize_cohort(patient_rows, period_rows, stable_band=0.5, top_n=3)
+
+    assert summary["patients"] == 1000
+    assert summary["share_rising"] == pytest.approx((slopes > 0.5).mean())
+    assert summary["share_falling"] == pytest.approx((slopes < -0.5).mean())
+    assert summary["slope_per_hour"]["median"] == pytest.approx(np.median(slopes))
+    assert [r["slope_per_hour"] for r in summary["steepest_declines"]] == pytest.approx(np.sort(slopes)[:3])
+    assert [r["slope_per_hour"] for r in summary["steepest_rises"]] == pytest.approx(np.sort(slopes)[::-1][:3])
+    assert [p["patients"] for p in summary["population"]] == [1000, 990]
+
+
+class FakeCohortDatabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetch_all(self, query, values=None):
+        self.queries.append((query, values))
+        return self.rows
+
+
+@pytest.mark.asyncio
+async def test_cohort_trends_split_grouping_sets_rows(monkeypatch):
+    period = datetime(2024, 1, 1, 10, tzinfo=UTC)
+    db = FakeCohortDatabase([
+        {"patient_id": "a", "period": None, "buckets": 4, "slope": -0.2, "mean_value": 95.0},
+        {"patient_id": "b", "period": None, "buckets": 4, "slope": 0.01, "mean_value": 97.0},
+        {"patient_id": None, "period": period, "buckets": 2, "slope": None, "mean_value": 96.0},
+    ])
+    use_fake_db(monkeypatch, cohort_module, db)
+    service = CohortTrendService(CacheService(LocalRedis()))
+
+    result = await service.get_cohort_trends(
+        "oxygen_saturation", "dept-1", hours=6, end_date=datetime(2024, 1, 1, 12, 30, tzinfo=UTC)
+    )
+
+    _, params = db.queries[0]
+    assert params["end_date"] == datetime(2024, 1, 1, 12, tzinfo=UTC)
+    assert params["start_date"] == datetime(2024, 1, 1, 6, tzinfo=UTC)
+    assert result["patients"] == 2
+    assert result["share_falling"] == 0.5 and result["share_stable"] == 0.5
+    assert result["population"] == [{"period": period.isoformat(), "mean": 96.0, "patients": 2}]
+
+    with pytest.raises(ValueError):
+        await service.get_cohort_trends("cholesterol")
+
+
+class IngestDatabase(FakeDatabase):
+    async def fetch_one(self, query, values=None):
+        return {"id": uuid4()}
+
+    async def copy_from_query(self, query, *args, output, format):
+        output.write(pgcopy_binary({"heart_rate": np.array([])}))
+
+
+@pytest.mark.asyncio
+async def test_ingest_invalidates_cached_cohort_trends(monkeypatch):
+    cohort_db = FakeCohortDatabase([
+        {"patient_id": "a", "period": None, "buckets": 4, "slope": 1.0, "mean_value": 80.0},
+    ])
+    use_fake_db(monkeypatch, cohort_module, cohort_db)
+    use_fake_db(monkeypatch, ts_module, IngestDatabase())
+    monkeypatch.setattr(settings, "SKETCH_UPDATE_ON_INGEST", False)
+    cohorts = CohortTrendService(CacheService(LocalRedis()))
+    service = TimeSeriesService()
+    service.cohorts = cohorts
+    end = datetime(2024, 1, 1, 12, tzinfo=UTC)
+
+    async def trend(metric):
+        return await cohorts.get_cohort_trends(metric, hours=6, end_date=end)
+
+    assert (await trend("heart_rate"))["patients"] == 1
+    await trend("temperature")
+    cohort_db.rows = cohort_db.rows + [
+        {"patient_id": "b", "period": None, "buckets": 4, "slope": -1.0, "mean_value": 90.0},
+    ]
+    assert (await trend("heart_rate"))["patients"] == 1  # cached
+
+    await service.record_health_metrics_batch([make_metric(heart_rate=90.0)])
+    assert (await trend("heart_rate"))["patients"] == 2
+    # Vitals the batch did not carry stay cached
+    assert len(cohort_db.queries) == 3
+
+    cohort_db.rows = cohort_db.rows[:1]
+    await service.record_health_metrics(make_metric(temperature=37.0))
+    assert (await trend("temperature"))["patients"] == 1 and len(cohort_db.queries) == 4
+
+
+class StaysDatabase:
+    """patient_departments in memory, applying the stay service's statements."""
+
+    def __init__(self):
+        self.stays = {}
+
+    async def execute(self, query, values=None):
+        from src.services.department_stays import CLOSE_STAY, OPEN_STAY
+
+        patient, at = values["patient_id"], values["timestamp"]
+        admissions = sorted(admitted for p, admitted in self.stays if p == patient)
+        if query == CLOSE_STAY:
+            earlier = [admitted for admitted in admissions if admitted < at]
+            if earlier:
+                stay = self.stays[(patient, earlier[-1])]
+                if stay["discharged_at"] is None or stay["discharged_at"] > at:
+                    stay["discharged_at"] = at
+        elif query == OPEN_STAY:
+            earlier = [admitted for admitted in admissions if admitted < at]
+            later = [admitted for admitted in admissions if admitted > at]
+            split = self.stays[(patient, earlier[-1])]["discharged_at"] if earlier else None
+            discharged_at = split if split and split > at else (later[0] if later else None)
+            stay = self.stays.setdefault((patient, at), {"department_id": None, "discharged_at": discharged_at})
+            stay["department_id"] = values["department_id"]
+        else:
+            raise AssertionError(query)
+
+    async def fetch_val(self, query, values=None):
+        # The alert service's current-department lookup
+        assert "FROM patient_departments" in query
+        open_stays = [
+            (admitted, stay["department_id"]) for (patient, admitted), stay in self.stays.items()
+            if str(patient) == values["patient_id"] and stay["discharged_at"] is None
+        ]
+        return max(open_stays)[1] if open_stays else None
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def test_transfers_endpoint_maintains_department_stays(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from src.api.endpoints import admissions as admissions_endpoint
+    from src.services import department_stays as stays_module
+
+    db = StaysDatabase()
+    use_fake_db(monkeypatch, stays_module, db)
+    app = FastAPI()
+    app.include_router(admissions_endpoint.router)
+    client = TestClient(app)
+    patient, icu, ward = uuid4(), uuid4(), uuid4()
+    at = lambda hour: datetime(2024, 1, 1, hour, tzinfo=UTC)
+
+    response = client.post("/transfers", json=[
+        {"patient_id": str(patient), "department_id": str(icu), "timestamp": at(2).isoformat()},
+        {"patient_id": str(patient), "department_id": None, "timestamp": at(9).isoformat()},
+    ])
+    assert response.status_code == 201 and response.json() == {"recorded": 2, "patients": 1}
+    # A late transfer between admission and discharge splits the ICU stay
+    client.post("/transfers", json=[
+        {"patient_id": str(patient), "department_id": str(ward), "timestamp": at(5).isoformat()},
+    ])
+    # Replayed admission
+    client.post("/transfers", json=[
+        {"patient_id": str(patient), "department_id": str(icu), "timestamp": at(2).isoformat()},
+    ])
+
+    assert db.stays == {
+        (patient, at(2)): {"department_id": icu, "discharged_at": at(5)},
+        (patient, at(5)): {"department_id": ward, "discharged_at": at(9)},
+    }
+
+
+@pytest.mark.asyncio
+async def test_alerts_follow_the_patient_through_transfers(monkeypatch):
+    from src.models.schemas import PatientTransfer
+    from src.services import department_stays as stays_module
+
+    db = StaysDatabase()
+    use_fake_db(monkeypatch, stays_module, db)
+    use_fake_db(monkeypatch, alert_module, db)
+    broker = alert_module.AlertBroker(max_queue=16, max_subscribers=10)
+    service = alert_module.AlertService(alert_module.AlertEvaluator(alert_module.ALERT_RULES, 100), broker,
+                                        heartbeat=30, department_ttl=3600)
+    monkeypatch.setattr(stays_module, "alert_service", service)
+    stays = stays_module.DepartmentStayService()
+    patient, ward, icu = uuid4(), uuid4(), uuid4()
+    ward_alerts = broker.subscribe([f"department:{ward}"])
+    icu_alerts = broker.subscribe([f"department:{icu}"])
+
+    admit = PatientTransfer(patient_id=patient, department_id=ward, timestamp=datetime(2024, 1, 1, tzinfo=UTC))
+    await stays.record_transfers([admit])
+    await service.observe_readings([make_metric(patient, heart_rate=130.0)])
+    # Moving to the ICU takes effect before the cached department expires
+    await stays.record_transfers([admit.model_copy(update={"department_id": icu, "timestamp": datetime(2024, 1, 2, tzinfo=UTC)})])
+    await service.observe_readings([HealthMetric(patient_id=patient, timestamp=datetime(2024, 1, 2, 1), heart_rate=80.0)])
+
+    triggered = json.loads((await ward_alerts.next(1)).split(b"data: ")[1])
+    resolved = json.loads((await icu_alerts.next(1)).split(b"data: ")[1])
+    assert (triggered["status"], triggered["department_id"]) == ("triggered", str(ward))
+    assert (resolved["status"], resolved["department_id"]) == ("resolved", str(icu))
+
+
+# Report jobs
+
+def test_report_params_hash_ignores_order_and_formatting():
+    _, first = report_module.normalize_request(
+        "treatment_outcomes_by_diagnosis",
+        {"start_date": "2024-01-01", "end_date": "2024-03-01", "diagnosis_codes": ["I10", "E11", "I10"]},
+        "csv"
+    )
+    params, second = report_module.normalize_request(
+        "treatment_outcomes_by_diagnosis",
+        {"diagnosis_codes": ["E11", "I10"], "end_date": "2024-03-01", "start_date": "2024-01-01"},
+        "csv"
+    )
+    _, as_parquet = report_module.normalize_request(
+        "treatment_outcomes_by_diagnosis", params, "parquet"
+    )
+    assert first == second != as_parquet
+    assert params["diagnosis_codes"] == ["E11", "I10"]
+
+    with pytest.raises(ReportError):
+        report_module.normalize_request("unknown", {}, "csv")
+    with pytest.raises(ReportError):
+        report_module.normalize_request(
+            "treatment_outcomes_by_diagnosis", {"start_date": "2024-03-01", "end_date": "2024-01-01"}, "csv"
+        )
+
+
+def test_parquet_reports_are_rejected_at_submit_without_pyarrow(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from src.api.endpoints import reports as reports_endpoint
+
+    db = SubmitDatabase([])
+    use_fake_db(monkeypatch, report_module, db)
+    monkeypatch.setattr(report_module, "parquet_available", lambda: False)
+    app = FastAPI()
+    app.include_router(reports_endpoint.router, prefix="/api/reports")
+
+    response = TestClient(app).post("/api/reports", json={
+        "report_type": "treatment_outcomes_by_diagnosis", "format": "parquet",
+        "params": {"start_date": "2024-01-01", "end_date": "2024-03-01"}
+    })
+
+    assert response.status_code == 400 and "pyarrow" in response.json()["detail"]
+    assert db.executed == []
+
+def test_report_month_chunks_split_at_month_boundaries():
+    from datetime import date
+    assert report_module.month_chunks(date(2024, 1, 15), date(2024, 3, 10)) == [
+        (date(2024, 1, 15), date(2024, 2, 1)),
+        (date(2024, 2, 1), date(2024, 3, 1)),
+        (date(2024, 3, 1), date(2024, 3, 10)),
+    ]
+    definition = report_module.REPORTS["department_utilization_monthly"]
+    params = definition.params_model(start_month="2023-12-05", end_month="2024-02-01")
+    assert len(definition.chunks(params)) == 3
+
+
+class FakeReportDatabase(FakeDatabase):
+    async def fetch_all(self, query, values=None):
+        self.executed.append((query, values))
+        month = values["start_date"].month
+        return [{
+            "diagnosis_code": "I10", "treatments": month, "patients": 1,
+            "average_success_rating": 4.0, "complication_rate": 0.0, "average_duration_days": 2.5
+        }]
+
+
+@pytest.mark.asyncio
+async def test_report_job_runs_chunks_into_csv_and_marks_success(monkeypatch, tmp_path):
+    db = FakeReportDatabase()
+    use_fake_db(monkeypatch, report_module, db)
+    service = report_module.ReportService(str(tmp_path))
+    job = {
+        "id": uuid4(), "report_type": "treatment_outcomes_by_diagnosis", "format": "csv",
+        "params": {"start_date": "2024-01-01", "end_date": "2024-03-01"},
+        "created_at": datetime(2024, 4, 1, tzinfo=UTC), "started_at": datetime(2024, 4, 1, 0, 0, 3, tzinfo=UTC)
+    }
+
+    await service.run(job)
+
+    lines = (tmp_path / f"{job['id']}.csv").read_text().splitlines()
+    assert lines[0].startswith("month,diagnosis_code,treatments")
+    assert [line.split(",")[:3] for line in lines[1:]] == [["2024-01-01", "I10", "1"], ["2024-02-01", "I10", "2"]]
+    assert not list(tmp_path.glob("*.part"))
+    updates = [values for query, values in db.executed if "UPDATE report_jobs" in query]
+    assert [u.get("chunks_done") for u in updates[:2]] == [1, 2]
+    assert updates[-1]["status"] == "succeeded"
+
+
+@pytest.mark.asyncio
+async def test_report_job_failure_removes_partial_output(monkeypatch, tmp_path):
+    db = FakeReportDatabase()
+    use_fake_db(monkeypatch, report_module, db)
+
+    async def broken_chunk(db, params, chunk):
+        raise RuntimeError("query failed")
+
+    definition = report_module.REPORTS["treatment_outcomes_by_diagnosis"]
+    monkeypatch.setitem(report_module.REPORTS, definition.name, report_module.ReportDefinition(
+        definition.name, definition.params_model, definition.columns, definition.chunks, broken_chunk
+    ))
+    job = {
+        "id": uuid4(), "report_type": definition.name, "format": "csv",
+        "params": {"start_date": "2024-01-01", "end_date": "2024-02-01"},
+        "created_at": datetime(2024, 4, 1, tzinfo=UTC), "started_at": datetime(2024, 4, 1, tzinfo=UTC)
+    }
+
+    await report_module.ReportService(str(tmp_path)).run(job)
+
+    assert not list(tmp_path.iterdir())
+    assert db.executed[-1][1]["status"] == "failed"
+    assert db.executed[-1][1]["error"] == "query failed"
+
+
+class DecimalReportDatabase(FakeDatabase):
+    """Numeric aggregates as asyncpg decodes them"""
+
+    async def fetch_all(self, query, values=None):
+        self.executed.append((query, values))
+        return [{
+            "diagnosis_code": "I10", "treatments": 3, "patients": 2,
+            "average_success_rating": Decimal("4.3333333333333333"), "complication_rate": Decimal("0.5000000000"),
+            "average_duration_days": Decimal("2.5")
+        }]
+
+
+@pytest.mark.asyncio
+async def test_report_job_writes_numeric_aggregates_to_parquet(monkeypatch, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    db = DecimalReportDatabase()
+    use_fake_db(monkeypatch, report_module, db)
+    job = {
+        "id": uuid4(), "report_type": "treatment_outcomes_by_diagnosis", "format": "parquet",
+        "params": {"start_date": "2024-01-01", "end_date": "2024-03-01"},
+        "created_at": datetime(2024, 4, 1, tzinfo=UTC), "started_at": datetime(2024, 4, 1, tzinfo=UTC)
+    }
+
+    await report_module.ReportService(str(tmp_path)).run(job)
+
+    assert db.executed[-1][1]["status"] == "succeeded"
+    table = pq.read_table(tmp_path / f"{job['id']}.parquet")
+    assert table.num_rows == 2
+    assert table.column("average_success_rating").to_pylist() == [pytest.approx(13 / 3)] * 2
+    assert table.column("complication_rate").to_pylist() == [0.5, 0.5]
+    assert "AS double precision) AS average_success_rating" in db.executed[0][0]
+
+
+class SubmitDatabase(FakeDatabase):
+    """report_jobs answering a scripted sequence of fetch_one calls"""
+
+    def __init__(self, answers):
+        super().__init__()
+        self.answers = list(answers)
+
+    async def fetch_one(self, query, values=None):
+        self.executed.append((query, values))
+        return self.answers.pop(0)
+
+    async def fetch_val(self, query, values=None):
+        self.executed.append((query, values))
+        return 4
+
+
+def report_job_row(**overrides):
+    return {
+        "id": uuid4(), "report_type": "treatment_outcomes_by_diagnosis",
+        "params": {"start_date": "2024-01-01", "end_date": "2024-03-01"}, "format": "csv", "status": "queued",
+        "chunks_total": None, "chunks_done": 0, "rows_written": 0, "result_path": None, "error": None,
+        "created_at": datetime(2024, 4, 1, tzinfo=UTC), "started_at": None, "finished_at": None,
+        "expires_at": None, **overrides
+    }
+
+
+@pytest.mark.asyncio
+async def test_report_submit_retries_when_the_conflicting_job_is_gone(monkeypatch, tmp_path):
+    params = {"start_date": "2024-01-01", "end_date": "2024-03-01"}
+    service = report_module.ReportService(str(tmp_path))
+
+    # The duplicate failed between the insert and the lookup; the retry inserts
+    db = SubmitDatabase([None, None, report_job_row()])
+    use_fake_db(monkeypatch, report_module, db)
+    job = await service.submit("treatment_outcomes_by_diagnosis", params, "csv")
+    assert not job["deduplicated"] and job["status"] == "queued"
+    assert sum("INSERT INTO report_jobs" in query for query, _ in db.executed) == 2
+    assert _sample("analytics_report_jobs_queued") == 4
+
+    running = report_job_row(status="running")
+    db = SubmitDatabase([None, running])
+    use_fake_db(monkeypatch, report_module, db)
+    job = await service.submit("treatment_outcomes_by_diagnosis", params, "csv")
+    assert job["deduplicated"] and job["id"] == running["id"]
+
+    db = SubmitDatabase([None] * 2 * report_module.SUBMIT_ATTEMPTS)
+    use_fake_db(monkeypatch, report_module, db)
+    with pytest.raises(ServiceUnavailableError):
+        await service.submit("treatment_outcomes_by_diagnosis", params, "csv")
+
+
+@pytest.mark.asyncio
+async def test_report_worker_samples_queue_depth_while_draining_a_backlog():
+    backlog = [report_job_row() for _ in range(3)]
+    samples = []
+
+    class Service:
+        async def queue_depth(self):
+            samples.append(len(backlog))
+            return len(backlog)
+
+        async def claim(self):
+            return backlog.pop(0) if backlog else None
+
+        async def run(self, job):
+            pass
+
+    worker = report_module.ReportWorker(Service(), poll_interval=60)
+    worker.start()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    await worker.stop()
+
+    assert samples == [3, 2, 1, 0]
+
+
+# Benchmark gating
+
+def test_benchmark_compare_flags_slowdown_and_memory_growth():
+    from benchmarks.harness import compare
+
+    baseline = {
+        "a": {"throughput": 100.0, "peak_memory_bytes": 1 << 20, "unit": "points/s"},
+        "b": {"throughput": 100.0, "peak_memory_bytes": 1 << 10, "unit": "points/s"},
+    }
+    results = {
+        "a": {"throughput": 80.0, "peak_memory_bytes": 2 << 20, "unit": "points/s"},
+        "b": {"throughput": 70.0, "peak_memory_bytes": 1 << 14, "unit": "points/s"},
+        "new": {"throughput": 1.0, "peak_memory_bytes": 1, "unit": "points/s"},
+    }
+
+    regressions = compare(results, baseline, max_slowdown=0.25, max_memory_growth=0.5)
+
+    assert len(regressions) == 2
+    assert regressions[0].startswith("a: peak memory")
+    assert regressions[1].startswith("b: throughput")
+
+
+# Risk scoring
+
+class ScoringDatabase(FakeDatabase):
+    def __init__(self, patients, latest_run=None):
+        super().__init__()
+        self.patients = patients
+        self.latest_run = latest_run
+
+    async def fetch_val(self, query, values=None):
+        return True
+
+    async def fetch_one(self, query, values=None):
+        self.executed.append((query, values))
+        if "INSERT INTO risk_scoring_runs" in query:
+            return {
+                "id": uuid4(), "started_at": values["started_at"], "changed_since": values["changed_since"],
+                "after_patient_id": None, "patients_scored": 0, "patients_skipped": 0, "page_failures": 0,
+                "scoring_seconds": 0.0, "completed_at": None
+            }
+        return self.latest_run
+
+    async def fetch_all(self, query, values=None):
+        self.executed.append((query, values))
+        assert all(f":{name}" in query for name in values)
+        after = values.get("after_patient_id")
+        return [row for row in self.patients if after is None or row["patient_id"] > after][:values["batch_size"]]
+
+    def statements(self, fragment):
+        return [values for query, values in self.executed if fragment in query]
+
+
+class FakeScoringClient:
+    def __init__(self, fail_on_call=None, rejected=()):
+        self.calls = []
+        self.fail_on_call = fail_on_call
+        self.rejected = set(rejected)
+
+    async def score(self, requests, seed):
+        from src.services.risk_scoring import ScoringRejectedError
+
+        self.calls.append((requests, seed))
+        if len(self.calls) == self.fail_on_call:
+            raise RuntimeError("ml-service unavailable")
+        if any(request["patient_id"] in self.rejected for request in requests):
+            raise ScoringRejectedError("ml-service answered 422")
+        return [{"risk_score": 80.0, "readmission_risk": 25.0} for _ in requests]
+
+
+def scoring_patients(count, missing=()):
+    rows = []
+    for i in range(count):
+        row = {column: 70.0 + i for column in ts_module.VITAL_COLUMNS}
+        if i in missing:
+            row["oxygen_saturation"] = None
+        rows.append({"patient_id": UUID(int=i + 1), **row})
+    return rows
+
+
+@pytest.mark.asyncio
+async def test_risk_scoring_pages_patients_and_checkpoints_each_page(monkeypatch):
+    from src.services import risk_scoring as scoring_module
+
+    db = ScoringDatabase(scoring_patients(5, missing={3}))
+    use_fake_db(monkeypatch, scoring_module, db)
+    client = FakeScoringClient()
+    cache = CacheService(LocalRedis())
+    service = scoring_module.RiskScoringService(
+        client, batch_size=2, lookback=timedelta(hours=24), analytics=AnalyticsService(cache)
+    )
+    cached_keys = ("summary:daily:all:patients", "summary:weekly:d1:patients", "summary:daily:all:utilization")
+
+    async def cached(value):
+        return value
+
+    for key in cached_keys:
+        await cache.get_or_compute(key, lambda: cached("old"))
+    now = datetime(2024, 3, 1, 12, tzinfo=UTC)
+
+    result = await service.run(now)
+
+    assert (result["patients_scored"], result["patients_skipped"], result["resumed"]) == (4, 1, False)
+    assert result["patients_per_second"] > 0
+    assert db.statements("INSERT INTO risk_scoring_runs")[0]["changed_since"] == now - timedelta(hours=24)
+    pages = db.statements("FROM health_metrics")
+    assert len(pages) == 3 and "after_patient_id" not in pages[0]
+    assert [page["after_patient_id"] for page in pages[1:]] == [UUID(int=2), UUID(int=4)]
+    # Patient 4 lacks a required vital and is skipped rather than sent
+    assert [len(requests) for requests, _ in client.calls] == [2, 1, 1]
+    assert len({seed for _, seed in client.calls}) == 1
+
+    upserts = db.statements("INSERT INTO patient_analytics")
+    assert [values["patient_ids"] for values in upserts] == [[UUID(int=1), UUID(int=2)], [UUID(int=3)], [UUID(int=5)]]
+    assert upserts[0]["readmission_risks"] == [0.25, 0.25]
+    assert len(db.statements("INSERT INTO patient_risk_trends")) == 3
+    checkpoints = db.statements("UPDATE risk_scoring_runs\n")
+    assert [c["after_patient_id"] for c in checkpoints] == [UUID(int=2), UUID(int=4), UUID(int=5)]
+    assert [(c["scored"], c["skipped"]) for c in checkpoints] == [(2, 0), (1, 1), (1, 0)]
+    assert "completed_at = NOW()" in db.executed[-1][0]
+    # The scores reach cached summaries at once; other sections are kept
+    assert [await cache.get_or_compute(key, lambda: cached("new")) for key in cached_keys] == ["new", "new", "old"]
+
+
+@pytest.mark.asyncio
+async def test_interrupted_risk_scoring_run_resumes_after_last_checkpoint(monkeypatch):
+    from src.services import risk_scoring as scoring_module
+
+    patients = scoring_patients(5)
+    db = ScoringDatabase(patients)
+    use_fake_db(monkeypatch, scoring_module, db)
+    service = scoring_module.RiskScoringService(
+        FakeScoringClient(fail_on_call=2), batch_size=2, lookback=timedelta(hours=24),
+        analytics=AnalyticsService(CacheService(LocalRedis()))
+    )
+
+    with pytest.raises(RuntimeError):
+        await service.run(datetime(2024, 3, 1, 12, tzinfo=UTC))
+    checkpoints = db.statements("UPDATE risk_scoring_runs\n")
+    assert [c["after_patient_id"] for c in checkpoints] == [UUID(int=2)]
+    assert not any("completed_at = NOW()" in query for query, _ in db.executed)
+
+    run = db.statements("INSERT INTO risk_scoring_runs")[0]
+    db = ScoringDatabase(patients, latest_run={
+        "id": checkpoints[0]["id"], "started_at": run["started_at"], "changed_since": run["changed_since"],
+        "after_patient_id": UUID(int=2), "patients_scored": 2, "patients_skipped": 0, "page_failures": 0,
+        "scoring_seconds": 0.5, "completed_at": None
+    })
+    use_fake_db(monkeypatch, scoring_module, db)
+    client = FakeScoringClient()
+    service.client = client
+
+    result = await service.run(datetime(2024, 3, 1, 13, tzinfo=UTC))
+
+    assert result["resumed"] and result["patients_scored"] == 5
+    assert not db.statements("INSERT INTO risk_scoring_runs")
+    assert db.statements("FROM health_metrics")[0]["after_patient_id"] == UUID(int=2)
+    assert [request["patient_id"] for requests, _ in client.calls for request in requests] == [
+        UUID(int=3), UUID(int=4), UUID(int=5)
+    ]
+
+
+
+def test_scoring_requests_treat_non_finite_vitals_as_missing():
+    from src.services import risk_scoring as scoring_module
+
+    rows = scoring_patients(3)
+    rows[0]["temperature"] = float("nan")
+    rows[1]["heart_rate"] = float("inf")
+    rows[2]["oxygen_saturation"] = float("nan")
+
+    requests = scoring_module.scoring_requests(rows)
+
+    assert [request["patient_id"] for request in requests] == [UUID(int=1)]
+    assert requests[0]["metrics"]["temperature"] is None
+
+
+@pytest.mark.asyncio
+async def test_risk_scoring_skips_a_page_ml_service_keeps_rejecting(monkeypatch):
+    from src.services import risk_scoring as scoring_module
+
+    patients = scoring_patients(5)
+    db = ScoringDatabase(patients)
+    use_fake_db(monkeypatch, scoring_module, db)
+    service = scoring_module.RiskScoringService(
+        FakeScoringClient(rejected={UUID(int=3)}), batch_size=2, lookback=timedelta(hours=24), page_attempts=2,
+        analytics=AnalyticsService(CacheService(LocalRedis()))
+    )
+
+    with pytest.raises(scoring_module.ScoringRejectedError):
+        await service.run(datetime(2024, 3, 1, 12, tzinfo=UTC))
+    assert db.statements("SET page_failures = :failures")[0]["failures"] == 1
+
+    run = db.statements("INSERT INTO risk_scoring_runs")[0]
+    db = ScoringDatabase(patients, latest_run={
+        "id": uuid4(), "started_at": run["started_at"], "changed_since": run["changed_since"],
+        "after_patient_id": UUID(int=2), "patients_scored": 2, "patients_skipped": 0, "page_failures": 1,
+        "scoring_seconds": 0.5, "completed_at": None
+    })
+    use_fake_db(monkeypatch, scoring_module, db)
+
+    result = await service.run(datetime(2024, 3, 1, 13, tzinfo=UTC))
+
+    # The second rejection skips patients 3 and 4 and the run completes
+    assert (result["patients_scored"], result["patients_skipped"]) == (3, 2)
+    checkpoints = db.statements("UPDATE risk_scoring_runs\n")
+    assert [(c["after_patient_id"], c["scored"], c["skipped"]) for c in checkpoints] == [
+        (UUID(int=4), 0, 2), (UUID(int=5), 1, 0)
+    ]
+    assert [values["patient_ids"] for values in db.statements("INSERT INTO patient_analytics")] == [[UUID(int=5)]]
+    assert "completed_at = NOW()" in db.executed[-1][0]
+
+
+# Startup budget
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+
+# Peak RSS from VmHWM: ru_maxrss carries the forking parent's peak over exec
+COLD_START = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+import src.main
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "rss_mb": (
+        int(next(line for line in open("/proc/self/status") if line.startswith("VmHWM")).split()[1]) / 1024
+        if os.path.exists("/proc/self/status")
+        else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    ),
+    "modules": sorted(sys.modules)
+}))
+"""
+
+def test_cold_start_stays_within_budget_and_defers_heavy_modules():
+    # A fresh interpreter: the test process has imported everything already
+    completed = subprocess.run(
+        [sys.executable, "-c", COLD_START], cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+    )
+    profile = json.loads(completed.stdout.splitlines()[-1])
+
+    assert profile["seconds"] < settings.STARTUP_BUDGET_SECONDS
+    assert profile["rss_mb"] < settings.STARTUP_BUDGET_RSS_MB
+    loaded = {module.split(".")[0] for module in profile["modules"]}
+    assert not loaded & {"pandas", "statsmodels", "scipy"}
+
+@pytest.mark.asyncio
+async def test_readiness_waits_for_warm_up(monkeypatch):
+    from src.api.endpoints import health
+    from src.core.warmup import Warmup
+
+    warmup = Warmup(["json", "module_that_does_not_exist"])
+    monkeypatch.setattr(health, "warmup", warmup)
+    monkeypatch.setattr(health.db_pool.database, "is_connected", True)
+    assert warmup.ready
+
+    warmup.start()
+    assert (await health.readiness_check()).status_code == 503
+    await warmup._task
+
+    assert warmup.state == "failed" and not warmup.ready
+    assert "json" in warmup.stats()["import_seconds"]
+    assert (await health.readiness_check()).status_code == 503
+
+    warmup = Warmup(["json"])
+    monkeypatch.setattr(health, "warmup", warmup)
+    warmup.start()
+    await warmup._task
+    response = await health.readiness_check()
+    assert response.status_code == 200
+    assert json.loads(response.body)["warmup"]["state"] == "warm"
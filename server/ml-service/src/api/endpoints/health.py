@@ -1,6 +1,9 @@
 # src/api/endpoints/health.py
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from datetime import datetime
+from core.security import get_auth_stats
+from services.model_registry import model_registry
 
 router = APIRouter()
 
@@ -9,5 +12,17 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "service": "ml-service"
-    }
\ No newline at end of file
+        "service": "ml-service",
+        "auth": get_auth_stats()
+    }
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    503 until the models have been loaded and warmed up
+    """
+    ready = model_registry.ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming", "models": sorted(model_registry.stats())}
+    )
\ No newline at end of file
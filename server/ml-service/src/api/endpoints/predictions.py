@@ -1,32 +1,83 @@
 # src/api/endpoints/predictions.py
-from fastapi import APIRouter, Depends, HTTPException
-from models.schemas import RiskPredictionRequest, RiskPredictionResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from models.schemas import (
+    RiskPredictionRequest, RiskPredictionResponse,
+    BatchRiskPredictionRequest, BatchRiskPredictionResponse
+)
+from core.config import settings
 from core.security import verify_token
 from services.ml_service import MLService
+from services.model_registry import model_registry
 from datetime import datetime
 
 router = APIRouter()
-ml_service = MLService()
+ml_service = MLService(model_registry, settings.RISK_MODEL_NAME, settings.READMISSION_MODEL_NAME)
 
 @router.post("/risk-assessment", response_model=RiskPredictionResponse)
 async def predict_risk(
     request: RiskPredictionRequest,
+    seed: Optional[int] = Query(None, description="Seed for the score noise"),
     user: dict = Depends(verify_token)
 ):
     """
     Predict health risks based on patient metrics and history
     """
     try:
-        prediction = ml_service.predict_risk(request)
+        prediction = ml_service.predict_risk(request, seed)
         return RiskPredictionResponse(
+            patient_id=request.patient_id,
             risk_score=prediction.risk_score,
             risk_factors=prediction.risk_factors,
             recommendations=prediction.recommendations,
             prediction_time=datetime.now(),
-            confidence_score=prediction.confidence_score
+            confidence_score=prediction.confidence_score,
+            model_version=prediction.model_version,
+            readmission_risk=prediction.readmission_risk
         )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Prediction failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/risk-assessment/batch", response_model=BatchRiskPredictionResponse)
+async def predict_risk_batch(
+    request: BatchRiskPredictionRequest,
+    user: dict = Depends(verify_token)
+):
+    """
+    Predict health risks for many patients in one call. Predictions are
+    returned in request order; with the same seed each patient scores as
+    it would through /risk-assessment.
+    """
+    if len(request.patients) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.MAX_BATCH_SIZE} patients"
+        )
+
+    try:
+        predictions = ml_service.predict_risk_batch(request.patients, request.seed)
+        prediction_time = datetime.now()
+        return BatchRiskPredictionResponse(
+            count=len(predictions),
+            predictions=[
+                RiskPredictionResponse(
+                    patient_id=patient.patient_id,
+                    risk_score=prediction.risk_score,
+                    risk_factors=prediction.risk_factors,
+                    recommendations=prediction.recommendations,
+                    prediction_time=prediction_time,
+                    confidence_score=prediction.confidence_score,
+                    model_version=prediction.model_version,
+                    readmission_risk=prediction.readmission_risk
+                )
+                for patient, prediction in zip(request.patients, predictions)
+            ]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Prediction failed: {str(e)}"
+        )
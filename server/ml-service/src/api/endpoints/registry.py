@@ -0,0 +1,56 @@
+# src/api/endpoints/registry.py
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, Dict
+from models.schemas import ModelActivationRequest
+from core.security import verify_token
+from services.model_registry import model_registry, ModelLoadError, ModelNotFoundError
+import asyncio
+
+router = APIRouter()
+
+def require_admin(user: dict = Depends(verify_token)) -> dict:
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return user
+
+@router.get("")
+async def list_models(user: dict = Depends(verify_token)) -> Dict[str, Any]:
+    """
+    Available versions and, per active model, load time and memory use
+    """
+    return {
+        "available": model_registry.discover(),
+        "active": model_registry.stats()
+    }
+
+@router.post("/{name}/activate")
+async def activate_model(
+    name: str,
+    request: ModelActivationRequest,
+    user: dict = Depends(require_admin)
+):
+    """
+    Load, warm up and switch to a model version. Other workers follow
+    within MODEL_SYNC_INTERVAL_SECONDS.
+    """
+    try:
+        model = await asyncio.to_thread(model_registry.activate, name, request.version)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelLoadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return model.stats()
+
+@router.post("/{name}/rollback")
+async def rollback_model(name: str, user: dict = Depends(require_admin)):
+    """
+    Switch back to the previously active version
+    """
+    try:
+        model_registry.versions(name)
+        model = model_registry.rollback(name)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelLoadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return model.stats()
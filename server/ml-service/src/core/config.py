@@ -10,13 +10,46 @@ class Settings(BaseModel):
     # Security
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-secret-key-for-development")
     ALGORITHM: str = "HS256"
+    # Verified tokens are cached for this long, never past their exp
+    TOKEN_CACHE_TTL_SECONDS: float = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+    TOKEN_CACHE_MAX_ENTRIES: int = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+    # Also confirm uncached tokens with auth service (e.g. to catch deleted users)
+    AUTH_REVOCATION_CHECK: bool = os.getenv("AUTH_REVOCATION_CHECK", "false").lower() == "true"
+    # Services signing their own tokens (role "service"), e.g. analytics
+    # risk scoring. They have no auth-service user, so revocation checks
+    # skip them; the signature and exp are still verified.
+    AUTH_SERVICE_ACCOUNTS: List[str] = [
+        account for account in os.getenv("AUTH_SERVICE_ACCOUNTS", "analytics-service").split(",") if account
+    ]
+    AUTH_HTTP_TIMEOUT: float = float(os.getenv("AUTH_HTTP_TIMEOUT", "2"))
     
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
     
     # Model paths
     MODEL_PATH: str = os.getenv("MODEL_PATH", "./models")
+    # Registry model used for risk scores; rule-based scoring when absent
+    RISK_MODEL_NAME: str = os.getenv("RISK_MODEL_NAME", "risk")
+    # Registry model for readmission risk; predictions leave it null when absent
+    READMISSION_MODEL_NAME: str = os.getenv("READMISSION_MODEL_NAME", "readmission")
+    # How often workers re-read MODEL_PATH/<name>/ACTIVE (0 disables)
+    MODEL_SYNC_INTERVAL_SECONDS: float = float(os.getenv("MODEL_SYNC_INTERVAL_SECONDS", "30"))
+    # Load models after startup instead of before it; /ready answers 503
+    # (and risk scores are rule-based) until they are loaded
+    MODEL_WARMUP_IN_BACKGROUND: bool = os.getenv("MODEL_WARMUP_IN_BACKGROUND", "false").lower() == "true"
     
+    # Largest batch accepted by /predictions/risk-assessment/batch
+    MAX_BATCH_SIZE: int = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+
+    # Prometheus: how often token cache and auth counters are sampled
+    METRICS_SAMPLE_INTERVAL_SECONDS: float = float(os.getenv("METRICS_SAMPLE_INTERVAL_SECONDS", "5"))
+
+    # Cold start budget (importing main in a fresh interpreter). Tests
+    # enforce the memory budget; the time budget with STARTUP_BENCHMARK=1.
+    # scripts/startup_profile.py breaks the import time down
+    STARTUP_BUDGET_SECONDS: float = float(os.getenv("STARTUP_BUDGET_SECONDS", "2.5"))
+    STARTUP_BUDGET_RSS_MB: float = float(os.getenv("STARTUP_BUDGET_RSS_MB", "128"))
+
     # Service URLs
     AUTH_SERVICE_URL: str = os.getenv("AUTH_SERVICE_URL", "http://auth-service:4001")
 
@@ -0,0 +1,135 @@
+# src/core/metrics.py
+"""
+Prometheus instrumentation.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory (cleared before the service starts); /metrics then
+aggregates every worker's samples. Token cache and auth counters are
+sampled in the background instead of on each request.
+"""
+from typing import Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, make_asgi_app, multiprocess
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "ml_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+SCORING_BATCH_SIZE = Histogram(
+    "ml_scoring_batch_size", "Patients scored per call",
+    ["scorer"], buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+)
+SCORING_SECONDS = Histogram(
+    "ml_scoring_duration_seconds", "Time scoring a batch",
+    ["scorer"], buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+TOKEN_CACHE_ENTRIES = Gauge(
+    "ml_token_cache_entries", "Verified tokens cached", multiprocess_mode="livesum"
+)
+AUTH_EVENTS = Counter(
+    "ml_auth_events_total", "Token verifications by outcome", ["event"]
+)
+
+def metrics_app():
+    """
+    ASGI app serving /metrics, aggregated across workers in multiprocess mode
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return make_asgi_app(registry)
+    return make_asgi_app()
+
+def mark_worker_dead() -> None:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+class PrometheusMiddleware:
+    """
+    Records request latency by method, route template and status
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - start)
+
+class MetricsSampler:
+    """
+    Periodically copies in-process counters and sizes into Prometheus
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sources: Dict[str, Callable[[], None]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, sample: Callable[[], None]) -> None:
+        self._sources[name] = sample
+
+    def sample(self) -> None:
+        for name, sample in self._sources.items():
+            try:
+                sample()
+            except Exception as e:
+                logger.warning("Sampling %s metrics failed: %s", name, e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+def counter_sampler(counter: Counter, read: Callable[[], Dict[str, float]]) -> Callable[[], None]:
+    """
+    Sampler turning a dict of running totals into Counter increments
+    """
+    last: Dict[str, float] = {}
+
+    def sample() -> None:
+        for key, total in read().items():
+            delta = total - last.get(key, 0)
+            if delta > 0:
+                counter.labels(key).inc(delta)
+            last[key] = total
+    return sample
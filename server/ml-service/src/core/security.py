@@ -1,31 +1,166 @@
 # src/core/security.py
-from fastapi import HTTPException, Security
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+import time
+
+from fastapi import HTTPException, Response, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import httpx
+from jose import JWTError, jwt
 from core.config import settings
 
+# httpx is only needed for revocation checks and is imported on first use
+if TYPE_CHECKING:
+    import httpx
+
 security = HTTPBearer()
 
-async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)) -> dict:
+class VerifiedTokenCache:
+    """
+    LRU of verified claims by token. An entry lives for TOKEN_CACHE_TTL_SECONDS
+    but never past the token's own expiry, which also bounds how long a
+    revoked token keeps working when revocation checks are enabled.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    def get(self, token: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if expires_at <= (now or time.time()):
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return claims
+
+    def put(self, token: str, claims: Dict[str, Any], token_exp: Optional[float], now: Optional[float] = None) -> None:
+        expires_at = (now or time.time()) + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        self._entries[token] = (claims, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_MAX_ENTRIES, settings.TOKEN_CACHE_TTL_SECONDS)
+
+auth_stats = {
+    "cache_hits": 0,
+    "local_verifications": 0,
+    "remote_checks": 0,
+    "failures": 0,
+    "seconds_total": 0.0
+}
+
+_http_client: Optional["httpx.AsyncClient"] = None
+
+def get_http_client() -> "httpx.AsyncClient":
+    """
+    Shared pooled client for auth-service calls
+    """
+    global _http_client
+    if _http_client is None:
+        import httpx
+
+        _http_client = httpx.AsyncClient(
+            base_url=settings.AUTH_SERVICE_URL,
+            timeout=settings.AUTH_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _http_client
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def decode_token(token: str) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    Verify signature and expiry locally. Returns the user claims in the
+    shape of auth-service's /auth/verify, and the token's exp.
+    """
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials"
+        )
+    claims = {
+        "userId": payload.get("userId"),
+        "email": payload.get("email"),
+        "role": payload.get("role")
+    }
+    return claims, payload.get("exp")
+
+def is_service_account(claims: Dict[str, Any]) -> bool:
+    return claims.get("role") == "service" and claims.get("userId") in settings.AUTH_SERVICE_ACCOUNTS
+
+async def check_revocation(token: str) -> Dict[str, Any]:
     """
-    Verify JWT token with auth service
+    Ask auth-service whether the token's user is still valid
     """
+    import httpx
+
+    auth_stats["remote_checks"] += 1
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.AUTH_SERVICE_URL}/auth/verify",
-                headers={"Authorization": f"Bearer {credentials.credentials}"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=401,
-                    detail="Invalid authentication credentials"
-                )
-                
-            return response.json()
-    except Exception as e:
+        response = await get_http_client().get(
+            "/auth/verify",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    except httpx.HTTPError:
         raise HTTPException(
             status_code=401,
             detail="Authentication service unavailable"
-        )
\ No newline at end of file
+        )
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials"
+        )
+    return response.json()
+
+async def verify_token(
+    response: Response,
+    credentials: HTTPAuthorizationCredentials = Security(security)
+) -> dict:
+    """
+    Verify JWT token locally, caching verified claims. When
+    AUTH_REVOCATION_CHECK is set, tokens not in the cache are also checked
+    with auth service, except those of AUTH_SERVICE_ACCOUNTS. Time spent is
+    reported in a Server-Timing header.
+    """
+    started = time.perf_counter()
+    source = "cache"
+    token = credentials.credentials
+    try:
+        claims = token_cache.get(token)
+        if claims is None:
+            source = "local"
+            claims, token_exp = decode_token(token)
+            auth_stats["local_verifications"] += 1
+            if settings.AUTH_REVOCATION_CHECK and not is_service_account(claims):
+                source = "remote"
+                claims = await check_revocation(token)
+            token_cache.put(token, claims, token_exp)
+        else:
+            auth_stats["cache_hits"] += 1
+        return claims
+    except HTTPException:
+        auth_stats["failures"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        auth_stats["seconds_total"] += elapsed
+        response.headers.append("Server-Timing", f'auth;dur={elapsed * 1000:.3f};desc="{source}"')
+
+def get_auth_stats() -> Dict[str, Any]:
+    return {**auth_stats, "cached_tokens": len(token_cache)}
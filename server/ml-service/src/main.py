@@ -2,8 +2,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 # Update imports to be relative
-from api.endpoints import health, predictions
+from api.endpoints import health, predictions, registry
 from core.config import settings
+from core.metrics import (
+    AUTH_EVENTS, TOKEN_CACHE_ENTRIES, MetricsSampler, PrometheusMiddleware,
+    counter_sampler, mark_worker_dead, metrics_app
+)
+from core.security import auth_stats, close_http_client, token_cache
+from services.model_registry import model_registry
+import asyncio
 
 app = FastAPI(
     title="Healthcare Analytics ML Service",
@@ -20,9 +27,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency by route and status
+app.add_middleware(PrometheusMiddleware)
+
 # Include routers
 app.include_router(health.router)
 app.include_router(predictions.router, prefix="/predictions", tags=["predictions"])
+app.include_router(registry.router, prefix="/models", tags=["models"])
+
+# Prometheus metrics
+app.mount("/metrics", metrics_app())
+
+metrics_sampler = MetricsSampler(settings.METRICS_SAMPLE_INTERVAL_SECONDS)
+metrics_sampler.register("token_cache", lambda: TOKEN_CACHE_ENTRIES.set(len(token_cache)))
+metrics_sampler.register("auth", counter_sampler(
+    AUTH_EVENTS, lambda: {k: v for k, v in auth_stats.items() if k != "seconds_total"}
+))
+
+@app.on_event("startup")
+async def startup():
+    # Load and warm up models before taking traffic, or behind /ready
+    if settings.MODEL_WARMUP_IN_BACKGROUND:
+        model_registry.warm_up_in_background()
+    else:
+        await asyncio.to_thread(model_registry.sync)
+    if settings.MODEL_SYNC_INTERVAL_SECONDS > 0:
+        model_registry.start(settings.MODEL_SYNC_INTERVAL_SECONDS)
+    metrics_sampler.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await model_registry.stop()
+    await close_http_client()
+    await metrics_sampler.stop()
+    mark_worker_dead()
 
 # Test endpoint
 @app.get("/test")
@@ -0,0 +1,47 @@
+# src/models/schemas.py
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+from uuid import UUID
+
+class PatientMetrics(BaseModel):
+    heart_rate: float
+    blood_pressure_systolic: float
+    blood_pressure_diastolic: float
+    oxygen_saturation: float
+    temperature: Optional[float] = None
+    respiratory_rate: Optional[float] = None
+
+class RiskPredictionRequest(BaseModel):
+    patient_id: Optional[UUID] = None
+    patient_age: Optional[int] = Field(
+        None, description="Unknown ages skip the age rule and are missing values to registry models"
+    )
+    metrics: PatientMetrics
+
+class RiskPredictionResponse(BaseModel):
+    model_config = {"protected_namespaces": ()}
+
+    patient_id: Optional[UUID] = None
+    risk_score: float
+    risk_factors: List[str]
+    recommendations: List[str]
+    prediction_time: datetime
+    confidence_score: float
+    model_version: Optional[str] = Field(None, description="Registry model version; None for rule-based scores")
+    readmission_risk: Optional[float] = Field(
+        None, description="Readmission probability (x100) from the registry's readmission model, when one is active"
+    )
+
+class BatchRiskPredictionRequest(BaseModel):
+    patients: List[RiskPredictionRequest]
+    seed: Optional[int] = Field(
+        None, description="Seed for the score noise; the same seed gives the same scores"
+    )
+
+class BatchRiskPredictionResponse(BaseModel):
+    count: int
+    predictions: List[RiskPredictionResponse]
+
+class ModelActivationRequest(BaseModel):
+    version: Optional[str] = Field(None, description="Defaults to the newest version")
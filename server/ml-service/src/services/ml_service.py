@@ -1,7 +1,12 @@
 # src/services/ml_service.py
 from models.schemas import RiskPredictionRequest
+from services.model_registry import ModelRegistry
+from core.metrics import SCORING_BATCH_SIZE, SCORING_SECONDS
+import hashlib
+import secrets
+import time
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence
 from dataclasses import dataclass
 
 @dataclass
@@ -10,53 +15,169 @@ class PredictionResult:
     risk_factors: List[str]
     recommendations: List[str]
     confidence_score: float
+    model_version: Optional[str] = None
+    readmission_risk: Optional[float] = None
+
+@dataclass(frozen=True)
+class RiskRule:
+    factor: str
+    recommendation: str
+    weight: float
+
+# Column order of the masks built in MLService._rule_masks
+RISK_RULES = [
+    RiskRule("Advanced age", "Regular health checkups recommended", 20),
+    RiskRule("High blood pressure", "Monitor blood pressure daily", 25),
+    RiskRule("Elevated heart rate", "Cardiovascular evaluation recommended", 15),
+    RiskRule("Low oxygen saturation", "Respiratory assessment needed", 20),
+]
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+def _splitmix64(state: np.ndarray) -> np.ndarray:
+    """Vectorized SplitMix64 finalizer (uint64 arithmetic wraps)"""
+    with np.errstate(over="ignore"):
+        z = (state + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+        z = ((z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASK64
+        z = ((z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASK64
+        return z ^ (z >> np.uint64(31))
+
+def _uniform(bits: np.ndarray) -> np.ndarray:
+    """Map uint64 to (0, 1) using the top 53 bits"""
+    return ((bits >> np.uint64(11)).astype(np.float64) + 0.5) / float(1 << 53)
 
 class MLService:
-    def __init__(self):
-        # In a real implementation, we would load trained models here
-        pass
+    def __init__(
+        self,
+        registry: Optional[ModelRegistry] = None,
+        model_name: str = "risk",
+        readmission_model_name: Optional[str] = None
+    ):
+        # Trained models are served from the registry when one is active
+        self.registry = registry
+        self.model_name = model_name
+        self.readmission_model_name = readmission_model_name
 
-    def predict_risk(self, request: RiskPredictionRequest) -> PredictionResult:
+    def predict_risk(self, request: RiskPredictionRequest, seed: Optional[int] = None) -> PredictionResult:
         """
         Predict health risks based on patient data
         Currently using a simplified mock implementation
         """
-        # Mock risk calculation based on basic rules
-        risk_score = 0
-        risk_factors = []
-        recommendations = []
-        
-        # Age-based risk
-        if request.patient_age > 60:
-            risk_score += 20
-            risk_factors.append("Advanced age")
-            recommendations.append("Regular health checkups recommended")
-
-        # Blood pressure risk
-        if request.metrics.blood_pressure_systolic > 140 or request.metrics.blood_pressure_diastolic > 90:
-            risk_score += 25
-            risk_factors.append("High blood pressure")
-            recommendations.append("Monitor blood pressure daily")
-
-        # Heart rate risk
-        if request.metrics.heart_rate > 100:
-            risk_score += 15
-            risk_factors.append("Elevated heart rate")
-            recommendations.append("Cardiovascular evaluation recommended")
-
-        # Oxygen saturation risk
-        if request.metrics.oxygen_saturation < 95:
-            risk_score += 20
-            risk_factors.append("Low oxygen saturation")
-            recommendations.append("Respiratory assessment needed")
-
-        # Add noise for realistic variation
-        risk_score = min(100, max(0, risk_score + np.random.normal(0, 5)))
-        confidence_score = 0.85 + np.random.normal(0, 0.05)
-
-        return PredictionResult(
-            risk_score=round(risk_score, 2),
-            risk_factors=risk_factors,
-            recommendations=recommendations,
-            confidence_score=round(min(1.0, max(0.0, confidence_score)), 3)
-        )
\ No newline at end of file
+        return self.predict_risk_batch([request], seed)[0]
+
+    def predict_risk_batch(
+        self,
+        requests: Sequence[RiskPredictionRequest],
+        seed: Optional[int] = None
+    ) -> List[PredictionResult]:
+        """
+        Score many patients at once with array operations.
+        Noise is drawn from (seed, patient) rather than call order, so a
+        patient gets the same score alone or in any batch for a given seed.
+        Without a seed a fresh one is drawn per call.
+        When the registry has an active risk model, its probability (x100)
+        replaces the rule weights and no score noise is added; the rules
+        still supply risk factors and recommendations. An active readmission
+        model adds its probability (x100) as readmission_risk.
+        """
+        if not requests:
+            return []
+
+        started = time.perf_counter()
+        masks = self._rule_masks(requests)
+        score_noise, confidence_noise = self._noise(requests, seed)
+        confidence_scores = np.clip(0.85 + 0.05 * confidence_noise, 0.0, 1.0)
+
+        model = self.registry.active(self.model_name) if self.registry else None
+        if model is not None:
+            risk_scores = np.clip(100 * model.predict(self._model_features(requests, model.features)), 0, 100)
+        else:
+            weights = np.array([rule.weight for rule in RISK_RULES])
+            # Add noise for realistic variation
+            risk_scores = np.clip(masks @ weights + 5 * score_noise, 0, 100)
+
+        readmission = (
+            self.registry.active(self.readmission_model_name)
+            if self.registry and self.readmission_model_name else None
+        )
+        readmission_risks = [None] * len(requests)
+        if readmission is not None:
+            features = self._model_features(requests, readmission.features)
+            readmission_risks = [
+                round(float(risk), 2) for risk in np.clip(100 * readmission.predict(features), 0, 100)
+            ]
+
+        results = [
+            PredictionResult(
+                risk_score=round(float(risk_score), 2),
+                risk_factors=[RISK_RULES[i].factor for i in np.flatnonzero(mask)],
+                recommendations=[RISK_RULES[i].recommendation for i in np.flatnonzero(mask)],
+                confidence_score=round(float(confidence_score), 3),
+                model_version=model.version if model is not None else None,
+                readmission_risk=readmission_risk
+            )
+            for mask, risk_score, confidence_score, readmission_risk
+            in zip(masks, risk_scores, confidence_scores, readmission_risks)
+        ]
+        scorer = "model" if model is not None else "rules"
+        SCORING_BATCH_SIZE.labels(scorer).observe(len(requests))
+        SCORING_SECONDS.labels(scorer).observe(time.perf_counter() - started)
+        return results
+
+    def _rule_masks(self, requests: Sequence[RiskPredictionRequest]) -> np.ndarray:
+        """
+        (n_patients, n_rules) boolean matrix of triggered rules; a missing
+        age (NaN) triggers no age rule
+        """
+        columns = np.array([
+            (
+                r.patient_age,
+                r.metrics.blood_pressure_systolic,
+                r.metrics.blood_pressure_diastolic,
+                r.metrics.heart_rate,
+                r.metrics.oxygen_saturation
+            )
+            for r in requests
+        ], dtype=float)
+        age, systolic, diastolic, heart_rate, spo2 = columns.T
+
+        return np.column_stack([
+            age > 60,
+            (systolic > 140) | (diastolic > 90),
+            heart_rate > 100,
+            spo2 < 95
+        ])
+
+    @staticmethod
+    def _model_features(requests: Sequence[RiskPredictionRequest], features: List[str]) -> np.ndarray:
+        """
+        (n_patients, n_features) in the model's feature order; missing
+        optional vitals become NaN
+        """
+        rows = []
+        for r in requests:
+            values = {"patient_age": r.patient_age, **r.metrics.dict()}
+            rows.append([values.get(name) if values.get(name) is not None else np.nan for name in features])
+        return np.array(rows, dtype=float)
+
+    def _noise(self, requests: Sequence[RiskPredictionRequest], seed: Optional[int]):
+        """
+        Two standard normal draws per patient (Box-Muller over SplitMix64)
+        """
+        if seed is None:
+            seed = secrets.randbits(64)
+        keys = np.array([self._patient_key(r) for r in requests], dtype=np.uint64)
+        state = _splitmix64(keys ^ np.uint64(seed & 0xFFFFFFFFFFFFFFFF))
+        u1 = _uniform(_splitmix64(state))
+        u2 = _uniform(_splitmix64(state ^ np.uint64(0xD1B54A32D192ED03)))
+        radius = np.sqrt(-2.0 * np.log(u1))
+        return radius * np.cos(2 * np.pi * u2), radius * np.sin(2 * np.pi * u2)
+
+    @staticmethod
+    def _patient_key(request: RiskPredictionRequest) -> int:
+        """
+        Stable 64-bit key: the patient id, or the request contents when the
+        caller did not send one
+        """
+        identity = str(request.patient_id) if request.patient_id else request.json()
+        return int.from_bytes(hashlib.blake2b(identity.encode(), digest_size=8).digest(), "little")
@@ -0,0 +1,311 @@
+# src/services/model_registry.py
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+ACTIVE_FILE = "ACTIVE"
+
+class ModelLoadError(Exception):
+    pass
+
+class ModelNotFoundError(ModelLoadError):
+    pass
+
+@dataclass
+class LoadedModel:
+    """
+    One model version with its weights memory-mapped read-only, so every
+    worker process maps the same page-cache pages instead of holding a copy
+    """
+    name: str
+    version: str
+    path: Path
+    manifest: Dict[str, Any]
+    arrays: Dict[str, np.ndarray]
+    load_seconds: float = 0.0
+    warmup_seconds: float = 0.0
+    loaded_at: float = field(default_factory=time.time)
+
+    @property
+    def features(self) -> List[str]:
+        return self.manifest["features"]
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Probabilities for an (n_samples, n_features) array. Missing values
+        (NaN) are imputed with the training mean, or 0 without one.
+        """
+        model_type = self.manifest.get("type", "logistic")
+        if model_type != "logistic":
+            raise ModelLoadError(f"Unsupported model type: {model_type}")
+        if "mean" in self.arrays:
+            features = np.where(np.isnan(features), self.arrays["mean"], features)
+            scaled = (features - self.arrays["mean"]) / self.arrays["scale"]
+        else:
+            scaled = np.nan_to_num(features, nan=0.0)
+        logits = scaled @ self.arrays["coefficients"] + float(self.manifest.get("intercept", 0.0))
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    @property
+    def mapped_bytes(self) -> int:
+        return sum(int(array.nbytes) for array in self.arrays.values())
+
+    def resident_bytes(self) -> Optional[int]:
+        """
+        Bytes of this model's weight files resident in this process
+        (Linux only; None elsewhere)
+        """
+        return _resident_bytes([str((self.path / f"{name}.npy").resolve()) for name in self.arrays])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "load_seconds": round(self.load_seconds, 6),
+            "warmup_seconds": round(self.warmup_seconds, 6),
+            "mapped_bytes": self.mapped_bytes,
+            "resident_bytes": self.resident_bytes(),
+            "loaded_at": self.loaded_at
+        }
+
+class ModelRegistry:
+    """
+    Discovers versioned artifacts laid out as
+
+        MODEL_PATH/<name>/<version>/manifest.json
+        MODEL_PATH/<name>/<version>/<array>.npy
+        MODEL_PATH/<name>/ACTIVE            (optional: version to serve)
+
+    A model is loaded and warmed up before it replaces the active version,
+    so a broken artifact never takes traffic. Activation and rollback
+    rewrite ACTIVE atomically; sync() (polled in the background) brings
+    every worker to the version it names without a restart.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._active: Dict[str, LoadedModel] = {}
+        self._previous: Dict[str, LoadedModel] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._warmup: Optional[asyncio.Task] = None
+        # Set once the first sync has finished
+        self.synced_at: Optional[float] = None
+
+    def discover(self) -> Dict[str, List[str]]:
+        """
+        Available versions per model name, oldest first
+        """
+        models = {}
+        if not self.root.is_dir():
+            return models
+        for model_dir in sorted(p for p in self.root.iterdir() if p.is_dir()):
+            versions = [p.name for p in model_dir.iterdir() if (p / MANIFEST_FILE).is_file()]
+            if versions:
+                models[model_dir.name] = sorted(versions, key=_version_key)
+        return models
+
+    def active(self, name: str) -> Optional[LoadedModel]:
+        return self._active.get(name)
+
+    def desired_version(self, name: str) -> Optional[str]:
+        """
+        The version named by ACTIVE, or the newest one
+        """
+        pointer = self.root / name / ACTIVE_FILE
+        if pointer.is_file():
+            version = pointer.read_text().strip()
+            if version:
+                return version
+        versions = self.discover().get(name)
+        return versions[-1] if versions else None
+
+    def versions(self, name: str) -> List[str]:
+        """
+        Versions of a discovered model, oldest first. Names and versions
+        only ever come from this listing, so a request cannot point the
+        registry outside its root.
+        """
+        versions = self.discover().get(name)
+        if not versions:
+            raise ModelNotFoundError(f"Unknown model {name}")
+        return versions
+
+    def load(self, name: str, version: str) -> LoadedModel:
+        if version not in self.versions(name):
+            raise ModelNotFoundError(f"Unknown version {name}/{version}")
+        path = self.root / name / version
+        started = time.perf_counter()
+        try:
+            manifest = json.loads((path / MANIFEST_FILE).read_text())
+            arrays = {
+                array_name: np.load(path / f"{array_name}.npy", mmap_mode="r")
+                for array_name in manifest.get("arrays", ["coefficients"])
+            }
+        except (OSError, ValueError) as e:
+            raise ModelLoadError(f"Cannot load {name}/{version}: {e}")
+        model = LoadedModel(name, version, path, manifest, arrays)
+        model.load_seconds = time.perf_counter() - started
+        self.warm_up(model)
+        return model
+
+    def warm_up(self, model: LoadedModel) -> None:
+        """
+        Fault the weights in and run a prediction; fail rather than serve
+        a model that yields non-finite output
+        """
+        started = time.perf_counter()
+        for array in model.arrays.values():
+            float(np.asarray(array).sum())
+        sample = np.asarray(model.manifest.get("warmup_input") or [[0.0] * len(model.features)], dtype=float)
+        try:
+            output = model.predict(sample)
+        except Exception as e:
+            raise ModelLoadError(f"Warm-up failed for {model.name}/{model.version}: {e}")
+        if not np.all(np.isfinite(output)):
+            raise ModelLoadError(f"Warm-up produced non-finite output for {model.name}/{model.version}")
+        model.warmup_seconds = time.perf_counter() - started
+
+    def activate(self, name: str, version: Optional[str] = None, persist: bool = True) -> LoadedModel:
+        """
+        Load and warm up `version` (default: newest), then swap it in.
+        With `persist`, ACTIVE is rewritten so other workers follow.
+        """
+        versions = self.versions(name)
+        if version is None:
+            version = versions[-1]
+        elif version not in versions:
+            raise ModelNotFoundError(f"Unknown version {name}/{version}")
+        with self._lock:
+            current = self._active.get(name)
+            if current is not None and current.version == version:
+                # Already serving it here, but ACTIVE may still name another version
+                if persist:
+                    self._write_pointer(name, version)
+                return current
+            model = self.load(name, version)
+            if current is not None:
+                self._previous[name] = current
+            self._active[name] = model
+            if persist:
+                self._write_pointer(name, version)
+        logger.info("Activated model %s/%s (load %.3fs, warm-up %.3fs)",
+                    name, version, model.load_seconds, model.warmup_seconds)
+        return model
+
+    def rollback(self, name: str) -> LoadedModel:
+        """
+        Swap back to the previously active version
+        """
+        with self._lock:
+            previous = self._previous.get(name)
+            if previous is None:
+                raise ModelLoadError(f"No previous version of {name} to roll back to")
+            self._previous[name] = self._active[name]
+            self._active[name] = previous
+            self._write_pointer(name, previous.version)
+        logger.info("Rolled back model %s to %s", name, previous.version)
+        return previous
+
+    def sync(self) -> Dict[str, str]:
+        """
+        Bring every discovered model to its desired version. Failures keep
+        the version already being served.
+        """
+        changed = {}
+        for name in self.discover():
+            desired = self.desired_version(name)
+            current = self._active.get(name)
+            if current is not None and current.version == desired:
+                continue
+            try:
+                changed[name] = self.activate(name, desired, persist=False).version
+            except ModelLoadError as e:
+                logger.error("%s", e)
+        if self.synced_at is None:
+            self.synced_at = time.time()
+        return changed
+
+    @property
+    def ready(self) -> bool:
+        return self.synced_at is not None
+
+    def warm_up_in_background(self) -> None:
+        """
+        First sync on a worker thread, letting the service start at once
+        """
+        if self._warmup is None:
+            self._warmup = asyncio.create_task(asyncio.to_thread(self.sync))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                **model.stats(),
+                "previous_version": self._previous[name].version if name in self._previous else None
+            }
+            for name, model in self._active.items()
+        }
+
+    def start(self, interval_seconds: float) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(interval_seconds))
+
+    async def stop(self) -> None:
+        for task in (self._task, self._warmup):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._warmup = None
+
+    async def _run(self, interval_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception as e:
+                logger.warning("Model sync failed: %s", e)
+
+    def _write_pointer(self, name: str, version: str) -> None:
+        pointer = self.root / name / ACTIVE_FILE
+        temporary = pointer.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(version)
+        os.replace(temporary, pointer)
+
+def _version_key(version: str):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)]
+
+def _resident_bytes(paths: List[str]) -> Optional[int]:
+    try:
+        with open("/proc/self/smaps") as smaps:
+            lines = smaps.readlines()
+    except OSError:
+        return None
+    wanted = set(paths)
+    total, in_mapping = 0, False
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        if not fields[0].endswith(":") or "-" in fields[0]:
+            in_mapping = len(fields) >= 6 and fields[-1] in wanted
+        elif in_mapping and fields[0] == "Rss:":
+            total += int(fields[1]) * 1024
+    return total
+
+model_registry = ModelRegistry(settings.MODEL_PATH)
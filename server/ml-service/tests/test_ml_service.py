@@ -0,0 +1,419 @@
+# tests/test_ml_service.py
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from core import security
+from core.config import settings
+from core.security import VerifiedTokenCache, verify_token
+from main import app
+from models.schemas import RiskPredictionRequest
+from services.ml_service import MLService, RISK_RULES
+from services.model_registry import ModelLoadError, ModelNotFoundError, ModelRegistry
+
+
+def make_request(age=45, systolic=120, diastolic=80, heart_rate=72, spo2=98, patient_id=None):
+    return RiskPredictionRequest(
+        patient_id=patient_id or uuid4(),
+        patient_age=age,
+        metrics={
+            "heart_rate": heart_rate,
+            "blood_pressure_systolic": systolic,
+            "blood_pressure_diastolic": diastolic,
+            "oxygen_saturation": spo2
+        }
+    )
+
+
+def test_batch_scores_match_single_requests_for_same_seed():
+    service = MLService()
+    rng = np.random.default_rng(0)
+    requests = [
+        make_request(
+            age=int(rng.integers(20, 90)),
+            systolic=float(rng.normal(130, 15)),
+            diastolic=float(rng.normal(85, 8)),
+            heart_rate=float(rng.normal(85, 15)),
+            spo2=float(rng.normal(96, 2))
+        )
+        for _ in range(200)
+    ]
+
+    batch = service.predict_risk_batch(requests, seed=42)
+
+    assert batch == [service.predict_risk(r, seed=42) for r in requests]
+    assert service.predict_risk_batch(requests[::-1], seed=42) == batch[::-1]
+    assert service.predict_risk_batch(requests, seed=43) != batch
+
+
+def test_batch_applies_every_threshold_rule():
+    service = MLService()
+    healthy = make_request()
+    high_risk = make_request(age=70, systolic=150, heart_rate=110, spo2=90)
+    diastolic_only = make_request(diastolic=95)
+
+    results = service.predict_risk_batch([healthy, high_risk, diastolic_only], seed=1)
+
+    assert results[0].risk_factors == [] and results[0].recommendations == []
+    assert results[1].risk_factors == [rule.factor for rule in RISK_RULES]
+    assert results[2].risk_factors == ["High blood pressure"]
+    # Noise has a standard deviation of 5 points around the rule weights
+    assert abs(results[1].risk_score - 80) < 25
+    assert all(0 <= r.risk_score <= 100 and 0 <= r.confidence_score <= 1 for r in results)
+
+
+def test_noise_is_standard_normal_across_patients():
+    score_noise, confidence_noise = MLService()._noise([make_request() for _ in range(20000)], seed=7)
+
+    for noise in (score_noise, confidence_noise):
+        assert abs(noise.mean()) < 0.05
+        assert abs(noise.std() - 1) < 0.05
+    assert abs(np.corrcoef(score_noise, confidence_noise)[0, 1]) < 0.05
+
+
+def test_batch_endpoint_returns_predictions_in_request_order():
+    app.dependency_overrides[verify_token] = lambda: {"userId": "test"}
+    try:
+        client = TestClient(app)
+        patients = [make_request(age=age) for age in (30, 75)]
+        body = {"patients": [p.dict() for p in patients], "seed": 5}
+        for patient in body["patients"]:
+            patient["patient_id"] = str(patient["patient_id"])
+
+        response = client.post("/predictions/risk-assessment/batch", json=body)
+        single = client.post(
+            "/predictions/risk-assessment", params={"seed": 5}, json=body["patients"][1]
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    assert [p["patient_id"] for p in predictions] == [str(p.patient_id) for p in patients]
+    assert predictions[1]["risk_factors"] == ["Advanced age"]
+    assert single.json()["risk_score"] == predictions[1]["risk_score"]
+
+
+def test_metrics_record_route_latency_and_scoring_batch_sizes():
+    from prometheus_client import REGISTRY
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    route = {"method": "POST", "route": "/predictions/risk-assessment/batch", "status": "200"}
+    before = sample("ml_http_request_duration_seconds_count", **route)
+    batch_sum = sample("ml_scoring_batch_size_sum", scorer="rules")
+    app.dependency_overrides[verify_token] = lambda: {"userId": "test"}
+    try:
+        client = TestClient(app)
+        patients = [json.loads(make_request(age=age).json()) for age in (30, 40, 50)]
+        client.post("/predictions/risk-assessment/batch", json={"patients": patients, "seed": 1})
+        exposition = client.get("/metrics/").text
+    finally:
+        app.dependency_overrides.clear()
+
+    assert sample("ml_http_request_duration_seconds_count", **route) == before + 1
+    assert sample("ml_scoring_batch_size_sum", scorer="rules") == batch_sum + 3
+    assert "ml_scoring_duration_seconds_bucket" in exposition
+
+
+# Token verification
+
+def make_token(exp_in=3600, secret=None, user_id="u1", role="doctor"):
+    payload = {"userId": user_id, "email": "a@b.c", "role": role, "exp": int(time.time()) + exp_in}
+    return jwt.encode(payload, secret or settings.JWT_SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.fixture
+def fresh_token_cache(monkeypatch):
+    cache = VerifiedTokenCache(max_entries=2, ttl_seconds=60)
+    monkeypatch.setattr(security, "token_cache", cache)
+    return cache
+
+
+def test_token_cache_entries_expire_with_token_and_evict_lru():
+    cache = VerifiedTokenCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", {"userId": "a"}, token_exp=1010, now=1000)
+    cache.put("b", {"userId": "b"}, token_exp=None, now=1000)
+
+    assert cache.get("a", now=1005) == {"userId": "a"}
+    assert cache.get("a", now=1010) is None
+    assert cache.get("b", now=1059) == {"userId": "b"}
+    cache.put("c", {}, None, now=1000)
+    cache.put("d", {}, None, now=1000)
+    assert cache.get("b", now=1001) is None and len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_verify_token_locally_then_from_cache(monkeypatch, fresh_token_cache):
+    async def no_remote(token):
+        raise AssertionError("auth service should not be called")
+
+    monkeypatch.setattr(security, "check_revocation", no_remote)
+    token = make_token()
+    first, second = Response(), Response()
+
+    claims = await verify_token(first, bearer(token))
+    assert claims == {"userId": "u1", "email": "a@b.c", "role": "doctor"}
+    assert await verify_token(second, bearer(token)) == claims
+    assert 'desc="local"' in first.headers["server-timing"]
+    assert 'desc="cache"' in second.headers["server-timing"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", [make_token(exp_in=-10), make_token(secret="other"), "not-a-jwt"])
+async def test_verify_token_rejects_expired_or_forged_tokens(fresh_token_cache, token):
+    with pytest.raises(HTTPException) as exc:
+        await verify_token(Response(), bearer(token))
+
+    assert exc.value.status_code == 401
+    assert len(fresh_token_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_revocation_check_runs_once_per_cached_token(monkeypatch, fresh_token_cache):
+    calls = []
+
+    async def remote(token):
+        calls.append(token)
+        return {"userId": "u1", "email": "a@b.c", "role": "admin"}
+
+    monkeypatch.setattr(settings, "AUTH_REVOCATION_CHECK", True)
+    monkeypatch.setattr(security, "check_revocation", remote)
+    token = make_token()
+
+    for _ in range(3):
+        claims = await verify_token(Response(), bearer(token))
+
+    assert calls == [token]
+    assert claims["role"] == "admin"
+
+
+@pytest.mark.asyncio
+async def test_revocation_check_skips_service_account_tokens(monkeypatch, fresh_token_cache):
+    calls = []
+
+    async def remote(token):
+        # auth-service knows no user for a service account
+        calls.append(token)
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+
+    monkeypatch.setattr(settings, "AUTH_REVOCATION_CHECK", True)
+    monkeypatch.setattr(security, "check_revocation", remote)
+    service = make_token(user_id="analytics-service", role="service")
+    unknown_service = make_token(user_id="someone", role="service")
+
+    claims = await verify_token(Response(), bearer(service))
+    assert claims["userId"] == "analytics-service" and calls == []
+    with pytest.raises(HTTPException):
+        await verify_token(Response(), bearer(unknown_service))
+    with pytest.raises(HTTPException):
+        await verify_token(Response(), bearer(make_token(role="service", secret="other")))
+    assert calls == [unknown_service]
+
+
+# Model registry
+
+FEATURES = ["patient_age", "blood_pressure_systolic", "heart_rate", "oxygen_saturation"]
+
+
+def write_model(root, version, coefficients, name="risk"):
+    path = root / name / version
+    path.mkdir(parents=True)
+    np.save(path / "coefficients.npy", np.asarray(coefficients, dtype=float))
+    np.save(path / "mean.npy", np.array([50.0, 120.0, 75.0, 97.0]))
+    np.save(path / "scale.npy", np.array([15.0, 15.0, 12.0, 2.0]))
+    (path / "manifest.json").write_text(json.dumps({
+        "type": "logistic",
+        "features": FEATURES,
+        "arrays": ["coefficients", "mean", "scale"],
+        "intercept": -1.0
+    }))
+
+
+def test_registry_loads_newest_version_memory_mapped(tmp_path):
+    write_model(tmp_path, "v2", [0.5, 0.5, 0.5, -0.5])
+    write_model(tmp_path, "v10", [1.0, 1.0, 1.0, -1.0])
+    registry = ModelRegistry(str(tmp_path))
+
+    assert registry.discover() == {"risk": ["v2", "v10"]}
+    assert registry.sync() == {"risk": "v10"}
+
+    model = registry.active("risk")
+    assert isinstance(model.arrays["coefficients"], np.memmap)
+    stats = registry.stats()["risk"]
+    assert stats["version"] == "v10" and stats["load_seconds"] > 0
+    assert stats["mapped_bytes"] == 3 * 4 * 8
+    assert stats["resident_bytes"] is None or stats["resident_bytes"] >= 0
+
+
+def test_registry_hot_swaps_and_rolls_back_through_active_pointer(tmp_path):
+    write_model(tmp_path, "v1", [0.1, 0.1, 0.1, -0.1])
+    write_model(tmp_path, "v2", [2.0, 2.0, 2.0, -2.0])
+    registry = ModelRegistry(str(tmp_path))
+    other_worker = ModelRegistry(str(tmp_path))
+    service = MLService(registry)
+    sick = make_request(age=80, systolic=170, heart_rate=120, spo2=88)
+
+    registry.activate("risk", "v1")
+    low = service.predict_risk(sick, seed=1)
+    registry.activate("risk")
+    high = service.predict_risk(sick, seed=1)
+    other_worker.sync()
+
+    assert (low.model_version, high.model_version) == ("v1", "v2")
+    assert high.risk_score > low.risk_score
+    assert other_worker.active("risk").version == "v2"
+
+    registry.rollback("risk")
+    other_worker.sync()
+    assert service.predict_risk(sick, seed=1) == low
+    assert other_worker.active("risk").version == "v1"
+
+
+def test_registry_persists_pointer_when_version_is_already_active_locally(tmp_path):
+    write_model(tmp_path, "v1", [0.1, 0.1, 0.1, -0.1])
+    write_model(tmp_path, "v2", [2.0, 2.0, 2.0, -2.0])
+    registry = ModelRegistry(str(tmp_path))
+    other_worker = ModelRegistry(str(tmp_path))
+    registry.activate("risk", "v1")
+    other_worker.sync()
+    registry.activate("risk", "v2")
+
+    # Still serving v1 before its next sync, the other worker pins v1 again
+    assert other_worker.activate("risk", "v1").version == "v1"
+
+    assert (tmp_path / "risk" / "ACTIVE").read_text() == "v1"
+    assert registry.sync() == {"risk": "v1"}
+
+
+def test_registry_only_resolves_discovered_models(monkeypatch, tmp_path):
+    from api.endpoints import registry as registry_endpoint
+
+    root = tmp_path / "models"
+    write_model(root, "v1", [0.1, 0.1, 0.1, -0.1])
+    write_model(tmp_path, "v1", [0.1, 0.1, 0.1, -0.1], name="outside")
+    registry = ModelRegistry(str(root))
+
+    for name, version in [("risk", "../../outside/v1"), ("..", "outside/v1"), ("risk", "v9"), ("sepsis", None)]:
+        with pytest.raises(ModelNotFoundError):
+            registry.activate(name, version)
+    with pytest.raises(ModelNotFoundError):
+        registry.load("risk", "../risk/v1")
+    assert not (tmp_path / "outside" / "ACTIVE").exists() and not (root / "risk" / "ACTIVE").exists()
+
+    monkeypatch.setattr(registry_endpoint, "model_registry", registry)
+    app.dependency_overrides[registry_endpoint.require_admin] = lambda: {"userId": "test", "role": "admin"}
+    try:
+        client = TestClient(app)
+        unknown = client.post("/models/sepsis/activate", json={})
+        traversal = client.post("/models/risk/activate", json={"version": "../../outside/v1"})
+        rollback = client.post("/models/sepsis/rollback")
+        activated = client.post("/models/risk/activate", json={"version": "v1"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert (unknown.status_code, traversal.status_code, rollback.status_code) == (404, 404, 404)
+    assert activated.status_code == 200 and (root / "risk" / "ACTIVE").read_text() == "v1"
+
+def test_registry_keeps_serving_when_new_version_fails_warm_up(tmp_path):
+    write_model(tmp_path, "v1", [0.1, 0.1, 0.1, -0.1])
+    write_model(tmp_path, "v2", [np.nan, 0.1, 0.1, -0.1])
+    registry = ModelRegistry(str(tmp_path))
+    registry.activate("risk", "v1")
+
+    with pytest.raises(ModelLoadError):
+        registry.activate("risk", "v2")
+    (tmp_path / "risk" / "ACTIVE").write_text("v2")
+    assert registry.sync() == {}
+
+    assert registry.active("risk").version == "v1"
+
+
+
+def test_readmission_model_scores_alongside_rules_and_tolerates_missing_age(tmp_path):
+    write_model(tmp_path, "v1", [0.1, 0.1, 0.1, -0.1], name="readmission")
+    registry = ModelRegistry(str(tmp_path))
+    registry.sync()
+    without_age = make_request(systolic=170, heart_rate=120, spo2=88)
+    without_age.patient_age = None
+
+    plain = MLService(registry).predict_risk_batch([without_age], seed=3)[0]
+    scored = MLService(registry, readmission_model_name="readmission").predict_risk_batch([without_age], seed=3)[0]
+
+    assert plain.readmission_risk is None
+    assert scored.risk_score == plain.risk_score and 0 < scored.readmission_risk < 100
+    assert "Advanced age" not in scored.risk_factors
+    assert "High blood pressure" in scored.risk_factors
+
+
+# Startup budget
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+# Peak RSS from VmHWM: ru_maxrss carries the forking parent's peak over exec
+COLD_START = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "rss_mb": (
+        int(next(line for line in open("/proc/self/status") if line.startswith("VmHWM")).split()[1]) / 1024
+        if os.path.exists("/proc/self/status")
+        else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    ),
+    "modules": sorted(sys.modules)
+}))
+"""
+
+
+def cold_start_profile():
+    # A fresh interpreter: the test process has imported everything already
+    completed = subprocess.run(
+        [sys.executable, "-c", COLD_START], cwd=SRC_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def test_cold_start_stays_within_memory_budget_and_defers_httpx():
+    profile = cold_start_profile()
+
+    assert profile["rss_mb"] < settings.STARTUP_BUDGET_RSS_MB
+    assert "httpx" not in profile["modules"]
+
+
+# Wall-clock time depends on the machine, so the time budget is a benchmark
+# run on demand (STARTUP_BENCHMARK=1), not on every CI run
+@pytest.mark.skipif(not os.getenv("STARTUP_BENCHMARK"), reason="set STARTUP_BENCHMARK=1 to time the cold start")
+def test_cold_start_stays_within_time_budget():
+    assert cold_start_profile()["seconds"] < settings.STARTUP_BUDGET_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_registry_reports_ready_once_background_warm_up_synced(tmp_path):
+    write_model(tmp_path, "v1", [0.1, 0.1, 0.1, -0.1])
+    registry = ModelRegistry(str(tmp_path))
+    assert not registry.ready
+
+    registry.warm_up_in_background()
+    await registry._warmup
+
+    assert registry.ready
+    assert registry.active("risk").version == "v1"
+    await registry.stop()